@@ -0,0 +1,36 @@
+"""Create student_dimension_scores table
+
+Revision ID: 5d2f8c71a4b3
+Revises: 11292e9137da
+Create Date: 2025-09-12 10:20:00.000000
+
+"""
+from pathlib import Path
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2f8c71a4b3'
+down_revision: Union[str, Sequence[str], None] = '11292e9137da'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SQL_FILE = Path(__file__).resolve().parents[2] / 'create_dimension_scores_table.sql'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 建表并回填历史批次（语句与 create_dimension_scores_table.sql 保持一致）
+    statements = [s.strip() for s in SQL_FILE.read_text(encoding='utf-8').split(';')]
+    for statement in statements:
+        lines = [line for line in statement.splitlines() if not line.strip().startswith('--')]
+        if any(line.strip() for line in lines):
+            op.execute(sa.text('\n'.join(lines)))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('student_dimension_scores')
@@ -0,0 +1,50 @@
+"""Add score input fingerprints
+
+Revision ID: 8e41b0c9d2f7
+Revises: 5d2f8c71a4b3
+Create Date: 2025-10-16 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e41b0c9d2f7'
+down_revision: Union[str, Sequence[str], None] = '5d2f8c71a4b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('score_input_fingerprints',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('batch_code', sa.String(length=50), nullable=False, comment='批次代码'),
+    sa.Column('subject_name', sa.String(length=100), nullable=False, comment='科目名称'),
+    sa.Column('school_id', sa.String(length=50), nullable=False, comment='学校ID'),
+    sa.Column('school_code', sa.String(length=50), nullable=True, comment='学校代码'),
+    sa.Column('row_count', sa.BigInteger(), nullable=False, comment='清洗记录数'),
+    sa.Column('score_sum', sa.DECIMAL(precision=16, scale=2), nullable=False, comment='总分合计'),
+    sa.Column('checksum', sa.String(length=16), nullable=False, comment='(学生ID, 总分, 维度分数)校验和'),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('batch_code', 'subject_name', 'school_id', name='uk_fingerprint_batch_subject_school'),
+    comment='清洗数据指纹表'
+    )
+    with op.batch_alter_table('score_input_fingerprints', schema=None) as batch_op:
+        batch_op.create_index('idx_fingerprint_batch_code', ['batch_code'], unique=False)
+        batch_op.create_index(batch_op.f('ix_score_input_fingerprints_id'), ['id'], unique=False)
+
+    with op.batch_alter_table('statistical_aggregations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('input_fingerprint', sa.String(length=64), nullable=True,
+                                      comment='计算输入指纹(算法版本+清洗数据指纹)'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('statistical_aggregations', schema=None) as batch_op:
+        batch_op.drop_column('input_fingerprint')
+    op.drop_table('score_input_fingerprints')
@@ -0,0 +1,54 @@
+"""Add school score partials
+
+Revision ID: b7c3e5a91f20
+Revises: 8e41b0c9d2f7
+Create Date: 2025-10-16 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7c3e5a91f20'
+down_revision: Union[str, Sequence[str], None] = '8e41b0c9d2f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('school_score_partials',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('batch_code', sa.String(length=50), nullable=False, comment='批次代码'),
+    sa.Column('subject_name', sa.String(length=100), nullable=False, comment='科目名称'),
+    sa.Column('subject_type', sa.String(length=20), nullable=True, comment='科目类型'),
+    sa.Column('school_code', sa.String(length=50), nullable=False, comment='学校代码'),
+    sa.Column('school_name', sa.String(length=100), nullable=True, comment='学校名称'),
+    sa.Column('dimension_code', sa.String(length=50), nullable=False, comment='维度代码(科目总分为空串)'),
+    sa.Column('student_count', sa.BigInteger(), nullable=False, comment='记录数'),
+    sa.Column('score_sum', sa.Float(), nullable=False, comment='分数合计'),
+    sa.Column('score_sq_sum', sa.Float(), nullable=False, comment='分数平方和'),
+    sa.Column('score_min', sa.Float(), nullable=True, comment='最低分'),
+    sa.Column('score_max', sa.Float(), nullable=True, comment='最高分'),
+    sa.Column('full_score_max', sa.Float(), nullable=True, comment='满分最大值'),
+    sa.Column('full_score_sum', sa.Float(), nullable=False, comment='满分合计'),
+    sa.Column('bin_width', sa.Float(), nullable=False, comment='直方图分箱宽度'),
+    sa.Column('histogram', sa.JSON(), nullable=True, comment='分数直方图 {分箱序号: 人数}'),
+    sa.Column('first_seen_id', sa.BigInteger(), nullable=True, comment='维度首次写入的记录ID(维度排序用)'),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('batch_code', 'subject_name', 'school_code', 'dimension_code',
+                        name='uk_partial_batch_subject_school_dimension'),
+    comment='学校部分统计量表'
+    )
+    with op.batch_alter_table('school_score_partials', schema=None) as batch_op:
+        batch_op.create_index('idx_partial_batch_subject', ['batch_code', 'subject_name'], unique=False)
+        batch_op.create_index(batch_op.f('ix_school_score_partials_id'), ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('school_score_partials')
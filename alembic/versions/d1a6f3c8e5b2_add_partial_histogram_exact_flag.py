@@ -0,0 +1,31 @@
+"""Add exact flag to school score partials
+
+Revision ID: d1a6f3c8e5b2
+Revises: b7c3e5a91f20
+Create Date: 2025-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1a6f3c8e5b2'
+down_revision: Union[str, Sequence[str], None] = 'b7c3e5a91f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('school_score_partials', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('histogram_exact', sa.Boolean(), nullable=False, server_default=sa.false(),
+                                      comment='分数全部落在分箱取值上(直方图可精确还原分数分布)'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('school_score_partials', schema=None) as batch_op:
+        batch_op.drop_column('histogram_exact')
@@ -0,0 +1,62 @@
+"""Add task queue columns and batch task locks
+
+Revision ID: e7c2a9d4b8f1
+Revises: d1a6f3c8e5b2
+Create Date: 2025-10-20 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7c2a9d4b8f1'
+down_revision: Union[str, Sequence[str], None] = 'd1a6f3c8e5b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('task_type', sa.String(length=20), nullable=True,
+                                      comment='任务类型(calculation/cleaning)'))
+        batch_op.add_column(sa.Column('batch_code', sa.String(length=50), nullable=True, comment='批次代码'))
+        batch_op.add_column(sa.Column('school_id', sa.String(length=50), nullable=True, comment='学校ID(学校级计算)'))
+        batch_op.add_column(sa.Column('aggregation_level', sa.String(length=20), nullable=True, comment='汇聚级别'))
+        batch_op.add_column(sa.Column('priority', sa.Integer(), nullable=False, server_default='5',
+                                      comment='优先级(数值越大越先执行)'))
+        batch_op.add_column(sa.Column('stage_details', sa.JSON(), nullable=True, comment='阶段进度'))
+        batch_op.add_column(sa.Column('cancel_requested', sa.Boolean(), nullable=False, server_default=sa.false(),
+                                      comment='是否已请求取消'))
+        batch_op.add_column(sa.Column('worker_id', sa.String(length=100), nullable=True, comment='执行该任务的工作线程'))
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True, comment='工作线程最近心跳时间'))
+        batch_op.create_index('idx_tasks_queue', ['status', 'priority', 'id'], unique=False)
+        batch_op.create_index('idx_tasks_batch_status', ['batch_code', 'status'], unique=False)
+
+    op.create_table('task_batch_locks',
+    sa.Column('batch_code', sa.String(length=50), nullable=False, comment='批次代码'),
+    sa.Column('task_id', sa.BigInteger(), nullable=False, comment='持有锁的任务ID'),
+    sa.Column('worker_id', sa.String(length=100), nullable=False, comment='持有锁的工作线程'),
+    sa.Column('acquired_at', sa.DateTime(), nullable=False, comment='加锁时间'),
+    sa.PrimaryKeyConstraint('batch_code')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('task_batch_locks')
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.drop_index('idx_tasks_batch_status')
+        batch_op.drop_index('idx_tasks_queue')
+        batch_op.drop_column('heartbeat_at')
+        batch_op.drop_column('worker_id')
+        batch_op.drop_column('cancel_requested')
+        batch_op.drop_column('stage_details')
+        batch_op.drop_column('priority')
+        batch_op.drop_column('aggregation_level')
+        batch_op.drop_column('school_id')
+        batch_op.drop_column('batch_code')
+        batch_op.drop_column('task_type')
@@ -0,0 +1,31 @@
+"""Add estimated rows to tasks
+
+Revision ID: f3d9b1e6a2c4
+Revises: e7c2a9d4b8f1
+Create Date: 2025-10-21 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3d9b1e6a2c4'
+down_revision: Union[str, Sequence[str], None] = 'e7c2a9d4b8f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('estimated_rows', sa.BigInteger(), nullable=True,
+                                      comment='估算的清洗记录数(内存预算用)'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.drop_column('estimated_rows')
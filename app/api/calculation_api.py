@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, BackgroundTasks
+from fastapi.responses import PlainTextResponse
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import uuid
@@ -19,6 +20,7 @@ from ..schemas.response_schemas import (
 )
 from ..services.batch_service import BatchService
 from ..services.task_manager import TaskManager
+from ..calculation.engine import get_calculation_engine
 from ..database.connection import get_db
 from ..database.connection import SessionLocal
 from ..database.enums import CalculationStatus, AggregationLevel
@@ -416,6 +418,15 @@ async def get_system_status(
         raise HTTPException(status_code=500, detail="系统状态查询失败")
 
 
+@router.get("/system/engine-metrics")
+async def get_engine_metrics(format: str = Query("json", pattern="^(json|prometheus)$")):
+    """计算引擎性能指标（按策略的延迟分位数、调用计数、采样内存）；format=prometheus 时返回文本格式"""
+    engine = get_calculation_engine()
+    if format == "prometheus":
+        return PlainTextResponse(engine.export_prometheus_metrics(), media_type="text/plain; version=0.0.4")
+    return engine.get_metrics_snapshot()
+
+
 @router.get("/tasks", response_model=List[TaskResponse])
 async def list_tasks(
     status: Optional[str] = Query(None, description="任务状态筛选"),
@@ -1,11 +1,18 @@
-from fastapi import APIRouter, HTTPException
-from typing import Any, Dict
+import json
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Callable, Dict, List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
 from app.database.connection import SessionLocal
+from app.database.payload_cache import get_payload_cache
 from app.database.repositories import StatisticalAggregationRepository
 from app.database.enums import AggregationLevel as DBAggregationLevel, CalculationStatus
+from app.services.incremental_aggregation import IncrementalAggregationService
+from app.services.input_fingerprint import load_input_fingerprints
 from app.services.subjects_builder import SubjectsBuilder
 from app.utils.precision import round2_json
 
@@ -21,9 +28,9 @@ def get_db_session() -> Session:
         db.close()
 
 
-def _fetch_v12_regional(db: Session, batch_code: str) -> Dict[str, Any]:
+def _fetch_v12_regional(db: Session, batch_code: str, rebuild: bool = False) -> Dict[str, Any]:
     repo = StatisticalAggregationRepository(db)
-    regional = repo.get_regional_statistics(batch_code)
+    regional = None if rebuild else repo.get_regional_statistics(batch_code)
     if regional and isinstance(regional.statistics_data, dict):
         data = regional.statistics_data
         if data.get("subjects"):
@@ -44,6 +51,7 @@ def _fetch_v12_regional(db: Session, batch_code: str) -> Dict[str, Any]:
         "school_name": None,
         "statistics_data": processed,
         "calculation_status": CalculationStatus.COMPLETED,
+        "input_fingerprint": load_input_fingerprints(db, batch_code).unit_fingerprint(DBAggregationLevel.REGIONAL),
     })
     return processed
 
@@ -71,52 +79,144 @@ def _fetch_v12_school(db: Session, batch_code: str, school_code: str) -> Dict[st
         "school_name": None,
         "statistics_data": processed,
         "calculation_status": CalculationStatus.COMPLETED,
+        "input_fingerprint": load_input_fingerprints(db, batch_code).unit_fingerprint(
+            DBAggregationLevel.SCHOOL, school_code
+        ),
     })
     return processed
 
 
-@router.get("/batch/{batch_code}/regional")
-def get_v12_regional(batch_code: str):
-    try:
+def _encode_response(message: str, data: Dict[str, Any]) -> bytes:
+    """编码响应体（与 FastAPI JSONResponse 的序列化参数一致）"""
+    return json.dumps(
+        {"success": True, "message": message, "data": data, "code": 200},
+        ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+    ).encode("utf-8")
+
+
+async def _cached_v12_response(batch_code: str, level: DBAggregationLevel, school_code: Optional[str],
+                               fetch: Callable[[Session], Dict[str, Any]], message: str) -> bytes:
+    """经两级缓存获取预编码响应；记录尚未生成时直接构建，不进入缓存"""
+    def probe_version() -> Optional[str]:
         db = next(get_db_session())
         try:
-            data = _fetch_v12_regional(db, batch_code)
-            return {"success": True, "message": f"v1.2 区域级 subjects 已生成 {batch_code}", "data": data, "code": 200}
+            return StatisticalAggregationRepository(db).get_statistics_version(batch_code, level, school_code)
         finally:
             db.close()
+
+    def load() -> bytes:
+        db = next(get_db_session())
+        try:
+            return _encode_response(message, fetch(db))
+        finally:
+            db.close()
+
+    version = await run_in_threadpool(probe_version)
+    if version is None:
+        return await run_in_threadpool(load)
+    key = ("v12", batch_code, level.value, school_code or "", version)
+    return await get_payload_cache().get_or_load(key, lambda: run_in_threadpool(load), batch_code=batch_code)
+
+
+@router.get("/batch/{batch_code}/regional")
+async def get_v12_regional(batch_code: str):
+    try:
+        body = await _cached_v12_response(
+            batch_code, DBAggregationLevel.REGIONAL, None,
+            lambda db: _fetch_v12_regional(db, batch_code),
+            f"v1.2 区域级 subjects 已生成 {batch_code}",
+        )
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成 v1.2 区域级失败: {str(e)}")
 
 
 @router.get("/batch/{batch_code}/school/{school_code}")
-def get_v12_school(batch_code: str, school_code: str):
+async def get_v12_school(batch_code: str, school_code: str):
     try:
-        db = next(get_db_session())
-        try:
-            data = _fetch_v12_school(db, batch_code, school_code)
-            return {"success": True, "message": f"v1.2 学校级 subjects 已生成 {batch_code}/{school_code}", "data": data, "code": 200}
-        finally:
-            db.close()
+        body = await _cached_v12_response(
+            batch_code, DBAggregationLevel.SCHOOL, school_code,
+            lambda db: _fetch_v12_school(db, batch_code, school_code),
+            f"v1.2 学校级 subjects 已生成 {batch_code}/{school_code}",
+        )
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成 v1.2 学校级失败: {str(e)}")
 
 
 @router.post("/batch/{batch_code}/materialize")
-def materialize_v12(batch_code: str):
+def materialize_v12(batch_code: str, force: bool = False):
     try:
         db = next(get_db_session())
         try:
+            repo = StatisticalAggregationRepository(db)
+            # 输入指纹（算法版本+清洗数据）未变化的单元不重新生成；无指纹时仅生成缺失的单元
+            fingerprints = load_input_fingerprints(db, batch_code)
+            stored = repo.get_input_fingerprints(batch_code) if fingerprints and not force else {}
             # 触发区域
-            _fetch_v12_regional(db, batch_code)
-            # 触发学校级（批量）
+            _fetch_v12_regional(
+                db, batch_code,
+                rebuild=force or (bool(fingerprints) and not fingerprints.unit_unchanged(stored, DBAggregationLevel.REGIONAL))
+            )
+            # 触发学校级（批量）：仅为输入变化或尚未生成 subjects 的学校计算，分块批量写入
             rows = db.execute(text("SELECT DISTINCT school_code FROM student_cleaned_scores WHERE batch_code=:b"), {"b": batch_code}).fetchall()
-            count = 0
-            for (school_code,) in rows:
-                _fetch_v12_school(db, batch_code, school_code)
-                count += 1
-            return {"success": True, "message": "v1.2 subjects 全量生成完成", "data": {"batch_code": batch_code, "schools_materialized": count}, "code": 200}
+            school_codes = [r[0] for r in rows if r[0] is not None]
+            if fingerprints:
+                pending = [
+                    code for code in school_codes
+                    if force or not fingerprints.unit_unchanged(stored, DBAggregationLevel.SCHOOL, code)
+                ]
+            else:
+                materialized = {
+                    rec.school_id for rec in repo.get_all_school_statistics(batch_code)
+                    if isinstance(rec.statistics_data, dict) and rec.statistics_data.get("subjects")
+                }
+                pending = [code for code in school_codes if code not in materialized]
+            if pending:
+                subjects_by_school = SubjectsBuilder().build_all_school_subjects(batch_code, pending)
+                records = [
+                    {
+                        "batch_code": batch_code,
+                        "aggregation_level": DBAggregationLevel.SCHOOL,
+                        "school_id": school_code,
+                        "school_name": None,
+                        "statistics_data": round2_json({
+                            "schema_version": "v1.2",
+                            "batch_code": batch_code,
+                            "aggregation_level": "SCHOOL",
+                            "school_code": school_code,
+                            "subjects": subjects,
+                        }),
+                        "calculation_status": CalculationStatus.COMPLETED,
+                        "input_fingerprint": fingerprints.unit_fingerprint(DBAggregationLevel.SCHOOL, school_code),
+                    }
+                    for school_code, subjects in subjects_by_school.items()
+                ]
+                write_result = repo.batch_upsert_statistics(records, batch_size=500)
+                if write_result.errors:
+                    raise RuntimeError("; ".join(write_result.errors))
+            count = len(school_codes)
+            return {"success": True, "message": "v1.2 subjects 全量生成完成", "data": {"batch_code": batch_code, "schools_materialized": count, "schools_regenerated": len(pending)}, "code": 200}
         finally:
             db.close()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"v1.2 全量生成失败: {str(e)}")
 
+
+@router.post("/batch/{batch_code}/schools/refresh")
+async def refresh_v12_schools(batch_code: str, school_codes: List[str] = Query(...),
+                              subject_names: Optional[List[str]] = Query(None), reclean: bool = True):
+    """单校成绩更正：只重新清洗指定学校，区域与学校结果由学校部分统计量增量更新"""
+    try:
+        db = next(get_db_session())
+        try:
+            service = IncrementalAggregationService(db)
+            if reclean:
+                result = await service.apply_school_corrections(batch_code, school_codes, subject_names)
+            else:
+                result = await run_in_threadpool(service.update_school_aggregates, batch_code, school_codes)
+            return {"success": True, "message": "v1.2 学校增量更新完成", "data": result, "code": 200}
+        finally:
+            db.close()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"v1.2 学校增量更新失败: {str(e)}")
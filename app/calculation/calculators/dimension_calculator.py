@@ -9,6 +9,7 @@ from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from ..engine import StatisticalStrategy
+from ..order_statistics import order_statistics
 from ...database.connection import SessionLocal
 
 logger = logging.getLogger(__name__)
@@ -448,16 +449,8 @@ class DimensionCalculator:
         if scores.empty:
             return {}
         
-        scores_sorted = scores.sort_values()
-        n = len(scores_sorted)
-        percentiles = [10, 25, 50, 75, 90]
-        
-        result = {}
-        for p in percentiles:
-            rank = int(np.floor(n * p / 100.0))
-            rank = max(0, min(rank, n - 1))
-            result[f'P{p}'] = float(scores_sorted.iloc[rank])
-        
+        result = order_statistics(scores.to_numpy(dtype=np.float64), [10, 25, 50, 75, 90])['percentiles']
+        result.pop('IQR', None)
         return result
     
     def _calculate_discrimination(self, scores: pd.Series, max_score: float) -> Dict[str, Any]:
@@ -465,15 +458,10 @@ class DimensionCalculator:
         if len(scores) < 10 or max_score <= 0:
             return {'discrimination_index': 0, 'interpretation': 'insufficient_data'}
         
-        scores_sorted = scores.sort_values(ascending=False)
-        n = len(scores_sorted)
-        
         # 前27%和后27%分组
-        high_group_size = max(1, int(n * 0.27))
-        low_group_size = max(1, int(n * 0.27))
-        
-        high_group_mean = scores_sorted.iloc[:high_group_size].mean()
-        low_group_mean = scores_sorted.iloc[-low_group_size:].mean()
+        stats = order_statistics(scores.to_numpy(dtype=np.float64), percentiles=())
+        high_group_mean = stats['high_group_mean']
+        low_group_mean = stats['low_group_mean']
         
         discrimination_index = (high_group_mean - low_group_mean) / max_score
         
@@ -6,6 +6,7 @@ from typing import Dict, Any, List, Optional, Union, Tuple
 from dataclasses import dataclass
 from enum import Enum
 from ..engine import StatisticalStrategy
+from ..order_statistics import select_ranks
 
 logger = logging.getLogger(__name__)
 
@@ -78,13 +79,13 @@ class PercentileCalculator:
                 method=method
             )
             
-        # 排序数据
-        scores_sorted = np.sort(scores)
-        n = len(scores_sorted)
+        n = len(scores)
         
         # 计算精确位置
         position = (percentile / 100.0) * (n - 1) if method == InterpolationMethod.LINEAR else np.floor(n * percentile / 100.0)
         
+        # 部分排序：只需保证位置两侧名次上的值正确
+        scores_sorted = select_ranks(scores, self._neighbour_ranks(position, n))
         return self._calculate_with_method(scores_sorted, position, percentile, method)
     
     def calculate_multiple_percentiles(self, 
@@ -126,18 +127,28 @@ class PercentileCalculator:
                 )
             return results
             
-        # 排序一次，重复使用
-        scores_sorted = np.sort(scores)
-        n = len(scores_sorted)
+        n = len(scores)
+        positions = {
+            p: (p / 100.0) * (n - 1) if method == InterpolationMethod.LINEAR else np.floor(n * p / 100.0)
+            for p in percentiles
+        }
+        
+        # 部分排序一次，选出全部百分位数所需名次
+        ranks = [rank for position in positions.values() for rank in self._neighbour_ranks(position, n)]
+        scores_sorted = select_ranks(scores, ranks)
         
         # 批量计算
-        for p in percentiles:
-            position = (p / 100.0) * (n - 1) if method == InterpolationMethod.LINEAR else np.floor(n * p / 100.0)
+        for p, position in positions.items():
             result = self._calculate_with_method(scores_sorted, position, p, method)
             results[f'P{int(p)}'] = result
             
         return results
     
+    @staticmethod
+    def _neighbour_ranks(position: float, n: int) -> List[int]:
+        """插值所需的相邻名次（floor 与 ceil，截断到 [0, n-1]）"""
+        return [max(0, min(int(np.floor(position)), n - 1)), max(0, min(int(np.ceil(position)), n - 1))]
+    
     def calculate_standard_percentiles(self, 
                                      data: Union[pd.Series, np.ndarray, List[float]],
                                      method: Optional[InterpolationMethod] = None) -> Dict[str, PercentileResult]:
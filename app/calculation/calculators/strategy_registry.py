@@ -8,6 +8,7 @@ from ..formulas import (
     EducationalMetricsStrategy,
     DiscriminationStrategy
 )
+from ..subject_metrics import SubjectMetricsStrategy
 from .dimension_calculator import DimensionStatisticsStrategy
 # from .difficulty_calculator import DifficultyCalculator  # Temporarily disabled
 # from .discrimination_calculator import DiscriminationCalculator  # Temporarily disabled
@@ -126,6 +127,13 @@ def register_default_strategies():
         '计算区分度指标(前27%后27%分组法)'
     )
     
+    # 科目指标融合策略（一次调用得到上述四组指标）
+    register_strategy(
+        'subject_metrics',
+        SubjectMetricsStrategy,
+        '科目指标融合计算：基础统计、教育指标、百分位数和区分度一次完成，输入为float64分数数组'
+    )
+    
     # 年级差异化等级分布策略
     register_strategy(
         'grade_distribution',
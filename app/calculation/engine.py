@@ -10,6 +10,10 @@ import gc
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import multiprocessing as mp
 
+from .instrumentation import EngineMetrics
+from .order_statistics import order_statistics
+from .partials import ScorePartial
+
 # Optional dependency for memory monitoring
 try:
     import psutil
@@ -50,25 +54,18 @@ class CalculationMetrics:
     error_message: Optional[str] = None
 
 
-class PerformanceMonitor:
-    """性能监控器"""
+class PerformanceMonitor(EngineMetrics):
+    """性能监控器
     
-    def __init__(self):
-        self.metrics: List[CalculationMetrics] = []
+    基于 EngineMetrics 的有界统计：按策略的延迟直方图与计数器，不保存逐次调用记录；
+    内存变化只在 RSS 采样的调用上记录（字节）。
+    """
     
     def record_calculation(self, operation: str, data_size: int, 
-                         execution_time: float, memory_usage: float,
+                         execution_time: float, memory_usage: Optional[float],
                          success: bool, error: Optional[str] = None):
         """记录计算指标"""
-        metric = CalculationMetrics(
-            operation_name=operation,
-            data_size=data_size,
-            execution_time=execution_time,
-            memory_usage=memory_usage,
-            success=success,
-            error_message=error
-        )
-        self.metrics.append(metric)
+        self.record(operation, execution_time, data_size, success, memory_usage)
         
         # 性能告警
         if execution_time > self._get_performance_threshold(data_size):
@@ -85,20 +82,23 @@ class PerformanceMonitor:
     
     def get_stats(self) -> Dict[str, Any]:
         """获取性能统计"""
-        if not self.metrics:
+        merged = self.merged().values()
+        total = sum(s.succeeded + s.failed for s in merged)
+        if not total:
             return {}
         
-        successful_metrics = [m for m in self.metrics if m.success]
-        failed_metrics = [m for m in self.metrics if not m.success]
-        
+        successful = sum(s.succeeded for s in merged)
+        memory_samples = sum(s.memory_samples for s in merged)
         return {
-            'total_operations': len(self.metrics),
-            'successful_operations': len(successful_metrics),
-            'failed_operations': len(failed_metrics),
-            'success_rate': len(successful_metrics) / len(self.metrics),
-            'avg_execution_time': np.mean([m.execution_time for m in successful_metrics]) if successful_metrics else 0,
-            'avg_memory_usage': np.mean([m.memory_usage for m in successful_metrics]) if successful_metrics else 0,
-            'total_data_processed': sum(m.data_size for m in successful_metrics)
+            'total_operations': total,
+            'successful_operations': successful,
+            'failed_operations': total - successful,
+            'success_rate': successful / total,
+            'avg_execution_time': sum(s.seconds for s in merged) / total,
+            # 原 avg_memory_usage（系统内存占比变化）已不再统计，改为采样调用上的平均 RSS 变化（字节）
+            'avg_rss_delta_bytes': sum(s.memory_delta for s in merged) / memory_samples if memory_samples else 0,
+            'memory_samples': memory_samples,
+            'total_data_processed': sum(s.rows for s in merged)
         }
 
 
@@ -222,12 +222,17 @@ class ChunkProcessor:
         if n_rows <= self.chunk_size:
             return calculation_func(data, **kwargs)
         
-        # 分块处理
+        # 分块处理（同时累积可合并的部分统计量，用于合并中位数、标准差和百分位数）
         results = []
+        partial = ScorePartial() if 'score' in data.columns else None
         for i in range(0, n_rows, self.chunk_size):
             chunk = data.iloc[i:i + self.chunk_size]
             chunk_result = calculation_func(chunk, **kwargs)
             results.append(chunk_result)
+            if partial is not None:
+                partial = partial.merge(ScorePartial.from_scores(
+                    pd.to_numeric(chunk['score'], errors='coerce').to_numpy(dtype=np.float64)
+                ))
             
             # 内存管理
             if self.memory_manager.should_trigger_gc():
@@ -237,10 +242,15 @@ class ChunkProcessor:
         if merge_func:
             return merge_func(results, data)
         else:
-            return self._merge_chunk_results(results, data)
+            return self._merge_chunk_results(results, data, partial)
     
-    def _merge_chunk_results(self, results: List[Dict[str, Any]], original_data: pd.DataFrame) -> Dict[str, Any]:
-        """合并分块计算结果"""
+    def _merge_chunk_results(self, results: List[Dict[str, Any]], original_data: pd.DataFrame,
+                             partial: Optional[ScorePartial] = None) -> Dict[str, Any]:
+        """合并分块计算结果
+        
+        部分统计量直方图精确时，中位数、标准差与百分位数由合并后的部分统计量得到，
+        否则从原始数据部分排序一次得到。
+        """
         if not results:
             return {}
         
@@ -256,21 +266,31 @@ class ChunkProcessor:
         if 'sum' in merged and 'count' in merged and merged['count'] > 0:
             merged['mean'] = merged['sum'] / merged['count']
         
+        if partial is not None and partial.count and partial.exact:
+            variance = partial.sample_variance
+            merged['median'] = float(partial.median)
+            merged['std'] = float(np.sqrt(variance))
+            merged['var'] = float(variance)
+            merged['min'] = float(partial.min)
+            merged['max'] = float(partial.max)
+            for p in [10, 25, 50, 75, 90]:
+                merged[f'P{p}'] = float(partial.percentile(p))
+            return merged
+        
         # 对于需要从原始数据重新计算的指标（如中位数、百分位数）
         if 'score' in original_data.columns:
             # 确保score字段为数值类型，防止Categorical类型导致median计算失败
             scores = pd.to_numeric(original_data['score'], errors='coerce').dropna()
-            merged['median'] = float(scores.median())
             merged['std'] = float(scores.std(ddof=1))
             merged['var'] = float(scores.var(ddof=1))
             merged['min'] = float(scores.min())
             merged['max'] = float(scores.max())
             
-            # 计算百分位数
+            # 中位数与百分位数
+            stats = order_statistics(scores.to_numpy(dtype=np.float64), [10, 25, 50, 75, 90])
+            merged['median'] = stats['median']
             for p in [10, 25, 50, 75, 90]:
-                rank = int(np.floor(len(scores) * p / 100.0))
-                rank = max(0, min(rank, len(scores) - 1))
-                merged[f'P{p}'] = float(scores.sort_values().iloc[rank])
+                merged[f'P{p}'] = stats['percentiles'][f'P{p}']
         
         return merged
 
@@ -342,11 +362,17 @@ class CalculationEngine:
         self.strategies[name] = strategy
         logger.info(f"已注册计算策略: {name}")
         
-    def calculate(self, strategy_name: str, data: pd.DataFrame, 
+    def calculate(self, strategy_name: str, data: Union[pd.DataFrame, np.ndarray], 
                  config: Dict[str, Any]) -> Dict[str, Any]:
-        """执行计算"""
+        """执行计算
+        
+        data 为 NumPy 分数数组时（如 subject_metrics 融合策略）直接交给策略计算，
+        不做 DataFrame 内存优化和分块处理。
+        """
         start_time = time.time()
-        memory_before = self.memory_manager.get_memory_usage()
+        # 每 N 次调用采样一次进程内存，其余调用不做系统调用
+        monitor = self.performance_monitor
+        rss_before = monitor.sample_rss() if monitor.should_sample() else None
         
         try:
             if strategy_name not in self.strategies:
@@ -359,23 +385,27 @@ class CalculationEngine:
             if not validation_result['is_valid']:
                 raise ValueError(f"数据验证失败: {validation_result['errors']}")
             
-            # 内存优化
-            data = self.memory_manager.optimize_dataframe_memory(data)
-            
-            # 选择处理方式
-            # 对于需要全局数据计算的策略，禁用分块处理
-            no_chunk_strategies = ['educational_metrics', 'discrimination', 'percentiles']
-            
-            if len(data) > self.chunk_processor.chunk_size and strategy_name not in no_chunk_strategies:
-                # 大数据集分块处理
-                result = self.chunk_processor.process_large_dataset(
-                    data, 
-                    strategy.calculate, 
-                    config=config
-                )
-            else:
-                # 直接计算
+            if isinstance(data, np.ndarray):
+                # 分数数组直接计算
                 result = strategy.calculate(data, config)
+            else:
+                # 内存优化
+                data = self.memory_manager.optimize_dataframe_memory(data)
+                
+                # 选择处理方式
+                # 对于需要全局数据计算的策略，禁用分块处理
+                no_chunk_strategies = ['educational_metrics', 'discrimination', 'percentiles']
+                
+                if len(data) > self.chunk_processor.chunk_size and strategy_name not in no_chunk_strategies:
+                    # 大数据集分块处理
+                    result = self.chunk_processor.process_large_dataset(
+                        data, 
+                        strategy.calculate, 
+                        config=config
+                    )
+                else:
+                    # 直接计算
+                    result = strategy.calculate(data, config)
             
             # 结果验证
             algorithm_info = strategy.get_algorithm_info()
@@ -392,23 +422,28 @@ class CalculationEngine:
             
             # 记录性能指标
             execution_time = time.time() - start_time
-            memory_after = self.memory_manager.get_memory_usage()
-            self.performance_monitor.record_calculation(
-                strategy_name, len(data), execution_time, 
-                memory_after - memory_before, True
+            monitor.record_calculation(
+                strategy_name, len(data), execution_time,
+                self._memory_delta(rss_before), True
             )
             
             return result
             
         except Exception as e:
             execution_time = time.time() - start_time
-            memory_after = self.memory_manager.get_memory_usage()
-            self.performance_monitor.record_calculation(
+            monitor.record_calculation(
                 strategy_name, len(data), execution_time,
-                memory_after - memory_before, False, str(e)
+                self._memory_delta(rss_before), False, str(e)
             )
             raise
     
+    def _memory_delta(self, rss_before: Optional[int]) -> Optional[float]:
+        """采样调用的进程内存变化（字节），未采样时为None"""
+        if rss_before is None:
+            return None
+        rss_after = self.performance_monitor.sample_rss()
+        return None if rss_after is None else float(rss_after - rss_before)
+    
     def calculate_basic_statistics(self, data: pd.DataFrame, config: Dict[str, Any] = None) -> dict:
         """计算基础统计信息"""
         config = config or {}
@@ -446,9 +481,17 @@ class CalculationEngine:
         """获取性能统计"""
         return self.performance_monitor.get_stats()
     
+    def get_metrics_snapshot(self) -> Dict[str, Any]:
+        """按策略的延迟分位数、调用计数与采样内存"""
+        return self.performance_monitor.snapshot()
+    
+    def export_prometheus_metrics(self) -> str:
+        """Prometheus 文本格式的引擎指标"""
+        return self.performance_monitor.prometheus_text()
+    
     def reset_performance_stats(self):
         """重置性能统计"""
-        self.performance_monitor = PerformanceMonitor()
+        self.performance_monitor.reset()
     
     def get_available_strategies(self) -> List[str]:
         """获取所有可用的计算策略列表
@@ -4,9 +4,31 @@ import pandas as pd
 import logging
 from typing import Dict, Any, List, Optional, Union
 from .engine import StatisticalStrategy
+from .order_statistics import order_statistics
 
 logger = logging.getLogger(__name__)
 
+# 小学年级（适用小学等级划分标准）
+PRIMARY_GRADE_LEVELS = ('1st_grade', '2nd_grade', '3rd_grade',
+                        '4th_grade', '5th_grade', '6th_grade')
+
+
+def is_primary_grade(grade_level: str) -> bool:
+    """判断是否为小学年级"""
+    return grade_level in PRIMARY_GRADE_LEVELS
+
+
+def interpret_discrimination(index: float) -> str:
+    """解释区分度结果"""
+    if index >= 0.4:
+        return "excellent"
+    elif index >= 0.3:
+        return "good"
+    elif index >= 0.2:
+        return "acceptable"
+    else:
+        return "poor"
+
 
 def _normalize_input_data(data: Union[pd.DataFrame, List, Any]) -> pd.DataFrame:
     """
@@ -120,27 +142,14 @@ class EducationalPercentileStrategy(StatisticalStrategy):
         if 'score' not in data.columns:
             raise ValueError("数据中缺少'score'列")
             
-        scores = data['score'].astype(float).dropna().sort_values()
-        n = len(scores)
+        scores = data['score'].astype(float).dropna()
         
-        if n == 0:
+        if len(scores) == 0:
             raise ValueError("没有有效的分数数据")
         
+        # 教育统计标准floor算法，部分排序一次选出全部百分位数名次（含四分位距）
         percentiles = config.get('percentiles', [10, 25, 50, 75, 90])
-        result = {}
-        
-        for p in percentiles:
-            # 教育统计标准：使用floor算法
-            rank = int(np.floor(n * p / 100.0))
-            # 确保索引不超出范围
-            rank = max(0, min(rank, n - 1))
-            result[f'P{p}'] = float(scores.iloc[rank])
-        
-        # 四分位距
-        if 'P75' in result and 'P25' in result:
-            result['IQR'] = result['P75'] - result['P25']
-        
-        return result
+        return order_statistics(scores.to_numpy(), percentiles)['percentiles']
     
     def validate_input(self, data: Union[pd.DataFrame, List, Any], config: Dict[str, Any]) -> Dict[str, Any]:
         """验证输入数据"""
@@ -258,9 +267,7 @@ class EducationalMetricsStrategy(StatisticalStrategy):
     
     def _is_primary_grade(self, grade_level: str) -> bool:
         """判断是否为小学年级"""
-        primary_grades = ['1st_grade', '2nd_grade', '3rd_grade', 
-                         '4th_grade', '5th_grade', '6th_grade']
-        return grade_level in primary_grades
+        return is_primary_grade(grade_level)
     
     def validate_input(self, data: Union[pd.DataFrame, List, Any], config: Dict[str, Any]) -> Dict[str, Any]:
         """验证输入数据"""
@@ -319,7 +326,7 @@ class DiscriminationStrategy(StatisticalStrategy):
         if 'score' not in data.columns:
             raise ValueError("数据中缺少'score'列")
             
-        scores = data['score'].astype(float).dropna().sort_values(ascending=False)
+        scores = data['score'].astype(float).dropna()
         n = len(scores)
         
         if n == 0:
@@ -328,15 +335,11 @@ class DiscriminationStrategy(StatisticalStrategy):
         if n < 10:  # 数据量太少无法计算区分度
             logger.warning(f"数据量过少({n})，区分度计算可能不准确")
         
-        # 教育统计标准：前27%和后27%
-        high_group_size = max(1, int(n * 0.27))
-        low_group_size = max(1, int(n * 0.27))
-        
-        high_group = scores.iloc[:high_group_size]
-        low_group = scores.iloc[-low_group_size:]
-        
-        high_mean = high_group.mean()
-        low_mean = low_group.mean()
+        # 教育统计标准：前27%和后27%（部分排序选出高低分组）
+        stats = order_statistics(scores.to_numpy(), percentiles=())
+        high_group_size = low_group_size = stats['group_size']
+        high_mean = stats['high_group_mean']
+        low_mean = stats['low_group_mean']
         max_score = config.get('max_score', 100)
         
         # 区分度 = (高分组平均分 - 低分组平均分) / 满分
@@ -355,14 +358,7 @@ class DiscriminationStrategy(StatisticalStrategy):
     
     def _interpret_discrimination(self, index: float) -> str:
         """解释区分度结果"""
-        if index >= 0.4:
-            return "excellent"
-        elif index >= 0.3:
-            return "good"
-        elif index >= 0.2:
-            return "acceptable"
-        else:
-            return "poor"
+        return interpret_discrimination(index)
     
     def validate_input(self, data: Union[pd.DataFrame, List, Any], config: Dict[str, Any]) -> Dict[str, Any]:
         """验证输入数据"""
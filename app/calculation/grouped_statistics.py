@@ -0,0 +1,244 @@
+# 分组统计计算（排序分段向量化实现）
+"""
+对多个分组（如 学校 × 科目）一次性计算统计指标。
+
+实现方式：按 (分组, 分数) 排序后（order_statistics.sort_segments），每个分组对应
+排序数组中的一段连续区间，均值、标准差、极值、百分位数、等级分布和区分度都通过分段索引和
+``np.add.reduceat`` 一次完成，避免逐组调用计算引擎。
+
+各指标口径与单组策略保持一致：
+- 标准差/方差为样本口径（ddof=1），与 BasicStatisticsStrategy 相同
+- 百分位数采用 floor(n * p / 100) 算法，与 EducationalPercentileStrategy 相同
+- 等级分布阈值与 EducationalMetricsStrategy 相同
+- 区分度采用前27%/后27%分组，与 DiscriminationStrategy 相同
+
+statistics_from_partial 以同样的输出结构由可合并部分统计量（ScorePartial）
+计算，区域级指标可由各学校部分统计量合并后得到而无需重新扫描学生分数。
+"""
+
+import logging
+import math
+from typing import Any, Dict, Hashable, Sequence, Tuple
+
+import numpy as np
+
+from .formulas import interpret_discrimination, is_primary_grade
+from .order_statistics import (
+    DEFAULT_PERCENTILES,
+    SortedSegments,
+    discrimination_group_size,
+    segment_discrimination,
+    segment_percentiles,
+    sort_segments,
+)
+from .partials import ScorePartial
+
+logger = logging.getLogger(__name__)
+
+
+def segment_basic_statistics(segments: SortedSegments) -> Dict[str, np.ndarray]:
+    """分段基础统计：计数、总和、均值、中位数、样本标准差、极值"""
+    s, starts, counts = segments.scores, segments.starts, segments.counts
+    sums = np.add.reduceat(s, starts)
+    means = sums / counts
+
+    deviations = s - np.repeat(means, counts)
+    squared = np.add.reduceat(deviations * deviations, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = np.where(counts > 1, squared / (counts - 1), np.nan)
+
+    mins = s[starts]
+    maxs = s[segments.ends - 1]
+
+    half = counts // 2
+    upper_mid = s[starts + half]
+    lower_mid = s[starts + np.maximum(half - (counts % 2 == 0), 0)]
+    medians = (upper_mid + lower_mid) / 2.0
+
+    return {
+        'count': counts,
+        'sum': sums,
+        'mean': means,
+        'median': medians,
+        'std': np.sqrt(variance),
+        'variance': variance,
+        'min': mins,
+        'max': maxs,
+        'range': maxs - mins,
+    }
+
+
+def segment_threshold_counts(segments: SortedSegments, threshold: float) -> np.ndarray:
+    """分段统计不低于阈值的人数"""
+    return np.add.reduceat((segments.scores >= threshold).astype(np.int64), segments.starts)
+
+
+def calculate_grouped_statistics(group_labels: Sequence[Hashable], scores: np.ndarray,
+                                 config: Dict[str, Any]) -> Dict[Hashable, Dict[str, Any]]:
+    """对所有分组一次性计算统计指标
+
+    Args:
+        group_labels: 与 scores 等长的分组标签（如学校ID）
+        scores: 分数向量
+        config: 计算配置（max_score、grade_level、percentiles、min_discrimination_size）
+
+    Returns:
+        {分组标签: {'basic_statistics', 'educational_metrics', 'percentiles', 'discrimination'}}，
+        各结果字典的字段与对应单组计算策略的输出一致；样本不足时 discrimination 为 None
+    """
+    return statistics_from_segments(sort_segments(group_labels, scores), config)
+
+
+def statistics_from_segments(segments: SortedSegments, config: Dict[str, Any]) -> Dict[Hashable, Dict[str, Any]]:
+    """对已排序分段计算统计指标（calculate_grouped_statistics 的分段部分，单组时可直接构造一段）"""
+    if len(segments.starts) == 0:
+        return {}
+
+    max_score = float(config.get('max_score', 100))
+    grade_level = config.get('grade_level', '1st_grade')
+    percentiles = config.get('percentiles', DEFAULT_PERCENTILES)
+    min_discrimination_size = config.get('min_discrimination_size', 10)
+
+    basic = segment_basic_statistics(segments)
+    pct = segment_percentiles(segments, percentiles)
+    discrimination = segment_discrimination(segments, max_score) if max_score > 0 else None
+
+    primary = is_primary_grade(grade_level)
+    at_least = {
+        ratio: segment_threshold_counts(segments, max_score * ratio)
+        for ratio in _grade_ratios(primary)
+    }
+
+    results: Dict[Hashable, Dict[str, Any]] = {}
+    for i, label in enumerate(segments.labels):
+        n = int(segments.counts[i])
+        group_result = {
+            'basic_statistics': {key: _to_python(values[i]) for key, values in basic.items()},
+            'educational_metrics': _educational_metrics(
+                n, float(basic['mean'][i]), max_score, primary,
+                {ratio: int(counts[i]) for ratio, counts in at_least.items()}
+            ),
+            'percentiles': {key: float(values[i]) for key, values in pct.items()},
+            'discrimination': None,
+        }
+
+        if discrimination is not None and n >= min_discrimination_size:
+            index = float(discrimination['discrimination_index'][i])
+            size = int(discrimination['group_size'][i])
+            group_result['discrimination'] = {
+                'discrimination_index': index,
+                'high_group_mean': float(discrimination['high_group_mean'][i]),
+                'low_group_mean': float(discrimination['low_group_mean'][i]),
+                'high_group_size': size,
+                'low_group_size': size,
+                'interpretation': interpret_discrimination(index),
+            }
+
+        results[label] = group_result
+
+    return results
+
+
+def statistics_from_partial(partial: ScorePartial, config: Dict[str, Any],
+                            min_discrimination_size: int = 10) -> Dict[str, Any]:
+    """由部分统计量计算单组统计指标，输出结构与 calculate_grouped_statistics 的单组结果一致
+
+    部分统计量的直方图须为精确直方图（partial.exact），否则百分位数、等级人数
+    和区分度只能按分箱估计，调用方应改用原始分数计算。
+    """
+    if not partial.count:
+        raise ValueError("没有有效的分数数据")
+    if not partial.exact:
+        raise ValueError("部分统计量直方图不精确，无法还原分数分布")
+
+    max_score = float(config.get('max_score', 100))
+    primary = is_primary_grade(config.get('grade_level', '1st_grade'))
+    n = partial.count
+    mean = partial.mean
+    variance = partial.sample_variance
+    basic = {
+        'count': n,
+        'sum': partial.total,
+        'mean': mean,
+        'median': partial.median,
+        'std': math.sqrt(variance) if not math.isnan(variance) else variance,
+        'variance': variance,
+        'min': partial.min,
+        'max': partial.max,
+        'range': partial.max - partial.min,
+        **partial.shape_statistics(),
+    }
+
+    percentiles = {f'P{p}': partial.percentile(p) for p in config.get('percentiles', DEFAULT_PERCENTILES)}
+    if 'P75' in percentiles and 'P25' in percentiles:
+        percentiles['IQR'] = percentiles['P75'] - percentiles['P25']
+
+    discrimination = None
+    if max_score > 0 and n >= min_discrimination_size:
+        size = discrimination_group_size(n)
+        high_mean, low_mean = partial.extreme_group_means(size)
+        index = (high_mean - low_mean) / max_score
+        discrimination = {
+            'discrimination_index': index,
+            'high_group_mean': high_mean,
+            'low_group_mean': low_mean,
+            'high_group_size': size,
+            'low_group_size': size,
+            'interpretation': interpret_discrimination(index),
+        }
+
+    return {
+        'basic_statistics': basic,
+        'educational_metrics': _educational_metrics(
+            n, mean, max_score, primary,
+            {ratio: partial.count_at_least(max_score * ratio) for ratio in _grade_ratios(primary)}
+        ),
+        'percentiles': percentiles,
+        'discrimination': discrimination,
+    }
+
+
+def _grade_ratios(primary: bool) -> Tuple[float, float, float]:
+    """等级阈值（得分率）：优秀、良好、及格"""
+    return (0.85 if primary else 0.80), 0.70, 0.60
+
+
+def _educational_metrics(n: int, mean: float, max_score: float, primary: bool,
+                         at_least: Dict[float, int]) -> Dict[str, Any]:
+    """由各阈值以上人数计算得分率与等级分布（口径与 EducationalMetricsStrategy 一致）"""
+    excellent_ratio = _grade_ratios(primary)[0]
+    excellent = at_least[excellent_ratio]
+    good = at_least[0.70] - excellent
+    passed = at_least[0.60] - at_least[0.70]
+    failed = n - at_least[0.60]
+
+    if primary:
+        grade_distribution = {
+            'excellent_rate': excellent / n, 'good_rate': good / n,
+            'pass_rate': passed / n, 'fail_rate': failed / n,
+            'excellent_count': excellent, 'good_count': good,
+            'pass_count': passed, 'fail_count': failed,
+        }
+    else:
+        grade_distribution = {
+            'a_rate': excellent / n, 'b_rate': good / n,
+            'c_rate': passed / n, 'd_rate': failed / n,
+            'a_count': excellent, 'b_count': good,
+            'c_count': passed, 'd_count': failed,
+        }
+
+    average_score_rate = mean / max_score if max_score > 0 else 0.0
+    return {
+        'average_score_rate': average_score_rate,
+        'grade_distribution': grade_distribution,
+        'pass_rate': at_least[0.60] / n,
+        'excellent_rate': excellent / n,
+        'difficulty_coefficient': average_score_rate,
+    }
+
+
+def _to_python(value: Any) -> Any:
+    """NumPy标量转换为Python原生类型"""
+    if isinstance(value, np.integer):
+        return int(value)
+    return float(value)
@@ -0,0 +1,268 @@
+# 计算引擎性能埋点
+"""
+计算引擎的常驻性能埋点：按策略统计的延迟直方图、调用计数与采样的进程内存（RSS）。
+
+- 延迟直方图为对数线性分桶（HDR 风格）：每个2倍区间划分 SUB_BUCKETS 个桶，
+  覆盖 1 微秒到约 19 小时，桶数固定，分位数相对误差不超过 2^(1/SUB_BUCKETS)-1（约9%）
+- 每个线程写入自己的分片，记录时不加锁也不做系统调用；读取时合并全部分片。
+  线程结束后其分片在下次注册新分片或读取时并入归档分片，内存占用只与存活线程数有关
+- RSS 每 N 次调用采样一次（CALC_METRICS_RSS_SAMPLE_EVERY，0 表示不采样）
+- 导出为 JSON 快照或 Prometheus 文本格式
+
+进程池模式下每个工作进程各自统计，导出的是当前进程的数据。
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+SUB_BUCKETS = 8
+MIN_LATENCY = 1e-6
+OCTAVES = 36
+BUCKET_COUNT = SUB_BUCKETS * OCTAVES + 1
+# 第 i 个桶的上界（秒）：MIN_LATENCY * 2^(i / SUB_BUCKETS)，最后一个桶为溢出桶
+BUCKET_BOUNDS = [MIN_LATENCY * 2 ** (i / SUB_BUCKETS) for i in range(BUCKET_COUNT - 1)] + [math.inf]
+
+
+def bucket_index(seconds: float) -> int:
+    """延迟所在桶序号（桶 i 覆盖 (上界[i-1], 上界[i]]）"""
+    if seconds <= MIN_LATENCY:
+        return 0
+    return min(int(math.ceil(math.log2(seconds / MIN_LATENCY) * SUB_BUCKETS - 1e-9)), BUCKET_COUNT - 1)
+
+
+class _StrategyShard:
+    """单个线程内某一策略的计数（只由所属线程写入）"""
+    __slots__ = ('buckets', 'succeeded', 'failed', 'rows', 'seconds', 'max_seconds',
+                 'memory_samples', 'memory_delta')
+
+    def __init__(self):
+        self.buckets = [0] * BUCKET_COUNT
+        self.succeeded = 0
+        self.failed = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.memory_samples = 0
+        self.memory_delta = 0.0
+
+    def merge_into(self, target: '_StrategyShard'):
+        for i, count in enumerate(self.buckets):
+            if count:
+                target.buckets[i] += count
+        target.succeeded += self.succeeded
+        target.failed += self.failed
+        target.rows += self.rows
+        target.seconds += self.seconds
+        target.max_seconds = max(target.max_seconds, self.max_seconds)
+        target.memory_samples += self.memory_samples
+        target.memory_delta += self.memory_delta
+
+
+class _ThreadShard:
+    """单个线程的全部计数"""
+    __slots__ = ('thread', 'strategies', 'calls')
+
+    def __init__(self, thread: Optional[threading.Thread]):
+        self.thread = thread
+        self.strategies: Dict[str, _StrategyShard] = {}
+        self.calls = 0
+
+
+class EngineMetrics:
+    """计算引擎性能埋点（有界、记录路径无锁）"""
+
+    def __init__(self, rss_sample_every: Optional[int] = None):
+        if rss_sample_every is None:
+            rss_sample_every = int(os.getenv("CALC_METRICS_RSS_SAMPLE_EVERY", 100))
+        self.rss_sample_every = max(0, rss_sample_every)
+        self._process = psutil.Process() if PSUTIL_AVAILABLE else None
+        self._lock = threading.Lock()   # 仅用于分片注册、归并与读取
+        self._local = threading.local()
+        self._shards: List[_ThreadShard] = []
+        self._retired = _ThreadShard(None)
+        self._rss_bytes: Optional[int] = None
+        self._rss_max_bytes: Optional[int] = None
+        self._rss_sampled_at: Optional[float] = None
+        self.started_at = time.time()
+
+    # ---- 记录 ----
+
+    def _shard(self) -> _ThreadShard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = _ThreadShard(threading.current_thread())
+            with self._lock:
+                self._fold_dead_shards()
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def should_sample(self) -> bool:
+        """本次调用是否采样内存（每 rss_sample_every 次调用一次）"""
+        if not self.rss_sample_every or self._process is None:
+            return False
+        shard = self._shard()
+        shard.calls += 1
+        return (shard.calls - 1) % self.rss_sample_every == 0
+
+    def sample_rss(self) -> Optional[int]:
+        """读取当前进程 RSS（字节）并更新内存指标"""
+        if self._process is None:
+            return None
+        try:
+            rss = int(self._process.memory_info().rss)
+        except Exception:
+            return None
+        self._rss_bytes = rss
+        self._rss_max_bytes = rss if self._rss_max_bytes is None else max(self._rss_max_bytes, rss)
+        self._rss_sampled_at = time.time()
+        return rss
+
+    def record(self, strategy: str, seconds: float, rows: int = 0, success: bool = True,
+               memory_delta: Optional[float] = None):
+        """记录一次调用（只写当前线程分片）"""
+        shard = self._shard()
+        stats = shard.strategies.get(strategy)
+        if stats is None:
+            stats = shard.strategies[strategy] = _StrategyShard()
+        stats.buckets[bucket_index(seconds)] += 1
+        if success:
+            stats.succeeded += 1
+            stats.rows += rows
+        else:
+            stats.failed += 1
+        stats.seconds += seconds
+        if seconds > stats.max_seconds:
+            stats.max_seconds = seconds
+        if memory_delta is not None:
+            stats.memory_samples += 1
+            stats.memory_delta += memory_delta
+
+    # ---- 读取 ----
+
+    def _fold_dead_shards(self):
+        """将已结束线程的分片并入归档分片（调用方持有锁）"""
+        alive = []
+        for shard in self._shards:
+            if shard.thread is not None and shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                self._merge_shard(shard, self._retired)
+        self._shards = alive
+
+    @staticmethod
+    def _merge_shard(source: _ThreadShard, target: _ThreadShard):
+        # 所属线程可能同时新增策略键，先复制再遍历
+        for name, stats in tuple(source.strategies.items()):
+            stats.merge_into(target.strategies.setdefault(name, _StrategyShard()))
+
+    def merged(self) -> Dict[str, _StrategyShard]:
+        """合并全部分片的按策略计数"""
+        with self._lock:
+            self._fold_dead_shards()
+            total = _ThreadShard(None)
+            self._merge_shard(self._retired, total)
+            for shard in list(self._shards):
+                self._merge_shard(shard, total)
+        return total.strategies
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON 快照：每个策略的调用数、耗时与延迟分位数"""
+        strategies = {}
+        for name, stats in sorted(self.merged().items()):
+            calls = stats.succeeded + stats.failed
+            strategies[name] = {
+                'calls': calls,
+                'succeeded': stats.succeeded,
+                'failed': stats.failed,
+                'rows': stats.rows,
+                'total_seconds': stats.seconds,
+                'avg_seconds': stats.seconds / calls if calls else 0.0,
+                'max_seconds': stats.max_seconds,
+                'p50_seconds': quantile(stats.buckets, 0.50),
+                'p90_seconds': quantile(stats.buckets, 0.90),
+                'p99_seconds': quantile(stats.buckets, 0.99),
+            }
+        return {
+            'uptime_seconds': time.time() - self.started_at,
+            'rss_bytes': self._rss_bytes,
+            'rss_max_bytes': self._rss_max_bytes,
+            'rss_sampled_at': self._rss_sampled_at,
+            'rss_sample_every': self.rss_sample_every,
+            'strategies': strategies,
+        }
+
+    def prometheus_text(self, prefix: str = 'calculation_engine') -> str:
+        """Prometheus 文本格式（0.0.4）；直方图按每个2倍区间导出一个 le 边界"""
+        lines = [
+            f'# HELP {prefix}_duration_seconds 计算策略调用耗时',
+            f'# TYPE {prefix}_duration_seconds histogram',
+        ]
+        merged = sorted(self.merged().items())
+        for name, stats in merged:
+            label = _escape_label(name)
+            cumulative = 0
+            for i, count in enumerate(stats.buckets):
+                cumulative += count
+                if i % SUB_BUCKETS == 0 and i < BUCKET_COUNT - 1:
+                    lines.append(f'{prefix}_duration_seconds_bucket{{strategy="{label}",le="{BUCKET_BOUNDS[i]:.6g}"}} {cumulative}')
+            lines.append(f'{prefix}_duration_seconds_bucket{{strategy="{label}",le="+Inf"}} {cumulative}')
+            lines.append(f'{prefix}_duration_seconds_sum{{strategy="{label}"}} {stats.seconds:.9g}')
+            lines.append(f'{prefix}_duration_seconds_count{{strategy="{label}"}} {cumulative}')
+
+        lines += [f'# HELP {prefix}_calls_total 计算策略调用次数', f'# TYPE {prefix}_calls_total counter']
+        for name, stats in merged:
+            label = _escape_label(name)
+            lines.append(f'{prefix}_calls_total{{strategy="{label}",status="success"}} {stats.succeeded}')
+            lines.append(f'{prefix}_calls_total{{strategy="{label}",status="failure"}} {stats.failed}')
+
+        lines += [f'# HELP {prefix}_rows_total 成功计算处理的记录数', f'# TYPE {prefix}_rows_total counter']
+        for name, stats in merged:
+            lines.append(f'{prefix}_rows_total{{strategy="{_escape_label(name)}"}} {stats.rows}')
+
+        if self._rss_bytes is not None:
+            lines += [
+                f'# HELP {prefix}_rss_bytes 最近一次采样的进程常驻内存',
+                f'# TYPE {prefix}_rss_bytes gauge',
+                f'{prefix}_rss_bytes {self._rss_bytes}',
+                f'# HELP {prefix}_rss_max_bytes 采样到的进程常驻内存峰值',
+                f'# TYPE {prefix}_rss_max_bytes gauge',
+                f'{prefix}_rss_max_bytes {self._rss_max_bytes}',
+            ]
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """清空全部计数（各线程下次记录时注册新分片）"""
+        with self._lock:
+            self._local = threading.local()
+            self._shards = []
+            self._retired = _ThreadShard(None)
+            self._rss_bytes = self._rss_max_bytes = self._rss_sampled_at = None
+            self.started_at = time.time()
+
+
+def quantile(buckets: List[int], q: float) -> float:
+    """由直方图估计分位数（返回所在桶上界，溢出桶返回最后一个有限上界）"""
+    total = sum(buckets)
+    if not total:
+        return 0.0
+    target = q * total
+    cumulative = 0
+    for i, count in enumerate(buckets):
+        cumulative += count
+        if count and cumulative >= target:
+            return BUCKET_BOUNDS[min(i, BUCKET_COUNT - 2)]
+    return BUCKET_BOUNDS[BUCKET_COUNT - 2]
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
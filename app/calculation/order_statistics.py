@@ -0,0 +1,155 @@
+# 顺序统计量计算内核
+"""
+百分位数、中位数与区分度高低分组的共享计算内核。
+
+单组：``order_statistics`` 用 ``np.partition`` 一次选出所需名次上的分数（O(n)，
+不做完整排序），一次调用返回各百分位数、IQR、中位数和前/后27%分组平均分。
+
+多组：``sort_segments`` 将分数按 (分组, 分数) 排序为连续分段，
+``segment_percentiles`` / ``segment_discrimination`` 对所有分组一次向量化计算，
+用于 学校 × 科目 × 维度 的分组统计。
+
+口径与各计算策略一致：
+- 百分位数采用 floor(n * p / 100) 算法（EducationalPercentileStrategy）
+- 高低分组人数为 max(1, int(n * 0.27))（DiscriminationStrategy）
+- 中位数为偶数个分数时取中间两数平均值（与 pandas median 相同）
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Iterable, Sequence
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+DISCRIMINATION_GROUP_RATIO = 0.27
+
+
+def percentile_rank(n: int, p: float) -> int:
+    """教育统计百分位数名次（从0开始）：floor(n * p / 100)，截断到 [0, n-1]"""
+    return max(0, min(int(np.floor(n * p / 100.0)), n - 1))
+
+
+def discrimination_group_size(n: int) -> int:
+    """区分度高/低分组人数"""
+    return max(1, int(n * DISCRIMINATION_GROUP_RATIO))
+
+
+def select_ranks(scores: np.ndarray, ranks: Iterable[int]) -> np.ndarray:
+    """部分排序：返回的数组在给定名次上的值与完整排序结果相同
+
+    每个名次左侧的分数都不大于该名次的分数、右侧都不小于该名次的分数，
+    因此前 k 个（或后 k 个）分数的集合也与完整排序相同。
+    """
+    ranks = sorted({int(r) for r in ranks})
+    if not ranks or len(scores) == 0:
+        return np.asarray(scores, dtype=np.float64)
+    return np.partition(np.asarray(scores, dtype=np.float64), ranks)
+
+
+def order_statistics(scores: Any, percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> Dict[str, Any]:
+    """单组顺序统计量（NaN 剔除）
+
+    Returns:
+        {'count', 'median', 'percentiles': {'P10', ..., 'IQR'},
+         'high_group_mean', 'low_group_mean', 'group_size'}
+
+    Raises:
+        ValueError: 没有有效分数
+    """
+    values = np.asarray(scores, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    n = len(values)
+    if n == 0:
+        raise ValueError("没有有效的分数数据")
+
+    half = n // 2
+    median_ranks = (half, half - 1 if n % 2 == 0 else half)
+    size = discrimination_group_size(n)
+    percentile_ranks = {p: percentile_rank(n, p) for p in percentiles}
+    selected = select_ranks(
+        values, list(percentile_ranks.values()) + list(median_ranks) + [size - 1, n - size]
+    )
+
+    result_percentiles = {f'P{p}': float(selected[rank]) for p, rank in percentile_ranks.items()}
+    if 'P75' in result_percentiles and 'P25' in result_percentiles:
+        result_percentiles['IQR'] = result_percentiles['P75'] - result_percentiles['P25']
+
+    return {
+        'count': n,
+        'median': float((selected[median_ranks[0]] + selected[median_ranks[1]]) / 2.0),
+        'percentiles': result_percentiles,
+        'high_group_mean': float(selected[n - size:].mean()),
+        'low_group_mean': float(selected[:size].mean()),
+        'group_size': size,
+    }
+
+
+@dataclass(frozen=True)
+class SortedSegments:
+    """按分组排序后的分段数组"""
+    labels: np.ndarray   # 每段对应的分组标签
+    scores: np.ndarray   # 按 (分组, 分数升序) 排序后的分数
+    starts: np.ndarray   # 每段起始位置
+    counts: np.ndarray   # 每段长度
+
+    @property
+    def ends(self) -> np.ndarray:
+        return self.starts + self.counts
+
+
+def sort_segments(group_labels: Sequence[Hashable], scores: np.ndarray) -> SortedSegments:
+    """将分数按分组排序并切分为连续分段（NaN分数会被剔除）"""
+    scores = np.asarray(scores, dtype=np.float64)
+    codes, uniques = pd.factorize(np.asarray(group_labels, dtype=object), sort=True)
+
+    valid = ~np.isnan(scores) & (codes >= 0)
+    codes = codes[valid]
+    scores = scores[valid]
+
+    order = np.lexsort((scores, codes))
+    codes = codes[order]
+    scores = scores[order]
+
+    if len(scores) == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return SortedSegments(np.empty(0, dtype=object), scores, empty, empty)
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    counts = np.diff(np.r_[starts, len(scores)])
+    return SortedSegments(
+        labels=np.asarray(uniques, dtype=object)[codes[starts]],
+        scores=scores,
+        starts=starts,
+        counts=counts,
+    )
+
+
+def segment_percentiles(segments: SortedSegments,
+                        percentiles: Sequence[int] = DEFAULT_PERCENTILES) -> Dict[str, np.ndarray]:
+    """分段百分位数（教育统计 floor 算法）"""
+    result = {}
+    for p in percentiles:
+        rank = np.floor(segments.counts * p / 100.0).astype(np.intp)
+        rank = np.clip(rank, 0, segments.counts - 1)
+        result[f'P{p}'] = segments.scores[segments.starts + rank]
+    if 'P75' in result and 'P25' in result:
+        result['IQR'] = result['P75'] - result['P25']
+    return result
+
+
+def segment_discrimination(segments: SortedSegments, max_score: float) -> Dict[str, np.ndarray]:
+    """分段区分度（前27%与后27%平均分之差 / 满分）"""
+    group_size = np.maximum(1, (segments.counts * DISCRIMINATION_GROUP_RATIO).astype(np.intp))
+    cumulative = np.r_[0.0, np.cumsum(segments.scores)]
+    starts, ends = segments.starts, segments.ends
+
+    low_mean = (cumulative[starts + group_size] - cumulative[starts]) / group_size
+    high_mean = (cumulative[ends] - cumulative[ends - group_size]) / group_size
+
+    return {
+        'discrimination_index': (high_mean - low_mean) / max_score,
+        'high_group_mean': high_mean,
+        'low_group_mean': low_mean,
+        'group_size': group_size,
+    }
@@ -0,0 +1,311 @@
+# 可合并的分数部分统计量
+"""
+学校级部分统计量（count / sum / sum of squares / min / max / 分数直方图）。
+
+部分统计量满足结合律，多个学校（或同一学校的多个分块）合并后的
+均值、标准差与极值与对全部学生直接计算的结果一致。
+
+直方图在 [0, 满分] 上按计分精度（默认0.5分）分箱。所有分数都落在分箱
+取值上时（exact=True）每个分箱只对应一个分数值，中位数、百分位数、
+等级人数、区分度高低分组均值、偏度/峰度都可以由直方图精确还原；
+否则百分位数按分箱下界估计，调用方应回退到原始分数计算。
+
+区域级指标与学校排名由各学校的部分统计量合并得到，单个学校成绩更正后
+只需重新计算该学校的部分统计量。
+"""
+
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_BIN_WIDTH = float(os.getenv("STATISTICS_SCORE_RESOLUTION", 0.5))
+# 分数与分箱取值的容差
+_GRID_TOLERANCE = 1e-9
+
+
+@dataclass
+class ScorePartial:
+    """单个分组（学校×科目或学校×科目×维度）的可合并统计量"""
+    count: int = 0
+    total: float = 0.0
+    total_sq: float = 0.0
+    min: Optional[float] = None
+    max: Optional[float] = None
+    # 满分：最大值与合计（满分以学生记录为单位取均值或最大值）
+    full_score_max: Optional[float] = None
+    full_score_sum: float = 0.0
+    bin_width: float = DEFAULT_BIN_WIDTH
+    histogram: Dict[int, int] = field(default_factory=dict)
+    # 所有分数都落在分箱取值上（直方图可精确还原分数分布）
+    exact: bool = True
+
+    @classmethod
+    def from_scores(cls, scores: Iterable[float], full_scores: Optional[Iterable[float]] = None,
+                    bin_width: float = DEFAULT_BIN_WIDTH) -> 'ScorePartial':
+        """由分数数组计算（NaN 忽略）"""
+        values = _as_array(scores)
+        valid = ~np.isnan(values)
+        values = values[valid]
+        partial = cls(bin_width=bin_width)
+        if values.size == 0:
+            return partial
+        partial.count = int(values.size)
+        partial.total = float(values.sum())
+        partial.total_sq = float(np.square(values).sum())
+        partial.min = float(values.min())
+        partial.max = float(values.max())
+        if full_scores is not None:
+            full = _as_array(full_scores)[valid]
+            full = full[~np.isnan(full)]
+            if full.size:
+                partial.full_score_max = float(full.max())
+                partial.full_score_sum = float(full.sum())
+        bins, exact = _bin_indices(values, bin_width)
+        bins, counts = np.unique(bins, return_counts=True)
+        partial.histogram = {int(b): int(c) for b, c in zip(bins, counts)}
+        partial.exact = bool(exact.all())
+        return partial
+
+    @classmethod
+    def from_grouped(cls, group_labels: Sequence[Hashable], scores: np.ndarray,
+                     full_score: Optional[float] = None,
+                     bin_width: float = DEFAULT_BIN_WIDTH) -> Dict[Hashable, 'ScorePartial']:
+        """一次分组计算多个分组（如学校）的部分统计量（向量化，不排序分数）"""
+        values = _as_array(scores)
+        labels = np.asarray(group_labels, dtype=object)
+        valid = ~np.isnan(values)
+        values, labels = values[valid], labels[valid]
+        if values.size == 0:
+            return {}
+        codes, uniques = pd.factorize(labels, sort=True)
+        k = len(uniques)
+        counts = np.bincount(codes, minlength=k)
+        totals = np.bincount(codes, weights=values, minlength=k)
+        totals_sq = np.bincount(codes, weights=values * values, minlength=k)
+        mins = np.full(k, np.inf)
+        maxs = np.full(k, -np.inf)
+        np.minimum.at(mins, codes, values)
+        np.maximum.at(maxs, codes, values)
+        bins, exact = _bin_indices(values, bin_width)
+        off_grid = np.bincount(codes, weights=(~exact).astype(np.float64), minlength=k)
+
+        pairs, pair_counts = np.unique(np.stack([codes, bins]), axis=1, return_counts=True)
+        histograms: List[Dict[int, int]] = [{} for _ in range(k)]
+        for code, b, c in zip(pairs[0], pairs[1], pair_counts):
+            histograms[code][int(b)] = int(c)
+
+        return {
+            uniques[i]: cls(
+                count=int(counts[i]),
+                total=float(totals[i]),
+                total_sq=float(totals_sq[i]),
+                min=float(mins[i]),
+                max=float(maxs[i]),
+                full_score_max=None if full_score is None else float(full_score),
+                full_score_sum=0.0 if full_score is None else float(full_score) * int(counts[i]),
+                bin_width=bin_width,
+                histogram=histograms[i],
+                exact=not off_grid[i],
+            )
+            for i in range(k)
+        }
+
+    def merge(self, other: 'ScorePartial') -> 'ScorePartial':
+        """合并两个部分统计量（返回新对象）"""
+        if self.count and other.count and self.bin_width != other.bin_width:
+            raise ValueError(f"直方图分箱宽度不一致: {self.bin_width} != {other.bin_width}")
+        histogram = dict(self.histogram)
+        for b, c in other.histogram.items():
+            histogram[b] = histogram.get(b, 0) + c
+        return ScorePartial(
+            count=self.count + other.count,
+            total=self.total + other.total,
+            total_sq=self.total_sq + other.total_sq,
+            min=_pick(min, self.min, other.min),
+            max=_pick(max, self.max, other.max),
+            full_score_max=_pick(max, self.full_score_max, other.full_score_max),
+            full_score_sum=self.full_score_sum + other.full_score_sum,
+            bin_width=self.bin_width if self.count else other.bin_width,
+            histogram=histogram,
+            exact=self.exact and other.exact,
+        )
+
+    @classmethod
+    def merge_all(cls, partials: Iterable['ScorePartial']) -> 'ScorePartial':
+        merged = cls()
+        for partial in partials:
+            merged = merged.merge(partial)
+        return merged
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    @property
+    def std(self) -> Optional[float]:
+        """总体标准差（与 STDDEV_POP 口径一致）"""
+        if not self.count:
+            return None
+        return math.sqrt(self._squared_deviations() / self.count)
+
+    @property
+    def sample_variance(self) -> float:
+        """样本方差（ddof=1，样本数不足2时为NaN）"""
+        if self.count < 2:
+            return float('nan')
+        return self._squared_deviations() / (self.count - 1)
+
+    def _squared_deviations(self) -> float:
+        """离差平方和：直方图精确时两遍计算，否则由平方和计算"""
+        mean = self.total / self.count
+        if self.exact and self.histogram:
+            values, counts = self.bin_values()
+            deviations = values - mean
+            return float(np.dot(counts, deviations * deviations))
+        return max(self.total_sq - self.count * mean * mean, 0.0)
+
+    def bin_values(self) -> Tuple[np.ndarray, np.ndarray]:
+        """按分数升序的 (分箱取值, 人数)"""
+        bins = np.array(sorted(self.histogram), dtype=np.int64)
+        counts = np.array([self.histogram[b] for b in bins], dtype=np.float64)
+        return np.round(bins * self.bin_width, 10), counts
+
+    @property
+    def full_score_mean(self) -> Optional[float]:
+        return self.full_score_sum / self.count if self.count else None
+
+    def percentile(self, p: float) -> Optional[float]:
+        """百分位数（教育统计 floor(n*p/100) 算法）；直方图不精确时为所在分箱下界"""
+        if not self.count:
+            return None
+        return self.value_at(min(int(math.floor(self.count * p / 100.0)), self.count - 1))
+
+    def value_at(self, rank: int) -> float:
+        """升序排序后第 rank 个分数（从0开始）"""
+        values, counts = self.bin_values()
+        position = int(np.searchsorted(np.cumsum(counts), rank, side='right'))
+        value = float(values[min(position, len(values) - 1)])
+        return value if self.exact else max(value, self.min)
+
+    @property
+    def median(self) -> Optional[float]:
+        if not self.count:
+            return None
+        half = self.count // 2
+        lower = half - 1 if self.count % 2 == 0 else half
+        return (self.value_at(half) + self.value_at(lower)) / 2.0
+
+    def count_at_least(self, threshold: float) -> int:
+        """不低于阈值的人数（直方图精确时与逐个比较一致）"""
+        values, counts = self.bin_values()
+        return int(counts[values >= threshold].sum())
+
+    def extreme_group_means(self, size: int) -> Tuple[float, float]:
+        """最高与最低 size 个分数的平均分"""
+        values, counts = self.bin_values()
+        return _take_mean(values[::-1], counts[::-1], size), _take_mean(values, counts, size)
+
+    def shape_statistics(self) -> Dict[str, Optional[float]]:
+        """偏度、峰度（与 pandas 无偏估计口径一致）与众数，由精确直方图计算"""
+        values, counts = self.bin_values()
+        n = self.count
+        mean = self.total / n
+        deviations = values - mean
+        m2 = float(np.dot(counts, deviations ** 2))
+        m3 = float(np.dot(counts, deviations ** 3))
+        m4 = float(np.dot(counts, deviations ** 4))
+        skewness = kurtosis = float('nan')
+        if n >= 3:
+            skewness = 0.0 if m2 == 0 else (
+                math.sqrt(n * (n - 1)) / (n - 2) * (m3 / n) / (m2 / n) ** 1.5
+            )
+        if n >= 4:
+            kurtosis = 0.0 if m2 == 0 else (
+                (n + 1) * n * (n - 1) / ((n - 2) * (n - 3)) * m4 / (m2 * m2)
+                - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+            )
+        mode = float(values[int(np.argmax(counts))]) if len(values) else None
+        return {'skewness': skewness, 'kurtosis': kurtosis, 'mode': mode}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'total': self.total,
+            'total_sq': self.total_sq,
+            'min': self.min,
+            'max': self.max,
+            'full_score_max': self.full_score_max,
+            'full_score_sum': self.full_score_sum,
+            'bin_width': self.bin_width,
+            'histogram': {str(b): c for b, c in sorted(self.histogram.items())},
+            'exact': self.exact,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ScorePartial':
+        return cls(
+            count=int(data.get('count') or 0),
+            total=float(data.get('total') or 0),
+            total_sq=float(data.get('total_sq') or 0),
+            min=_optional_float(data.get('min')),
+            max=_optional_float(data.get('max')),
+            full_score_max=_optional_float(data.get('full_score_max')),
+            full_score_sum=float(data.get('full_score_sum') or 0),
+            bin_width=float(data.get('bin_width') or DEFAULT_BIN_WIDTH),
+            histogram={int(b): int(c) for b, c in (data.get('histogram') or {}).items()},
+            exact=bool(data.get('exact', True)),
+        )
+
+
+def merge_partial_rows(rows: Iterable[Dict[str, Any]],
+                       key: Callable[[Dict[str, Any]], Hashable] = lambda row: (row['subject_name'],
+                                                                                 row['dimension_code'])
+                       ) -> Dict[Hashable, ScorePartial]:
+    """按键合并部分统计量行（默认按 科目×维度 合并全部学校，即区域级汇总）
+
+    Args:
+        rows: SchoolPartialRepository.get_partials 的结果（可来自多个批次）
+    """
+    merged: Dict[Hashable, ScorePartial] = {}
+    for row in rows:
+        k = key(row)
+        partial = ScorePartial.from_dict(row['partial'])
+        merged[k] = merged[k].merge(partial) if k in merged else partial
+    return merged
+
+
+def _as_array(values: Iterable[float]) -> np.ndarray:
+    if isinstance(values, np.ndarray):
+        return values.astype(np.float64, copy=False)
+    return np.asarray(list(values), dtype=np.float64)
+
+
+def _bin_indices(values: np.ndarray, bin_width: float) -> Tuple[np.ndarray, np.ndarray]:
+    """分箱序号与每个分数是否恰好落在分箱取值上"""
+    scaled = values / bin_width
+    nearest = np.rint(scaled)
+    exact = np.abs(scaled - nearest) <= _GRID_TOLERANCE * np.maximum(1.0, np.abs(scaled))
+    return np.where(exact, nearest, np.floor(scaled)).astype(np.int64), exact
+
+
+def _take_mean(values: np.ndarray, counts: np.ndarray, size: int) -> float:
+    """按顺序取前 size 个分数的平均值"""
+    cumulative = np.cumsum(counts)
+    taken = np.minimum(counts, np.maximum(size - (cumulative - counts), 0))
+    return float(np.dot(values, taken) / size)
+
+
+def _pick(func, a: Optional[float], b: Optional[float]) -> Optional[float]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return func(a, b)
+
+
+def _optional_float(value: Any) -> Optional[float]:
+    return None if value is None else float(value)
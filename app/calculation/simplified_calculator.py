@@ -11,6 +11,7 @@ from ..utils.precision_handler import (
     create_statistics_summary, validate_numeric_ranges, safe_divide
 )
 from ..database.enums import SubjectType
+from .order_statistics import order_statistics
 
 logger = logging.getLogger(__name__)
 
@@ -264,15 +265,10 @@ class SimplifiedStatisticsCalculator:
             if len(scores) < 10:
                 return None
             
-            scores_sorted = scores.sort_values(ascending=False)
-            n = len(scores_sorted)
-            
             # 前27%和后27%
-            high_group_size = max(1, int(n * 0.27))
-            low_group_size = max(1, int(n * 0.27))
-            
-            high_group_mean = scores_sorted.iloc[:high_group_size].mean()
-            low_group_mean = scores_sorted.iloc[-low_group_size:].mean()
+            stats = order_statistics(scores.to_numpy(dtype=np.float64), percentiles=())
+            high_group_mean = stats['high_group_mean']
+            low_group_mean = stats['low_group_mean']
             
             discrimination = (high_group_mean - low_group_mean) / max_score
             return format_decimal(discrimination, 4)  # 区分度保留4位小数
@@ -284,17 +280,9 @@ class SimplifiedStatisticsCalculator:
     def _calculate_percentiles(self, scores: pd.Series, percentiles: List[int]) -> Dict[str, Optional[float]]:
         """计算百分位数"""
         try:
-            scores_sorted = scores.sort_values()
-            n = len(scores_sorted)
-            result = {}
-            
-            for p in percentiles:
-                # 使用教育统计标准算法
-                rank = int(np.floor(n * p / 100.0))
-                rank = max(0, min(rank, n - 1))
-                result[f'P{p}'] = format_decimal(scores_sorted.iloc[rank])
-            
-            return result
+            # 使用教育统计标准算法
+            values = order_statistics(scores.to_numpy(dtype=np.float64), percentiles)['percentiles']
+            return {f'P{p}': format_decimal(values[f'P{p}']) for p in percentiles}
         
         except Exception as e:
             logger.warning(f"计算百分位数失败: {str(e)}")
@@ -0,0 +1,129 @@
+# 科目指标融合计算策略
+"""
+科目/维度统计的融合策略（subject_metrics）。
+
+区域级与学校级的每个科目和维度原先需要分别调用 basic_statistics、
+educational_metrics、percentiles、discrimination 四个策略，每次调用都要
+重新验证输入、优化 DataFrame 内存并转换分数类型。融合策略直接接收
+float64 分数数组，只验证一次、排序一次，由同一个有序数组得到四组结果，
+各字段口径与四个单独策略一致。
+"""
+
+import math
+from typing import Any, Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+from .engine import StatisticalStrategy
+from .grouped_statistics import statistics_from_segments
+from .order_statistics import SortedSegments
+
+RESULT_GROUPS = ('basic_statistics', 'educational_metrics', 'percentiles', 'discrimination')
+
+
+def score_array(data: Union[np.ndarray, pd.DataFrame, pd.Series, List[float]]) -> np.ndarray:
+    """将输入转换为 float64 分数数组（DataFrame 取 score 列）"""
+    if isinstance(data, pd.DataFrame):
+        if 'score' not in data.columns:
+            raise ValueError("数据中缺少'score'列")
+        data = pd.to_numeric(data['score'], errors='coerce')
+    if isinstance(data, pd.Series):
+        return data.to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.asarray(data, dtype=np.float64)
+
+
+class SubjectMetricsStrategy(StatisticalStrategy):
+    """科目指标融合策略：一次计算基础统计、教育指标、百分位数和区分度"""
+
+    def calculate(self, data: Union[np.ndarray, pd.DataFrame], config: Dict[str, Any]) -> Dict[str, Any]:
+        """返回 {'basic_statistics', 'educational_metrics', 'percentiles', 'discrimination'}
+
+        样本数少于 min_discrimination_size（默认10）时 discrimination 为 None。
+        """
+        scores = score_array(data)
+        ordered = np.sort(scores[~np.isnan(scores)])
+        n = len(ordered)
+        if n == 0:
+            raise ValueError("没有有效的分数数据")
+
+        segment = SortedSegments(
+            labels=np.array([0], dtype=object),
+            scores=ordered,
+            starts=np.array([0], dtype=np.intp),
+            counts=np.array([n], dtype=np.intp),
+        )
+        result = statistics_from_segments(segment, config)[0]
+        result['basic_statistics'].update(_shape_statistics(ordered, result['basic_statistics']['mean']))
+        return result
+
+    def validate_input(self, data: Union[np.ndarray, pd.DataFrame], config: Dict[str, Any]) -> Dict[str, Any]:
+        """验证输入数据（四组指标共用一次验证）"""
+        validation_result = {
+            'is_valid': True,
+            'errors': [],
+            'warnings': [],
+            'stats': {}
+        }
+
+        try:
+            scores = score_array(data)
+        except (ValueError, TypeError) as e:
+            validation_result['is_valid'] = False
+            validation_result['errors'].append(str(e))
+            return validation_result
+
+        valid_count = int(np.count_nonzero(~np.isnan(scores)))
+        max_score = config.get('max_score', 100)
+
+        if len(scores) == 0:
+            validation_result['is_valid'] = False
+            validation_result['errors'].append("数据集为空")
+        elif valid_count == 0:
+            validation_result['is_valid'] = False
+            validation_result['errors'].append("没有有效的分数数据")
+        elif valid_count < len(scores):
+            validation_result['warnings'].append(f"发现{len(scores) - valid_count}个无效分数值")
+
+        if max_score <= 0:
+            validation_result['is_valid'] = False
+            validation_result['errors'].append("满分配置无效")
+
+        validation_result['stats']['total_records'] = len(scores)
+        validation_result['stats']['valid_scores'] = valid_count
+        return validation_result
+
+    def get_algorithm_info(self) -> Dict[str, str]:
+        return {
+            'name': 'SubjectMetrics',
+            'version': '1.0',
+            'description': '科目指标融合计算（基础统计、教育指标、百分位数、区分度）',
+            'std_formula': 'sample_std_ddof_1',
+            'percentile_algorithm': 'floor(n * p / 100)',
+            'discrimination_formula': '(高分组平均分 - 低分组平均分) / 满分'
+        }
+
+
+def _shape_statistics(ordered: np.ndarray, mean: float) -> Dict[str, Any]:
+    """偏度、峰度（与 pandas skew/kurtosis 无偏估计口径一致）与众数（最小的最高频分数）"""
+    n = len(ordered)
+    deviations = ordered - mean
+    squared = deviations * deviations
+    m2 = float(squared.sum())
+    m3 = float((squared * deviations).sum())
+    m4 = float((squared * squared).sum())
+
+    skewness = kurtosis = float('nan')
+    if n >= 3:
+        skewness = 0.0 if m2 == 0 else math.sqrt(n * (n - 1)) / (n - 2) * (m3 / n) / (m2 / n) ** 1.5
+    if n >= 4:
+        kurtosis = 0.0 if m2 == 0 else (
+            (n + 1) * n * (n - 1) / ((n - 2) * (n - 3)) * m4 / (m2 * m2)
+            - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+        )
+
+    run_starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    run_lengths = np.diff(np.r_[run_starts, n])
+    mode = float(ordered[run_starts[int(np.argmax(run_lengths))]])
+
+    return {'skewness': skewness, 'kurtosis': kurtosis, 'mode': mode}
@@ -4,7 +4,9 @@ from .survey_strategies import (
     ScaleTransformationStrategy,
     FrequencyAnalysisStrategy, 
     DimensionAggregationStrategy,
-    SurveyQualityStrategy
+    SurveyQualityStrategy,
+    ItemMatrix,
+    transform_items
 )
 
 __all__ = [
@@ -15,5 +17,7 @@ __all__ = [
     'ScaleTransformationStrategy',
     'FrequencyAnalysisStrategy',
     'DimensionAggregationStrategy',
-    'SurveyQualityStrategy'
+    'SurveyQualityStrategy',
+    'ItemMatrix',
+    'transform_items'
 ]
\ No newline at end of file
@@ -2,12 +2,28 @@
 import numpy as np
 import pandas as pd
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 from ..engine import StatisticalStrategy
 from .scale_config import ScaleConfigManager, SCALE_TYPES, QUALITY_RULES
 
 logger = logging.getLogger(__name__)
 
+SCALE_DIRECTIONS = ('forward', 'reverse')
+
+
+class ItemMatrix(NamedTuple):
+    """列式量表转换结果
+
+    values 为 (作答人数 × 题目) 的转换后分值矩阵，缺失或不在映射中的取值为 NaN；
+    同一题目在不同维度中方向不同时各占一列。scores 为 (作答人数 × 维度) 的维度得分矩阵。
+    """
+    items: List[Tuple[str, str]]            # 每列对应的 (题目, 方向)
+    values: np.ndarray
+    latest: Dict[str, int]                  # 题目 -> 最后一次处理时使用的列序号
+    dimensions: List[str]                   # 至少有一道题存在于数据中的维度
+    question_counts: List[int]
+    scores: np.ndarray
+
 
 class ScaleTransformationStrategy(StatisticalStrategy):
     """量表转换计算策略"""
@@ -16,7 +32,10 @@ class ScaleTransformationStrategy(StatisticalStrategy):
         self.scale_manager = ScaleConfigManager()
     
     def calculate(self, data: pd.DataFrame, config: Dict[str, Any]) -> Dict[str, Any]:
-        """执行量表转换计算"""
+        """执行量表转换计算
+
+        config['include_transformed_data'] 为 False 时不生成逐行的 transformed_data。
+        """
         dimensions = config.get('dimensions', {})
         scale_config = config.get('scale_config', SCALE_TYPES)
         
@@ -29,79 +48,42 @@ class ScaleTransformationStrategy(StatisticalStrategy):
             'dimension_scores': {}
         }
         
-        transformed_data = data.copy()
-        transformation_summary = {}
+        matrix = transform_items(data, dimensions, scale_config)
+        
+        # 维度统计
+        for j, dimension_name in enumerate(matrix.dimensions):
+            dimension_scores = pd.Series(matrix.scores[:, j])
+            dimension_weight = dimensions[dimension_name].get('weight', 1.0)
+            weighted_scores = dimension_scores * dimension_weight
+            
+            results['dimension_scores'][dimension_name] = {
+                'mean': float(dimension_scores.mean()),
+                'std': float(dimension_scores.std()),
+                'median': float(dimension_scores.median()),
+                'min': float(dimension_scores.min()),
+                'max': float(dimension_scores.max()),
+                'count': int(dimension_scores.notna().sum()),
+                'weight': dimension_weight,
+                'weighted_mean': float(weighted_scores.mean()),
+                'questions_count': matrix.question_counts[j]
+            }
         
-        # 按维度处理题目
-        for dimension_name, dimension_config in dimensions.items():
-            dim_transformed_cols = []
-            
-            # 处理正向题目
-            forward_questions = dimension_config.get('forward_questions', [])
-            for question in forward_questions:
-                if question in data.columns:
-                    transformed_col = f'{question}_transformed'
-                    transformed_data[transformed_col] = data[question].map(
-                        scale_config['forward']
-                    ).astype('Int64')  # 使用nullable integer
-                    dim_transformed_cols.append(transformed_col)
-                    
-                    # 记录转换统计
-                    original_stats = data[question].value_counts().to_dict()
-                    transformed_stats = transformed_data[transformed_col].value_counts().to_dict()
-                    transformation_summary[question] = {
-                        'type': 'forward',
-                        'original_distribution': original_stats,
-                        'transformed_distribution': transformed_stats,
-                        'valid_count': transformed_data[transformed_col].notna().sum()
-                    }
-            
-            # 处理反向题目
-            reverse_questions = dimension_config.get('reverse_questions', [])
-            for question in reverse_questions:
-                if question in data.columns:
-                    transformed_col = f'{question}_transformed'
-                    transformed_data[transformed_col] = data[question].map(
-                        scale_config['reverse']
-                    ).astype('Int64')  # 使用nullable integer
-                    dim_transformed_cols.append(transformed_col)
-                    
-                    # 记录转换统计
-                    original_stats = data[question].value_counts().to_dict()
-                    transformed_stats = transformed_data[transformed_col].value_counts().to_dict()
-                    transformation_summary[question] = {
-                        'type': 'reverse',
-                        'original_distribution': original_stats,
-                        'transformed_distribution': transformed_stats,
-                        'valid_count': transformed_data[transformed_col].notna().sum()
-                    }
-            
-            # 计算维度得分
-            if dim_transformed_cols:
-                dimension_scores = transformed_data[dim_transformed_cols].mean(axis=1, skipna=True)
-                dimension_scores.name = f'{dimension_name}_score'
-                transformed_data[dimension_scores.name] = dimension_scores
-                
-                # 维度统计
-                dimension_weight = dimension_config.get('weight', 1.0)
-                weighted_scores = dimension_scores * dimension_weight
-                
-                results['dimension_scores'][dimension_name] = {
-                    'mean': float(dimension_scores.mean()),
-                    'std': float(dimension_scores.std()),
-                    'median': float(dimension_scores.median()),
-                    'min': float(dimension_scores.min()),
-                    'max': float(dimension_scores.max()),
-                    'count': int(dimension_scores.notna().sum()),
-                    'weight': dimension_weight,
-                    'weighted_mean': float(weighted_scores.mean()),
-                    'questions_count': len(dim_transformed_cols)
-                }
+        # 转换统计（同一题目出现多次时以最后一次处理为准）
+        transformed_columns = {}
+        for question, column in matrix.latest.items():
+            transformed = pd.Series(matrix.values[:, column], index=data.index).astype('Int64')
+            transformed_columns[question] = transformed
+            results['transformation_summary'][question] = {
+                'type': matrix.items[column][1],
+                'original_distribution': data[question].value_counts().to_dict(),
+                'transformed_distribution': transformed.value_counts().to_dict(),
+                'valid_count': int(transformed.notna().sum())
+            }
         
-        # 提取转换后的数据（仅包含转换列）
-        transformed_cols = [col for col in transformed_data.columns if col.endswith('_transformed') or col.endswith('_score')]
-        results['transformed_data'] = transformed_data[transformed_cols].to_dict()
-        results['transformation_summary'] = transformation_summary
+        if config.get('include_transformed_data', True):
+            results['transformed_data'] = _materialize_transformed_data(
+                data, dimensions, matrix, transformed_columns
+            )
         
         return results
     
@@ -315,9 +297,8 @@ class DimensionAggregationStrategy(StatisticalStrategy):
         if not dimensions:
             raise ValueError("未提供维度配置")
         
-        # 首先进行量表转换
-        transformation_strategy = ScaleTransformationStrategy()
-        transformation_result = transformation_strategy.calculate(data, config)
+        # 首先进行量表转换（列式计算，不生成逐行转换数据）
+        matrix = transform_items(data, dimensions, config.get('scale_config', SCALE_TYPES))
         
         results = {
             'dimension_statistics': {},
@@ -327,27 +308,14 @@ class DimensionAggregationStrategy(StatisticalStrategy):
         
         # 获取维度得分数据
         dimension_scores = {}
+        score_columns = {name: j for j, name in enumerate(matrix.dimensions)}
         for dimension_name, dimension_config in dimensions.items():
-            score_col = f'{dimension_name}_score'
-            
-            # 从转换结果或数据中获取维度得分
-            if score_col in transformation_result.get('transformed_data', {}):
-                scores = pd.Series(transformation_result['transformed_data'][score_col])
+            if dimension_name in score_columns:
+                scores = pd.Series(matrix.scores[:, score_columns[dimension_name]], index=data.index)
             else:
-                # 手动计算维度得分
-                all_questions = (dimension_config.get('forward_questions', []) + 
-                               dimension_config.get('reverse_questions', []))
-                question_scores = []
-                
-                for question in all_questions:
-                    transformed_col = f'{question}_transformed'
-                    if transformed_col in transformation_result.get('transformed_data', {}):
-                        question_scores.append(pd.Series(transformation_result['transformed_data'][transformed_col]))
-                
-                if question_scores:
-                    scores_df = pd.DataFrame(question_scores).T
-                    scores = scores_df.mean(axis=1, skipna=True)
-                else:
+                # 输入为已转换数据时，直接使用其中的维度得分列或题目转换列
+                scores = self._pretransformed_scores(data, dimension_name, dimension_config)
+                if scores is None:
                     continue
             
             scores = scores.dropna()
@@ -415,17 +383,14 @@ class DimensionAggregationStrategy(StatisticalStrategy):
             results['dimension_correlations'] = correlations
         
         # 整体问卷指标
-        all_scores = []
-        all_weighted_scores = []
-        total_weight = 0
-        
-        for dimension_name, scores in dimension_scores.items():
-            weight = dimensions[dimension_name].get('weight', 1.0)
-            all_scores.extend(scores.tolist())
-            all_weighted_scores.extend((scores * weight).tolist())
-            total_weight += weight
-        
-        if all_scores:
+        if dimension_scores:
+            weights = [dimensions[name].get('weight', 1.0) for name in dimension_scores]
+            all_scores = np.concatenate([scores.to_numpy() for scores in dimension_scores.values()])
+            all_weighted_scores = np.concatenate([
+                scores.to_numpy() * weight for scores, weight in zip(dimension_scores.values(), weights)
+            ])
+            total_weight = sum(weights)
+            
             results['overall_survey_metrics'] = {
                 'total_dimensions': len(dimension_scores),
                 'total_responses': len(data),
@@ -438,6 +403,27 @@ class DimensionAggregationStrategy(StatisticalStrategy):
         
         return results
     
+    def _pretransformed_scores(self, data: pd.DataFrame, dimension_name: str,
+                               dimension_config: Dict[str, Any]) -> Optional[pd.Series]:
+        """从已有的 {维度}_score 列或 {题目}_transformed 列得到维度得分"""
+        score_col = f'{dimension_name}_score'
+        if score_col in data.columns:
+            return pd.to_numeric(data[score_col], errors='coerce')
+        
+        transformed_cols = [
+            f'{question}_transformed'
+            for question in dimension_config.get('forward_questions', []) + dimension_config.get('reverse_questions', [])
+            if f'{question}_transformed' in data.columns
+        ]
+        if not transformed_cols:
+            return None
+        
+        values = _numeric_matrix(data[transformed_cols])
+        answered = ~np.isnan(values)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(answered, values, 0.0).sum(axis=1) / answered.sum(axis=1)
+        return pd.Series(means, index=data.index)
+    
     def _interpret_correlation_strength(self, correlation: float) -> str:
         """解释相关性强度"""
         if correlation < 0.3:
@@ -529,10 +515,11 @@ class SurveyQualityStrategy(StatisticalStrategy):
         total_issues += low_completion
         
         # 2. 连续相同选项检查（直线响应）
+        # 响应矩阵只构建一次，计数与索引共用同一组逐行标记
+        response_data = data[questions]
         straight_line_max = quality_rules.get('straight_line_max', 10)
-        straight_line_responses = self._detect_straight_line_responses(
-            data[questions], straight_line_max
-        )
+        straight_line_mask = self._straight_line_mask(response_data, straight_line_max)
+        straight_line_responses = int(straight_line_mask.sum())
         
         results['quality_flags']['straight_line'] = {
             'count': int(straight_line_responses),
@@ -543,9 +530,9 @@ class SurveyQualityStrategy(StatisticalStrategy):
         
         # 3. 无变化响应检查
         variance_threshold = quality_rules.get('variance_threshold', 0.1)
-        no_variance_count = self._detect_no_variance_responses(
-            data[questions], variance_threshold
-        )
+        row_variances = _row_variances(response_data)
+        no_variance_mask = self._no_variance_mask(response_data, variance_threshold, row_variances)
+        no_variance_count = int(no_variance_mask.sum())
         
         results['quality_flags']['no_variance'] = {
             'count': int(no_variance_count),
@@ -566,11 +553,8 @@ class SurveyQualityStrategy(StatisticalStrategy):
         total_issues += sum(pattern_issues.values())
         
         # 计算有效响应数
-        valid_responses = len(data) - len(set(
-            data.index[completion_rates < min_completion_rate].tolist() +
-            self._get_straight_line_indices(data[questions], straight_line_max) +
-            self._get_no_variance_indices(data[questions], variance_threshold)
-        ))
+        invalid_mask = (completion_rates < min_completion_rate).to_numpy() | straight_line_mask | no_variance_mask
+        valid_responses = len(data) - len(set(data.index[invalid_mask].tolist()))
         
         # 更新汇总信息
         results['quality_summary']['valid_responses'] = valid_responses
@@ -580,7 +564,7 @@ class SurveyQualityStrategy(StatisticalStrategy):
         # 详细分析
         results['detailed_analysis'] = {
             'completion_analysis': self._analyze_completion_patterns(data[questions]),
-            'response_variance_analysis': self._analyze_response_variance(data[questions]),
+            'response_variance_analysis': self._analyze_response_variance(response_data, row_variances),
             'extreme_responses_analysis': self._analyze_extreme_responses(data[questions])
         }
         
@@ -591,90 +575,32 @@ class SurveyQualityStrategy(StatisticalStrategy):
     
     def _detect_straight_line_responses(self, data: pd.DataFrame, max_consecutive: int) -> int:
         """检测连续相同选项响应"""
-        straight_line_count = 0
-        
-        for index, row in data.iterrows():
-            valid_responses = row.dropna()
-            if len(valid_responses) < 3:  # 至少需要3个响应才能判断
-                continue
-            
-            consecutive_count = 1
-            max_consecutive_in_row = 1
-            
-            for i in range(1, len(valid_responses)):
-                if valid_responses.iloc[i] == valid_responses.iloc[i-1]:
-                    consecutive_count += 1
-                    max_consecutive_in_row = max(max_consecutive_in_row, consecutive_count)
-                else:
-                    consecutive_count = 1
-            
-            if max_consecutive_in_row >= max_consecutive:
-                straight_line_count += 1
-        
-        return straight_line_count
+        return int(self._straight_line_mask(data, max_consecutive).sum())
     
     def _get_straight_line_indices(self, data: pd.DataFrame, max_consecutive: int) -> List[int]:
         """获取直线响应的索引列表"""
-        straight_line_indices = []
-        
-        for index, row in data.iterrows():
-            valid_responses = row.dropna()
-            if len(valid_responses) < 3:
-                continue
-            
-            consecutive_count = 1
-            max_consecutive_in_row = 1
-            
-            for i in range(1, len(valid_responses)):
-                if valid_responses.iloc[i] == valid_responses.iloc[i-1]:
-                    consecutive_count += 1
-                    max_consecutive_in_row = max(max_consecutive_in_row, consecutive_count)
-                else:
-                    consecutive_count = 1
-            
-            if max_consecutive_in_row >= max_consecutive:
-                straight_line_indices.append(index)
-        
-        return straight_line_indices
+        return data.index[self._straight_line_mask(data, max_consecutive)].tolist()
     
     def _detect_no_variance_responses(self, data: pd.DataFrame, variance_threshold: float) -> int:
         """检测无变化响应"""
-        no_variance_count = 0
-        
-        for index, row in data.iterrows():
-            valid_responses = row.dropna()
-            if len(valid_responses) < 3:
-                continue
-            
-            # 转换为数值类型
-            numeric_responses = pd.to_numeric(valid_responses, errors='coerce').dropna()
-            if len(numeric_responses) < 3:
-                continue
-            
-            variance = numeric_responses.var()
-            if pd.notna(variance) and variance <= variance_threshold:
-                no_variance_count += 1
-        
-        return no_variance_count
+        return int(self._no_variance_mask(data, variance_threshold).sum())
     
     def _get_no_variance_indices(self, data: pd.DataFrame, variance_threshold: float) -> List[int]:
         """获取无变化响应的索引列表"""
-        no_variance_indices = []
-        
-        for index, row in data.iterrows():
-            valid_responses = row.dropna()
-            if len(valid_responses) < 3:
-                continue
-            
-            numeric_responses = pd.to_numeric(valid_responses, errors='coerce').dropna()
-            if len(numeric_responses) < 3:
-                continue
-            
-            variance = numeric_responses.var()
-            if pd.notna(variance) and variance <= variance_threshold:
-                no_variance_indices.append(index)
-        
-        return no_variance_indices
+        return data.index[self._no_variance_mask(data, variance_threshold)].tolist()
+    
+    def _straight_line_mask(self, data: pd.DataFrame, max_consecutive: int) -> np.ndarray:
+        """直线响应标记：去除缺失值后至少3个响应，且最长连续相同选项数达到阈值"""
+        longest, valid_counts = _longest_runs(data)
+        return (valid_counts >= 3) & (longest >= max_consecutive)
+    
+    def _no_variance_mask(self, data: pd.DataFrame, variance_threshold: float,
+                          variances: Optional[np.ndarray] = None) -> np.ndarray:
+        """无变化响应标记：至少3个数值响应，且样本方差不超过阈值"""
+        if variances is None:
+            variances = _row_variances(data)
+        with np.errstate(invalid='ignore'):
+            return ~np.isnan(variances) & (variances <= variance_threshold)
     
     def _check_response_time(self, response_times: pd.Series, quality_rules: Dict[str, Any]) -> Dict[str, Any]:
         """检查响应时间"""
@@ -752,20 +678,16 @@ class SurveyQualityStrategy(StatisticalStrategy):
             'no_completion_count': int((completion_rates == 0.0).sum())
         }
     
-    def _analyze_response_variance(self, data: pd.DataFrame) -> Dict[str, Any]:
+    def _analyze_response_variance(self, data: pd.DataFrame,
+                                   row_variances: Optional[np.ndarray] = None) -> Dict[str, Any]:
         """分析响应变异性"""
-        variances = []
+        if row_variances is None:
+            row_variances = _row_variances(data)
+        variances = pd.Series(row_variances[~np.isnan(row_variances)])
         
-        for index, row in data.iterrows():
-            numeric_row = pd.to_numeric(row, errors='coerce').dropna()
-            if len(numeric_row) >= 3:
-                variances.append(numeric_row.var())
-        
-        if not variances:
+        if variances.empty:
             return {'message': 'Insufficient data for variance analysis'}
         
-        variances = pd.Series(variances)
-        
         return {
             'mean_variance': float(variances.mean()),
             'std_variance': float(variances.std()),
@@ -876,4 +798,167 @@ class SurveyQualityStrategy(StatisticalStrategy):
             'description': '问卷数据质量检查：检测完成率、直线响应、响应时间等质量指标',
             'quality_dimensions': 'completion,straightlining,variance,timing,patterns',
             'recommendation_engine': 'rule_based'
-        }
\ No newline at end of file
+        }
+
+
+def transform_items(data: pd.DataFrame, dimensions: Dict[str, Dict[str, Any]],
+                    scale_config: Dict[str, Dict[Any, Any]]) -> ItemMatrix:
+    """列式量表转换：按方向对题目矩阵查表映射，维度得分由题目-维度关联矩阵一次求得
+
+    与逐列 Series.map 结果一致：不在映射中的取值（含非整数分值）记为缺失，
+    维度得分为各题转换分值忽略缺失后的均值。
+    """
+    items: List[Tuple[str, str]] = []
+    positions: Dict[Tuple[str, str], int] = {}
+    latest: Dict[str, int] = {}
+    dimension_names: List[str] = []
+    dimension_columns: List[List[int]] = []
+
+    for dimension_name, dimension_config in dimensions.items():
+        columns = []
+        for direction in SCALE_DIRECTIONS:
+            for question in dimension_config.get(f'{direction}_questions', []):
+                if question not in data.columns:
+                    continue
+                key = (question, direction)
+                if key not in positions:
+                    positions[key] = len(items)
+                    items.append(key)
+                columns.append(positions[key])
+                latest[question] = positions[key]
+        if columns:
+            dimension_names.append(dimension_name)
+            dimension_columns.append(columns)
+
+    values = np.full((len(data), len(items)), np.nan)
+    for direction in SCALE_DIRECTIONS:
+        indices = [i for i, (_, d) in enumerate(items) if d == direction]
+        if indices:
+            _remap_columns(data, [items[i][0] for i in indices], scale_config[direction], values, indices)
+
+    # 题目-维度关联矩阵（同一维度重复列出的题目按出现次数计权，与原逐列求均值一致）
+    incidence = np.zeros((len(items), len(dimension_names)))
+    for j, columns in enumerate(dimension_columns):
+        np.add.at(incidence[:, j], columns, 1.0)
+    answered = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = (np.where(answered, values, 0.0) @ incidence) / (answered @ incidence)
+
+    return ItemMatrix(
+        items=items,
+        values=values,
+        latest=latest,
+        dimensions=dimension_names,
+        question_counts=[len(columns) for columns in dimension_columns],
+        scores=scores,
+    )
+
+
+def _lookup_table(mapping: Dict[Any, Any]) -> Optional[Tuple[int, np.ndarray]]:
+    """整数选项映射转换为查找表 (最小选项, 表)；选项不全是整数时返回 None"""
+    keys = list(mapping)
+    if not keys or not all(isinstance(k, (int, np.integer)) and not isinstance(k, bool) for k in keys):
+        return None
+    low, high = int(min(keys)), int(max(keys))
+    if high - low > 1000:
+        return None
+    table = np.full(high - low + 1, np.nan)
+    for key, value in mapping.items():
+        table[int(key) - low] = np.nan if value is None else value
+    return low, table
+
+
+def _remap_columns(data: pd.DataFrame, questions: List[str], mapping: Dict[Any, Any],
+                   out: np.ndarray, indices: List[int]):
+    """将 questions 各列按 mapping 映射后写入 out 的 indices 列"""
+    table = _lookup_table(mapping)
+    numeric = [
+        table is not None
+        and pd.api.types.is_numeric_dtype(data[q].dtype)
+        and not pd.api.types.is_bool_dtype(data[q].dtype)
+        for q in questions
+    ]
+
+    block = [i for i, is_numeric in enumerate(numeric) if is_numeric]
+    if block:
+        low, lut = table
+        raw = data[[questions[i] for i in block]].to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(invalid='ignore'):
+            offsets = raw - low
+            mapped = (offsets >= 0) & (offsets < len(lut)) & (offsets == np.floor(offsets))
+        positions = np.where(mapped, offsets, 0).astype(np.intp)
+        out[:, [indices[i] for i in block]] = np.where(mapped, lut[positions], np.nan)
+
+    # 非数值列（或映射键不是整数）按原始取值逐列映射
+    for i, is_numeric in enumerate(numeric):
+        if not is_numeric:
+            out[:, indices[i]] = pd.to_numeric(
+                data[questions[i]].map(mapping), errors='coerce'
+            ).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _materialize_transformed_data(data: pd.DataFrame, dimensions: Dict[str, Dict[str, Any]],
+                                  matrix: ItemMatrix, transformed_columns: Dict[str, pd.Series]) -> Dict[str, Any]:
+    """生成逐行的转换数据字典（原始数据中的 _transformed/_score 列、各题转换列与维度得分列）"""
+    columns: Dict[str, Any] = {
+        col: data[col] for col in data.columns
+        if col.endswith('_transformed') or col.endswith('_score')
+    }
+    scored = set(matrix.dimensions)
+    for dimension_name, dimension_config in dimensions.items():
+        for direction in SCALE_DIRECTIONS:
+            for question in dimension_config.get(f'{direction}_questions', []):
+                if question in transformed_columns:
+                    columns[f'{question}_transformed'] = transformed_columns[question]
+        if dimension_name in scored:
+            j = matrix.dimensions.index(dimension_name)
+            columns[f'{dimension_name}_score'] = pd.Series(matrix.scores[:, j], index=data.index)
+    return pd.DataFrame(columns, index=data.index).to_dict()
+
+
+def _numeric_matrix(data: pd.DataFrame) -> np.ndarray:
+    """逐元素转换为数值的二维响应矩阵（无法转换的值为 NaN）"""
+    if all(pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+           for dtype in data.dtypes):
+        return data.to_numpy(dtype=np.float64, na_value=np.nan)
+    return data.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _row_variances(data: pd.DataFrame) -> np.ndarray:
+    """每行数值响应的样本方差（ddof=1），数值响应少于3个的行为 NaN"""
+    values = _numeric_matrix(data)
+    valid = ~np.isnan(values)
+    counts = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(valid, values, 0.0).sum(axis=1) / counts
+        deviations = np.where(valid, values - means[:, None], 0.0)
+        variances = (deviations * deviations).sum(axis=1) / (counts - 1)
+    variances[counts < 3] = np.nan
+    return variances
+
+
+def _longest_runs(data: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """每行去除缺失值后最长的连续相同选项数，以及每行有效响应数
+
+    比较的是原始取值（'1' 与 1 视为不同选项）。缺失值先移到行尾使有效响应
+    连续排列，再由相邻相等标记的 cumsum 在不相等处清零得到游程长度。
+    """
+    n_rows, n_cols = data.shape
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in data.dtypes):
+        values = data.to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = ~np.isnan(values)
+    else:
+        codes, _ = pd.factorize(data.to_numpy(dtype=object).ravel())
+        values = codes.reshape(n_rows, n_cols)
+        valid = values >= 0
+    valid_counts = valid.sum(axis=1)
+    if n_cols < 2:
+        return np.ones(n_rows, dtype=np.intp), valid_counts
+
+    order = np.argsort(~valid, axis=1, kind='stable')
+    packed = np.take_along_axis(values, order, axis=1)
+    same = (packed[:, 1:] == packed[:, :-1]) & (np.arange(1, n_cols) < valid_counts[:, None])
+
+    running = np.cumsum(same, axis=1)
+    resets = np.maximum.accumulate(np.where(same, 0, running), axis=1)
+    return (running - resets).max(axis=1) + 1, valid_counts
@@ -0,0 +1,84 @@
+# 统计汇聚批量写入
+"""
+statistical_aggregations 的 Core 级批量 upsert。
+
+每个分块生成一条多行 INSERT ... ON DUPLICATE KEY UPDATE，冲突由唯一键
+uk_batch_level_school_name 判定。MySQL 唯一键中的 NULL 互不冲突，
+区域级记录（school_id 为空）和未填写学校名称的学校记录无法依赖唯一键去重，
+这些行需要先解析出已有记录的 id 并随 INSERT 一起写入，由主键冲突触发更新。
+"""
+
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from .enums import AggregationLevel, CalculationStatus
+from .models import StatisticalAggregation
+
+DEFAULT_UPSERT_CHUNK_SIZE = int(os.getenv("STATISTICS_UPSERT_CHUNK_SIZE", 500))
+
+KEY_COLUMNS = ('batch_code', 'aggregation_level', 'school_id', 'school_name')
+# 冲突时保留原值的列
+_IMMUTABLE_COLUMNS = KEY_COLUMNS + ('id', 'created_at')
+
+AggregationKey = Tuple[Any, str, Optional[str], Optional[str]]
+
+
+def aggregation_key(batch_code: Any, aggregation_level: Any,
+                    school_id: Optional[str], school_name: Optional[str]) -> AggregationKey:
+    """唯一键元组（汇聚级别统一为枚举名）"""
+    return batch_code, to_aggregation_level(aggregation_level).name, school_id, school_name
+
+
+def item_key(item: Dict[str, Any]) -> AggregationKey:
+    return aggregation_key(item['batch_code'], item['aggregation_level'],
+                           item.get('school_id'), item.get('school_name'))
+
+
+def has_null_key(item: Dict[str, Any]) -> bool:
+    """唯一键中存在NULL，MySQL 不会判定重复"""
+    return item.get('school_id') is None or item.get('school_name') is None
+
+
+def normalize_row(item: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """转换为 INSERT 行：枚举字段统一为枚举成员，补齐时间戳"""
+    row = {k: v for k, v in item.items() if k in StatisticalAggregation.__table__.c}
+    row['aggregation_level'] = to_aggregation_level(row['aggregation_level'])
+    row.setdefault('school_id', None)
+    row.setdefault('school_name', None)
+    if isinstance(row.get('calculation_status'), str):
+        row['calculation_status'] = CalculationStatus[row['calculation_status'].upper()]
+    row['created_at'] = row.get('created_at') or now
+    row['updated_at'] = now
+    return row
+
+
+def group_by_columns(rows: Iterable[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """按列集合分组，多行 VALUES 要求每行列相同"""
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return list(groups.values())
+
+
+def build_upsert_statement(rows: Sequence[Dict[str, Any]]):
+    """构建多行 INSERT ... ON DUPLICATE KEY UPDATE（rows 列集合须一致）"""
+    stmt = mysql_insert(StatisticalAggregation.__table__).values(list(rows))
+    updates = {
+        column: stmt.inserted[column]
+        for column in rows[0] if column not in _IMMUTABLE_COLUMNS
+    }
+    return stmt.on_duplicate_key_update(**updates)
+
+
+def to_aggregation_level(level: Any) -> AggregationLevel:
+    """汇聚级别统一为枚举成员（兼容枚举名和枚举值字符串）"""
+    if isinstance(level, AggregationLevel):
+        return level
+    text = str(level)
+    try:
+        return AggregationLevel[text.upper()]
+    except KeyError:
+        return AggregationLevel(text.lower())
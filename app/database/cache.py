@@ -1,5 +1,13 @@
 # Redis缓存层实现
-import redis
+"""
+基于 redis.asyncio 的非阻塞统计数据缓存。
+
+所有缓存键在写入时登记到所属批次的标签集合（``tags:batch:<批次>``），
+学校级缓存另登记到 ``tags:school:<批次>``，查询结果缓存登记到 ``tags:query``。
+失效时直接读取标签集合删除成员键，不再按模式扫描整个键空间。
+批量读写（如批次下所有学校）通过 MGET / 管道一次往返完成。
+"""
+import os
 import json
 import pickle
 import hashlib
@@ -8,6 +16,8 @@ from typing import Optional, Any, Dict, List, Union
 from datetime import timedelta, datetime
 from contextlib import contextmanager
 
+import redis.asyncio as aioredis
+
 from .enums import AggregationLevel, CalculationStatus
 
 logger = logging.getLogger(__name__)
@@ -21,7 +31,7 @@ class CacheError(Exception):
 class StatisticalDataCache:
     """统计数据缓存管理器"""
     
-    def __init__(self, redis_client: redis.Redis):
+    def __init__(self, redis_client: aioredis.Redis):
         self.redis = redis_client
         self.default_ttl = 3600  # 1小时默认过期时间
         self.prefix = "stats_cache:"
@@ -30,8 +40,11 @@ class StatisticalDataCache:
             "school_statistics": 1800,        # 学校统计缓存30分钟  
             "query_results": 600,             # 查询结果缓存10分钟
             "batch_summary": 900,             # 批次摘要缓存15分钟
-            "metadata": 7200                  # 元数据缓存2小时
+            "metadata": 7200,                 # 元数据缓存2小时
+            "payload": 1800                   # 预编码响应缓存30分钟
         }
+        # 标签集合的过期时间取各类缓存的最大值，保证标签不早于其成员过期
+        self.tag_ttl = max(self.ttl_config.values())
     
     def _make_key(self, key_components: List[str]) -> str:
         """生成缓存键"""
@@ -41,6 +54,18 @@ class StatisticalDataCache:
             key_hash = hashlib.md5(key_string.encode()).hexdigest()
             return f"{self.prefix}hash:{key_hash}"
         return f"{self.prefix}{key_string}"
+
+    def _batch_tag(self, batch_code: str) -> str:
+        """批次标签集合键"""
+        return f"{self.prefix}tags:batch:{batch_code}"
+
+    def _school_tag(self, batch_code: str) -> str:
+        """批次学校级缓存标签集合键"""
+        return f"{self.prefix}tags:school:{batch_code}"
+
+    def _query_tag(self) -> str:
+        """查询结果缓存标签集合键"""
+        return f"{self.prefix}tags:query"
     
     async def get_regional_statistics(self, batch_code: str) -> Optional[Dict[str, Any]]:
         """获取区域统计数据缓存"""
@@ -72,7 +97,8 @@ class StatisticalDataCache:
             success = await self._set_cached_data(
                 key, 
                 json.dumps(statistics_data, ensure_ascii=False),
-                expire_time
+                expire_time,
+                tags=[self._batch_tag(batch_code)]
             )
             
             if success:
@@ -114,7 +140,8 @@ class StatisticalDataCache:
             success = await self._set_cached_data(
                 key, 
                 json.dumps(statistics_data, ensure_ascii=False),
-                expire_time
+                expire_time,
+                tags=[self._batch_tag(batch_code), self._school_tag(batch_code)]
             )
             
             if success:
@@ -125,6 +152,109 @@ class StatisticalDataCache:
             logger.error(f"Error setting school statistics cache: {str(e)}")
             return False
     
+    async def get_many_school_statistics(
+        self,
+        batch_code: str,
+        school_ids: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """批量获取学校统计数据缓存（一次 MGET），只返回命中的学校"""
+        if not school_ids:
+            return {}
+        try:
+            keys = [self._make_key(["school", batch_code, school_id]) for school_id in school_ids]
+            values = await self._get_many_cached_data(keys)
+            result = {
+                school_id: json.loads(value)
+                for school_id, value in zip(school_ids, values)
+                if value
+            }
+            logger.debug(f"School statistics cache: {len(result)}/{len(school_ids)} hits for batch {batch_code}")
+            return result
+        except Exception as e:
+            logger.error(f"Error getting school statistics cache in bulk: {str(e)}")
+            return {}
+
+    async def set_many_school_statistics(
+        self,
+        batch_code: str,
+        statistics_by_school: Dict[str, Dict[str, Any]],
+        ttl: Optional[int] = None
+    ) -> bool:
+        """批量设置学校统计数据缓存（单次管道提交）"""
+        if not statistics_by_school:
+            return True
+        try:
+            expire_time = ttl or self.ttl_config["school_statistics"]
+            items = {
+                self._make_key(["school", batch_code, school_id]): json.dumps(data, ensure_ascii=False)
+                for school_id, data in statistics_by_school.items()
+            }
+            success = await self._set_many_cached_data(
+                items,
+                expire_time,
+                tags=[self._batch_tag(batch_code), self._school_tag(batch_code)]
+            )
+            if success:
+                logger.debug(f"Cached {len(items)} school statistics for batch: {batch_code}")
+            return success
+        except Exception as e:
+            logger.error(f"Error setting school statistics cache in bulk: {str(e)}")
+            return False
+
+    async def get_school_id_index(self, batch_code: str) -> Optional[List[str]]:
+        """获取批次已缓存的完整学校ID列表（由 set_school_id_index 写入）"""
+        try:
+            cached_data = await self._get_cached_data(self._make_key(["school_ids", batch_code]))
+            return json.loads(cached_data) if cached_data else None
+        except Exception as e:
+            logger.error(f"Error getting school id index cache: {str(e)}")
+            return None
+
+    async def set_school_id_index(
+        self,
+        batch_code: str,
+        school_ids: List[str],
+        ttl: Optional[int] = None
+    ) -> bool:
+        """缓存批次完整学校ID列表，用于一次性批量读取全部学校"""
+        try:
+            return await self._set_cached_data(
+                self._make_key(["school_ids", batch_code]),
+                json.dumps(list(school_ids), ensure_ascii=False),
+                ttl or self.ttl_config["school_statistics"],
+                tags=[self._batch_tag(batch_code), self._school_tag(batch_code)]
+            )
+        except Exception as e:
+            logger.error(f"Error setting school id index cache: {str(e)}")
+            return False
+
+    async def get_payload(self, key_components: List[str]) -> Optional[bytes]:
+        """获取预编码响应缓存"""
+        try:
+            return await self._get_cached_data(self._make_key(["payload", *key_components]))
+        except Exception as e:
+            logger.error(f"Error getting payload cache: {str(e)}")
+            return None
+
+    async def set_payload(
+        self,
+        key_components: List[str],
+        payload: bytes,
+        batch_code: Optional[str] = None,
+        ttl: Optional[int] = None
+    ) -> bool:
+        """设置预编码响应缓存（登记到批次标签，随批次失效）"""
+        try:
+            return await self._set_cached_data(
+                self._make_key(["payload", *key_components]),
+                payload,
+                ttl or self.ttl_config["payload"],
+                tags=[self._batch_tag(batch_code)] if batch_code else None
+            )
+        except Exception as e:
+            logger.error(f"Error setting payload cache: {str(e)}")
+            return False
+
     async def get_batch_summary_cache(self, batch_code: str) -> Optional[Dict[str, Any]]:
         """获取批次摘要缓存"""
         try:
@@ -154,7 +284,8 @@ class StatisticalDataCache:
             success = await self._set_cached_data(
                 key,
                 json.dumps(summary_data, ensure_ascii=False),
-                expire_time
+                expire_time,
+                tags=[self._batch_tag(batch_code)]
             )
             
             if success:
@@ -168,15 +299,10 @@ class StatisticalDataCache:
     async def invalidate_batch_cache(self, batch_code: str) -> int:
         """清除批次相关所有缓存"""
         try:
-            pattern = f"{self.prefix}*{batch_code}*"
-            keys = await self._scan_keys(pattern)
-            
-            if keys:
-                deleted_count = await self._delete_keys(keys)
+            deleted_count = await self._invalidate_tag(self._batch_tag(batch_code))
+            if deleted_count:
                 logger.info(f"Invalidated {deleted_count} cache entries for batch: {batch_code}")
-                return deleted_count
-            
-            return 0
+            return deleted_count
         except Exception as e:
             logger.error(f"Error invalidating batch cache: {str(e)}")
             return 0
@@ -185,7 +311,7 @@ class StatisticalDataCache:
         """获取查询结果缓存"""
         try:
             key = self._make_key(["query", query_hash])
-            cached_data = await self._get_cached_data(key, use_pickle=True)
+            cached_data = await self._get_cached_data(key)
             
             if cached_data:
                 logger.debug(f"Cache hit for query: {query_hash[:8]}...")
@@ -200,17 +326,22 @@ class StatisticalDataCache:
         self, 
         query_hash: str, 
         result: Any,
-        ttl: Optional[int] = None
+        ttl: Optional[int] = None,
+        batch_code: Optional[str] = None
     ) -> bool:
         """设置查询结果缓存"""
         try:
             key = self._make_key(["query", query_hash])
             expire_time = ttl or self.ttl_config["query_results"]
             
+            tags = [self._query_tag()]
+            if batch_code:
+                tags.append(self._batch_tag(batch_code))
             success = await self._set_cached_data(
                 key,
                 pickle.dumps(result),
-                expire_time
+                expire_time,
+                tags=tags
             )
             
             if success:
@@ -289,46 +420,85 @@ class StatisticalDataCache:
             return {"error": str(e)}
     
     # 私有辅助方法
-    async def _get_cached_data(self, key: str, use_pickle: bool = False) -> Optional[bytes]:
+    async def _get_cached_data(self, key: str) -> Optional[bytes]:
         """获取缓存数据"""
-        return self.redis.get(key)
+        return await self.redis.get(key)
+
+    async def _get_many_cached_data(self, keys: List[str]) -> List[Optional[bytes]]:
+        """批量获取缓存数据（单次 MGET 往返）"""
+        if not keys:
+            return []
+        return await self.redis.mget(keys)
     
-    async def _set_cached_data(self, key: str, data: Union[str, bytes], ttl: int) -> bool:
-        """设置缓存数据"""
-        return self.redis.setex(key, ttl, data)
+    async def _set_cached_data(
+        self,
+        key: str,
+        data: Union[str, bytes],
+        ttl: int,
+        tags: Optional[List[str]] = None
+    ) -> bool:
+        """设置缓存数据，并将键登记到标签集合"""
+        return await self._set_many_cached_data({key: data}, ttl, tags)
+
+    async def _set_many_cached_data(
+        self,
+        items: Dict[str, Union[str, bytes]],
+        ttl: int,
+        tags: Optional[List[str]] = None
+    ) -> bool:
+        """通过管道批量写入缓存数据及标签登记（一次往返）"""
+        if not items:
+            return True
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, data in items.items():
+                pipe.setex(key, ttl, data)
+            for tag in tags or []:
+                pipe.sadd(tag, *items.keys())
+                pipe.expire(tag, max(ttl, self.tag_ttl))
+            results = await pipe.execute()
+        return all(bool(r) for r in results[:len(items)])
     
     async def _delete_keys(self, keys: List[str]) -> int:
-        """删除多个缓存键"""
+        """删除多个缓存键（UNLINK 异步回收内存）"""
         if keys:
-            return self.redis.delete(*keys)
+            return await self.redis.unlink(*keys)
         return 0
+
+    async def _invalidate_tag(self, tag: str) -> int:
+        """删除标签集合登记的全部键及标签本身，返回删除的缓存键数量"""
+        members = await self.redis.smembers(tag)
+        if not members:
+            return 0
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.unlink(*members)
+            pipe.unlink(tag)
+            deleted, _ = await pipe.execute()
+        return deleted
     
-    async def _scan_keys(self, pattern: str) -> List[str]:
-        """扫描匹配模式的键"""
-        return self.redis.keys(pattern)
+    async def _scan_keys(self, pattern: str, count: int = 1000) -> List[str]:
+        """基于游标的 SCAN 遍历匹配模式的键（仅用于统计诊断，失效路径使用标签集合）"""
+        return [key async for key in self.redis.scan_iter(match=pattern, count=count)]
     
     async def _get_redis_info(self) -> Dict[str, Any]:
         """获取Redis信息"""
-        return self.redis.info()
+        return await self.redis.info()
     
     async def _invalidate_batch_school_caches(self, batch_code: str) -> None:
         """清理批次下所有学校缓存"""
-        pattern = f"{self.prefix}school:{batch_code}:*"
-        keys = await self._scan_keys(pattern)
-        if keys:
-            deleted = await self._delete_keys(keys)
+        deleted = await self._invalidate_tag(self._school_tag(batch_code))
+        if deleted:
             logger.debug(f"Invalidated {deleted} school cache entries for batch: {batch_code}")
     
     async def _invalidate_related_query_caches(self, batch_code: str) -> None:
         """清理相关查询缓存"""
-        pattern = f"{self.prefix}query:*"
-        keys = await self._scan_keys(pattern)
-        
-        # 这里可以实现更智能的查询缓存失效策略
-        # 当前简单删除所有查询缓存
-        if keys:
-            deleted = await self._delete_keys(keys)
+        # 查询条件不一定包含批次，无法精确判断相关性，沿用删除全部查询缓存的策略
+        deleted = await self._invalidate_tag(self._query_tag())
+        if deleted:
             logger.debug(f"Invalidated {deleted} query cache entries")
+
+    async def close(self) -> None:
+        """关闭客户端并释放连接池"""
+        await self.redis.aclose()
     
     @contextmanager
     def cache_fallback(self, operation_name: str):
@@ -340,16 +510,18 @@ class StatisticalDataCache:
             yield None
 
 
-def create_redis_client() -> redis.Redis:
-    """创建Redis客户端"""
-    import os
-    
+def create_redis_client() -> aioredis.Redis:
+    """创建基于连接池的异步Redis客户端
+
+    连接在首次使用时按需建立，不在导入阶段阻塞事件循环。
+    查询结果缓存使用 pickle 存储二进制数据，因此不启用 decode_responses，
+    JSON 数据由 json.loads 直接解析字节串。
+    """
     redis_config = {
         "host": os.getenv("REDIS_HOST", "127.0.0.1"),
         "port": int(os.getenv("REDIS_PORT", 6379)),
         "db": int(os.getenv("REDIS_DB", 0)),
         "password": os.getenv("REDIS_PASSWORD"),
-        "decode_responses": True,
         "max_connections": 50,
         "socket_timeout": 30,
         "socket_connect_timeout": 30,
@@ -361,14 +533,13 @@ def create_redis_client() -> redis.Redis:
         del redis_config["password"]
     
     try:
-        client = redis.Redis(**redis_config)
-        # 测试连接
-        client.ping()
-        logger.info("Redis client connected successfully")
+        pool = aioredis.ConnectionPool(**redis_config)
+        client = aioredis.Redis(connection_pool=pool)
+        logger.info(f"Redis connection pool created: {redis_config['host']}:{redis_config['port']}")
         return client
     except Exception as e:
-        logger.error(f"Failed to connect to Redis: {str(e)}")
-        raise CacheError(f"Redis connection failed: {str(e)}")
+        logger.error(f"Failed to create Redis client: {str(e)}")
+        raise CacheError(f"Redis client creation failed: {str(e)}")
 
 
 def create_cache_manager() -> Optional[StatisticalDataCache]:
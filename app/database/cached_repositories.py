@@ -96,6 +96,45 @@ class CachedStatisticalAggregationRepository(StatisticalAggregationRepository):
             # 缓存失败时降级到直接数据库查询
             return super().get_school_statistics(batch_code, school_id)
     
+    async def get_all_school_statistics_cached(self, batch_code: str) -> List[StatisticalAggregation]:
+        """获取批次所有学校统计数据(带缓存，一次批量读取)"""
+        if not self.cache_enabled:
+            return super().get_all_school_statistics(batch_code)
+        
+        start_time = time.time()
+        
+        try:
+            # 学校ID列表与各校数据均命中时，一次 MGET 返回全部学校
+            school_ids = await self.cache.get_school_id_index(batch_code)
+            if school_ids is not None:
+                cached = await self.cache.get_many_school_statistics(batch_code, school_ids)
+                if len(cached) == len(school_ids):
+                    self.cache_hits += 1
+                    result = [self._build_aggregation_from_cache(cached[school_id]) for school_id in school_ids]
+                    duration = time.time() - start_time
+                    self.performance_tracker.record_query("get_all_school_statistics_cache_hit", duration)
+                    return result
+            
+            # 缓存未命中或不完整，查询数据库后整体回填
+            self.cache_misses += 1
+            result = super().get_all_school_statistics(batch_code)
+            
+            if result:
+                await self.cache.set_many_school_statistics(batch_code, {
+                    item.school_id: self._serialize_aggregation_for_cache(item) for item in result
+                })
+                await self.cache.set_school_id_index(batch_code, [item.school_id for item in result])
+            
+            duration = time.time() - start_time
+            self.performance_tracker.record_query("get_all_school_statistics_cache_miss", duration)
+            
+            return result
+            
+        except Exception as e:
+            logger.error(f"Cache operation failed for all school statistics: {str(e)}")
+            # 缓存失败时降级到直接数据库查询
+            return super().get_all_school_statistics(batch_code)
+    
     async def get_batch_statistics_summary_cached(self, batch_code: str) -> Dict[str, Any]:
         """获取批次统计数据摘要(带缓存)"""
         if not self.cache_enabled:
@@ -155,7 +194,7 @@ class CachedStatisticalAggregationRepository(StatisticalAggregationRepository):
             
             # 缓存查询结果
             if result.data:
-                await self.cache.set_query_result_cache(query_hash, result)
+                await self.cache.set_query_result_cache(query_hash, result, batch_code=criteria.get('batch_code'))
             
             duration = time.time() - start_time
             self.performance_tracker.record_query("get_statistics_by_criteria_cache_miss", duration)
@@ -290,12 +329,15 @@ class CachedStatisticalAggregationRepository(StatisticalAggregationRepository):
                 await self.cache.set_regional_statistics(batch_code, cache_data)
                 warmed["regional"] = 1
             
-            # 预热学校级数据
+            # 预热学校级数据（单次管道写入）
             school_data_list = super().get_all_school_statistics(batch_code)
-            for school_data in school_data_list:
-                cache_data = self._serialize_aggregation_for_cache(school_data)
-                await self.cache.set_school_statistics(batch_code, school_data.school_id, cache_data)
-                warmed["schools"] += 1
+            if school_data_list:
+                await self.cache.set_many_school_statistics(batch_code, {
+                    school_data.school_id: self._serialize_aggregation_for_cache(school_data)
+                    for school_data in school_data_list
+                })
+                await self.cache.set_school_id_index(batch_code, [item.school_id for item in school_data_list])
+                warmed["schools"] = len(school_data_list)
             
             logger.info(f"Cache warmed up for batch {batch_code}: {warmed}")
             
@@ -1,6 +1,6 @@
 # SQLAlchemy模型定义
 from sqlalchemy import (
-    Column, BigInteger, String, DateTime, Text, Float, JSON, Enum, Boolean, DECIMAL,
+    Column, BigInteger, Integer, String, DateTime, Text, Float, JSON, Enum, Boolean, DECIMAL,
     ForeignKey, Index, UniqueConstraint, func
 )
 from sqlalchemy.orm import relationship
@@ -23,7 +23,7 @@ class Batch(Base):
 
 
 class Task(Base):
-    """任务模型（原有模型，保持向后兼容）"""
+    """任务模型（原有模型，保持向后兼容；队列字段供跨进程的任务队列使用）"""
     __tablename__ = "tasks"
     
     id = Column(BigInteger, primary_key=True, index=True)
@@ -39,6 +39,31 @@ class Task(Base):
         nullable=True
     )
     error_message = Column(Text)
+    task_type = Column(String(20), nullable=True, comment="任务类型(calculation/cleaning)")
+    batch_code = Column(String(50), nullable=True, comment="批次代码")
+    school_id = Column(String(50), nullable=True, comment="学校ID(学校级计算)")
+    aggregation_level = Column(String(20), nullable=True, comment="汇聚级别")
+    priority = Column(Integer, nullable=False, default=5, comment="优先级(数值越大越先执行)")
+    stage_details = Column(JSON, nullable=True, comment="阶段进度")
+    cancel_requested = Column(Boolean, nullable=False, default=False, comment="是否已请求取消")
+    worker_id = Column(String(100), nullable=True, comment="执行该任务的工作线程")
+    heartbeat_at = Column(DateTime, nullable=True, comment="工作线程最近心跳时间")
+    estimated_rows = Column(BigInteger, nullable=True, comment="估算的清洗记录数(内存预算用)")
+    
+    __table_args__ = (
+        Index('idx_tasks_queue', 'status', 'priority', 'id'),
+        Index('idx_tasks_batch_status', 'batch_code', 'status'),
+    )
+
+
+class TaskBatchLock(Base):
+    """批次任务互斥锁（每个批次同一时间只允许一个任务执行，主键冲突即为已被占用）"""
+    __tablename__ = "task_batch_locks"
+    
+    batch_code = Column(String(50), primary_key=True, comment="批次代码")
+    task_id = Column(BigInteger, nullable=False, comment="持有锁的任务ID")
+    worker_id = Column(String(100), nullable=False, comment="持有锁的工作线程")
+    acquired_at = Column(DateTime, nullable=False, comment="加锁时间")
 
 
 # 新的统计相关模型
@@ -62,6 +87,7 @@ class StatisticalAggregation(Base):
     total_students = Column(BigInteger, default=0, comment="参与学生总数")
     total_schools = Column(BigInteger, default=0, comment="参与学校总数(区域级)")
     calculation_duration = Column(DECIMAL(8, 2), nullable=True, comment="计算耗时(秒)")
+    input_fingerprint = Column(String(64), nullable=True, comment="计算输入指纹(算法版本+清洗数据指纹)")
     created_at = Column(DateTime, default=func.now(), nullable=False)
     updated_at = Column(
         DateTime, 
@@ -158,4 +184,63 @@ class StatisticalHistory(Base):
         Index('idx_batch_code', 'batch_code'),
         Index('idx_created_at', 'created_at'),
         {"comment": "统计历史记录表"}
-    )
\ No newline at end of file
+    )
+
+
+class ScoreInputFingerprint(Base):
+    """清洗数据指纹表模型（每个 批次×科目×学校 一条，清洗完成时生成）"""
+    __tablename__ = "score_input_fingerprints"
+
+    id = Column(BigInteger, primary_key=True, index=True)
+    batch_code = Column(String(50), nullable=False, comment="批次代码")
+    subject_name = Column(String(100), nullable=False, comment="科目名称")
+    school_id = Column(String(50), nullable=False, default="", comment="学校ID")
+    school_code = Column(String(50), nullable=True, comment="学校代码")
+    row_count = Column(BigInteger, nullable=False, default=0, comment="清洗记录数")
+    score_sum = Column(DECIMAL(16, 2), nullable=False, default=0, comment="总分合计")
+    checksum = Column(String(16), nullable=False, comment="(学生ID, 总分, 维度分数)校验和")
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint(
+            'batch_code', 'subject_name', 'school_id',
+            name='uk_fingerprint_batch_subject_school'
+        ),
+        Index('idx_fingerprint_batch_code', 'batch_code'),
+        {"comment": "清洗数据指纹表"}
+    )
+
+
+class SchoolScorePartial(Base):
+    """学校部分统计量表模型（每个 批次×科目×学校×维度 一条，区域指标由其合并得到）"""
+    __tablename__ = "school_score_partials"
+
+    id = Column(BigInteger, primary_key=True, index=True)
+    batch_code = Column(String(50), nullable=False, comment="批次代码")
+    subject_name = Column(String(100), nullable=False, comment="科目名称")
+    subject_type = Column(String(20), nullable=True, comment="科目类型")
+    school_code = Column(String(50), nullable=False, comment="学校代码")
+    school_name = Column(String(100), nullable=True, comment="学校名称")
+    dimension_code = Column(String(50), nullable=False, default="", comment="维度代码(科目总分为空串)")
+    student_count = Column(BigInteger, nullable=False, default=0, comment="记录数")
+    score_sum = Column(Float, nullable=False, default=0, comment="分数合计")
+    score_sq_sum = Column(Float, nullable=False, default=0, comment="分数平方和")
+    score_min = Column(Float, nullable=True, comment="最低分")
+    score_max = Column(Float, nullable=True, comment="最高分")
+    full_score_max = Column(Float, nullable=True, comment="满分最大值")
+    full_score_sum = Column(Float, nullable=False, default=0, comment="满分合计")
+    bin_width = Column(Float, nullable=False, default=0.5, comment="直方图分箱宽度")
+    histogram = Column(JSON, nullable=True, comment="分数直方图 {分箱序号: 人数}")
+    histogram_exact = Column(Boolean, nullable=False, default=False,
+                             comment="分数全部落在分箱取值上(直方图可精确还原分数分布)")
+    first_seen_id = Column(BigInteger, nullable=True, comment="维度首次写入的记录ID(维度排序用)")
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint(
+            'batch_code', 'subject_name', 'school_code', 'dimension_code',
+            name='uk_partial_batch_subject_school_dimension'
+        ),
+        Index('idx_partial_batch_subject', 'batch_code', 'subject_name'),
+        {"comment": "学校部分统计量表"}
+    )
@@ -0,0 +1,160 @@
+# 两级响应缓存
+"""
+进程内 LRU + TTL（第一级）与 Redis（第二级，多进程共享）组成的响应缓存。
+
+缓存值为预编码的响应字节，键形如 (命名空间, 批次, 级别, 学校, 数据版本)。
+数据版本由汇聚记录的 data_version 与 updated_at 组成，记录更新后版本变化，
+旧键自然失效，无需跨进程通知。同一键的并发未命中通过 single-flight 合并，
+只触发一次数据库加载。
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from .cache import StatisticalDataCache
+
+logger = logging.getLogger(__name__)
+
+PayloadKey = Tuple[Hashable, ...]
+
+
+class LocalPayloadCache:
+    """容量受限（条目数与字节数）的进程内 LRU + TTL 缓存"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 128 * 1024 * 1024,
+                 ttl: float = 300, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: 'OrderedDict[PayloadKey, Tuple[float, bytes]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: PayloadKey) -> Optional[bytes]:
+        """读取缓存，过期条目视为未命中并移除"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: PayloadKey, value: bytes, ttl: Optional[float] = None) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + (ttl or self.ttl), value)
+            self.total_bytes += len(value)
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key: PayloadKey) -> None:
+        _, value = self._entries.pop(key)
+        self.total_bytes -= len(value)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+class PayloadCache:
+    """两级响应缓存，带 single-flight 并发未命中合并"""
+
+    def __init__(self, local: LocalPayloadCache, shared: Optional[StatisticalDataCache] = None):
+        self.local = local
+        self.shared = shared
+        self._inflight: Dict[PayloadKey, asyncio.Future] = {}
+
+    async def get_or_load(self, key: PayloadKey, loader: Callable[[], Awaitable[bytes]],
+                          batch_code: Optional[str] = None) -> bytes:
+        """依次查询进程内缓存、Redis，均未命中时调用 loader 加载并回填两级缓存"""
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load_shared(key, loader, batch_code)
+            self.local.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 无等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _load_shared(self, key: PayloadKey, loader: Callable[[], Awaitable[bytes]],
+                           batch_code: Optional[str]) -> bytes:
+        components = [str(k) for k in key]
+        if self.shared is not None:
+            value = await self.shared.get_payload(components)
+            if value is not None:
+                return value
+
+        value = await loader()
+        if self.shared is not None:
+            await self.shared.set_payload(components, value, batch_code=batch_code)
+        return value
+
+
+_payload_cache: Optional[PayloadCache] = None
+
+
+def get_payload_cache() -> PayloadCache:
+    """获取全局两级响应缓存（Redis 不可用时仅使用进程内缓存）"""
+    global _payload_cache
+    if _payload_cache is None:
+        from .connection import get_cache_manager
+
+        local = LocalPayloadCache(
+            max_entries=int(os.getenv("PAYLOAD_CACHE_MAX_ENTRIES", 1024)),
+            max_bytes=int(os.getenv("PAYLOAD_CACHE_MAX_BYTES", 128 * 1024 * 1024)),
+            ttl=float(os.getenv("PAYLOAD_CACHE_TTL", 300)),
+        )
+        _payload_cache = PayloadCache(local, get_cache_manager())
+    return _payload_cache
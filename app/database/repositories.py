@@ -1,14 +1,15 @@
 # 数据仓库层
-from typing import List, Optional, Dict, Any, Union, Callable
+from typing import List, Optional, Dict, Any, Union, Callable, Tuple, Iterator
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc, asc, func, select, text
+from sqlalchemy import and_, or_, desc, asc, func, select, text, bindparam
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from datetime import datetime, timedelta
 import logging
 import time
 
 from .models import (
-    Batch, Task, StatisticalAggregation, StatisticalMetadata, StatisticalHistory,
+    Batch, Task, TaskBatchLock, StatisticalAggregation, StatisticalMetadata, StatisticalHistory, ScoreInputFingerprint,
+    SchoolScorePartial,
     AggregationLevel, MetadataType, ChangeType, CalculationStatus
 )
 from .query_builder import (
@@ -20,6 +21,9 @@ from .schemas import (
     PerformanceCriteria, QueryPerformanceTracker
 )
 from .cache import StatisticalDataCache
+from .score_stream import DEFAULT_STREAM_CHUNK_SIZE, DimensionChunk, ScoreChunk
+from . import bulk_upsert, statistics_history
+from ..calculation.partials import DEFAULT_BIN_WIDTH
 
 logger = logging.getLogger(__name__)
 
@@ -87,6 +91,10 @@ class BatchRepository(BaseRepository):
             self._handle_db_error(e, "delete_batch")
 
 
+# 队列中尚未结束的任务状态
+ACTIVE_TASK_STATUSES = ('pending', 'running')
+
+
 class TaskRepository(BaseRepository):
     """任务数据仓库"""
     
@@ -102,6 +110,14 @@ class TaskRepository(BaseRepository):
             task.started_at = task_data.get('started_at')
             task.completed_at = task_data.get('completed_at')
             task.error_message = task_data.get('error_message')
+            task.task_type = task_data.get('task_type')
+            task.batch_code = task_data.get('batch_code')
+            task.school_id = task_data.get('school_id')
+            task.aggregation_level = task_data.get('aggregation_level')
+            task.priority = int(task_data.get('priority', 5))
+            task.stage_details = task_data.get('stage_details')
+            task.cancel_requested = False
+            task.estimated_rows = task_data.get('estimated_rows')
             
             self.db.add(task)
             self.db.commit()
@@ -177,6 +193,137 @@ class TaskRepository(BaseRepository):
         except Exception as e:
             self._handle_db_error(e, "get_paginated")
     
+    # ---- 任务队列 ----
+    
+    def find_active(self, task_type: str, batch_code: str, school_id: Optional[str] = None) -> Optional[Task]:
+        """查找同一批次（学校）尚未结束的同类任务"""
+        try:
+            return self.db.query(Task).filter(
+                Task.task_type == task_type,
+                Task.batch_code == batch_code,
+                Task.school_id == school_id if school_id is not None else Task.school_id.is_(None),
+                Task.status.in_(ACTIVE_TASK_STATUSES)
+            ).order_by(asc(Task.id)).first()
+        except Exception as e:
+            self._handle_db_error(e, "find_active")
+    
+    def claim_next(self, worker_id: str, scan_limit: int = 20, max_rows: Optional[int] = None) -> Optional[Task]:
+        """认领优先级最高、且所属批次没有任务在执行的待执行任务
+        
+        先插入批次锁（主键冲突表示批次已被占用），再以 status='pending' 为条件更新任务状态，
+        两步在同一事务内提交：多个进程同时认领时每个任务、每个批次只有一方成功。
+        max_rows 不为 None 时，估算行数超过该值的任务（内存预算不足）不认领，排在它之后的任务也
+        不再认领：等执行中的任务结束、预算释放后按优先级先执行该任务，避免持续到来的小批次使其饿死。
+        """
+        try:
+            candidates = self.db.query(Task.id, Task.batch_code, Task.estimated_rows).filter(
+                Task.status == 'pending', Task.task_type.isnot(None)
+            ).order_by(desc(Task.priority), asc(Task.id)).limit(scan_limit).all()
+            locked = {row.batch_code for row in self.db.query(TaskBatchLock.batch_code)}
+            self.db.rollback()
+            
+            for task_id, batch_code, estimated_rows in candidates:
+                if batch_code in locked:
+                    continue
+                if max_rows is not None and (estimated_rows or 0) > max_rows:
+                    return None
+                now = datetime.now()
+                try:
+                    self.db.add(TaskBatchLock(batch_code=batch_code, task_id=task_id,
+                                              worker_id=worker_id, acquired_at=now))
+                    self.db.flush()
+                except IntegrityError:
+                    self.db.rollback()
+                    locked.add(batch_code)
+                    continue
+                claimed = self.db.query(Task).filter(Task.id == task_id, Task.status == 'pending').update(
+                    {'status': 'running', 'worker_id': worker_id, 'heartbeat_at': now},
+                    synchronize_session=False
+                )
+                if claimed:
+                    self.db.commit()
+                    return self.get_by_id(task_id)
+                self.db.rollback()
+            return None
+        except Exception as e:
+            self._handle_db_error(e, "claim_next")
+    
+    def release(self, task_id: int, batch_code: str) -> None:
+        """释放任务持有的批次锁"""
+        try:
+            self.db.query(TaskBatchLock).filter(
+                TaskBatchLock.batch_code == batch_code, TaskBatchLock.task_id == task_id
+            ).delete(synchronize_session=False)
+            self.db.commit()
+        except Exception as e:
+            self._handle_db_error(e, "release")
+    
+    def heartbeat(self, task_ids: List[int]) -> List[int]:
+        """刷新执行中任务的心跳，返回其中已请求取消的任务ID"""
+        if not task_ids:
+            return []
+        try:
+            self.db.query(Task).filter(Task.id.in_(task_ids)).update(
+                {'heartbeat_at': datetime.now()}, synchronize_session=False
+            )
+            self.db.commit()
+            return [row.id for row in self.db.query(Task.id).filter(
+                Task.id.in_(task_ids), Task.cancel_requested.is_(True)
+            )]
+        except Exception as e:
+            self._handle_db_error(e, "heartbeat")
+    
+    def request_cancel(self, task_id: int) -> bool:
+        """请求取消尚未结束的任务（待执行任务不再被认领，执行中任务由工作线程在阶段边界停止）"""
+        try:
+            updated = self.db.query(Task).filter(
+                Task.id == task_id, Task.status.in_(ACTIVE_TASK_STATUSES)
+            ).update({'cancel_requested': True, 'status': 'cancelled', 'completed_at': datetime.now()},
+                     synchronize_session=False)
+            self.db.commit()
+            return bool(updated)
+        except Exception as e:
+            self._handle_db_error(e, "request_cancel")
+    
+    def is_cancel_requested(self, task_id: int) -> bool:
+        try:
+            row = self.db.query(Task.cancel_requested).filter(Task.id == task_id).first()
+            return bool(row and row.cancel_requested)
+        except Exception as e:
+            self._handle_db_error(e, "is_cancel_requested")
+    
+    def reap_stale(self, timeout_seconds: float) -> List[int]:
+        """回收心跳超时的任务：标记为失败并释放其批次锁，返回被回收的任务ID"""
+        try:
+            cutoff = datetime.now() - timedelta(seconds=timeout_seconds)
+            stale = [row.id for row in self.db.query(Task.id).filter(
+                Task.status == 'running', Task.heartbeat_at < cutoff
+            )]
+            if stale:
+                self.db.query(Task).filter(Task.id.in_(stale), Task.status == 'running').update(
+                    {'status': 'failed', 'error_message': '工作线程心跳超时，任务已中止', 'completed_at': datetime.now()},
+                    synchronize_session=False
+                )
+            # 持锁任务已不存在或心跳超时（含已取消但工作线程失联的任务）时释放锁
+            live = self.db.query(Task.id).filter(
+                Task.id == TaskBatchLock.task_id, Task.heartbeat_at >= cutoff
+            ).exists()
+            self.db.query(TaskBatchLock).filter(~live).delete(synchronize_session=False)
+            self.db.commit()
+            return stale
+        except Exception as e:
+            self._handle_db_error(e, "reap_stale")
+    
+    def status_counts(self) -> Dict[str, int]:
+        """队列任务按状态计数"""
+        try:
+            rows = self.db.query(Task.status, func.count(Task.id)).filter(
+                Task.task_type.isnot(None)
+            ).group_by(Task.status).all()
+            return {status: int(count) for status, count in rows}
+        except Exception as e:
+            self._handle_db_error(e, "status_counts")
+    
     # Legacy methods for backward compatibility
     def create_task(self, task_data: Dict[str, Any]) -> Task:
         """创建任务（兼容性方法）"""
@@ -200,6 +347,8 @@ class StatisticalAggregationRepository(BaseRepository):
     def __init__(self, db_session: Session):
         super().__init__(db_session)
         self.performance_tracker = QueryPerformanceTracker()
+        # 各统计记录最近一条差异历史的 change_summary（aggregation_id -> summary）
+        self._history_heads: Dict[int, Optional[Dict[str, Any]]] = {}
     
     def get_regional_statistics(self, batch_code: str) -> Optional[StatisticalAggregation]:
         """获取区域级统计数据"""
@@ -226,6 +375,66 @@ class StatisticalAggregationRepository(BaseRepository):
         except Exception as e:
             self._handle_db_error(e, "get_school_statistics")
     
+    def get_statistics_version(self, batch_code: str, aggregation_level: AggregationLevel,
+                               school_id: Optional[str] = None) -> Optional[str]:
+        """获取统计记录版本标识（data_version@updated_at），不加载 statistics_data，记录不存在时返回None"""
+        try:
+            conditions = [
+                StatisticalAggregation.batch_code == batch_code,
+                StatisticalAggregation.aggregation_level == aggregation_level
+            ]
+            if school_id is not None:
+                conditions.append(StatisticalAggregation.school_id == school_id)
+            row = self.db.query(
+                StatisticalAggregation.data_version, StatisticalAggregation.updated_at
+            ).filter(and_(*conditions)).first()
+            if row is None:
+                return None
+            updated_at = row.updated_at.isoformat() if row.updated_at else ''
+            return f"{row.data_version}@{updated_at}"
+        except Exception as e:
+            self._handle_db_error(e, "get_statistics_version")
+    
+    def get_input_fingerprints(self, batch_code: str) -> Dict[Tuple[str, Optional[str]], Optional[str]]:
+        """获取批次各汇聚记录的输入指纹 {(汇聚级别名, 学校ID): 指纹}（不读取统计数据）"""
+        try:
+            rows = self.db.query(
+                StatisticalAggregation.aggregation_level,
+                StatisticalAggregation.school_id,
+                StatisticalAggregation.input_fingerprint
+            ).filter(
+                and_(
+                    StatisticalAggregation.batch_code == batch_code,
+                    StatisticalAggregation.calculation_status == CalculationStatus.COMPLETED
+                )
+            ).all()
+            return {(row.aggregation_level.name, row.school_id): row.input_fingerprint for row in rows}
+        except Exception as e:
+            self._handle_db_error(e, "get_input_fingerprints")
+
+    def update_school_input_fingerprints(self, batch_code: str, fingerprints: Dict[str, Optional[str]]) -> int:
+        """只更新学校级记录的输入指纹 {学校ID: 指纹}（统计数据无需重写的单元）"""
+        if not fingerprints:
+            return 0
+        try:
+            result = self.db.execute(
+                StatisticalAggregation.__table__.update()
+                .where(and_(
+                    StatisticalAggregation.batch_code == bindparam('b_batch_code'),
+                    StatisticalAggregation.aggregation_level == AggregationLevel.SCHOOL,
+                    StatisticalAggregation.school_id == bindparam('b_school_id'),
+                ))
+                .values(input_fingerprint=bindparam('b_fingerprint')),
+                [
+                    {'b_batch_code': batch_code, 'b_school_id': school_id, 'b_fingerprint': fingerprint}
+                    for school_id, fingerprint in fingerprints.items()
+                ]
+            )
+            self.db.commit()
+            return result.rowcount
+        except Exception as e:
+            self._handle_db_error(e, "update_school_input_fingerprints")
+    
     def get_all_school_statistics(self, batch_code: str) -> List[StatisticalAggregation]:
         """获取批次所有学校统计数据"""
         try:
@@ -363,7 +572,47 @@ class StatisticalAggregationRepository(BaseRepository):
             self._handle_db_error(e, "delete_batch_statistics")
     
     def _record_history_change(self, existing: StatisticalAggregation, new_data: Dict[str, Any]) -> None:
-        """记录历史变更"""
+        """记录历史变更（默认差异格式，见 statistics_history）"""
+        if statistics_history.HISTORY_MODE == 'full':
+            self._record_full_history_change(existing, new_data)
+            return
+        try:
+            head = self._get_history_head(existing.id)
+            entry = statistics_history.build_delta_history(existing, new_data, head)
+            if entry is None:
+                # 重算结果与当前版本一致，不写历史
+                return
+            history_data, self._history_heads[existing.id] = entry
+            history_data.update({
+                'aggregation_id': existing.id,
+                'change_type': ChangeType.UPDATED,
+                'change_reason': new_data.get('change_reason', 'Data update'),
+                'triggered_by': new_data.get('triggered_by', 'system'),
+                'batch_code': existing.batch_code,
+                'created_at': datetime.now()
+            })
+            self.db.add(StatisticalHistory(**history_data))
+        except Exception as e:
+            logger.error(f"Failed to record history change: {str(e)}")
+            # 历史记录失败不应阻止主要操作
+
+    def _get_history_head(self, aggregation_id: int) -> Optional[Dict[str, Any]]:
+        """获取统计记录最近一条差异历史的 change_summary"""
+        if aggregation_id in self._history_heads:
+            return self._history_heads[aggregation_id]
+        latest = self.db.query(StatisticalHistory.change_summary).filter(
+            and_(
+                StatisticalHistory.aggregation_id == aggregation_id,
+                StatisticalHistory.change_type == ChangeType.UPDATED
+            )
+        ).order_by(desc(StatisticalHistory.id)).first()
+        summary = latest[0] if latest else None
+        head = summary if isinstance(summary, dict) and summary.get('format') == 'delta' else None
+        self._history_heads[aggregation_id] = head
+        return head
+
+    def _record_full_history_change(self, existing: StatisticalAggregation, new_data: Dict[str, Any]) -> None:
+        """记录历史变更（全量快照格式）"""
         try:
             # 创建历史记录
             history_data = {
@@ -760,14 +1009,24 @@ class StatisticalAggregationRepository(BaseRepository):
     def batch_upsert_statistics(
         self, 
         statistics_list: List[Dict[str, Any]],
-        batch_size: int = 100
+        batch_size: Optional[int] = None,
+        track_history: bool = True,
+        atomic: bool = False
     ) -> BatchOperationResult:
-        """批量插入或更新统计数据"""
+        """批量插入或更新统计数据
+
+        MySQL 下每个分块一条多行 INSERT ... ON DUPLICATE KEY UPDATE 并提交一次；
+        其他数据库使用逐条 ORM 处理。track_history 为 False 时不查询已有记录、不写历史。
+        atomic 为 True 时全部分块在同一事务内写入、最后提交一次：任一分块失败即回滚全部分块，
+        结果中 total_processed 为0。
+        """
         start_time = time.time()
         total_processed = 0
         total_created = 0
         total_updated = 0
         errors = []
+        batch_size = batch_size or bulk_upsert.DEFAULT_UPSERT_CHUNK_SIZE
+        use_bulk = self._supports_bulk_upsert()
         
         try:
             # 分批处理，避免内存溢出
@@ -775,7 +1034,10 @@ class StatisticalAggregationRepository(BaseRepository):
                 batch = statistics_list[i:i + batch_size]
                 
                 try:
-                    result = self._process_statistics_batch(batch)
+                    if use_bulk:
+                        result = self._bulk_upsert_chunk(batch, track_history, commit=not atomic)
+                    else:
+                        result = self._process_statistics_batch(batch, commit=not atomic)
                     total_processed += result.processed_count
                     total_created += result.created_count
                     total_updated += result.updated_count
@@ -783,6 +1045,18 @@ class StatisticalAggregationRepository(BaseRepository):
                     error_msg = f"Batch {i//batch_size + 1}: {str(e)}"
                     errors.append(error_msg)
                     logger.error(f"Batch operation failed for items {i}-{i+len(batch)}: {str(e)}")
+                    if atomic:
+                        # 分块失败时已回滚整个事务，之前的分块也未写入
+                        total_processed = total_created = total_updated = 0
+                        break
+            
+            if atomic and not errors:
+                try:
+                    self.db.commit()
+                except Exception as e:
+                    self.db.rollback()
+                    errors.append(f"Commit: {str(e)}")
+                    total_processed = total_created = total_updated = 0
             
             success_rate = total_processed / len(statistics_list) if statistics_list else 0.0
             result = BatchOperationResult(
@@ -797,7 +1071,7 @@ class StatisticalAggregationRepository(BaseRepository):
             self.performance_tracker.record_query(
                 "batch_upsert_statistics", 
                 duration,
-                {"total_records": len(statistics_list), "batch_size": batch_size}
+                {"total_records": len(statistics_list), "batch_size": batch_size, "bulk": use_bulk}
             )
             
             return result
@@ -805,8 +1079,87 @@ class StatisticalAggregationRepository(BaseRepository):
         except Exception as e:
             self._handle_db_error(e, "batch_upsert_statistics")
     
-    def _process_statistics_batch(self, batch: List[Dict[str, Any]]) -> BatchResult:
-        """处理单个批次的数据"""
+    def _supports_bulk_upsert(self) -> bool:
+        """当前连接是否支持 INSERT ... ON DUPLICATE KEY UPDATE"""
+        try:
+            return self.db.get_bind().dialect.name == 'mysql'
+        except Exception:
+            return False
+
+    def _bulk_upsert_chunk(self, batch: List[Dict[str, Any]], track_history: bool,
+                           commit: bool = True) -> BatchResult:
+        """以多行 upsert 写入一个分块（commit 为 False 时不提交，由调用方统一提交）"""
+        try:
+            now = datetime.now()
+            # 仅在需要写历史或唯一键含NULL时解析已有记录
+            to_resolve = [item for item in batch if track_history or bulk_upsert.has_null_key(item)]
+            existing_records = self._resolve_existing_records(to_resolve, full=track_history) if to_resolve else {}
+
+            rows = []
+            resolved_count = len(to_resolve)
+            updated_count = 0
+            for item in batch:
+                row = bulk_upsert.normalize_row(item, now)
+                existing = existing_records.get(bulk_upsert.item_key(item))
+                if existing is not None:
+                    row['id'] = existing.id
+                    updated_count += 1
+                    if track_history:
+                        self._record_history_change(existing, item)
+                rows.append(row)
+
+            affected = 0
+            for group in bulk_upsert.group_by_columns(rows):
+                result = self.db.execute(bulk_upsert.build_upsert_statement(group))
+                if 'id' not in group[0]:
+                    affected += max(result.rowcount or 0, 0)
+            if commit:
+                self.db.commit()
+
+            # 未解析的行按影响行数估算更新数（MySQL 插入计1行，更新计2行）
+            unresolved = len(batch) - resolved_count
+            if unresolved:
+                rows_without_id = sum(1 for row in rows if 'id' not in row)
+                updated_count += min(max(affected - rows_without_id, 0), unresolved)
+            return BatchResult(
+                processed_count=len(batch),
+                created_count=len(batch) - updated_count,
+                updated_count=updated_count
+            )
+        except Exception as e:
+            self.db.rollback()
+            raise RepositoryError(f"Bulk upsert failed: {str(e)}")
+
+    def _resolve_existing_records(self, items: List[Dict[str, Any]], full: bool) -> Dict[Any, Any]:
+        """一次查询解析已有记录，返回 {唯一键: 记录}（full 为 False 时只查询id和唯一键列）"""
+        school_ids = {item.get('school_id') for item in items}
+        school_filters = []
+        non_null_ids = sorted(s for s in school_ids if s is not None)
+        if non_null_ids:
+            school_filters.append(StatisticalAggregation.school_id.in_(non_null_ids))
+        if None in school_ids:
+            school_filters.append(StatisticalAggregation.school_id.is_(None))
+
+        columns = [StatisticalAggregation] if full else [
+            StatisticalAggregation.id,
+            *(getattr(StatisticalAggregation, c) for c in bulk_upsert.KEY_COLUMNS)
+        ]
+        records = self.db.query(*columns).filter(
+            and_(
+                StatisticalAggregation.batch_code.in_({item['batch_code'] for item in items}),
+                StatisticalAggregation.aggregation_level.in_(
+                    {bulk_upsert.to_aggregation_level(item['aggregation_level']) for item in items}
+                ),
+                or_(*school_filters)
+            )
+        ).all()
+        return {
+            bulk_upsert.aggregation_key(r.batch_code, r.aggregation_level, r.school_id, r.school_name): r
+            for r in records
+        }
+
+    def _process_statistics_batch(self, batch: List[Dict[str, Any]], commit: bool = True) -> BatchResult:
+        """处理单个批次的数据（commit 为 False 时只 flush，由调用方统一提交）"""
         created_count = 0
         updated_count = 0
         
@@ -852,7 +1205,10 @@ class StatisticalAggregationRepository(BaseRepository):
                     self.db.add(record)
                     created_count += 1
             
-            self.db.commit()
+            if commit:
+                self.db.commit()
+            else:
+                self.db.flush()
             return BatchResult(
                 processed_count=len(batch),
                 created_count=created_count,
@@ -1119,6 +1475,35 @@ class StatisticalHistoryRepository(BaseRepository):
         except Exception as e:
             self._handle_db_error(e, "get_changes_by_type")
     
+    def reconstruct_statistics_data(self, aggregation_id: int, content_hash: str) -> Optional[Dict[str, Any]]:
+        """按内容哈希重建统计数据的历史版本
+
+        先只读取 change_summary 定位目标版本之前最近的检查点，
+        再加载检查点到目标之间的记录并回放差异。
+        """
+        try:
+            summaries = self.db.query(StatisticalHistory.id, StatisticalHistory.change_summary).filter(
+                and_(
+                    StatisticalHistory.aggregation_id == aggregation_id,
+                    StatisticalHistory.change_type == ChangeType.UPDATED
+                )
+            ).order_by(asc(StatisticalHistory.id)).all()
+
+            query = self.db.query(StatisticalHistory).filter(
+                and_(
+                    StatisticalHistory.aggregation_id == aggregation_id,
+                    StatisticalHistory.change_type == ChangeType.UPDATED
+                )
+            )
+            window = statistics_history.replay_window(summaries, content_hash)
+            if window:
+                query = query.filter(StatisticalHistory.id.between(*window))
+            return statistics_history.replay_statistics_history(
+                query.order_by(asc(StatisticalHistory.id)).all(), content_hash
+            )
+        except Exception as e:
+            self._handle_db_error(e, "reconstruct_statistics_data")
+
     def create_history_record(self, history_data: Dict[str, Any]) -> StatisticalHistory:
         """创建历史记录"""
         try:
@@ -1176,6 +1561,341 @@ class StatisticalHistoryRepository(BaseRepository):
             self._handle_db_error(e, "cleanup_old_history")
 
 
+class InputFingerprintRepository(BaseRepository):
+    """清洗数据指纹Repository"""
+
+    def compute_fingerprints(self, batch_code: str) -> List[Dict[str, Any]]:
+        """由 student_cleaned_scores 分组计算 科目×学校 指纹（校验和与行顺序无关）"""
+        try:
+            rows = self.db.execute(text("""
+                SELECT
+                    subject_name,
+                    COALESCE(school_id, '') AS school_id,
+                    MAX(school_code) AS school_code,
+                    COUNT(*) AS row_count,
+                    COALESCE(SUM(total_score), 0) AS score_sum,
+                    LPAD(HEX(BIT_XOR(CAST(CONV(SUBSTRING(MD5(CONCAT_WS('|',
+                        student_id, total_score, COALESCE(dimension_scores, ''))), 1, 16), 16, 10) AS UNSIGNED))),
+                        16, '0') AS checksum
+                FROM student_cleaned_scores
+                WHERE batch_code = :batch_code
+                GROUP BY subject_name, COALESCE(school_id, '')
+            """), {"batch_code": batch_code}).fetchall()
+            return [
+                {
+                    'subject_name': row.subject_name,
+                    'school_id': row.school_id,
+                    'school_code': row.school_code,
+                    'row_count': int(row.row_count or 0),
+                    'score_sum': row.score_sum,
+                    'checksum': row.checksum,
+                }
+                for row in rows
+            ]
+        except Exception as e:
+            self._handle_db_error(e, "compute_fingerprints")
+
+    def replace_fingerprints(self, batch_code: str, fingerprints: List[Dict[str, Any]]) -> int:
+        """替换批次的全部指纹"""
+        try:
+            self.db.query(ScoreInputFingerprint).filter(
+                ScoreInputFingerprint.batch_code == batch_code
+            ).delete(synchronize_session=False)
+            if fingerprints:
+                now = datetime.now()
+                self.db.execute(
+                    ScoreInputFingerprint.__table__.insert(),
+                    [{**row, 'batch_code': batch_code, 'created_at': now} for row in fingerprints]
+                )
+            self.db.commit()
+            return len(fingerprints)
+        except Exception as e:
+            self._handle_db_error(e, "replace_fingerprints")
+
+    def get_config_rows(self, batch_code: str) -> List[str]:
+        """读取影响统计结果的批次配置（题目满分与类型、维度映射、年级），每行规整为一个字符串"""
+        try:
+            params = {"batch_code": batch_code}
+            questions = self.db.execute(text("""
+                SELECT subject_name, question_id, max_score, question_type_enum, instrument_id
+                FROM subject_question_config
+                WHERE batch_code = :batch_code
+            """), params).fetchall()
+            mappings = self.db.execute(text("""
+                SELECT subject_name, question_id, dimension_code
+                FROM question_dimension_mapping
+                WHERE batch_code = :batch_code
+            """), params).fetchall()
+            grade = self.db.execute(text("""
+                SELECT grade_level
+                FROM grade_aggregation_main
+                WHERE batch_code = :batch_code
+                LIMIT 1
+            """), params).fetchone()
+            rows = [
+                f"q|{row.subject_name}|{row.question_id}|"
+                f"{'' if row.max_score is None else f'{float(row.max_score):.4f}'}|"
+                f"{row.question_type_enum or ''}|{row.instrument_id or ''}"
+                for row in questions
+            ]
+            rows.extend(f"d|{row.subject_name}|{row.question_id}|{row.dimension_code}" for row in mappings)
+            rows.append(f"g|{grade[0] if grade else ''}")
+            return sorted(rows)
+        except Exception as e:
+            self._handle_db_error(e, "get_config_rows")
+
+    def estimate_batch_rows(self, batch_codes: List[str]) -> Dict[str, int]:
+        """估算各批次的清洗记录数：优先汇总指纹行数，没有指纹的批次直接计数清洗表"""
+        if not batch_codes:
+            return {}
+        try:
+            estimates = {
+                row.batch_code: int(row.row_count or 0)
+                for row in self.db.query(
+                    ScoreInputFingerprint.batch_code, func.sum(ScoreInputFingerprint.row_count).label('row_count')
+                ).filter(ScoreInputFingerprint.batch_code.in_(batch_codes)).group_by(ScoreInputFingerprint.batch_code)
+            }
+            missing = [code for code in batch_codes if code not in estimates]
+            if missing:
+                rows = self.db.execute(text("""
+                    SELECT batch_code, COUNT(*) AS row_count
+                    FROM student_cleaned_scores
+                    WHERE batch_code IN :batch_codes
+                    GROUP BY batch_code
+                """).bindparams(bindparam('batch_codes', expanding=True)), {'batch_codes': missing}).fetchall()
+                estimates.update({row.batch_code: int(row.row_count or 0) for row in rows})
+            return estimates
+        except Exception as e:
+            self._handle_db_error(e, "estimate_batch_rows")
+
+    def delete_fingerprints(self, batch_code: str) -> int:
+        """删除批次指纹（清洗开始前调用，避免清洗中断后沿用旧指纹）"""
+        try:
+            deleted = self.db.query(ScoreInputFingerprint).filter(
+                ScoreInputFingerprint.batch_code == batch_code
+            ).delete(synchronize_session=False)
+            self.db.commit()
+            return deleted
+        except Exception as e:
+            self._handle_db_error(e, "delete_fingerprints")
+
+    def get_fingerprints(self, batch_code: str) -> List[Dict[str, Any]]:
+        """读取批次已保存的指纹"""
+        try:
+            rows = self.db.query(ScoreInputFingerprint).filter(
+                ScoreInputFingerprint.batch_code == batch_code
+            ).all()
+            return [
+                {
+                    'subject_name': row.subject_name,
+                    'school_id': row.school_id,
+                    'school_code': row.school_code,
+                    'row_count': row.row_count,
+                    'score_sum': row.score_sum,
+                    'checksum': row.checksum,
+                }
+                for row in rows
+            ]
+        except Exception as e:
+            self._handle_db_error(e, "get_fingerprints")
+
+
+class SchoolPartialRepository(BaseRepository):
+    """学校部分统计量Repository（区域指标与排名由各学校部分统计量合并得到）"""
+
+    DEFAULT_BIN_WIDTH = DEFAULT_BIN_WIDTH
+
+    def compute_partials(self, batch_code: str, school_codes: Optional[List[str]] = None,
+                         bin_width: float = DEFAULT_BIN_WIDTH) -> List[Dict[str, Any]]:
+        """由清洗表分组计算 科目×学校（×维度）部分统计量，school_codes 为空时计算全部学校
+
+        直方图按 FLOOR(分数/分箱宽度) 分箱；off_grid 统计不在分箱取值上的分数个数，
+        为0时直方图精确（exact），区域百分位数、等级人数与区分度可由合并结果精确得到。
+        """
+        params: Dict[str, Any] = {"batch_code": batch_code, "bin_width": bin_width}
+        school_filter = ""
+        if school_codes is not None:
+            if not school_codes:
+                return []
+            school_filter = "AND school_code IN :school_codes"
+            params["school_codes"] = list(school_codes)
+
+        def run(sql: str):
+            stmt = text(sql)
+            if school_codes is not None:
+                stmt = stmt.bindparams(bindparam('school_codes', expanding=True))
+            return self.db.execute(stmt, params).fetchall()
+
+        try:
+            subject_rows = run(f"""
+                SELECT subject_name, MAX(subject_type) AS subject_type, school_code,
+                       MAX(school_name) AS school_name, '' AS dimension_code,
+                       COUNT(total_score) AS cnt, COALESCE(SUM(total_score), 0) AS score_sum,
+                       COALESCE(SUM(total_score * total_score), 0) AS score_sq_sum,
+                       MIN(total_score) AS score_min, MAX(total_score) AS score_max,
+                       MAX(max_score) AS full_score_max, COALESCE(SUM(max_score), 0) AS full_score_sum,
+                       COALESCE(SUM(total_score <> FLOOR(total_score / :bin_width) * :bin_width), 0) AS off_grid,
+                       NULL AS first_seen_id
+                FROM student_cleaned_scores
+                WHERE batch_code = :batch_code AND subject_type IN ('exam','questionnaire')
+                  AND school_code IS NOT NULL {school_filter}
+                GROUP BY subject_name, school_code
+            """)
+            subject_bins = run(f"""
+                SELECT subject_name, school_code, '' AS dimension_code,
+                       FLOOR(total_score / :bin_width) AS bin, COUNT(*) AS cnt
+                FROM student_cleaned_scores
+                WHERE batch_code = :batch_code AND subject_type IN ('exam','questionnaire')
+                  AND school_code IS NOT NULL AND total_score IS NOT NULL {school_filter}
+                GROUP BY subject_name, school_code, bin
+            """)
+            dimension_rows = run(f"""
+                SELECT subject_name, NULL AS subject_type, school_code, NULL AS school_name, dimension_code,
+                       COUNT(score) AS cnt, COALESCE(SUM(score), 0) AS score_sum,
+                       COALESCE(SUM(score * score), 0) AS score_sq_sum,
+                       MIN(score) AS score_min, MAX(score) AS score_max,
+                       MAX(max_score) AS full_score_max, COALESCE(SUM(max_score), 0) AS full_score_sum,
+                       COALESCE(SUM(score <> FLOOR(score / :bin_width) * :bin_width), 0) AS off_grid,
+                       MIN(id) AS first_seen_id
+                FROM student_dimension_scores
+                WHERE batch_code = :batch_code AND school_code IS NOT NULL {school_filter}
+                GROUP BY subject_name, school_code, dimension_code
+            """)
+            dimension_bins = run(f"""
+                SELECT subject_name, school_code, dimension_code,
+                       FLOOR(score / :bin_width) AS bin, COUNT(*) AS cnt
+                FROM student_dimension_scores
+                WHERE batch_code = :batch_code AND school_code IS NOT NULL AND score IS NOT NULL {school_filter}
+                GROUP BY subject_name, school_code, dimension_code, bin
+            """)
+        except Exception as e:
+            self._handle_db_error(e, "compute_partials")
+
+        histograms: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+        for row in list(subject_bins) + list(dimension_bins):
+            key = (row.subject_name, row.school_code, row.dimension_code)
+            histograms.setdefault(key, {})[str(int(row.bin))] = int(row.cnt)
+
+        partials = []
+        for row in list(subject_rows) + list(dimension_rows):
+            key = (row.subject_name, row.school_code, row.dimension_code)
+            partials.append({
+                'subject_name': row.subject_name,
+                'subject_type': row.subject_type,
+                'school_code': row.school_code,
+                'school_name': row.school_name,
+                'dimension_code': row.dimension_code,
+                'first_seen_id': row.first_seen_id,
+                'partial': {
+                    'count': int(row.cnt or 0),
+                    'total': float(row.score_sum or 0),
+                    'total_sq': float(row.score_sq_sum or 0),
+                    'min': None if row.score_min is None else float(row.score_min),
+                    'max': None if row.score_max is None else float(row.score_max),
+                    'full_score_max': None if row.full_score_max is None else float(row.full_score_max),
+                    'full_score_sum': float(row.full_score_sum or 0),
+                    'bin_width': bin_width,
+                    'histogram': histograms.get(key, {}),
+                    'exact': not row.off_grid,
+                },
+            })
+        return partials
+
+    def replace_partials(self, batch_code: str, partials: List[Dict[str, Any]],
+                         school_codes: Optional[List[str]] = None) -> int:
+        """替换部分统计量（school_codes 为空时替换整个批次）"""
+        try:
+            query = self.db.query(SchoolScorePartial).filter(SchoolScorePartial.batch_code == batch_code)
+            if school_codes is not None:
+                query = query.filter(SchoolScorePartial.school_code.in_(list(school_codes)))
+            query.delete(synchronize_session=False)
+            if partials:
+                now = datetime.now()
+                self.db.execute(
+                    SchoolScorePartial.__table__.insert(),
+                    [self._to_row(batch_code, partial, now) for partial in partials]
+                )
+            self.db.commit()
+            return len(partials)
+        except Exception as e:
+            self._handle_db_error(e, "replace_partials")
+
+    def delete_partials(self, batch_code: str) -> int:
+        """删除批次部分统计量（整批重新清洗时调用，增量汇聚时按需重建）"""
+        try:
+            deleted = self.db.query(SchoolScorePartial).filter(
+                SchoolScorePartial.batch_code == batch_code
+            ).delete(synchronize_session=False)
+            self.db.commit()
+            return deleted
+        except Exception as e:
+            self._handle_db_error(e, "delete_partials")
+
+    def has_partials(self, batch_code: str) -> bool:
+        try:
+            return self.db.query(SchoolScorePartial.id).filter(
+                SchoolScorePartial.batch_code == batch_code
+            ).first() is not None
+        except Exception as e:
+            self._handle_db_error(e, "has_partials")
+
+    def get_partials(self, batch_code: str) -> List[Dict[str, Any]]:
+        """读取批次全部部分统计量（格式与 compute_partials 一致）"""
+        try:
+            rows = self.db.query(SchoolScorePartial).filter(
+                SchoolScorePartial.batch_code == batch_code
+            ).all()
+            return [
+                {
+                    'subject_name': row.subject_name,
+                    'subject_type': row.subject_type,
+                    'school_code': row.school_code,
+                    'school_name': row.school_name,
+                    'dimension_code': row.dimension_code,
+                    'first_seen_id': row.first_seen_id,
+                    'partial': {
+                        'count': row.student_count,
+                        'total': row.score_sum,
+                        'total_sq': row.score_sq_sum,
+                        'min': row.score_min,
+                        'max': row.score_max,
+                        'full_score_max': row.full_score_max,
+                        'full_score_sum': row.full_score_sum,
+                        'bin_width': row.bin_width,
+                        'histogram': row.histogram or {},
+                        'exact': bool(row.histogram_exact),
+                    },
+                }
+                for row in rows
+            ]
+        except Exception as e:
+            self._handle_db_error(e, "get_partials")
+
+    @staticmethod
+    def _to_row(batch_code: str, partial: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+        stats = partial['partial']
+        return {
+            'batch_code': batch_code,
+            'subject_name': partial['subject_name'],
+            'subject_type': partial.get('subject_type'),
+            'school_code': partial['school_code'],
+            'school_name': partial.get('school_name'),
+            'dimension_code': partial.get('dimension_code') or '',
+            'student_count': stats['count'],
+            'score_sum': stats['total'],
+            'score_sq_sum': stats['total_sq'],
+            'score_min': stats['min'],
+            'score_max': stats['max'],
+            'full_score_max': stats['full_score_max'],
+            'full_score_sum': stats['full_score_sum'],
+            'bin_width': stats['bin_width'],
+            'histogram': stats['histogram'],
+            'histogram_exact': bool(stats.get('exact', False)),
+            'first_seen_id': partial.get('first_seen_id'),
+            'updated_at': now,
+        }
+
+
 class DataAdapterRepository(BaseRepository):
     """数据适配器Repository - 统一清洗数据与汇聚计算的接口"""
     
@@ -1263,11 +1983,17 @@ class DataAdapterRepository(BaseRepository):
         except Exception as e:
             self._handle_db_error(e, "check_data_readiness")
     
-    def get_student_scores(self, batch_code: str, subject_type: str = None, school_id: str = None) -> List[Dict[str, Any]]:
-        """获取学生分数数据 - 自动选择最优数据源"""
+    def get_student_scores(self, batch_code: str, subject_type: str = None, school_id: str = None,
+                           readiness: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """获取学生分数数据 - 自动选择最优数据源
+        
+        Args:
+            readiness: 已获取的数据准备状态（如批次上下文缓存），提供时不再重复查询
+        """
         try:
             # 检查数据准备状态
-            readiness = self.check_data_readiness(batch_code)
+            if readiness is None:
+                readiness = self.check_data_readiness(batch_code)
             
             if readiness['data_sources']['has_cleaned_data']:
                 return self._get_cleaned_student_scores(batch_code, subject_type, school_id)
@@ -1280,8 +2006,12 @@ class DataAdapterRepository(BaseRepository):
             self._handle_db_error(e, "get_student_scores")
     
     def _get_cleaned_student_scores(self, batch_code: str, subject_type: str = None, school_id: str = None) -> List[Dict[str, Any]]:
-        """从清洗数据表获取学生分数"""
+        """从清洗数据表获取学生分数（维度分数读取 student_dimension_scores 长表）"""
         try:
+            dimension_index = self.get_dimension_scores(batch_code, school_id=school_id)
+            # 尚未生成维度长表的历史批次回退到解析 dimension_scores JSON
+            parse_json = not dimension_index
+            
             base_query = """
             SELECT 
                 student_id,
@@ -1337,13 +2067,14 @@ class DataAdapterRepository(BaseRepository):
                     'data_source': 'cleaned'
                 }
                 
-                # 解析维度分数JSON
-                if row.dimension_scores and row.dimension_max_scores:
-                    dimension_data = self.json_parser.parse_dimension_scores(
+                dimension_data = dimension_index.get((row.student_id, row.subject_name))
+                if dimension_data:
+                    score_data['dimensions'] = dimension_data
+                elif parse_json and row.dimension_scores and row.dimension_max_scores:
+                    score_data['dimensions'] = self.json_parser.parse_dimension_scores(
                         row.dimension_scores, 
                         row.dimension_max_scores
                     )
-                    score_data['dimensions'] = dimension_data
                 
                 student_scores.append(score_data)
             
@@ -1351,6 +2082,128 @@ class DataAdapterRepository(BaseRepository):
         except Exception as e:
             raise RepositoryError(f"Failed to get cleaned student scores: {str(e)}")
     
+    def count_cleaned_scores(self, batch_code: str, school_id: str = None) -> int:
+        """清洗分数行数（流式读取前预分配列数组用）"""
+        return self._count_batch_rows('student_cleaned_scores', batch_code, school_id)
+    
+    def count_dimension_scores(self, batch_code: str, school_id: str = None) -> int:
+        """维度分数长表行数（流式读取前预分配列数组用）"""
+        return self._count_batch_rows('student_dimension_scores', batch_code, school_id)
+    
+    def _count_batch_rows(self, table: str, batch_code: str, school_id: str = None) -> int:
+        query = f"SELECT COUNT(*) FROM {table} WHERE batch_code = :batch_code"
+        params = {"batch_code": batch_code}
+        if school_id:
+            query += " AND school_id = :school_id"
+            params["school_id"] = school_id
+        try:
+            return int(self.db.execute(text(query), params).scalar() or 0)
+        except Exception as e:
+            self._handle_db_error(e, f"count {table}")
+    
+    def iter_cleaned_score_chunks(self, batch_code: str, subject_type: str = None, school_id: str = None,
+                                  chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE,
+                                  parse_dimension_json: bool = False) -> Iterator[ScoreChunk]:
+        """以服务端游标流式读取清洗分数，按块产出列式 ScoreChunk
+        
+        Args:
+            parse_dimension_json: 维度长表缺失时解析 dimension_scores JSON，结果放在 chunk.dimensions
+        """
+        columns = "student_id, student_name, subject_name, subject_type, total_score as score, max_score, school_id, school_name"
+        if parse_dimension_json:
+            columns += ", dimension_scores, dimension_max_scores"
+        query = f"SELECT {columns} FROM student_cleaned_scores WHERE batch_code = :batch_code"
+        params = {"batch_code": batch_code}
+        
+        if subject_type:
+            query += " AND subject_type = :subject_type"
+            params["subject_type"] = subject_type
+        
+        if school_id:
+            query += " AND school_id = :school_id"
+            params["school_id"] = school_id
+        
+        query += " ORDER BY school_id, student_id, subject_name"
+        
+        parser = self.json_parser.parse_dimension_scores if parse_dimension_json else None
+        try:
+            for rows in self._stream_rows(query, params, chunk_size):
+                yield ScoreChunk.from_rows(rows, parse_dimensions=parser)
+        except Exception as e:
+            raise RepositoryError(f"Failed to stream cleaned student scores: {str(e)}")
+    
+    def iter_dimension_score_chunks(self, batch_code: str, subject_name: str = None, school_id: str = None,
+                                    chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE) -> Iterator[DimensionChunk]:
+        """以服务端游标流式读取维度分数长表，按块产出列式 DimensionChunk"""
+        query = """
+        SELECT student_id, subject_name, dimension_code, score, max_score
+        FROM student_dimension_scores
+        WHERE batch_code = :batch_code
+        """
+        params = {"batch_code": batch_code}
+        
+        if subject_name:
+            query += " AND subject_name = :subject_name"
+            params["subject_name"] = subject_name
+        
+        if school_id:
+            query += " AND school_id = :school_id"
+            params["school_id"] = school_id
+        
+        try:
+            for rows in self._stream_rows(query, params, chunk_size):
+                yield DimensionChunk.from_rows(rows)
+        except Exception as e:
+            raise RepositoryError(f"Failed to stream dimension scores: {str(e)}")
+    
+    def _stream_rows(self, query: str, params: Dict[str, Any], chunk_size: int) -> Iterator[List[Any]]:
+        """服务端游标分块读取，客户端最多缓冲 chunk_size 行"""
+        result = self.db.execute(
+            text(query), params,
+            execution_options={"stream_results": True, "max_row_buffer": chunk_size}
+        )
+        try:
+            for rows in result.partitions(chunk_size):
+                yield rows
+        finally:
+            result.close()
+    
+    def get_dimension_scores(self, batch_code: str, subject_name: str = None,
+                             school_id: str = None) -> Dict[Tuple[str, str], Dict[str, Dict[str, float]]]:
+        """从维度分数长表读取学生维度分数
+        
+        Returns:
+            {(student_id, subject_name): {dimension_code: {'score', 'max_score', 'score_rate'}}}
+        """
+        try:
+            query = """
+            SELECT student_id, subject_name, dimension_code, score, max_score
+            FROM student_dimension_scores
+            WHERE batch_code = :batch_code
+            """
+            params = {"batch_code": batch_code}
+            
+            if subject_name:
+                query += " AND subject_name = :subject_name"
+                params["subject_name"] = subject_name
+            
+            if school_id:
+                query += " AND school_id = :school_id"
+                params["school_id"] = school_id
+            
+            dimensions: Dict[Tuple[str, str], Dict[str, Dict[str, float]]] = {}
+            for student_id, subject, dimension_code, score, max_score in self.db.execute(text(query), params).fetchall():
+                score = float(score or 0)
+                max_score = float(max_score or 0)
+                dimensions.setdefault((student_id, subject), {})[dimension_code] = {
+                    'score': score,
+                    'max_score': max_score,
+                    'score_rate': (score / max_score) if max_score > 0 else 0.0
+                }
+            return dimensions
+        except Exception as e:
+            raise RepositoryError(f"Failed to get dimension scores: {str(e)}")
+    
     def _get_legacy_student_scores(self, batch_code: str, subject_type: str = None, school_id: str = None) -> List[Dict[str, Any]]:
         """从原始数据表获取学生分数（兼容性方法）"""
         try:
@@ -1557,13 +2410,16 @@ class DataAdapterRepository(BaseRepository):
         else:
             return 'exam'  # 默认考试类型
     
-    def get_batch_summary(self, batch_code: str) -> Dict[str, Any]:
-        """获取批次数据摘要"""
+    def get_batch_summary(self, batch_code: str, readiness: Optional[Dict[str, Any]] = None,
+                          subject_configs: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """获取批次数据摘要（可传入已获取的准备状态与科目配置）"""
         try:
-            readiness = self.check_data_readiness(batch_code)
+            if readiness is None:
+                readiness = self.check_data_readiness(batch_code)
             
             # 获取科目配置
-            subject_configs = self.get_subject_configurations(batch_code)
+            if subject_configs is None:
+                subject_configs = self.get_subject_configurations(batch_code)
             
             # 按科目类型分组统计
             exam_subjects = [s for s in subject_configs if s['subject_type'] == 'exam']
@@ -0,0 +1,185 @@
+# 流式分数列块
+"""
+清洗分数的流式列式读取结构。
+
+DataAdapterRepository 通过服务端游标（stream_results）按块读取
+student_cleaned_scores / student_dimension_scores，每块直接填充到预分配的
+NumPy 列数组中，不为每行构建字典。消费方可以逐块处理，或写入 ColumnBuffer：
+缓冲区按预先查询的行数一次分配，列块到达后复制进去即被释放，合并结果的
+峰值内存约为一份列式数据加一个列块。
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STREAM_CHUNK_SIZE = 20000
+
+
+@dataclass(frozen=True)
+class DimensionChunk:
+    """一块学生维度分数（长表格式，每行一个 学生×科目×维度）"""
+    student_ids: np.ndarray
+    subject_names: np.ndarray
+    dimension_codes: np.ndarray
+    scores: np.ndarray
+    max_scores: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    @classmethod
+    def empty(cls) -> 'DimensionChunk':
+        obj = np.empty(0, dtype=object)
+        num = np.empty(0, dtype=np.float64)
+        return cls(obj, obj, obj, num, num)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Sequence[Any]]) -> 'DimensionChunk':
+        """由 (student_id, subject_name, dimension_code, score, max_score) 行构建"""
+        n = len(rows)
+        chunk = cls(
+            student_ids=np.empty(n, dtype=object),
+            subject_names=np.empty(n, dtype=object),
+            dimension_codes=np.empty(n, dtype=object),
+            scores=np.empty(n, dtype=np.float64),
+            max_scores=np.empty(n, dtype=np.float64),
+        )
+        if n:
+            student_ids, subject_names, codes, scores, max_scores = zip(*rows)
+            chunk.student_ids[:] = student_ids
+            chunk.subject_names[:] = subject_names
+            chunk.dimension_codes[:] = codes
+            chunk.scores[:] = _to_float(scores)
+            chunk.max_scores[:] = _to_float(max_scores)
+        return chunk
+
+    @classmethod
+    def collect(cls, chunks: Iterable['DimensionChunk'], capacity: int = 0) -> 'DimensionChunk':
+        """将流式列块逐块写入按 capacity 预分配的列数组（不保留列块列表）"""
+        buffer = ColumnBuffer(DIMENSION_COLUMNS, capacity)
+        for chunk in chunks:
+            buffer.append(chunk)
+        return cls(**buffer.columns())
+
+
+@dataclass(frozen=True)
+class ScoreChunk:
+    """一块学生科目分数（列式）"""
+    student_ids: np.ndarray
+    student_names: np.ndarray
+    school_ids: np.ndarray
+    school_names: np.ndarray
+    subject_names: np.ndarray
+    subject_types: np.ndarray
+    scores: np.ndarray
+    max_scores: np.ndarray
+    # 维度长表缺失时由 dimension_scores JSON 解析得到的维度数据
+    dimensions: Optional[DimensionChunk] = None
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Any],
+                  parse_dimensions: Optional[Callable[[Any, Any], Dict[str, Dict[str, float]]]] = None) -> 'ScoreChunk':
+        """由清洗分数查询行构建，列数组按块大小预分配后逐列填充"""
+        n = len(rows)
+        chunk = cls(
+            student_ids=np.empty(n, dtype=object),
+            student_names=np.empty(n, dtype=object),
+            school_ids=np.empty(n, dtype=object),
+            school_names=np.empty(n, dtype=object),
+            subject_names=np.empty(n, dtype=object),
+            subject_types=np.empty(n, dtype=object),
+            scores=np.empty(n, dtype=np.float64),
+            max_scores=np.empty(n, dtype=np.float64),
+            dimensions=_parse_dimension_rows(rows, parse_dimensions) if parse_dimensions else None,
+        )
+        if n:
+            chunk.student_ids[:] = [row.student_id for row in rows]
+            chunk.student_names[:] = [row.student_name or '' for row in rows]
+            chunk.school_ids[:] = [_normalize_school_id(row.school_id) for row in rows]
+            chunk.school_names[:] = [row.school_name or '' for row in rows]
+            chunk.subject_names[:] = [row.subject_name for row in rows]
+            chunk.subject_types[:] = [row.subject_type or 'exam' for row in rows]
+            chunk.scores[:] = _to_float([row.score for row in rows])
+            chunk.max_scores[:] = _to_float([row.max_score for row in rows])
+        return chunk
+
+
+DIMENSION_COLUMNS: Dict[str, Any] = {
+    'student_ids': object, 'subject_names': object, 'dimension_codes': object,
+    'scores': np.float64, 'max_scores': np.float64,
+}
+SCORE_COLUMNS: Dict[str, Any] = {
+    'student_ids': object, 'student_names': object, 'school_ids': object, 'school_names': object,
+    'subject_names': object, 'subject_types': object, 'scores': np.float64, 'max_scores': np.float64,
+}
+
+
+class ColumnBuffer:
+    """按预估行数预分配的列数组，流式列块逐块复制写入
+
+    预估行数偏小（读取期间有新数据写入或未提供行数）时按倍数扩容。
+    """
+
+    def __init__(self, columns: Dict[str, Any], capacity: int = 0):
+        self._arrays = {name: np.empty(max(int(capacity or 0), 0), dtype=dtype) for name, dtype in columns.items()}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return len(next(iter(self._arrays.values())))
+
+    def append(self, chunk: Any) -> None:
+        n = len(chunk)
+        if not n:
+            return
+        end = self._size + n
+        if end > self.capacity:
+            grown_capacity = max(end, self.capacity * 2)
+            logger.debug(f"列缓冲区扩容: {self.capacity} -> {grown_capacity} 行")
+            for name, array in self._arrays.items():
+                grown = np.empty(grown_capacity, dtype=array.dtype)
+                grown[:self._size] = array[:self._size]
+                self._arrays[name] = grown
+        for name, array in self._arrays.items():
+            array[self._size:end] = getattr(chunk, name)
+        self._size = end
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """已写入的列（切片视图，不复制）"""
+        return {name: array[:self._size] for name, array in self._arrays.items()}
+
+
+def _to_float(values: Sequence[Any]) -> np.ndarray:
+    """数据库数值（Decimal/None）转换为float64，空值按0处理"""
+    array = np.array(values, dtype=np.float64)
+    return np.nan_to_num(array, nan=0.0)
+
+
+def _normalize_school_id(school_id: Any) -> str:
+    """学校ID统一为字符串，空值置空"""
+    if school_id is None or isinstance(school_id, dict):
+        return ''
+    return str(school_id)
+
+
+def _parse_dimension_rows(rows: Sequence[Any],
+                          parse: Callable[[Any, Any], Dict[str, Dict[str, float]]]) -> DimensionChunk:
+    """解析块内各行的维度JSON为长表格式"""
+    dimension_rows: List[tuple] = []
+    for row in rows:
+        if not (row.dimension_scores and row.dimension_max_scores):
+            continue
+        for code, data in parse(row.dimension_scores, row.dimension_max_scores).items():
+            dimension_rows.append((row.student_id, row.subject_name, code, data['score'], data['max_score']))
+    return DimensionChunk.from_rows(dimension_rows)
@@ -0,0 +1,211 @@
+# 统计历史差异编码
+"""
+statistical_history 的紧凑存储格式。
+
+每次更新只记录 statistics_data 的结构化差异（patch）和新旧版本的内容哈希，
+每隔 CHECKPOINT_INTERVAL 条（或版本链断开时）在 previous_data 中保存一次
+完整的变更前数据作为检查点。任意历史版本都可以从其之前最近的检查点
+按顺序回放差异重建。统计数据未变化的重算不写历史。
+
+记录格式：
+- previous_data: 检查点时为 {'format': 'checkpoint', 'hash', 'statistics_data', ...}，
+  否则只包含状态等标量字段
+- current_data: {'format': 'delta', 'hash', 'base_hash', 'patch', ...}
+- change_summary: 版本元数据（hash/base_hash/sequence/checkpoint），
+  重建时先只读取该列定位检查点，再加载需要回放的记录
+
+旧的全量记录（无 format 字段）在回放时直接作为完整版本使用。
+设置 STATISTICS_HISTORY_MODE=full 可恢复全量快照写法。
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+HISTORY_MODE = os.getenv("STATISTICS_HISTORY_MODE", "delta")
+CHECKPOINT_INTERVAL = int(os.getenv("STATISTICS_HISTORY_CHECKPOINT_INTERVAL", 20))
+
+_MISSING = object()
+
+
+def content_hash(data: Any) -> str:
+    """统计数据内容哈希（键排序后的规范JSON的SHA-256）"""
+    canonical = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def diff_json(old: Any, new: Any, path: Tuple = ()) -> List[Dict[str, Any]]:
+    """计算两个JSON文档的结构化差异
+
+    返回操作列表：{'op': 'set', 'path': [...], 'value': v} 或 {'op': 'del', 'path': [...]}。
+    字典逐键比较；等长列表逐元素比较，长度不同时整体替换。
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({'op': 'del', 'path': [*path, key]})
+        for key, value in new.items():
+            old_value = old.get(key, _MISSING)
+            if old_value is _MISSING:
+                ops.append({'op': 'set', 'path': [*path, key], 'value': value})
+            elif old_value != value:
+                ops.extend(diff_json(old_value, value, (*path, key)))
+        return ops
+
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        ops = []
+        for i, (old_item, new_item) in enumerate(zip(old, new)):
+            if old_item != new_item:
+                ops.extend(diff_json(old_item, new_item, (*path, i)))
+        return ops
+
+    if old == new and type(old) is type(new):
+        return []
+    return [{'op': 'set', 'path': list(path), 'value': new}]
+
+
+def apply_json_patch(document: Any, ops: Iterable[Dict[str, Any]]) -> Any:
+    """在文档副本上应用 diff_json 生成的差异"""
+    document = copy.deepcopy(document)
+    for op in ops:
+        path = op['path']
+        if not path:
+            document = copy.deepcopy(op.get('value'))
+            continue
+        parent = document
+        for key in path[:-1]:
+            parent = parent[key]
+        key = path[-1]
+        if op['op'] == 'del':
+            del parent[key]
+        elif isinstance(parent, list) and key == len(parent):
+            parent.append(copy.deepcopy(op['value']))
+        else:
+            parent[key] = copy.deepcopy(op['value'])
+    return document
+
+
+def _enum_value(value: Any) -> Any:
+    return value.value if hasattr(value, 'value') else value
+
+
+def build_delta_history(existing: Any, new_data: Dict[str, Any],
+                        head: Optional[Dict[str, Any]],
+                        checkpoint_interval: int = CHECKPOINT_INTERVAL
+                        ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """构建一条差异格式的历史记录
+
+    Args:
+        existing: 更新前的 StatisticalAggregation
+        new_data: 更新数据
+        head: 该统计记录最近一条差异历史的 change_summary（没有时为None）
+
+    Returns:
+        (历史记录字段, 新的 change_summary)；统计数据与状态均未变化时返回None
+    """
+    previous_stats = existing.statistics_data
+    current_stats = new_data.get('statistics_data', previous_stats)
+    previous_fields = {
+        'calculation_status': _enum_value(existing.calculation_status),
+        'total_students': existing.total_students,
+    }
+    current_fields = {
+        'calculation_status': _enum_value(new_data.get('calculation_status', existing.calculation_status)),
+        'total_students': new_data.get('total_students', existing.total_students),
+    }
+
+    base_hash = content_hash(previous_stats)
+    new_hash = content_hash(current_stats)
+    if base_hash == new_hash and previous_fields == current_fields:
+        return None
+
+    # 首条记录、达到检查点间隔或版本链断开（记录被绕过仓库修改）时写检查点
+    since_checkpoint = (head or {}).get('since_checkpoint', 0) + 1
+    checkpoint = head is None or head.get('hash') != base_hash or since_checkpoint >= checkpoint_interval
+    patch = diff_json(previous_stats, current_stats)
+
+    summary = {
+        'format': 'delta',
+        'hash': new_hash,
+        'base_hash': base_hash,
+        'sequence': (head or {}).get('sequence', 0) + 1,
+        'checkpoint': checkpoint,
+        'since_checkpoint': 0 if checkpoint else since_checkpoint,
+        'patch_ops': len(patch),
+        'updated_fields': list(new_data.keys()),
+        'update_time': datetime.now().isoformat(),
+    }
+    previous_data = dict(previous_fields)
+    if checkpoint:
+        previous_data.update({'format': 'checkpoint', 'hash': base_hash, 'statistics_data': previous_stats})
+    current_data = {
+        'format': 'delta',
+        'hash': new_hash,
+        'base_hash': base_hash,
+        'patch': patch,
+        **current_fields,
+        'calculation_duration': new_data.get('calculation_duration'),
+    }
+    history_data = {
+        'previous_data': previous_data,
+        'current_data': current_data,
+        'change_summary': summary,
+    }
+    return history_data, summary
+
+
+def replay_window(summaries: Sequence[Tuple[int, Optional[Dict[str, Any]]]],
+                  target_hash: str) -> Optional[Tuple[int, int]]:
+    """根据按id升序的 (历史id, change_summary) 确定重建目标版本需回放的记录区间
+
+    Returns:
+        (起始检查点id, 目标记录id)；目标不在差异格式记录中时返回None
+    """
+    checkpoint_id = None
+    for history_id, summary in summaries:
+        summary = summary or {}
+        if summary.get('format') != 'delta':
+            # 旧的全量记录同样可作为回放起点
+            checkpoint_id = history_id
+            continue
+        if summary.get('checkpoint'):
+            checkpoint_id = history_id
+        if target_hash in (summary.get('hash'), summary.get('base_hash')) and checkpoint_id is not None:
+            return checkpoint_id, history_id
+    return None
+
+
+def replay_statistics_history(rows: Iterable[Any], target_hash: str) -> Optional[Any]:
+    """按id升序回放历史记录，返回内容哈希等于 target_hash 的 statistics_data"""
+    state = _MISSING
+    for row in rows:
+        previous = row.previous_data or {}
+        current = row.current_data or {}
+
+        if previous.get('format') == 'checkpoint':
+            state = previous.get('statistics_data')
+            if previous.get('hash') == target_hash:
+                return copy.deepcopy(state)
+        elif current.get('format') != 'delta' and 'statistics_data' in previous:
+            state = previous['statistics_data']
+            if content_hash(state) == target_hash:
+                return copy.deepcopy(state)
+
+        if current.get('format') == 'delta':
+            if state is _MISSING:
+                continue
+            state = apply_json_patch(state, current.get('patch') or [])
+            if current.get('hash') == target_hash:
+                return state
+        elif 'statistics_data' in current:
+            state = current['statistics_data']
+            if content_hash(state) == target_hash:
+                return copy.deepcopy(state)
+    return None
@@ -29,6 +29,27 @@ app.include_router(reporting_router, prefix="/api/v1/reporting", tags=["报告AP
 app.include_router(calculation_router, prefix="/api/v1/statistics", tags=["统计计算API"])
 app.include_router(subjects_v12_router, prefix="/api/v12", tags=["Subjects v1.2"])
 
+@app.on_event("startup")
+async def start_task_workers():
+    """嵌入模式下启动任务队列工作线程（继续执行重启前排队的任务）"""
+    from app.services.task_queue import TaskQueueSettings, get_worker_pool
+    if TaskQueueSettings.from_env().embedded:
+        get_worker_pool()
+
+@app.on_event("shutdown")
+async def stop_task_workers():
+    """停止认领新任务；未结束的任务由其他进程在心跳超时后回收"""
+    from app.services.task_queue import shutdown_worker_pool
+    shutdown_worker_pool(timeout=5)
+
+@app.on_event("shutdown")
+async def close_cache_connections():
+    """关闭Redis连接池"""
+    from app.database.connection import get_cache_manager
+    cache = get_cache_manager()
+    if cache:
+        await cache.close()
+
 @app.get("/")
 async def root():
     return {
@@ -0,0 +1,125 @@
+# 批次上下文
+"""
+计算运行内共享的批次元数据缓存。
+
+年级、数据准备状态、科目配置、批次摘要和清洗数据指纹在一次计算运行内只查询一次。
+上下文由 ``CalculationService`` 创建（每次 ``calculate_batch_statistics`` 使用新的上下文），
+序列化的数据整合器通过其计算服务读取年级；``SimplifiedAggregationService`` 和
+``StatisticsJsonSerializer`` 不使用上下文。
+
+数据清洗完成后调用 ``invalidate_batch_context(batch_code)``，本进程内已创建的上下文
+在下次访问时自动丢弃该批次的缓存值。失效标记只在当前进程内有效：清洗与计算在不同的
+工作进程中执行时（独立任务工作进程），依赖的是每次计算运行重新创建上下文，
+而不是失效通知。
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..database.repositories import DataAdapterRepository
+from .input_fingerprint import InputFingerprints, load_input_fingerprints
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRADE_LEVEL = '7th_grade'
+
+# 批次缓存代数：清洗完成后递增，上下文据此判断缓存是否失效
+_generations: Dict[str, int] = {}
+_generations_lock = threading.Lock()
+
+
+def invalidate_batch_context(batch_code: str) -> None:
+    """使指定批次的所有上下文缓存失效（数据清洗完成后调用）"""
+    with _generations_lock:
+        _generations[batch_code] = _generations.get(batch_code, 0) + 1
+    logger.debug(f"批次 {batch_code} 上下文缓存已失效")
+
+
+def _current_generation(batch_code: str) -> int:
+    return _generations.get(batch_code, 0)
+
+
+class BatchContext:
+    """单批次元数据的运行级缓存"""
+
+    def __init__(self, db_session: Session, batch_code: str,
+                 data_adapter: Optional[DataAdapterRepository] = None):
+        self.db_session = db_session
+        self.batch_code = batch_code
+        self.data_adapter = data_adapter or DataAdapterRepository(db_session)
+        self._values: Dict[str, Any] = {}
+        self._generation = _current_generation(batch_code)
+
+    def _resolve(self, key: str, loader: Callable[[], Any]) -> Any:
+        """读取缓存值，未命中或已失效时调用 loader 加载"""
+        generation = _current_generation(self.batch_code)
+        if generation != self._generation:
+            self._values.clear()
+            self._generation = generation
+        if key not in self._values:
+            self._values[key] = loader()
+        return self._values[key]
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """清除本上下文的缓存（不指定 key 时全部清除）"""
+        if key is None:
+            self._values.clear()
+        else:
+            self._values.pop(key, None)
+
+    @property
+    def grade_level(self) -> str:
+        """批次年级（来自 grade_aggregation_main，未找到时为默认年级）"""
+        return self.known_grade_level or DEFAULT_GRADE_LEVEL
+
+    @property
+    def known_grade_level(self) -> Optional[str]:
+        """批次年级，grade_aggregation_main 中未找到时为 None"""
+        return self._resolve('grade_level', self._load_grade_level)
+
+    @property
+    def readiness(self) -> Dict[str, Any]:
+        """批次数据准备状态"""
+        return self._resolve('readiness', lambda: self.data_adapter.check_data_readiness(self.batch_code))
+
+    @property
+    def subject_configurations(self) -> List[Dict[str, Any]]:
+        """批次科目配置"""
+        return self._resolve(
+            'subject_configurations', lambda: self.data_adapter.get_subject_configurations(self.batch_code) or []
+        )
+
+    @property
+    def batch_summary(self) -> Dict[str, Any]:
+        """批次摘要（复用已缓存的准备状态与科目配置）"""
+        return self._resolve('batch_summary', lambda: self.data_adapter.get_batch_summary(
+            self.batch_code, readiness=self.readiness, subject_configs=self.subject_configurations
+        ))
+
+    @property
+    def input_fingerprints(self) -> InputFingerprints:
+        """批次清洗数据指纹（判断汇聚单元输入是否变化）"""
+        return self._resolve('input_fingerprints', lambda: load_input_fingerprints(self.db_session, self.batch_code))
+
+    def _load_grade_level(self) -> Optional[str]:
+        try:
+            row = self.db_session.execute(
+                text("""
+                    SELECT grade_level
+                    FROM grade_aggregation_main
+                    WHERE batch_code = :batch_code
+                    LIMIT 1
+                """),
+                {'batch_code': self.batch_code}
+            ).fetchone()
+            if row:
+                logger.debug(f"从数据库获取批次 {self.batch_code} 年级: {row[0]}")
+                return row[0]
+            logger.warning(f"批次 {self.batch_code} 在grade_aggregation_main表中未找到，使用默认年级")
+        except Exception as e:
+            logger.error(f"获取批次年级失败: {e}")
+        return None
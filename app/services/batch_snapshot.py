@@ -0,0 +1,332 @@
+# 批次分数快照
+"""
+单次计算运行内共享的只读批次分数快照。
+
+快照在一次计算开始时从数据适配器加载一次，以列式 NumPy 数组保存分数、
+学校、科目等字段，并按科目预先解析维度分数矩阵。区域级、科目级、
+维度级和学校级计算都从同一份快照读取，避免重复访问 student_cleaned_scores。
+
+清洗数据通过 from_chunks 由流式列块直接构建，不经过逐行字典：列块逐块写入
+按预先查询的行数分配的列数组，不保留列块列表，加载时的峰值内存约为一份列式
+数据加一个列块。快照本身不是有界内存结构：它保存整批数据，各科目视图另外按
+行号复制学号、学校与分数列，并持有维度分数矩阵。需要有界内存的消费方应直接使用
+DataAdapterRepository.iter_cleaned_score_chunks 逐块处理。原始数据等兼容路径仍使用
+from_records。
+"""
+
+import logging
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..database.score_stream import DIMENSION_COLUMNS, SCORE_COLUMNS, ColumnBuffer, DimensionChunk, ScoreChunk
+
+logger = logging.getLogger(__name__)
+
+
+def _readonly(array: np.ndarray) -> np.ndarray:
+    """将数组标记为只读，防止计算过程中意外修改快照"""
+    array.setflags(write=False)
+    return array
+
+
+@dataclass(frozen=True)
+class SubjectScoreView:
+    """单个科目在快照中的列式视图"""
+    subject_name: str
+    subject_type: str
+    max_score: float
+    student_ids: np.ndarray
+    school_ids: np.ndarray
+    scores: np.ndarray
+    dimension_codes: Tuple[str, ...] = ()
+    dimension_scores: np.ndarray = field(default_factory=lambda: np.empty((0, 0)))
+    dimension_max_scores: Mapping[str, float] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def dimension_vector(self, dimension_code: str) -> np.ndarray:
+        """获取指定维度的学生分数向量（缺失维度按0分处理）"""
+        try:
+            column = self.dimension_codes.index(dimension_code)
+        except ValueError:
+            return _readonly(np.zeros(len(self.scores), dtype=np.float64))
+        return self.dimension_scores[:, column]
+
+    def for_school(self, school_id: str) -> 'SubjectScoreView':
+        """按学校筛选得到子视图"""
+        mask = self.school_ids == str(school_id)
+        return SubjectScoreView(
+            subject_name=self.subject_name,
+            subject_type=self.subject_type,
+            max_score=self.max_score,
+            student_ids=_readonly(self.student_ids[mask]),
+            school_ids=_readonly(self.school_ids[mask]),
+            scores=_readonly(self.scores[mask]),
+            dimension_codes=self.dimension_codes,
+            dimension_scores=_readonly(self.dimension_scores[mask]),
+            dimension_max_scores=self.dimension_max_scores,
+        )
+
+
+@dataclass(frozen=True)
+class BatchScoreSnapshot:
+    """批次学生分数的不可变列式快照"""
+    batch_code: str
+    student_ids: np.ndarray
+    student_names: np.ndarray
+    school_ids: np.ndarray
+    school_names: np.ndarray
+    subject_names: np.ndarray
+    subject_types: np.ndarray
+    scores: np.ndarray
+    max_scores: np.ndarray
+    grades: np.ndarray
+    data_sources: np.ndarray
+    subjects: Mapping[str, SubjectScoreView]
+
+    @classmethod
+    def from_records(cls, batch_code: str, records: Iterable[Dict[str, Any]]) -> 'BatchScoreSnapshot':
+        """由数据适配器返回的学生分数记录构建快照（只遍历一次记录）"""
+        records = list(records or [])
+
+        student_ids = np.array([r['student_id'] for r in records], dtype=object)
+        student_names = np.array([r.get('student_name') or '' for r in records], dtype=object)
+        school_ids = np.array([_normalize_school_id(r.get('school_id')) for r in records], dtype=object)
+        school_names = np.array([r.get('school_name') or '' for r in records], dtype=object)
+        subject_names = np.array([r['subject_name'] for r in records], dtype=object)
+        subject_types = np.array([r.get('subject_type') or 'exam' for r in records], dtype=object)
+        scores = np.array([r.get('total_score', r.get('score')) or 0.0 for r in records], dtype=np.float64)
+        max_scores = np.array([r.get('max_score') or 0.0 for r in records], dtype=np.float64)
+        grades = np.array([r.get('grade') or '' for r in records], dtype=object)
+        data_sources = np.array([r.get('data_source', 'unknown') for r in records], dtype=object)
+
+        return cls._assemble(
+            batch_code, student_ids, student_names, school_ids, school_names, subject_names,
+            subject_types, scores, max_scores, grades, data_sources,
+            lambda subject_name, index: _build_dimension_matrix([records[i] for i in index]),
+        )
+
+    @classmethod
+    def from_chunks(cls, batch_code: str, score_chunks: Iterable[ScoreChunk],
+                    dimensions: Optional[DimensionChunk] = None,
+                    capacity: int = 0) -> 'BatchScoreSnapshot':
+        """由数据适配器流式读取的列块构建快照
+
+        Args:
+            score_chunks: 清洗分数列块（可为按块读取数据库的迭代器），逐块写入预分配的列数组
+            dimensions: 维度长表数据；为空时使用各列块自带的 JSON 解析维度
+            capacity: 预估的清洗分数行数（列数组一次分配；偏小或为0时按倍数扩容）
+        """
+        json_dimensions = ColumnBuffer(DIMENSION_COLUMNS) if dimensions is None or not len(dimensions) else None
+        buffer = ColumnBuffer(SCORE_COLUMNS, capacity)
+        chunk_count = 0
+        for chunk in score_chunks:
+            if not len(chunk):
+                continue
+            chunk_count += 1
+            buffer.append(chunk)
+            if json_dimensions is not None and chunk.dimensions is not None:
+                json_dimensions.append(chunk.dimensions)
+        if json_dimensions is not None:
+            dimensions = DimensionChunk(**json_dimensions.columns())
+        columns = buffer.columns()
+
+        student_ids = columns['student_ids']
+        n = len(student_ids)
+        dimension_groups = _group_rows(dimensions.subject_names)
+
+        def build_dimensions(subject_name: str, index: np.ndarray):
+            rows = dimension_groups.get(subject_name)
+            if rows is None:
+                return (), np.zeros((len(index), 0), dtype=np.float64), {}
+            return _dimension_matrix_from_long(
+                student_ids[index], dimensions.student_ids[rows], dimensions.dimension_codes[rows],
+                dimensions.scores[rows], dimensions.max_scores[rows],
+            )
+
+        snapshot = cls._assemble(
+            batch_code, student_ids, columns['student_names'], columns['school_ids'],
+            columns['school_names'], columns['subject_names'], columns['subject_types'],
+            columns['scores'], columns['max_scores'],
+            np.full(n, '', dtype=object), np.full(n, 'cleaned', dtype=object),
+            build_dimensions,
+        )
+        logger.debug(f"批次 {batch_code} 由 {chunk_count} 个列块构建快照: {n} 行, {len(dimensions)} 条维度分数")
+        return snapshot
+
+    @classmethod
+    def _assemble(cls, batch_code: str, student_ids: np.ndarray, student_names: np.ndarray,
+                  school_ids: np.ndarray, school_names: np.ndarray, subject_names: np.ndarray,
+                  subject_types: np.ndarray, scores: np.ndarray, max_scores: np.ndarray,
+                  grades: np.ndarray, data_sources: np.ndarray,
+                  build_dimensions: Callable[[str, np.ndarray], Tuple[Tuple[str, ...], np.ndarray, Dict[str, float]]]
+                  ) -> 'BatchScoreSnapshot':
+        """由列数组组装快照，并按科目（保持首次出现顺序）构建科目视图"""
+        subjects: Dict[str, SubjectScoreView] = {}
+        for subject_name, index in _group_rows(subject_names).items():
+            codes, matrix, dim_max = build_dimensions(subject_name, index)
+            subjects[subject_name] = SubjectScoreView(
+                subject_name=subject_name,
+                subject_type=subject_types[index[0]],
+                max_score=float(max_scores[index[0]]),
+                student_ids=_readonly(student_ids[index]),
+                school_ids=_readonly(school_ids[index]),
+                scores=_readonly(scores[index]),
+                dimension_codes=codes,
+                dimension_scores=_readonly(matrix),
+                dimension_max_scores=MappingProxyType(dim_max),
+            )
+
+        return cls(
+            batch_code=batch_code,
+            student_ids=_readonly(student_ids),
+            student_names=_readonly(student_names),
+            school_ids=_readonly(school_ids),
+            school_names=_readonly(school_names),
+            subject_names=_readonly(subject_names),
+            subject_types=_readonly(subject_types),
+            scores=_readonly(scores),
+            max_scores=_readonly(max_scores),
+            grades=_readonly(grades),
+            data_sources=_readonly(data_sources),
+            subjects=MappingProxyType(subjects),
+        )
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    @property
+    def empty(self) -> bool:
+        return len(self.scores) == 0
+
+    def subject(self, subject_name: str) -> Optional[SubjectScoreView]:
+        """获取科目视图，不存在时返回None"""
+        return self.subjects.get(subject_name)
+
+    def school_list(self) -> List[str]:
+        """获取批次中所有学校ID（排序后）"""
+        return sorted({s for s in self.school_ids if s})
+
+    def school_name(self, school_id: str) -> Optional[str]:
+        """获取学校名称"""
+        matches = np.flatnonzero(self.school_ids == str(school_id))
+        for i in matches:
+            if self.school_names[i]:
+                return self.school_names[i]
+        return None
+
+    def for_school(self, school_id: str) -> 'BatchScoreSnapshot':
+        """按学校筛选得到子快照（不访问数据库）"""
+        mask = self.school_ids == str(school_id)
+        return BatchScoreSnapshot(
+            batch_code=self.batch_code,
+            student_ids=_readonly(self.student_ids[mask]),
+            student_names=_readonly(self.student_names[mask]),
+            school_ids=_readonly(self.school_ids[mask]),
+            school_names=_readonly(self.school_names[mask]),
+            subject_names=_readonly(self.subject_names[mask]),
+            subject_types=_readonly(self.subject_types[mask]),
+            scores=_readonly(self.scores[mask]),
+            max_scores=_readonly(self.max_scores[mask]),
+            grades=_readonly(self.grades[mask]),
+            data_sources=_readonly(self.data_sources[mask]),
+            subjects=MappingProxyType({
+                name: view.for_school(school_id)
+                for name, view in self.subjects.items()
+                if (view.school_ids == str(school_id)).any()
+            }),
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """转换为计算引擎使用的DataFrame（score列即学生科目总分）"""
+        return pd.DataFrame({
+            'student_id': self.student_ids,
+            'student_name': self.student_names,
+            'school_id': self.school_ids,
+            'school_name': self.school_names,
+            'subject_name': self.subject_names,
+            'score': self.scores,
+            'max_score': self.max_scores,
+            'subject_type': self.subject_types,
+            'grade': self.grades,
+            'data_source': self.data_sources,
+        })
+
+
+def _normalize_school_id(school_id: Any) -> str:
+    """学校ID统一为字符串，异常值（None/dict）置空"""
+    if school_id is None or isinstance(school_id, dict):
+        return ''
+    return str(school_id)
+
+
+def _group_rows(labels: np.ndarray) -> Dict[Any, np.ndarray]:
+    """按标签分组行号（组按首次出现顺序，组内保持原行序）"""
+    if len(labels) == 0:
+        return {}
+    codes, uniques = pd.factorize(labels, use_na_sentinel=False)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+    return dict(zip(uniques, np.split(order, bounds)))
+
+
+def _dimension_matrix_from_long(view_student_ids: np.ndarray, student_ids: np.ndarray, codes: np.ndarray,
+                                scores: np.ndarray, max_scores: np.ndarray
+                                ) -> Tuple[Tuple[str, ...], np.ndarray, Dict[str, float]]:
+    """将科目内的维度长表数据转换为 (学生数 × 维度数) 分数矩阵（向量化）
+
+    维度顺序与维度满分的取值口径与 _build_dimension_matrix 一致：
+    按学生在科目视图中首次出现的顺序确定。
+    """
+    view_index = pd.Index(view_student_ids)
+    if not view_index.is_unique:
+        view_index = view_index.drop_duplicates()
+    student_position = view_index.get_indexer(student_ids)
+    keep = student_position >= 0
+    if not keep.any():
+        return (), np.zeros((len(view_student_ids), 0), dtype=np.float64), {}
+
+    order = np.flatnonzero(keep)
+    order = order[np.argsort(student_position[order], kind='stable')]
+    codes, scores, max_scores = codes[order], scores[order], max_scores[order]
+    student_position = student_position[order]
+
+    code_index, code_uniques = pd.factorize(codes)
+    first = np.unique(code_index, return_index=True)[1]
+    dim_max = {str(code_uniques[k]): float(max_scores[i]) for k, i in enumerate(first)}
+
+    # 学生(去重) × 维度矩阵，没有维度数据的学生保持0分
+    matrix = np.zeros((len(view_index), len(code_uniques)), dtype=np.float64)
+    matrix[student_position, code_index] = scores
+    rows = view_index.get_indexer(view_student_ids)
+    return tuple(str(c) for c in code_uniques), matrix[rows], dim_max
+
+
+def _build_dimension_matrix(records: List[Dict[str, Any]]) -> Tuple[Tuple[str, ...], np.ndarray, Dict[str, float]]:
+    """将科目内学生的已解析维度数据转换为 (学生数 × 维度数) 分数矩阵"""
+    codes: Dict[str, int] = {}
+    dim_max: Dict[str, float] = {}
+    for record in records:
+        for code, dim_data in (record.get('dimensions') or {}).items():
+            if code not in codes:
+                codes[code] = len(codes)
+            # 维度满分以第一个有效记录为准
+            if code not in dim_max and isinstance(dim_data, dict):
+                dim_max[code] = float(dim_data.get('max_score', 0) or 0)
+
+    matrix = np.zeros((len(records), len(codes)), dtype=np.float64)
+    if codes:
+        for row, record in enumerate(records):
+            for code, dim_data in (record.get('dimensions') or {}).items():
+                if isinstance(dim_data, dict) and 'score' in dim_data:
+                    try:
+                        matrix[row, codes[code]] = float(dim_data['score'])
+                    except (TypeError, ValueError):
+                        pass
+
+    return tuple(codes), matrix, dim_max
@@ -1,17 +1,25 @@
 # 统计计算服务
-import json
+import asyncio
 import logging
+import numpy as np
 import pandas as pd
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Optional
 from sqlalchemy.orm import Session
 
 from ..database.models import AggregationLevel, CalculationStatus
 from .subjects_builder import SubjectsBuilder
+from .batch_snapshot import BatchScoreSnapshot, SubjectScoreView
+from .batch_context import BatchContext
+from .subject_executor import ExecutorSettings, ScoreTask, run_score_tasks
 from ..utils.precision import round2_json
 from ..database.repositories import StatisticalAggregationRepository, DataAdapterRepository
+from ..database.score_stream import DimensionChunk
 from ..calculation.calculators import initialize_calculation_system
 from ..calculation.engine import CalculationEngine
+from ..calculation.grouped_statistics import calculate_grouped_statistics, statistics_from_partial
+from ..calculation.partials import ScorePartial
 
 logger = logging.getLogger(__name__)
 
@@ -24,28 +32,53 @@ class CalculationService:
         self.repository = StatisticalAggregationRepository(db_session)
         self.data_adapter = DataAdapterRepository(db_session)
         self.engine = initialize_calculation_system()
+        # 批次上下文：年级、准备状态、科目配置等元数据在一次运行内只查询一次
+        self._batch_contexts: Dict[str, BatchContext] = {}
+        # 科目并行执行配置（CALC_EXECUTOR_MODE / CALC_EXECUTOR_WORKERS / CALC_PROCESS_THRESHOLD）
+        self.executor_settings = ExecutorSettings.from_env()
+    
+    def batch_context(self, batch_code: str) -> BatchContext:
+        """获取批次上下文（同一服务实例内复用）"""
+        context = self._batch_contexts.get(batch_code)
+        if context is None:
+            context = BatchContext(self.db_session, batch_code, self.data_adapter)
+            self._batch_contexts[batch_code] = context
+        return context
         
     async def calculate_batch_statistics(self, batch_code: str, config: Dict[str, Any] = None, 
-                                       progress_callback: callable = None) -> Dict[str, Any]:
-        """计算批次统计数据 - 增强版本，自动生成区域级和学校级数据"""
+                                       progress_callback: callable = None,
+                                       force: bool = False) -> Dict[str, Any]:
+        """计算批次统计数据 - 增强版本，自动生成区域级和学校级数据
+        
+        Args:
+            force: 为 False 时清洗数据指纹与算法版本均未变化的批次直接返回已有结果
+        """
         logger.info(f"开始增强计算批次 {batch_code} 的统计数据（区域级+学校级）")
         start_time = time.time()
         
         try:
-            # 1. 获取学生分数数据
+            # 新的计算运行使用新的批次上下文
+            self._batch_contexts.pop(batch_code, None)
+            
+            # 0. 输入未变化时跳过整批计算
+            if not force:
+                unchanged_result = self._unchanged_batch_result(batch_code, start_time)
+                if unchanged_result is not None:
+                    if progress_callback:
+                        progress_callback(100, "输入数据未变化，沿用已有统计结果")
+                    return unchanged_result
+            
+            # 1. 加载批次分数快照（本次运行内所有科目、维度、学校计算共享）
             if progress_callback:
                 progress_callback(5, "正在加载学生数据...")
-            data = await self._fetch_student_scores(batch_code)
-            if data.empty:
+            snapshot = await self._load_batch_snapshot(batch_code)
+            if snapshot.empty:
                 raise ValueError(f"批次 {batch_code} 没有找到学生分数数据")
+            data = snapshot.to_frame()
             
             # 2. 获取配置信息
             calculation_config = config or await self._get_calculation_config(batch_code)
             
-            # 3. 字段映射 (将total_score重命名为score以匹配计算引擎)
-            if 'total_score' in data.columns:
-                data = data.rename(columns={'total_score': 'score'})
-            
             # 4. 数据验证
             if progress_callback:
                 progress_callback(10, "正在验证数据完整性...")
@@ -59,7 +92,10 @@ class CalculationService:
             
             # 5. 整合多科目区域级结果
             consolidated_regional_results = await self._consolidate_multi_subject_results(
-                batch_code, data, validation_result
+                batch_code, data, validation_result, snapshot=snapshot,
+                progress_callback=(lambda done, total: progress_callback(
+                    15 + int(35 * done / total), f"已完成 {done}/{total} 项科目统计任务"
+                )) if progress_callback else None
             )
             
             if progress_callback:
@@ -83,7 +119,9 @@ class CalculationService:
             school_results = await self.calculate_batch_all_schools(
                 batch_code=batch_code,
                 config=calculation_config,
-                progress_callback=lambda p, msg: progress_callback(55 + int(p * 0.35), msg) if progress_callback else None
+                progress_callback=lambda p, msg: progress_callback(55 + int(p * 0.35), msg) if progress_callback else None,
+                snapshot=snapshot,
+                force=force
             )
             
             # 8. 整合最终结果 (90-100%)
@@ -119,55 +157,84 @@ class CalculationService:
             await self._update_calculation_status(batch_code, CalculationStatus.FAILED, str(e))
             raise
     
-    async def calculate_school_statistics(self, batch_code: str, school_id: str, config: Dict[str, Any] = None) -> Dict[str, Any]:
-        """计算学校级统计数据"""
+    def _unchanged_batch_result(self, batch_code: str, start_time: float) -> Optional[Dict[str, Any]]:
+        """输入指纹与已保存的全部汇聚记录一致时返回已有结果，否则返回None"""
+        fingerprints = self.batch_context(batch_code).input_fingerprints
+        if not fingerprints or not fingerprints.unchanged(self._stored_input_fingerprints(batch_code)):
+            return None
+        regional = self.repository.get_regional_statistics(batch_code)
+        if regional is None:
+            return None
+        total_schools = len(fingerprints.school_ids)
+        logger.info(f"批次 {batch_code} 清洗数据与算法版本未变化，跳过计算（{total_schools} 所学校）")
+        return {
+            'batch_code': batch_code,
+            'skipped': True,
+            'regional_statistics': regional.statistics_data,
+            'school_statistics_summary': {
+                'total_schools': total_schools,
+                'successful_schools': total_schools,
+                'failed_schools': 0,
+                'school_details': []
+            },
+            'calculation_duration': time.time() - start_time,
+            'total_students': regional.total_students,
+            'validation_warnings': []
+        }
+    
+    def _stored_input_fingerprints(self, batch_code: str) -> Dict[Any, Optional[str]]:
+        """已保存的汇聚记录输入指纹（查询失败时视为全部需要重新生成）"""
+        try:
+            return self.repository.get_input_fingerprints(batch_code)
+        except Exception as e:
+            logger.warning(f"批次 {batch_code} 汇聚记录指纹读取失败: {e}")
+            return {}
+    
+    async def calculate_school_statistics(self, batch_code: str, school_id: str, config: Dict[str, Any] = None,
+                                        snapshot: Optional[BatchScoreSnapshot] = None) -> Dict[str, Any]:
+        """计算学校级统计数据
+        
+        Args:
+            snapshot: 批次分数快照；提供时直接从快照筛选该校数据，不再访问数据库
+        """
         logger.info(f"开始计算批次 {batch_code} 学校 {school_id} 的统计数据")
         start_time = time.time()
         
         try:
             # 1. 获取学校学生分数数据
-            data = await self._fetch_school_scores(batch_code, school_id)
-            if data.empty:
+            if snapshot is not None:
+                school_snapshot = snapshot.for_school(school_id)
+            else:
+                school_snapshot = await self._load_batch_snapshot(batch_code, school_id=school_id)
+            if school_snapshot.empty:
                 raise ValueError(f"学校 {school_id} 在批次 {batch_code} 中没有找到学生分数数据")
+            data = school_snapshot.to_frame()
             
             # 2. 获取配置信息
             calculation_config = config or await self._get_calculation_config(batch_code)
             
-            # 3. 字段映射 (将total_score重命名为score以匹配计算引擎)
-            if 'total_score' in data.columns:
-                data = data.rename(columns={'total_score': 'score'})
-            
-            # 4. 执行计算（复用区域级计算逻辑）
-            results = {}
-            
-            basic_stats = self.engine.calculate('basic_statistics', data, calculation_config)
-            results['basic_statistics'] = basic_stats
-            
-            educational_metrics = self.engine.calculate('educational_metrics', data, calculation_config)
-            results['educational_metrics'] = educational_metrics
-            
-            percentiles = self.engine.calculate('percentiles', data, calculation_config)
-            results['percentiles'] = percentiles
+            # 4. 执行计算（复用区域级计算逻辑，融合策略一次得到四组指标）
+            results = self.engine.calculate(
+                'subject_metrics', pd.to_numeric(data['score'], errors='coerce').to_numpy(dtype=np.float64),
+                calculation_config
+            )
             
             # 区分度（如果学生数足够）
-            if len(data) >= 10:
-                discrimination = self.engine.calculate('discrimination', data, calculation_config)
-                results['discrimination'] = discrimination
-            else:
+            if results['discrimination'] is None:
                 logger.warning(f"学校 {school_id} 学生数不足({len(data)})，跳过区分度计算")
             
             # 4. 整合结果为标准JSON格式
             consolidated_results = {
-                "basic_stats": results.get('basic_statistics', {}),
-                "educational_metrics": results.get('educational_metrics', {}),
-                "percentiles": results.get('percentiles', {}),
+                "basic_stats": results['basic_statistics'],
+                "educational_metrics": results['educational_metrics'],
+                "percentiles": results['percentiles'],
                 "grade_distribution": results.get('grade_distribution', {}),
-                "discrimination": results.get('discrimination', {})
+                "discrimination": results['discrimination'] or {}
             }
             
             # 5. 保存到数据库
             duration = time.time() - start_time
-            school_name = await self._get_school_name(school_id)
+            school_name = school_snapshot.school_name(school_id) or await self._get_school_name(school_id)
             
             await self._save_school_statistics(
                 batch_code=batch_code,
@@ -194,8 +261,23 @@ class CalculationService:
             raise
     
     async def calculate_batch_all_schools(self, batch_code: str, config: Dict[str, Any] = None, 
-                                        progress_callback: callable = None) -> Dict[str, Any]:
-        """计算批次所有学校的统计数据"""
+                                        progress_callback: callable = None,
+                                        snapshot: Optional[BatchScoreSnapshot] = None,
+                                        force: bool = False) -> Dict[str, Any]:
+        """计算批次所有学校的统计数据
+        
+        Args:
+            snapshot: 批次分数快照；未提供时加载一次并在所有学校间共享
+            force: 分组模式下为 False 时跳过输入指纹未变化的学校
+            
+        计算模式由 config['school_calculation_mode'] 决定：
+            - 'grouped'（默认）：一次分组计算所有 (学校, 科目) 指标，单事务批量写入
+            - 'per_school'：逐校调用 calculate_school_statistics（旧模式）
+        """
+        mode = (config or {}).get('school_calculation_mode', 'grouped')
+        if mode == 'grouped':
+            return await self._calculate_all_schools_grouped(batch_code, config, progress_callback, snapshot, force)
+        
         logger.info(f"开始批量计算批次 {batch_code} 所有学校的统计数据")
         start_time = time.time()
         
@@ -203,7 +285,9 @@ class CalculationService:
             # 1. 获取批次中所有学校列表
             if progress_callback:
                 progress_callback(0, "正在获取学校列表...")
-            school_ids = await self._get_batch_schools(batch_code)
+            if snapshot is None:
+                snapshot = await self._load_batch_snapshot(batch_code)
+            school_ids = snapshot.school_list()
             if not school_ids:
                 raise ValueError(f"批次 {batch_code} 中没有找到学校数据")
             
@@ -221,7 +305,7 @@ class CalculationService:
                     if progress_callback:
                         progress_callback(progress, f"正在计算学校 {school_id} ({i+1}/{len(school_ids)})...")
                     
-                    school_result = await self.calculate_school_statistics(batch_code, school_id, config)
+                    school_result = await self.calculate_school_statistics(batch_code, school_id, config, snapshot=snapshot)
                     results.append({
                         'school_id': school_id,
                         'school_name': school_result['school_name'],
@@ -262,6 +346,139 @@ class CalculationService:
             logger.error(f"批次 {batch_code} 批量学校计算失败: {str(e)}")
             raise
     
+    async def _calculate_all_schools_grouped(self, batch_code: str, config: Dict[str, Any] = None,
+                                           progress_callback: callable = None,
+                                           snapshot: Optional[BatchScoreSnapshot] = None,
+                                           force: bool = False) -> Dict[str, Any]:
+        """分组模式：一次遍历快照计算所有 (学校, 科目) 的统计指标，并单事务批量写入"""
+        logger.info(f"开始分组计算批次 {batch_code} 所有学校的统计数据")
+        start_time = time.time()
+        
+        try:
+            if progress_callback:
+                progress_callback(0, "正在获取学校列表...")
+            if snapshot is None:
+                snapshot = await self._load_batch_snapshot(batch_code)
+            school_ids = snapshot.school_list()
+            if not school_ids:
+                raise ValueError(f"批次 {batch_code} 中没有找到学校数据")
+            
+            logger.info(f"批次 {batch_code} 共找到 {len(school_ids)} 所学校")
+            
+            calculation_config = config or await self._get_calculation_config(batch_code)
+            grade_level = calculation_config.get('grade_level') or self._get_batch_grade_level(batch_code)
+            subject_max_scores = {
+                s['subject_name']: s['max_score'] for s in await self._get_batch_subjects(batch_code)
+            }
+            
+            # 1. 每个科目一次分组计算，得到所有学校的指标
+            school_statistics: Dict[str, Dict[str, Any]] = {school_id: {} for school_id in school_ids}
+            subject_count = len(snapshot.subjects)
+            for i, (subject_name, subject_view) in enumerate(snapshot.subjects.items()):
+                max_score = float(subject_max_scores.get(subject_name) or subject_view.max_score or 100)
+                subject_config = {
+                    'max_score': max_score,
+                    'grade_level': grade_level,
+                    'percentiles': [10, 25, 50, 75, 90]
+                }
+                grouped = calculate_grouped_statistics(subject_view.school_ids, subject_view.scores, subject_config)
+                for school_id, stats in grouped.items():
+                    if school_id not in school_statistics:
+                        continue
+                    school_statistics[school_id][subject_name] = self._build_subject_statistics(
+                        subject_name, max_score, stats['basic_statistics'], stats['educational_metrics'],
+                        stats['percentiles'], stats['discrimination'], stats['basic_statistics']['count']
+                    )
+                if progress_callback:
+                    progress_callback(int(50 * (i + 1) / subject_count),
+                                      f"已完成科目 {subject_name} 的分组计算 ({i + 1}/{subject_count})")
+            
+            if progress_callback:
+                progress_callback(50, f"已完成 {len(school_ids)} 所学校的分组计算")
+            
+            # 2. 构建输入有变化的学校的汇聚记录（v1.2 subjects 按科目批量生成）
+            compute_duration = time.time() - start_time
+            school_record_counts = pd.Series(snapshot.school_ids).value_counts().to_dict()
+            fingerprints = self.batch_context(batch_code).input_fingerprints
+            stored_fingerprints = {} if force or not fingerprints else self._stored_input_fingerprints(batch_code)
+            pending_ids = [
+                school_id for school_id in school_ids
+                if not fingerprints.unit_unchanged(stored_fingerprints, AggregationLevel.SCHOOL, school_id)
+            ]
+            if len(pending_ids) < len(school_ids):
+                logger.info(f"批次 {batch_code} 有 {len(school_ids) - len(pending_ids)} 所学校输入未变化，跳过写入")
+            subjects_by_school = SubjectsBuilder().build_all_school_subjects(batch_code, pending_ids) if pending_ids else {}
+            pending = set(pending_ids)
+            records = []
+            results = []
+            failed_schools = []
+            for school_id in school_ids:
+                try:
+                    school_name = snapshot.school_name(school_id) or f"学校_{school_id}"
+                    total_students = int(school_record_counts.get(school_id, 0))
+                    if school_id not in pending:
+                        results.append({
+                            'school_id': school_id,
+                            'school_name': school_name,
+                            'total_students': total_students,
+                            'calculation_duration': compute_duration,
+                            'status': 'unchanged',
+                            'statistics': school_statistics[school_id]
+                        })
+                        continue
+                    records.append(self._build_school_aggregation_record(
+                        batch_code, school_id, school_name, total_students, compute_duration,
+                        subjects=subjects_by_school.get(school_id)
+                    ))
+                    results.append({
+                        'school_id': school_id,
+                        'school_name': school_name,
+                        'total_students': total_students,
+                        'calculation_duration': compute_duration,
+                        'status': 'success',
+                        'statistics': school_statistics[school_id]
+                    })
+                except Exception as e:
+                    logger.error(f"学校 {school_id} 汇聚记录构建失败: {str(e)}")
+                    failed_schools.append({'school_id': school_id, 'error': str(e), 'status': 'failed'})
+            
+            if progress_callback:
+                progress_callback(90, f"正在批量写入 {len(records)} 条学校统计数据...")
+            
+            # 3. 分块批量写入（每块一条多行 upsert，全部分块同一事务提交，失败时全部回滚）
+            if records:
+                write_result = self.repository.batch_upsert_statistics(records, atomic=True)
+                if write_result.errors:
+                    error = '; '.join(write_result.errors)
+                    logger.error(f"批次 {batch_code} 学校统计数据批量写入失败: {error}")
+                    failed_schools.extend(
+                        {'school_id': r['school_id'], 'error': error, 'status': 'failed'}
+                        for r in results if r['status'] == 'success'
+                    )
+                    results = [r for r in results if r['status'] == 'unchanged']
+            
+            duration = time.time() - start_time
+            
+            if progress_callback:
+                progress_callback(100, "所有学校数据计算完成")
+            
+            logger.info(f"批次 {batch_code} 所有学校分组计算完成，耗时 {duration:.2f}s，"
+                       f"成功: {len(results)}, 失败: {len(failed_schools)}")
+            
+            return {
+                'batch_code': batch_code,
+                'total_schools': len(school_ids),
+                'successful_schools': len(results),
+                'failed_schools': len(failed_schools),
+                'school_results': results,
+                'failed_details': failed_schools,
+                'total_duration': duration
+            }
+            
+        except Exception as e:
+            logger.error(f"批次 {batch_code} 分组学校计算失败: {str(e)}")
+            raise
+    
     async def calculate_statistics(self, batch_code: str, aggregation_level: AggregationLevel,
                                  school_id: Optional[str] = None) -> Dict[str, Any]:
         """计算统计数据
@@ -297,7 +514,7 @@ class CalculationService:
         
         try:
             if aggregation_level == AggregationLevel.REGIONAL:
-                return await self.calculate_batch_statistics(batch_code)
+                return await self.calculate_batch_statistics(batch_code, force=True)
             elif aggregation_level == AggregationLevel.SCHOOL:
                 if not school_id:
                     raise ValueError("学校级重计算需要提供school_id")
@@ -321,104 +538,53 @@ class CalculationService:
     # 私有辅助方法
     # ================================
     
-    async def _fetch_student_scores(self, batch_code: str) -> pd.DataFrame:
-        """获取批次学生分数数据 - 使用数据适配器"""
-        logger.debug(f"使用数据适配器获取批次 {batch_code} 的学生分数数据")
+    async def _load_batch_snapshot(self, batch_code: str, school_id: Optional[str] = None) -> BatchScoreSnapshot:
+        """加载批次分数快照 - 使用数据适配器，一次运行只读取一次清洗表"""
+        logger.debug(f"使用数据适配器加载批次 {batch_code} 的分数快照 (school_id={school_id})")
         
         try:
-            # 首先检查数据准备状态
-            readiness = self.data_adapter.check_data_readiness(batch_code)
-            if not readiness['is_ready']:
+            # 首先检查数据准备状态（批次上下文缓存）
+            readiness = self.batch_context(batch_code).readiness
+            if school_id is None and not readiness['is_ready']:
                 logger.warning(f"批次 {batch_code} 数据准备状态: {readiness['completeness_ratio']:.2%}")
             
-            # 使用适配器获取学生分数数据
-            student_scores = self.data_adapter.get_student_scores(batch_code)
-            
-            if not student_scores:
-                logger.warning(f"批次 {batch_code} 没有找到学生分数数据")
-                return pd.DataFrame()
-            
-            # 转换为DataFrame，保持与原有格式兼容
-            df_data = []
-            for score_record in student_scores:
-                df_data.append({
-                    'student_id': score_record['student_id'],
-                    'student_name': score_record.get('student_name', ''),
-                    'school_id': score_record['school_id'],
-                    'school_code': score_record.get('school_code', ''),
-                    'school_name': score_record.get('school_name', ''),
-                    'subject_name': score_record['subject_name'],
-                    'total_score': score_record['total_score'],
-                    'max_score': score_record['max_score'],
-                    'subject_type': score_record['subject_type'],
-                    'grade': score_record.get('grade', ''),
-                    'dimensions': json.dumps(score_record.get('dimensions', {}), ensure_ascii=False) if isinstance(score_record.get('dimensions'), dict) else str(score_record.get('dimensions', '{}')),
-                    'data_source': score_record.get('data_source', 'unknown')
-                })
-            
-            df = pd.DataFrame(df_data)
-            
-            logger.info(f"获取到 {len(df)} 条学生分数记录，包含 {df['subject_name'].nunique()} 个科目")
-            logger.info(f"数据源类型: {df['data_source'].value_counts().to_dict()}")
-            return df
-            
-        except Exception as e:
-            logger.error(f"获取学生分数数据失败: {e}")
-            raise
-    
-    async def _fetch_school_scores(self, batch_code: str, school_id: str) -> pd.DataFrame:
-        """获取学校学生分数数据 - 使用数据适配器"""
-        logger.debug(f"使用数据适配器获取学校 {school_id} 在批次 {batch_code} 的学生分数数据")
-        
-        try:
-            # 使用适配器获取特定学校的学生分数数据
-            student_scores = self.data_adapter.get_student_scores(batch_code, school_id=school_id)
-            
-            if not student_scores:
-                logger.warning(f"学校 {school_id} 在批次 {batch_code} 没有找到学生分数数据")
-                return pd.DataFrame()
-            
-            # 转换为DataFrame，保持与原有格式兼容
-            df_data = []
-            for score_record in student_scores:
-                df_data.append({
-                    'student_id': score_record['student_id'],
-                    'student_name': score_record.get('student_name', ''),
-                    'school_id': score_record['school_id'],
-                    'school_code': score_record.get('school_code', ''),
-                    'school_name': score_record.get('school_name', ''),
-                    'subject_name': score_record['subject_name'],
-                    'total_score': score_record['total_score'],
-                    'max_score': score_record['max_score'],
-                    'subject_type': score_record['subject_type'],
-                    'grade': score_record.get('grade', ''),
-                    'dimensions': json.dumps(score_record.get('dimensions', {}), ensure_ascii=False) if isinstance(score_record.get('dimensions'), dict) else str(score_record.get('dimensions', '{}')),
-                    'data_source': score_record.get('data_source', 'unknown')
-                })
+            if readiness['data_sources']['has_cleaned_data']:
+                # 清洗数据走服务端游标流式读取：先查询行数一次分配列数组，列块逐块写入后即释放
+                dimensions = DimensionChunk.collect(
+                    self.data_adapter.iter_dimension_score_chunks(batch_code, school_id=school_id),
+                    capacity=self.data_adapter.count_dimension_scores(batch_code, school_id=school_id)
+                )
+                if school_id is None and readiness.get('cleaned_records'):
+                    score_rows = readiness['cleaned_records']
+                else:
+                    score_rows = self.data_adapter.count_cleaned_scores(batch_code, school_id=school_id)
+                score_chunks = self.data_adapter.iter_cleaned_score_chunks(
+                    batch_code, school_id=school_id, parse_dimension_json=not len(dimensions)
+                )
+                snapshot = BatchScoreSnapshot.from_chunks(batch_code, score_chunks, dimensions, capacity=score_rows)
+            else:
+                student_scores = self.data_adapter.get_student_scores(batch_code, school_id=school_id, readiness=readiness)
+                snapshot = BatchScoreSnapshot.from_records(batch_code, student_scores)
             
-            df = pd.DataFrame(df_data)
+            if snapshot.empty:
+                logger.warning(f"批次 {batch_code} 没有找到学生分数数据 (school_id={school_id})")
+                return snapshot
             
-            logger.info(f"学校 {school_id} 获取到 {len(df)} 条学生分数记录，包含 {df['subject_name'].nunique()} 个科目")
-            try:
-                data_source_counts = df['data_source'].astype(str).value_counts().to_dict()
-                logger.info(f"数据源类型: {data_source_counts}")
-            except Exception as e:
-                logger.warning(f"无法统计数据源类型: {e}")
-                logger.info(f"数据源样本: {df['data_source'].head().tolist()}")
-            return df
+            logger.info(f"批次 {batch_code} 快照加载完成: {len(snapshot)} 条学生分数记录，"
+                       f"包含 {len(snapshot.subjects)} 个科目")
+            return snapshot
             
         except Exception as e:
-            logger.error(f"获取学校 {school_id} 分数数据失败: {e}")
+            logger.error(f"加载批次 {batch_code} 分数快照失败: {e}")
             raise
     
     async def _get_calculation_config(self, batch_code: str) -> Dict[str, Any]:
         """获取计算配置 - 使用数据适配器"""
         try:
-            # 从数据适配器获取批次摘要信息
-            batch_summary = self.data_adapter.get_batch_summary(batch_code)
-            
-            # 从数据库获取年级信息
-            grade_level = self._get_batch_grade_level(batch_code)
+            # 从批次上下文获取批次摘要与年级信息
+            context = self.batch_context(batch_code)
+            batch_summary = context.batch_summary
+            grade_level = context.grade_level
             
             # 构建计算配置
             config = {
@@ -442,33 +608,6 @@ class CalculationService:
                 'required_columns': ['score']
             }
     
-    async def _get_batch_schools(self, batch_code: str) -> List[str]:
-        """获取批次中的所有学校ID - 使用数据适配器"""
-        logger.debug(f"从数据适配器获取批次 {batch_code} 的学校列表")
-        
-        try:
-            # 获取批次的所有学生分数数据
-            student_scores = self.data_adapter.get_student_scores(batch_code)
-            
-            if not student_scores:
-                logger.warning(f"批次 {batch_code} 没有找到学生分数数据")
-                return []
-            
-            # 提取所有学校ID
-            school_ids = set()
-            for score_record in student_scores:
-                school_id = score_record.get('school_id')
-                if school_id and not isinstance(school_id, dict):
-                    school_ids.add(str(school_id))
-            
-            schools = sorted(list(school_ids))
-            logger.info(f"批次 {batch_code} 包含 {len(schools)} 个学校")
-            return schools
-            
-        except Exception as e:
-            logger.error(f"获取学校列表失败: {e}")
-            return []
-    
     async def _get_school_name(self, school_id: str) -> str:
         """获取学校名称"""
         try:
@@ -489,8 +628,8 @@ class CalculationService:
         logger.debug(f"从数据适配器获取批次 {batch_code} 的科目配置")
         
         try:
-            # 使用数据适配器获取科目配置
-            subject_configs = self.data_adapter.get_subject_configurations(batch_code)
+            # 使用批次上下文缓存的科目配置
+            subject_configs = self.batch_context(batch_code).subject_configurations
             
             if not subject_configs:
                 logger.warning(f"批次 {batch_code} 没有找到科目配置")
@@ -528,10 +667,19 @@ class CalculationService:
             return 'exam'  # 默认考试类型
     
     async def _consolidate_multi_subject_results(self, batch_code: str, scores_df: pd.DataFrame, 
-                                                validation_result: Dict[str, Any] = None) -> Dict[str, Any]:
-        """整合多科目计算结果"""
+                                                validation_result: Dict[str, Any] = None,
+                                                snapshot: Optional[BatchScoreSnapshot] = None,
+                                                progress_callback: callable = None) -> Dict[str, Any]:
+        """整合多科目计算结果
+        
+        各科目总分与维度统计拆分为独立任务，按执行器配置串行、线程或进程并行执行，
+        结果按科目配置顺序合并。progress_callback(已完成任务数, 任务总数) 按任务完成情况调用。
+        """
         logger.info(f"开始整合批次 {batch_code} 的多科目统计结果")
         
+        if snapshot is None:
+            snapshot = await self._load_batch_snapshot(batch_code)
+        
         # 获取科目配置信息
         subjects_config = await self._get_batch_subjects(batch_code)
         if not subjects_config:
@@ -550,107 +698,94 @@ class CalculationService:
             }
         }
         
-        # 为每个科目计算统计指标
+        # 从数据库中获取批次的真实年级信息
+        grade_level = self._get_batch_grade_level(batch_code)
+        
+        # 1. 按科目配置顺序确定待计算科目
+        jobs = []
         for subject_config in subjects_config:
             subject_name = subject_config['subject_name']
-            max_score = subject_config['max_score']
-            subject_type = self._normalize_subject_type(subject_config)
-            
-            logger.debug(f"处理科目: {subject_name} (满分: {max_score}, 类型: {subject_type})")
-            
-            # 筛选该科目的数据
-            subject_data_df = scores_df[scores_df['subject_name'] == subject_name].copy()
-            if subject_data_df.empty:
+            subject_view = snapshot.subject(subject_name)
+            if subject_view is None or len(subject_view) == 0:
                 logger.warning(f"科目 {subject_name} 没有找到学生分数数据")
                 continue
-            
-            # 清洗表中的数据已经是每个学生每个科目一条记录
-            logger.debug(f"清洗数据记录数: {len(subject_data_df)}")
-            
-            # 直接创建计算用的DataFrame（数据已经清洗和聚合）
-            # 注意：在上面的字段映射中，total_score已经被重命名为score
-            score_column = 'score' if 'score' in subject_data_df.columns else 'total_score'
-            calculation_df = pd.DataFrame({
-                'score': subject_data_df[score_column].fillna(0).astype(float),
-                'student_id': subject_data_df['student_id'],
-                'school_id': subject_data_df['school_id']
-            })
-            
-            # 计算该科目的唯一学生数量
-            unique_student_count = len(calculation_df)
-            logger.debug(f"科目 {subject_name} 学生数: {unique_student_count}")
-            
-            # 从数据库中获取批次的真实年级信息
-            grade_level = self._get_batch_grade_level(batch_code)
-            
-            # 科目专用配置
-            subject_calculation_config = {
-                'max_score': float(max_score),  # 确保是float类型
-                'grade_level': grade_level,
-                'percentiles': [10, 25, 50, 75, 90],  # 包含用户要求的P10, P50, P90
-                'required_columns': ['score']
-            }
+            jobs.append((subject_name, subject_config['max_score'], self._normalize_subject_type(subject_config), subject_view))
+        
+        # 2. 问卷科目明细查询（I/O 密集，多个问卷科目时线程并发）
+        questionnaire_inputs = await self._load_questionnaire_inputs(
+            batch_code, [job[0] for job in jobs if job[2] == 'questionnaire']
+        )
+        
+        # 3. 拆分为科目总分任务与维度任务
+        tasks = []
+        school_ids = {}
+        for subject_name, max_score, subject_type, subject_view in jobs:
+            if subject_type == 'questionnaire':
+                details = questionnaire_inputs[subject_name][0]
+                if not details:
+                    continue
+                scores = self._questionnaire_student_totals(details)
+            else:
+                # 清洗表中的数据已经是每个学生每个科目一条记录
+                scores = np.nan_to_num(subject_view.scores, nan=0.0)
+                school_ids[subject_name] = subject_view.school_ids
+            tasks.append(ScoreTask((subject_name, ''), scores, self._score_task_config(max_score, grade_level)))
+            tasks.extend(self._dimension_tasks(subject_view, grade_level))
+        
+        # 考试科目及其维度由学校部分统计量合并得到区域指标，其余任务交由计算引擎
+        derived, tasks = self._derive_from_school_partials(tasks, school_ids)
+        
+        settings = self.executor_settings
+        mode = settings.resolve_mode(len(snapshot), len(tasks))
+        logger.info(f"批次 {batch_code} 科目统计任务 {len(tasks)} 个（部分统计量合并 {len(derived)} 个），"
+                   f"执行模式: {mode} (workers={settings.max_workers})")
+        results = await run_score_tasks(tasks, mode, settings.max_workers, engine=self.engine,
+                                        progress_callback=progress_callback)
+        results.update(derived)
+        
+        # 4. 按科目配置顺序合并结果
+        for subject_name, max_score, subject_type, subject_view in jobs:
+            category = 'non_academic_subjects' if subject_type == 'questionnaire' else 'academic_subjects'
+            main_result = results.get((subject_name, ''))
             
             try:
-                # 根据科目类型选择不同的计算策略
-                if subject_type == 'questionnaire':
-                    # 问卷类科目：使用专门的问卷处理逻辑
-                    basic_stats, educational_metrics, percentiles, discrimination, dimension_statistics = \
-                        await self._calculate_questionnaire_statistics(batch_code, subject_name, max_score, subject_calculation_config)
+                if isinstance(main_result, Exception):
+                    if subject_type != 'questionnaire':
+                        raise main_result
+                    logger.error(f"问卷科目 {subject_name} 统计计算失败: {main_result}")
+                    main_result = None
+                
+                if main_result is None:
+                    # 问卷科目没有明细数据或计算失败
+                    basic_stats, educational_metrics, percentiles, discrimination = {}, {}, {}, None
+                    dimension_statistics = {}
                 else:
-                    # 学业科目：使用标准计算流程
-                    # 计算各项统计指标
-                    logger.info(f"学业科目 {subject_name} 开始计算，数据量: {len(calculation_df)}, 配置: {subject_calculation_config}")
-                    
-                    basic_stats = self.engine.calculate('basic_statistics', calculation_df, subject_calculation_config)
-                    logger.debug(f"科目 {subject_name} 基础统计完成: count={basic_stats.get('count', 0)}")
-                    
-                    # 验证数据
-                    logger.info(f"科目 {subject_name} 数据样本: score范围[{calculation_df['score'].min():.1f}, {calculation_df['score'].max():.1f}], 平均{calculation_df['score'].mean():.1f}")
-                    
-                    educational_metrics = self.engine.calculate('educational_metrics', calculation_df, subject_calculation_config)
+                    basic_stats = main_result['basic_statistics']
+                    educational_metrics = main_result['educational_metrics']
                     if educational_metrics is None:
                         logger.error(f"科目 {subject_name} 教育指标计算返回None!")
                         educational_metrics = {}
-                    else:
-                        logger.info(f"科目 {subject_name} 教育指标计算完成: grade_level={grade_level}, max_score={max_score}")
-                        logger.info(f"科目 {subject_name} 教育指标结果: {educational_metrics}")
-                    
-                    percentiles = self.engine.calculate('percentiles', calculation_df, subject_calculation_config)
-                    logger.debug(f"科目 {subject_name} 百分位数计算完成")
+                    percentiles = main_result['percentiles']
+                    discrimination = main_result['discrimination']
+                    dimension_statistics = self._collect_dimension_results(subject_view, results)
                     
-                    # 计算区分度（如果数据量足够）
-                    discrimination = None
-                    if len(calculation_df) >= 10:
-                        discrimination = self.engine.calculate('discrimination', calculation_df, subject_calculation_config)
-                        logger.debug(f"科目 {subject_name} 区分度计算完成: {discrimination.get('discrimination_index', 0)}")
-                    
-                    # 计算维度统计
-                    dimension_statistics = await self._calculate_subject_dimensions(batch_code, subject_name)
-                    logger.debug(f"科目 {subject_name} 维度统计完成: {len(dimension_statistics)} 个维度")
+                    option_distributions = questionnaire_inputs.get(subject_name, (None, None))[1]
+                    if option_distributions:
+                        logger.info(f"问卷科目 {subject_name} 获取到 {len(option_distributions)} 条选项分布记录")
+                        # 将选项分布信息添加到维度统计中
+                        dimension_statistics['_option_distributions'] = self._process_option_distributions(option_distributions)
                 
                 # 整合该科目的结果
-                subject_result = self._build_subject_statistics(
+                consolidated[category][subject_name] = self._build_subject_statistics(
                     subject_name, max_score, basic_stats, educational_metrics, 
-                    percentiles, discrimination, unique_student_count, dimension_statistics
+                    percentiles, discrimination, len(subject_view), dimension_statistics
                 )
-                
-                # 根据科目类型存储到对应的分类中
-                if subject_type == 'questionnaire':
-                    consolidated['non_academic_subjects'][subject_name] = subject_result
-                    logger.info(f"问卷科目 {subject_name} 统计计算完成，学生数: {len(calculation_df)}")
-                else:
-                    consolidated['academic_subjects'][subject_name] = subject_result
-                    logger.info(f"学业科目 {subject_name} 统计计算完成，学生数: {len(calculation_df)}")
+                logger.info(f"科目 {subject_name} 统计计算完成，学生数: {len(subject_view)}")
                 
             except Exception as e:
                 logger.error(f"科目 {subject_name} 统计计算失败: {e}")
                 # 创建空的统计结果
-                empty_stats = self._create_empty_subject_stats(subject_name, max_score)
-                if subject_type == 'questionnaire':
-                    consolidated['non_academic_subjects'][subject_name] = empty_stats
-                else:
-                    consolidated['academic_subjects'][subject_name] = empty_stats
+                consolidated[category][subject_name] = self._create_empty_subject_stats(subject_name, max_score)
         
         # 验证警告
         if validation_result:
@@ -659,6 +794,16 @@ class CalculationService:
         logger.info(f"多科目统计整合完成，处理了 {len(consolidated['academic_subjects'])} 个科目")
         return consolidated
     
+    @staticmethod
+    def _score_task_config(max_score: float, grade_level: str) -> Dict[str, Any]:
+        """科目/维度统计任务的计算配置"""
+        return {
+            'max_score': float(max_score),  # 确保是float类型
+            'grade_level': grade_level,
+            'percentiles': [10, 25, 50, 75, 90],  # 包含用户要求的P10, P50, P90
+            'required_columns': ['score']
+        }
+    
     def _build_subject_statistics(self, subject_name: str, max_score: float, 
                                 basic_stats: Dict, educational_metrics: Dict,
                                 percentiles: Dict, discrimination: Dict = None, 
@@ -828,7 +973,10 @@ class CalculationService:
             'calculation_status': CalculationStatus.COMPLETED,
             'total_students': total_students,
             'total_schools': 0,
-            'calculation_duration': calculation_duration
+            'calculation_duration': calculation_duration,
+            'input_fingerprint': self.batch_context(batch_code).input_fingerprints.unit_fingerprint(
+                AggregationLevel.REGIONAL
+            )
         }
         result = self.repository.upsert_statistics(aggregation_data)
         logger.debug(f"区域级统计数据已保存，记录ID: {result.id}")
@@ -837,9 +985,19 @@ class CalculationService:
                                     statistics_data: Dict[str, Any], total_students: int, 
                                     calculation_duration: float):
         """保存学校级统计数据"""
+        aggregation_data = self._build_school_aggregation_record(
+            batch_code, school_id, school_name, total_students, calculation_duration
+        )
+        result = self.repository.upsert_statistics(aggregation_data)
+        logger.debug(f"学校级统计数据已保存，记录ID: {result.id}")
+    
+    def _build_school_aggregation_record(self, batch_code: str, school_id: str, school_name: str,
+                                         total_students: int, calculation_duration: float,
+                                         subjects: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """构建学校级汇聚记录（subjects 未预先批量生成时逐校生成）"""
         # v1.2：计算完成即产出 subjects 结构
-        builder = SubjectsBuilder()
-        subjects = builder.build_school_subjects(batch_code, school_id)
+        if subjects is None:
+            subjects = SubjectsBuilder().build_school_subjects(batch_code, school_id)
         v12_json = {
             'schema_version': 'v1.2',
             'batch_code': batch_code,
@@ -857,304 +1015,197 @@ class CalculationService:
             'calculation_status': CalculationStatus.COMPLETED,
             'total_students': total_students,
             'total_schools': 0,
-            'calculation_duration': calculation_duration
+            'calculation_duration': calculation_duration,
+            'input_fingerprint': self.batch_context(batch_code).input_fingerprints.unit_fingerprint(
+                AggregationLevel.SCHOOL, school_id
+            )
         }
-        result = self.repository.upsert_statistics(aggregation_data)
-        logger.debug(f"学校级统计数据已保存，记录ID: {result.id}")
+        return aggregation_data
     
     # 注意: 以下方法已不再需要，因为现在直接从清洗表获取维度数据
     # _get_batch_dimensions, _get_dimension_question_mapping, _get_dimension_max_score
-    # 这些方法基于原始表和题目映射，现在维度数据直接来自清洗表的JSON字段
+    # 这些方法基于原始表和题目映射，现在维度数据来自 student_dimension_scores 长表（经数据适配器读入批次快照）
     
-    async def _get_students_score_detail_json(self, batch_code: str, subject_name: str) -> List[Dict[str, Any]]:
-        """从清洗表获取学生维度分数JSON数据"""
-        logger.debug(f"从清洗表获取批次 {batch_code} 科目 {subject_name} 的学生维度分数")
-        
-        try:
-            from sqlalchemy import text
-            query = text("""
-                SELECT 
-                    student_id,
-                    student_name,
-                    school_code,
-                    school_name,
-                    dimension_scores,
-                    dimension_max_scores
-                FROM student_cleaned_scores
-                WHERE batch_code = :batch_code 
-                    AND subject_name = :subject_name
-                    AND is_valid = 1
-                ORDER BY student_id
-            """)
-            
-            result = self.db_session.execute(query, {
-                'batch_code': batch_code,
-                'subject_name': subject_name
-            })
-            
-            students_data = []
-            for row in result.fetchall():
-                students_data.append({
-                    'student_id': row[0],
-                    'student_name': row[1], 
-                    'school_code': row[2],
-                    'school_name': row[3],
-                    'dimension_scores': row[4],  # 维度分数JSON
-                    'dimension_max_scores': row[5]  # 维度满分JSON
-                })
-            
-            logger.debug(f"从清洗表获取到 {len(students_data)} 个学生的维度分数数据")
-            return students_data
-            
-        except Exception as e:
-            logger.error(f"从清洗表获取学生维度分数失败: {e}")
+    def _dimension_tasks(self, subject_view: SubjectScoreView, grade_level: str) -> List[ScoreTask]:
+        """为科目的每个有效维度生成统计任务"""
+        subject_name = subject_view.subject_name
+        if not subject_view.dimension_codes:
+            logger.warning(f"科目 {subject_name} 没有找到任何维度数据")
             return []
-    
-    def _calculate_dimension_scores(self, students_data: List[Dict[str, Any]], 
-                                   dimension_code: str) -> List[float]:
-        """从清洗表的维度分数JSON中直接提取维度分数"""
-        import json
         
-        dimension_scores = []
+        logger.info(f"科目 {subject_name} 发现 {len(subject_view.dimension_codes)} 个维度: {list(subject_view.dimension_codes)}")
         
-        for student in students_data:
-            try:
-                dimension_scores_json = student.get('dimension_scores', '{}')
-                if isinstance(dimension_scores_json, str):
-                    dimension_data = json.loads(dimension_scores_json)
-                else:
-                    dimension_data = dimension_scores_json or {}
-                
-                # 直接从JSON中获取指定维度的分数
-                dimension_score = 0.0
-                if dimension_code in dimension_data:
-                    score_info = dimension_data[dimension_code]
-                    if isinstance(score_info, dict) and 'score' in score_info:
-                        dimension_score = float(score_info['score'])
-                    elif isinstance(score_info, (int, float)):
-                        dimension_score = float(score_info)
-                
-                dimension_scores.append(dimension_score)
-                
-            except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
-                logger.warning(f"学生 {student.get('student_id')} 维度 {dimension_code} 分数数据解析失败: {e}")
-                dimension_scores.append(0.0)
-        
-        logger.debug(f"从清洗数据提取到 {len(dimension_scores)} 个维度 {dimension_code} 分数")
-        return dimension_scores
+        tasks = []
+        for dimension_code in subject_view.dimension_codes:
+            # 提取学生在该维度的分数
+            dimension_scores = subject_view.dimension_vector(dimension_code)
+            if len(dimension_scores) == 0 or not dimension_scores.any():
+                logger.warning(f"维度 {dimension_code} 没有有效分数数据")
+                continue
+            dimension_max_score = float(subject_view.dimension_max_scores.get(dimension_code, 0))
+            tasks.append(ScoreTask(
+                (subject_name, dimension_code), dimension_scores,
+                self._score_task_config(dimension_max_score, grade_level)
+            ))
+        return tasks
     
-    async def _calculate_subject_dimensions(self, batch_code: str, subject_name: str) -> Dict[str, Dict[str, Any]]:
-        """计算科目的所有维度统计 - 基于数据适配器的JSON维度数据"""
-        logger.debug(f"使用数据适配器计算科目 {subject_name} 的维度统计")
+    @staticmethod
+    def _derive_from_school_partials(tasks: List[ScoreTask], school_ids: Dict[str, np.ndarray]):
+        """由各学校部分统计量合并计算区域级任务结果
         
-        try:
-            # 1. 使用数据适配器获取该科目的学生分数数据（包含维度JSON）
-            student_scores = self.data_adapter.get_student_scores(batch_code, subject_type=None, school_id=None)
-            if not student_scores:
-                logger.warning(f"批次 {batch_code} 没有找到学生分数数据")
-                return {}
-            
-            # 2. 筛选该科目的数据
-            subject_scores = [s for s in student_scores if s['subject_name'] == subject_name]
-            if not subject_scores:
-                logger.warning(f"科目 {subject_name} 没有找到学生维度数据")
-                return {}
-            
-            logger.info(f"科目 {subject_name} 找到 {len(subject_scores)} 个学生的维度数据")
-            
-        except Exception as e:
-            logger.error(f"获取科目 {subject_name} 维度数据失败: {e}")
-            return {}
-        
-        # 3. 提取所有维度定义和数据
-        available_dimensions = set()
-        dimension_max_scores_info = {}
-        
-        for student_score in subject_scores:
-            dimensions = student_score.get('dimensions', {})
-            if dimensions:
-                available_dimensions.update(dimensions.keys())
-                
-                # 保存维度满分信息（以第一个有效记录为准）
-                for dim_code, dim_data in dimensions.items():
-                    if dim_code not in dimension_max_scores_info and isinstance(dim_data, dict):
-                        dimension_max_scores_info[dim_code] = {
-                            'name': dim_code,
-                            'max_score': dim_data.get('max_score', 0)
-                        }
-        
-        if not available_dimensions:
-            logger.warning(f"科目 {subject_name} 没有找到任何维度数据")
-            return {}
-        
-        logger.info(f"科目 {subject_name} 发现 {len(available_dimensions)} 个维度: {list(available_dimensions)}")
+        分数全部落在计分精度（默认0.5分）上时，合并后的直方图可精确还原中位数、百分位数、
+        等级人数和区分度；否则该任务保留给计算引擎逐学生计算。
         
+        Returns:
+            ({任务键: 结果}, 仍需执行的任务列表)
+        """
+        derived = {}
+        remaining = []
+        for task in tasks:
+            labels = school_ids.get(task.key[0])
+            if labels is None or len(labels) != len(task.scores) or float(task.config.get('max_score', 0)) <= 0:
+                remaining.append(task)
+                continue
+            try:
+                by_school = ScorePartial.from_grouped(labels, task.scores, task.config['max_score'])
+                merged = ScorePartial.merge_all(by_school.values())
+                if not merged.exact or not merged.count:
+                    remaining.append(task)
+                    continue
+                derived[task.key] = statistics_from_partial(merged, task.config, task.min_discrimination_size)
+            except Exception as e:
+                logger.warning(f"任务 {task.key} 部分统计量合并失败，改为逐学生计算: {e}")
+                remaining.append(task)
+        return derived, remaining
+    
+    def _collect_dimension_results(self, subject_view: SubjectScoreView,
+                                   results: Dict[Any, Any]) -> Dict[str, Dict[str, Any]]:
+        """按维度顺序整理维度任务结果，失败或跳过的维度不输出"""
+        subject_name = subject_view.subject_name
         dimension_results = {}
         
-        # 4. 为每个维度计算统计
-        for dimension_code in available_dimensions:
+        for dimension_code in subject_view.dimension_codes:
+            result = results.get((subject_name, dimension_code))
+            if result is None:
+                continue
             try:
-                # 获取维度信息
-                dimension_max_info = dimension_max_scores_info.get(dimension_code, {})
-                dimension_name = dimension_max_info.get('name', dimension_code)
-                dimension_max_score = float(dimension_max_info.get('max_score', 0))
-                
-                logger.debug(f"处理维度: {dimension_code} - {dimension_name} (满分: {dimension_max_score})")
-                
-                # 提取学生在该维度的分数
-                dimension_scores = []
-                for student_score in subject_scores:
-                    dimensions = student_score.get('dimensions', {})
-                    dim_data = dimensions.get(dimension_code, {})
-                    if isinstance(dim_data, dict) and 'score' in dim_data:
-                        dimension_scores.append(float(dim_data['score']))
-                    else:
-                        dimension_scores.append(0.0)
-                
-                if not dimension_scores or all(score == 0 for score in dimension_scores):
-                    logger.warning(f"维度 {dimension_code} 没有有效分数数据")
-                    continue
-                
-                # 创建DataFrame用于统计计算
-                import pandas as pd
-                dimension_df = pd.DataFrame({'score': dimension_scores})
-                
-                # 维度专用配置
-                grade_level = self._get_batch_grade_level(batch_code)
-                dimension_config = {
-                    'max_score': dimension_max_score,
-                    'grade_level': grade_level,
-                    'percentiles': [10, 25, 50, 75, 90],
-                    'required_columns': ['score']
-                }
-                
-                # 计算基础统计
-                basic_stats = self.engine.calculate('basic_statistics', dimension_df, dimension_config)
-                
-                # 计算教育指标
-                educational_metrics = self.engine.calculate('educational_metrics', dimension_df, dimension_config)
-                
-                # 计算百分位数
-                percentiles = self.engine.calculate('percentiles', dimension_df, dimension_config)
-                
-                # 计算区分度（如果数据量足够）
-                discrimination = None
-                if len(dimension_scores) >= 10:
-                    discrimination = self.engine.calculate('discrimination', dimension_df, dimension_config)
-                
-                # 构建维度统计结果
-                dimension_results[dimension_code] = {
-                    'dimension_code': dimension_code,
-                    'dimension_name': dimension_name,
-                    'max_score': dimension_max_score,
-                    'question_count': 0,  # 清洗后数据不再需要题目计数
-                    'question_ids': [],   # 清洗后数据不再需要题目映射
-                    'basic_stats': {
-                        'avg_score': basic_stats.get('mean', 0),
-                        'std_score': basic_stats.get('std', 0),
-                        'min_score': basic_stats.get('min', 0),
-                        'max_score_achieved': basic_stats.get('max', 0),
-                        'student_count': basic_stats.get('count', 0),
-                        'score_rate': (basic_stats.get('mean', 0) / dimension_max_score) if dimension_max_score > 0 else 0
-                    },
-                    'percentiles': {
-                        'P10': percentiles.get('P10', 0),
-                        'P25': percentiles.get('P25', 0),
-                        'P50': percentiles.get('P50', 0),
-                        'P75': percentiles.get('P75', 0),
-                        'P90': percentiles.get('P90', 0),
-                        'IQR': percentiles.get('IQR', 0)
-                    },
-                    'educational_metrics': {
-                        'difficulty_coefficient': educational_metrics.get('difficulty_coefficient', 0),
-                        'pass_rate': educational_metrics.get('pass_rate', 0),
-                        'excellent_rate': educational_metrics.get('excellent_rate', 0),
-                        'average_score_rate': educational_metrics.get('average_score_rate', 0)
-                    }
-                }
-                
-                # 添加区分度（如果有的话）
-                if discrimination:
-                    dimension_results[dimension_code]['discrimination'] = {
-                        'discrimination_index': discrimination.get('discrimination_index', 0),
-                        'interpretation': discrimination.get('interpretation', 'unknown')
-                    }
-                
-                logger.info(f"维度 {dimension_code} 统计计算完成，学生数: {len(dimension_scores)}")
-                
+                if isinstance(result, Exception):
+                    raise result
+                dimension_results[dimension_code] = self._format_dimension_result(
+                    dimension_code, float(subject_view.dimension_max_scores.get(dimension_code, 0)), result
+                )
+                logger.info(f"维度 {dimension_code} 统计计算完成，学生数: {len(subject_view)}")
             except Exception as e:
                 logger.error(f"维度 {dimension_code} 统计计算失败: {e}")
-                continue
         
         logger.info(f"科目 {subject_name} 维度统计完成，处理了 {len(dimension_results)} 个维度")
         return dimension_results
     
-    async def _calculate_questionnaire_statistics(self, batch_code: str, subject_name: str, 
-                                                max_score: float, config: Dict[str, Any]) -> tuple:
-        """计算问卷类科目的统计数据 - 使用专用问卷明细表"""
-        logger.info(f"开始计算问卷科目 {subject_name} 的统计数据")
+    @staticmethod
+    def _format_dimension_result(dimension_code: str, dimension_max_score: float,
+                                 result: Dict[str, Any]) -> Dict[str, Any]:
+        """构建维度统计结果"""
+        basic_stats = result['basic_statistics']
+        educational_metrics = result['educational_metrics']
+        percentiles = result['percentiles']
+        discrimination = result['discrimination']
+        
+        dimension_result = {
+            'dimension_code': dimension_code,
+            'dimension_name': dimension_code,
+            'max_score': dimension_max_score,
+            'question_count': 0,  # 清洗后数据不再需要题目计数
+            'question_ids': [],   # 清洗后数据不再需要题目映射
+            'basic_stats': {
+                'avg_score': basic_stats.get('mean', 0),
+                'std_score': basic_stats.get('std', 0),
+                'min_score': basic_stats.get('min', 0),
+                'max_score_achieved': basic_stats.get('max', 0),
+                'student_count': basic_stats.get('count', 0),
+                'score_rate': (basic_stats.get('mean', 0) / dimension_max_score) if dimension_max_score > 0 else 0
+            },
+            'percentiles': {
+                'P10': percentiles.get('P10', 0),
+                'P25': percentiles.get('P25', 0),
+                'P50': percentiles.get('P50', 0),
+                'P75': percentiles.get('P75', 0),
+                'P90': percentiles.get('P90', 0),
+                'IQR': percentiles.get('IQR', 0)
+            },
+            'educational_metrics': {
+                'difficulty_coefficient': educational_metrics.get('difficulty_coefficient', 0),
+                'pass_rate': educational_metrics.get('pass_rate', 0),
+                'excellent_rate': educational_metrics.get('excellent_rate', 0),
+                'average_score_rate': educational_metrics.get('average_score_rate', 0)
+            }
+        }
         
+        # 添加区分度（如果有的话）
+        if discrimination:
+            dimension_result['discrimination'] = {
+                'discrimination_index': discrimination.get('discrimination_index', 0),
+                'interpretation': discrimination.get('interpretation', 'unknown')
+            }
+        return dimension_result
+    
+    async def _load_questionnaire_inputs(self, batch_code: str,
+                                         subject_names: List[str]) -> Dict[str, tuple]:
+        """获取问卷科目的明细与选项分布 {科目: (明细, 选项分布)}，查询失败的科目返回空明细"""
+        if not subject_names:
+            return {}
+        
+        if len(subject_names) > 1 and self.executor_settings.io_concurrency:
+            # 每个线程使用独立会话，Session 不能跨线程共享
+            loop = asyncio.get_running_loop()
+            workers = min(len(subject_names), self.executor_settings.max_workers)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='questionnaire-io') as pool:
+                outcomes = await asyncio.gather(*[
+                    loop.run_in_executor(pool, self._fetch_questionnaire_inputs_isolated, batch_code, name)
+                    for name in subject_names
+                ], return_exceptions=True)
+        else:
+            outcomes = []
+            for name in subject_names:
+                try:
+                    outcomes.append(self._fetch_questionnaire_inputs(self.data_adapter, batch_code, name))
+                except Exception as e:
+                    outcomes.append(e)
+        
+        inputs = {}
+        for name, outcome in zip(subject_names, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"问卷科目 {name} 明细查询失败: {outcome}")
+                outcome = ([], [])
+            inputs[name] = outcome
+        return inputs
+    
+    def _fetch_questionnaire_inputs_isolated(self, batch_code: str, subject_name: str) -> tuple:
+        """在独立数据库会话中查询问卷明细（供线程池调用）"""
+        session = Session(bind=self.db_session.get_bind())
         try:
-            # 1. 使用数据适配器获取问卷明细数据
-            questionnaire_details = self.data_adapter.get_questionnaire_details(batch_code, subject_name)
-            if not questionnaire_details:
-                logger.warning(f"问卷科目 {subject_name} 没有找到明细数据")
-                return {}, {}, {}, None, {}
-            
-            logger.info(f"问卷科目 {subject_name} 获取到 {len(questionnaire_details)} 条明细记录")
-            
-            # 2. 转换为计算引擎可用的DataFrame格式
-            df_data = []
-            for detail in questionnaire_details:
-                df_data.append({
-                    'score': detail['original_score'],
-                    'student_id': detail['student_id'],
-                    'school_id': detail['school_id'],
-                    'question_id': detail['question_id'],
-                    'max_score': detail['max_score'],
-                    'scale_level': detail['scale_level'],
-                    'instrument_type': detail['instrument_type']
-                })
-            
-            # 3. 按学生汇总分数（问卷总分）
-            import pandas as pd
-            details_df = pd.DataFrame(df_data)
-            
-            # 按学生ID汇总得到每个学生的问卷总分
-            student_totals = details_df.groupby('student_id')['score'].sum().reset_index()
-            calculation_df = pd.DataFrame({
-                'score': student_totals['score'],
-                'student_id': student_totals['student_id']
-            })
-            
-            logger.info(f"问卷科目 {subject_name} 学生总分范围: [{calculation_df['score'].min():.1f}, {calculation_df['score'].max():.1f}], 平均: {calculation_df['score'].mean():.1f}")
-            
-            # 4. 使用计算引擎进行统计计算
-            basic_stats = self.engine.calculate('basic_statistics', calculation_df, config)
-            educational_metrics = self.engine.calculate('educational_metrics', calculation_df, config)
-            percentiles = self.engine.calculate('percentiles', calculation_df, config)
-            
-            # 区分度（如果数据量足够）
-            discrimination = None
-            if len(calculation_df) >= 10:
-                discrimination = self.engine.calculate('discrimination', calculation_df, config)
-            
-            # 5. 计算问卷维度统计（基于JSON维度数据）
-            dimension_statistics = await self._calculate_subject_dimensions(batch_code, subject_name)
-            
-            # 6. 获取选项分布统计（问卷特有）
-            option_distributions = self.data_adapter.get_questionnaire_distribution(batch_code, subject_name)
-            if option_distributions:
-                logger.info(f"问卷科目 {subject_name} 获取到 {len(option_distributions)} 条选项分布记录")
-                # 将选项分布信息添加到维度统计中
-                dimension_statistics['_option_distributions'] = self._process_option_distributions(option_distributions)
-            
-            logger.info(f"问卷科目 {subject_name} 统计计算完成，学生数: {len(calculation_df)}")
-            return basic_stats, educational_metrics, percentiles, discrimination, dimension_statistics
-            
-        except Exception as e:
-            logger.error(f"问卷科目 {subject_name} 统计计算失败: {e}")
-            return {}, {}, {}, None, {}
+            return self._fetch_questionnaire_inputs(DataAdapterRepository(session), batch_code, subject_name)
+        finally:
+            session.close()
+    
+    @staticmethod
+    def _fetch_questionnaire_inputs(data_adapter: DataAdapterRepository, batch_code: str,
+                                    subject_name: str) -> tuple:
+        """查询问卷明细与选项分布（无明细时不查询选项分布）"""
+        questionnaire_details = data_adapter.get_questionnaire_details(batch_code, subject_name)
+        if not questionnaire_details:
+            logger.warning(f"问卷科目 {subject_name} 没有找到明细数据")
+            return [], []
+        logger.info(f"问卷科目 {subject_name} 获取到 {len(questionnaire_details)} 条明细记录")
+        return questionnaire_details, data_adapter.get_questionnaire_distribution(batch_code, subject_name)
+    
+    @staticmethod
+    def _questionnaire_student_totals(questionnaire_details: List[Dict[str, Any]]) -> np.ndarray:
+        """按学生汇总问卷明细得到问卷总分"""
+        details_df = pd.DataFrame({
+            'student_id': [d['student_id'] for d in questionnaire_details],
+            'score': [d['original_score'] for d in questionnaire_details],
+        })
+        return details_df.groupby('student_id')['score'].sum().to_numpy(dtype=np.float64)
     
     def _process_option_distributions(self, distributions: List[Dict[str, Any]]) -> Dict[str, Any]:
         """处理问卷选项分布数据"""
@@ -1177,31 +1228,8 @@ class CalculationService:
         return processed
 
     def _get_batch_grade_level(self, batch_code: str) -> str:
-        """从grade_aggregation_main表中获取批次的真实年级信息"""
-        try:
-            from sqlalchemy import text
-            query = text("""
-                SELECT grade_level 
-                FROM grade_aggregation_main 
-                WHERE batch_code = :batch_code
-                LIMIT 1
-            """)
-            
-            result = self.db_session.execute(query, {'batch_code': batch_code})
-            row = result.fetchone()
-            
-            if row:
-                grade_level = row[0]
-                logger.debug(f"从数据库获取批次 {batch_code} 年级: {grade_level}")
-                return grade_level
-            else:
-                logger.warning(f"批次 {batch_code} 在grade_aggregation_main表中未找到，使用默认年级")
-                
-        except Exception as e:
-            logger.error(f"获取批次年级失败: {e}")
-        
-        # 默认年级（如果数据库查询失败）
-        return '7th_grade'
+        """获取批次的真实年级信息（grade_aggregation_main，批次上下文内只查询一次）"""
+        return self.batch_context(batch_code).grade_level
 
     async def _update_calculation_status(self, batch_code: str, status: CalculationStatus, error_message: str = None):
         """更新计算状态"""
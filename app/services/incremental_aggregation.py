@@ -0,0 +1,154 @@
+# 学校级增量汇聚
+"""
+单校成绩更正后的增量汇聚。
+
+1. DataCleaningService.clean_school_scores 只重新清洗受影响的 (批次, 科目, 学校) 切片，
+   并刷新这些学校的部分统计量（school_score_partials）
+2. 区域 subjects 的指标与学校排名由全部学校的部分统计量合并生成，不扫描学生成绩
+3. 学校 subjects 同样由部分统计量生成，只写入受影响的学校以及区域名次、
+   维度名次等随之变化的学校；其余学校只更新输入指纹
+
+批次尚无部分统计量（首次增量更新或整批重新清洗后）时由清洗表一次分组查询重建。
+"""
+
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from data_cleaning_service import DataCleaningService
+
+from ..database.enums import AggregationLevel, CalculationStatus
+from ..database.repositories import SchoolPartialRepository, StatisticalAggregationRepository
+from ..utils.precision import round2_json
+from .batch_context import invalidate_batch_context
+from .input_fingerprint import load_input_fingerprints
+from .subjects_builder import SubjectsBuilder
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalAggregationService:
+    """按学校增量维护清洗数据与汇聚结果"""
+
+    def __init__(self, db_session: Session):
+        self.db = db_session
+        self.repository = StatisticalAggregationRepository(db_session)
+        self.partial_repository = SchoolPartialRepository(db_session)
+
+    async def apply_school_corrections(self, batch_code: str, school_codes: Iterable[str],
+                                       subject_names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """重新清洗指定学校并增量更新汇聚结果"""
+        school_codes = sorted({code for code in school_codes if code})
+        cleaning = await DataCleaningService(self.db).clean_school_scores(batch_code, school_codes, subject_names)
+        # 清洗时已刷新这些学校的部分统计量
+        result = self.update_school_aggregates(batch_code, school_codes, refresh_partials=False)
+        result['cleaning'] = cleaning
+        return result
+
+    def ensure_partials(self, batch_code: str, school_codes: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """返回批次全部部分统计量；缺失时整批重建，否则按需刷新指定学校"""
+        if not self.partial_repository.has_partials(batch_code):
+            rows = self.partial_repository.compute_partials(batch_code)
+            self.partial_repository.replace_partials(batch_code, rows)
+            logger.info(f"批次 {batch_code} 学校部分统计量已重建: {len(rows)} 条")
+        elif school_codes:
+            rows = self.partial_repository.compute_partials(batch_code, school_codes)
+            self.partial_repository.replace_partials(batch_code, rows, school_codes)
+        return self.partial_repository.get_partials(batch_code)
+
+    def update_school_aggregates(self, batch_code: str, school_codes: Iterable[str],
+                                 refresh_partials: bool = True) -> Dict[str, Any]:
+        """由部分统计量更新区域与学校汇聚结果
+
+        Args:
+            school_codes: 清洗数据有变化的学校
+            refresh_partials: 是否先由清洗表重新计算这些学校的部分统计量
+        """
+        start_time = time.time()
+        affected = sorted({code for code in school_codes if code})
+        partials = self.ensure_partials(batch_code, affected if refresh_partials else None)
+        invalidate_batch_context(batch_code)
+        fingerprints = load_input_fingerprints(self.db, batch_code)
+        builder = SubjectsBuilder()
+
+        # 1. 区域：部分统计量合并
+        regional_subjects = builder.build_regional_subjects_from_partials(batch_code, partials)
+        self.repository.upsert_statistics({
+            'batch_code': batch_code,
+            'aggregation_level': AggregationLevel.REGIONAL,
+            'school_id': None,
+            'school_name': None,
+            'statistics_data': round2_json({
+                'schema_version': 'v1.2',
+                'batch_code': batch_code,
+                'aggregation_level': 'REGIONAL',
+                'subjects': regional_subjects,
+            }),
+            'calculation_status': CalculationStatus.COMPLETED,
+            'input_fingerprint': fingerprints.unit_fingerprint(AggregationLevel.REGIONAL),
+        })
+
+        # 2. 学校：只写入受影响或名次等结果有变化的学校
+        subjects_by_school = builder.build_all_school_subjects_from_partials(batch_code, partials)
+        student_counts: Dict[str, int] = {}
+        for row in partials:
+            if row['dimension_code'] == '':
+                student_counts[row['school_code']] = (
+                    student_counts.get(row['school_code'], 0) + int(row['partial']['count'] or 0)
+                )
+        existing: Dict[str, List[Any]] = {}
+        for record in self.repository.get_all_school_statistics(batch_code):
+            existing.setdefault(record.school_id, []).append(record)
+
+        affected_set = set(affected)
+        records = []
+        unchanged: Dict[str, Optional[str]] = {}
+        for school_code, subjects in subjects_by_school.items():
+            fingerprint = fingerprints.unit_fingerprint(AggregationLevel.SCHOOL, school_code)
+            stored = existing.get(school_code, [])
+            if school_code not in affected_set and stored and all(
+                isinstance(rec.statistics_data, dict) and rec.statistics_data.get('subjects') == subjects
+                for rec in stored
+            ):
+                unchanged[school_code] = fingerprint
+                continue
+            statistics_data = round2_json({
+                'schema_version': 'v1.2',
+                'batch_code': batch_code,
+                'aggregation_level': 'SCHOOL',
+                'school_code': school_code,
+                'subjects': subjects,
+            })
+            # 同一学校可能存在不同学校名称的记录，逐条更新
+            for school_name in ([rec.school_name for rec in stored] or [None]):
+                records.append({
+                    'batch_code': batch_code,
+                    'aggregation_level': AggregationLevel.SCHOOL,
+                    'school_id': school_code,
+                    'school_name': school_name,
+                    'statistics_data': statistics_data,
+                    'calculation_status': CalculationStatus.COMPLETED,
+                    'total_students': student_counts.get(school_code, 0),
+                    'input_fingerprint': fingerprint,
+                })
+
+        if records:
+            write_result = self.repository.batch_upsert_statistics(records)
+            if write_result.errors:
+                raise RuntimeError('; '.join(write_result.errors))
+        if fingerprints:
+            self.repository.update_school_input_fingerprints(batch_code, unchanged)
+
+        duration = time.time() - start_time
+        logger.info(f"批次 {batch_code} 增量汇聚完成，受影响学校 {len(affected)} 所，"
+                    f"写入 {len(records)} 条学校记录，{len(unchanged)} 所学校结果未变化，耗时 {duration:.2f}s")
+        return {
+            'success': True,
+            'batch_code': batch_code,
+            'affected_schools': affected,
+            'schools_rewritten': sorted({r['school_id'] for r in records}),
+            'schools_unchanged': len(unchanged),
+            'duration': duration,
+        }
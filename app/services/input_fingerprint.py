@@ -0,0 +1,160 @@
+# 计算输入指纹
+"""
+清洗数据指纹与汇聚单元的输入指纹。
+
+清洗完成时按 批次×科目×学校 计算 (记录数, 总分合计, 校验和) 写入
+score_input_fingerprints，校验和为每行 (student_id, total_score, dimension_scores)
+MD5 前64位的异或，与行顺序无关，由数据库一次分组查询得到。
+
+汇聚记录保存生成时的输入指纹（算法版本 + 批次配置摘要 + 清洗数据指纹）。重新计算时
+指纹一致的单元不再计算和写入。批次配置包括题目满分与类型、维度映射和年级，修改配置
+同样使结果重新生成。学校级 v1.2 结果包含区域排名，依赖全部学校的数据，因此每个单元的
+指纹都包含整个批次的数据摘要；批次内任一学校的数据变化会使该批次所有单元重新生成。
+
+计算前 load_input_fingerprints 总是由清洗表重新计算指纹（一次分组查询，远低于重新汇聚的
+开销），不信任已保存的指纹：直接修改 student_cleaned_scores 的脚本不调用
+refresh_input_fingerprints 也不会使计算沿用旧结果，已保存的指纹在不一致时随之更新。
+"""
+
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..database.models import AggregationLevel
+from ..database.repositories import InputFingerprintRepository
+
+logger = logging.getLogger(__name__)
+
+# 统计口径或 v1.2 结构变化时递增，使已有汇聚结果全部失效
+ALGORITHM_VERSION = os.getenv("STATISTICS_ALGORITHM_VERSION", "1.2.0")
+
+
+@dataclass(frozen=True)
+class FingerprintEntry:
+    """单个 科目×学校 的清洗数据指纹"""
+    subject_name: str
+    school_id: str
+    school_code: Optional[str]
+    row_count: int
+    score_sum: str
+    checksum: str
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'FingerprintEntry':
+        return cls(
+            subject_name=row['subject_name'],
+            school_id=row['school_id'] or '',
+            school_code=row.get('school_code'),
+            row_count=int(row['row_count'] or 0),
+            score_sum=f"{float(row['score_sum'] or 0):.2f}",
+            checksum=row['checksum'],
+        )
+
+
+class InputFingerprints:
+    """批次的清洗数据指纹集合"""
+
+    def __init__(self, batch_code: str, entries: Iterable[FingerprintEntry],
+                 algorithm_version: str = ALGORITHM_VERSION, config_digest: str = ''):
+        self.batch_code = batch_code
+        self.algorithm_version = algorithm_version
+        self.config_digest = config_digest
+        self.entries: List[FingerprintEntry] = sorted(entries, key=lambda e: (e.subject_name, e.school_id))
+        self._batch_digest: Optional[str] = None
+
+    @classmethod
+    def from_rows(cls, batch_code: str, rows: Iterable[Dict[str, Any]],
+                  config_digest: str = '') -> 'InputFingerprints':
+        return cls(batch_code, [FingerprintEntry.from_row(row) for row in rows], config_digest=config_digest)
+
+    def __bool__(self) -> bool:
+        return bool(self.entries)
+
+    @property
+    def batch_digest(self) -> str:
+        """批次输入摘要（批次配置 + 清洗数据）"""
+        if self._batch_digest is None:
+            self._batch_digest = _digest(chain(
+                [f"config|{self.config_digest}"],
+                (f"{e.subject_name}|{e.school_id}|{e.row_count}|{e.score_sum}|{e.checksum}" for e in self.entries),
+            ))
+        return self._batch_digest
+
+    @property
+    def school_ids(self) -> List[str]:
+        return sorted({e.school_id for e in self.entries if e.school_id})
+
+    @property
+    def school_codes(self) -> List[str]:
+        return sorted({e.school_code for e in self.entries if e.school_code})
+
+    def unit_fingerprint(self, aggregation_level: AggregationLevel, school_key: Optional[str] = None) -> Optional[str]:
+        """汇聚单元的输入指纹（无清洗数据时为None，不参与跳过判断）"""
+        if not self.entries:
+            return None
+        return _digest([self.algorithm_version, aggregation_level.name, school_key or '', self.batch_digest])
+
+    def unit_unchanged(self, stored: Dict[Tuple[str, Optional[str]], Optional[str]],
+                       aggregation_level: AggregationLevel, school_key: Optional[str] = None) -> bool:
+        """已保存的汇聚单元指纹是否与当前输入一致
+
+        Args:
+            stored: StatisticalAggregationRepository.get_input_fingerprints 的结果
+        """
+        fingerprint = self.unit_fingerprint(aggregation_level, school_key)
+        return fingerprint is not None and stored.get((aggregation_level.name, school_key)) == fingerprint
+
+    def unchanged(self, stored: Dict[Tuple[str, Optional[str]], Optional[str]],
+                  school_keys: Optional[Iterable[str]] = None) -> bool:
+        """区域级与全部学校级单元是否都无需重新生成
+
+        Args:
+            school_keys: 学校级记录使用的学校键，默认为学校ID
+        """
+        if not self.unit_unchanged(stored, AggregationLevel.REGIONAL):
+            return False
+        keys = self.school_ids if school_keys is None else school_keys
+        return all(self.unit_unchanged(stored, AggregationLevel.SCHOOL, key) for key in keys)
+
+
+def _digest(parts: Iterable[str]) -> str:
+    sha = hashlib.sha256()
+    for part in parts:
+        sha.update(part.encode('utf-8'))
+        sha.update(b'\n')
+    return sha.hexdigest()
+
+
+def refresh_input_fingerprints(db_session: Session, batch_code: str) -> InputFingerprints:
+    """重新计算并保存批次的清洗数据指纹（清洗完成后调用）"""
+    repository = InputFingerprintRepository(db_session)
+    rows = repository.compute_fingerprints(batch_code)
+    repository.replace_fingerprints(batch_code, rows)
+    logger.info(f"批次 {batch_code} 清洗数据指纹已更新: {len(rows)} 个科目×学校单元")
+    return InputFingerprints.from_rows(batch_code, rows, _config_digest(repository, batch_code))
+
+
+def load_input_fingerprints(db_session: Session, batch_code: str) -> InputFingerprints:
+    """由清洗表重新计算批次的数据指纹，与已保存的指纹不一致时更新保存的指纹"""
+    try:
+        repository = InputFingerprintRepository(db_session)
+        rows = repository.compute_fingerprints(batch_code)
+        fingerprints = InputFingerprints.from_rows(batch_code, rows, _config_digest(repository, batch_code))
+        stored = InputFingerprints.from_rows(batch_code, repository.get_fingerprints(batch_code))
+        if stored.entries != fingerprints.entries:
+            if stored:
+                logger.warning(f"批次 {batch_code} 清洗数据在清洗流程之外被修改，已更新保存的指纹")
+            repository.replace_fingerprints(batch_code, rows)
+        return fingerprints
+    except Exception as e:
+        logger.warning(f"批次 {batch_code} 清洗数据指纹生成失败，不跳过计算: {e}")
+        return InputFingerprints(batch_code, [])
+
+
+def _config_digest(repository: InputFingerprintRepository, batch_code: str) -> str:
+    return _digest(repository.get_config_rows(batch_code))
@@ -0,0 +1,107 @@
+# 学校排名索引
+"""
+按 (批次, 科目) 一次性构建的学校排名索引。
+
+索引保存按平均分降序排列的学校数组和 学校ID -> 排名 字典，
+学校级汇聚查询排名为 O(1)，区域级学校排名列表也由同一索引生成，
+保证区域级与学校级排名口径一致。
+
+并列处理策略：
+- competition：并列学校名次相同，下一名次跳过（1, 1, 3），与 RankingService 一致
+- dense：并列学校名次相同，下一名次连续（1, 1, 2）
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TIE_POLICIES = ('competition', 'dense')
+
+
+@dataclass(frozen=True)
+class SchoolRankingIndex:
+    """学校平均分排名索引"""
+    school_ids: np.ndarray          # 按排名排序的学校ID
+    means: np.ndarray               # 对应的学校平均分（降序）
+    ranks: np.ndarray               # 对应的名次
+    tie_policy: str = 'competition'
+    _rank_by_school: Dict[Hashable, int] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def build(cls, school_ids: Sequence[Hashable], scores: Sequence[float],
+              tie_policy: str = 'competition') -> 'SchoolRankingIndex':
+        """由逐行 (学校ID, 分数) 构建索引，学校平均分为该校所有行分数的均值
+
+        平均分相同时按学校ID升序排列，保证结果稳定。
+        """
+        if tie_policy not in TIE_POLICIES:
+            raise ValueError(f"不支持的并列处理策略: {tie_policy}")
+
+        scores = np.asarray(scores, dtype=np.float64)
+        codes, uniques = pd.factorize(np.asarray(school_ids, dtype=object))
+        valid = (codes >= 0) & ~np.isnan(scores)
+        codes, scores = codes[valid], scores[valid]
+
+        counts = np.bincount(codes, minlength=len(uniques))
+        sums = np.bincount(codes, weights=scores, minlength=len(uniques))
+        present = counts > 0
+        ids = np.asarray(uniques, dtype=object)[present]
+        means = sums[present] / counts[present]
+
+        order = np.lexsort((ids.astype(str), -means))
+        ids, means = ids[order], means[order]
+        ranks = _assign_ranks(means, tie_policy)
+
+        return cls(
+            school_ids=ids,
+            means=means,
+            ranks=ranks,
+            tie_policy=tie_policy,
+            _rank_by_school={school_id: int(rank) for school_id, rank in zip(ids, ranks)},
+        )
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame, score_column: str,
+                   tie_policy: str = 'competition') -> 'SchoolRankingIndex':
+        """由包含 school_id 列的DataFrame构建索引"""
+        return cls.build(data['school_id'].to_numpy(), data[score_column].to_numpy(), tie_policy)
+
+    @property
+    def total_schools(self) -> int:
+        return len(self.school_ids)
+
+    def rank_of(self, school_id: Hashable) -> Optional[int]:
+        """查询学校名次，学校不在索引中时返回None"""
+        return self._rank_by_school.get(school_id)
+
+    def rank_for_score(self, score: float) -> int:
+        """查询给定平均分在区域内对应的名次（二分查找）"""
+        # means 为降序，取负后为升序；严格高于该分数的学校数决定名次
+        higher = int(np.searchsorted(-self.means, -score, side='left'))
+        if self.tie_policy == 'competition' or higher == 0:
+            return higher + 1
+        return int(self.ranks[higher - 1]) + 1
+
+    def rankings(self) -> List[Dict[str, Any]]:
+        """生成按名次排序的学校排名列表"""
+        return [
+            {'school_id': school_id, 'avg_score': float(mean), 'rank': int(rank)}
+            for school_id, mean, rank in zip(self.school_ids, self.means, self.ranks)
+        ]
+
+
+def _assign_ranks(sorted_means: np.ndarray, tie_policy: str) -> np.ndarray:
+    """按并列策略为降序排列的平均分分配名次"""
+    if len(sorted_means) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    new_group = np.r_[True, sorted_means[1:] != sorted_means[:-1]]
+    if tie_policy == 'dense':
+        return np.cumsum(new_group)
+    positions = np.arange(1, len(sorted_means) + 1)
+    return np.maximum.accumulate(np.where(new_group, positions, 0))
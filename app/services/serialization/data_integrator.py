@@ -12,6 +12,7 @@ from datetime import datetime
 
 from ...services.calculation_service import CalculationService
 from ...calculation.calculators.survey_calculator import SurveyCalculator
+from ...calculation.formulas import is_primary_grade
 from ...services.task_manager import TaskManager
 from ...database.enums import AggregationLevel
 from ...database.repositories import StatisticalAggregationRepository
@@ -476,8 +477,7 @@ class StatisticsDataIntegrator:
     
     async def _determine_grade_level(self, batch_code: str) -> str:
         """确定年级水平（小学/初中）"""
-        # 临时实现：从批次代码判断年级级别
-        # TODO: 从grade_aggregation_main表获取实际年级信息
+        # 优先使用 grade_aggregation_main 中的年级，未找到时从批次代码推断
         try:
             if self.score_repo is not None and hasattr(self.score_repo, 'get_batch_grade_info'):
                 grade_info = await self.score_repo.get_batch_grade_info(batch_code)
@@ -491,6 +491,11 @@ class StatisticsDataIntegrator:
                     elif grade_info['grade_level'] in middle_grades:
                         return '初中'
             
+            # 批次上下文中的 grade_aggregation_main 年级（运行内只查询一次）
+            grade_level = self.calculation_service.batch_context(batch_code).known_grade_level
+            if isinstance(grade_level, str) and grade_level:
+                return '小学' if is_primary_grade(grade_level) else '初中'
+            
             # 根据批次代码推断年级级别（临时方案）
             if 'G1' in batch_code or 'G2' in batch_code or 'G3' in batch_code or 'G4' in batch_code or 'G5' in batch_code or 'G6' in batch_code:
                 return '小学'
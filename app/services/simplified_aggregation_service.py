@@ -19,6 +19,7 @@ from ..schemas.simplified_aggregation_schema import (
 )
 from .questionnaire_processor import QuestionnaireProcessor, QuestionnaireConfig, ScaleType
 from .serialization.statistics_json_serializer import StatisticsJsonSerializer
+from .ranking_index import SchoolRankingIndex
 from ..calculation.engine import CalculationEngine
 from ..calculation.calculators import initialize_calculation_system
 
@@ -39,6 +40,8 @@ class SimplifiedAggregationService:
         self.questionnaire_processor = QuestionnaireProcessor()
         self.json_serializer = StatisticsJsonSerializer(db_session)
         self.calculation_engine = initialize_calculation_system()
+        # 学校排名索引缓存：(批次, 科目) -> SchoolRankingIndex
+        self._ranking_indexes: Dict[Tuple[str, Any], SchoolRankingIndex] = {}
         
         logger.info("初始化简化汇聚服务")
     
@@ -64,7 +67,8 @@ class SimplifiedAggregationService:
             if progress_callback:
                 progress_callback(5, "正在加载数据...")
             
-            # 1. 获取批次基础数据
+            # 1. 获取批次基础数据（重新加载数据时同时重建排名索引）
+            self.invalidate_ranking_indexes(batch_code)
             batch_data = self._fetch_batch_data(batch_code)
             if batch_data.empty:
                 raise ValueError(f"批次 {batch_code} 没有找到数据")
@@ -170,8 +174,8 @@ class SimplifiedAggregationService:
             if school_data.empty:
                 raise ValueError(f"学校 {school_name} 在批次 {batch_code} 中没有找到数据")
             
-            # 2. 获取区域数据用于排名计算
-            regional_data = self._fetch_batch_data(batch_code)
+            # 2. 区域数据仅在排名索引未缓存时加载
+            regional_data = None
             
             if progress_callback:
                 progress_callback(15, "正在分析科目结构...")
@@ -193,19 +197,27 @@ class SimplifiedAggregationService:
                         progress_callback(progress, f"正在处理科目: {subject_info['name']}")
                     
                     subject_data = school_data[school_data['subject_id'] == subject_id]
-                    regional_subject_data = regional_data[regional_data['subject_id'] == subject_id]
+                    
+                    ranking_index = self._ranking_indexes.get((batch_code, subject_id))
+                    if ranking_index is None:
+                        if regional_data is None:
+                            regional_data = self._fetch_batch_data(batch_code)
+                        ranking_index = self._get_ranking_index(
+                            batch_code, subject_id,
+                            regional_data[regional_data['subject_id'] == subject_id], 'raw_score'
+                        )
                     
                     if subject_info['type'] == 'questionnaire':
                         # 问卷类科目
                         subject_stats = self._calculate_questionnaire_subject_school(
                             subject_data, subject_info, batch_code,
-                            regional_subject_data
+                            ranking_index
                         )
                     else:
                         # 考试类科目
                         subject_stats = self._calculate_exam_subject_school(
                             subject_data, subject_info, batch_code,
-                            regional_subject_data, school_id
+                            ranking_index, school_id
                         )
                     
                     if subject_stats:
@@ -342,6 +354,7 @@ class SimplifiedAggregationService:
                     'regional': regional_result,
                     'schools': school_results
                 }
+                self.invalidate_ranking_indexes(batch_code)
                 
             except Exception as e:
                 logger.error(f"处理批次 {batch_code} 时发生错误: {str(e)}")
@@ -482,7 +495,11 @@ class SimplifiedAggregationService:
             )
             
             # 学校排名
-            school_rankings = self._calculate_school_rankings(subject_data, 'raw_score')
+            school_rankings = self._calculate_school_rankings(
+                self._get_ranking_index(
+                    batch_code, subject_data['subject_id'].iloc[0], subject_data, 'raw_score'
+                )
+            )
             ranking = SubjectRanking(school_rankings=school_rankings)
             
             # 维度统计
@@ -506,7 +523,7 @@ class SimplifiedAggregationService:
         subject_data: pd.DataFrame,
         subject_info: Dict[str, Any],
         batch_code: str,
-        regional_data: pd.DataFrame,
+        ranking_index: SchoolRankingIndex,
         school_id: str
     ) -> SubjectStatistics:
         """计算考试类科目学校级统计"""
@@ -547,7 +564,7 @@ class SimplifiedAggregationService:
             
             # 计算在区域内的排名
             regional_rank, total_schools = self._calculate_school_rank(
-                regional_data, school_id, 'raw_score'
+                ranking_index, school_id
             )
             ranking = SubjectRanking(
                 regional_rank=regional_rank,
@@ -611,7 +628,11 @@ class SimplifiedAggregationService:
             )
             
             # 学校排名（基于平均分）
-            school_rankings = self._calculate_school_rankings(subject_data, 'raw_score')
+            school_rankings = self._calculate_school_rankings(
+                self._get_ranking_index(
+                    batch_code, subject_data['subject_id'].iloc[0], subject_data, 'raw_score'
+                )
+            )
             ranking = SubjectRanking(school_rankings=school_rankings)
             
             return SubjectStatistics(
@@ -632,7 +653,7 @@ class SimplifiedAggregationService:
         subject_data: pd.DataFrame,
         subject_info: Dict[str, Any],
         batch_code: str,
-        regional_data: pd.DataFrame
+        ranking_index: SchoolRankingIndex
     ) -> SubjectStatistics:
         """计算问卷类科目学校级统计"""
         try:
@@ -671,7 +692,7 @@ class SimplifiedAggregationService:
             # 计算在区域内的排名
             school_id = subject_data['school_id'].iloc[0]
             regional_rank, total_schools = self._calculate_school_rank(
-                regional_data, school_id, 'raw_score'
+                ranking_index, school_id
             )
             ranking = SubjectRanking(
                 regional_rank=regional_rank,
@@ -737,24 +758,42 @@ class SimplifiedAggregationService:
         except Exception:
             return 0.0
     
-    def _calculate_school_rankings(
+    def _get_ranking_index(
         self,
-        data: pd.DataFrame,
+        batch_code: str,
+        subject_id: Any,
+        subject_data: pd.DataFrame,
         score_column: str
+    ) -> SchoolRankingIndex:
+        """获取 (批次, 科目) 学校排名索引，未缓存时由区域科目数据构建一次"""
+        key = (batch_code, subject_id)
+        ranking_index = self._ranking_indexes.get(key)
+        if ranking_index is None:
+            ranking_index = SchoolRankingIndex.from_frame(subject_data, score_column)
+            self._ranking_indexes[key] = ranking_index
+        return ranking_index
+    
+    def invalidate_ranking_indexes(self, batch_code: Optional[str] = None) -> None:
+        """清除排名索引缓存（不指定批次时全部清除）"""
+        if batch_code is None:
+            self._ranking_indexes.clear()
+            return
+        for key in [k for k in self._ranking_indexes if k[0] == batch_code]:
+            del self._ranking_indexes[key]
+    
+    def _calculate_school_rankings(
+        self,
+        ranking_index: SchoolRankingIndex
     ) -> List[Dict[str, Any]]:
         """计算学校排名"""
         try:
-            # 按学校聚合计算平均分
-            school_scores = data.groupby(['school_id'])[score_column].mean().reset_index()
-            school_scores = school_scores.sort_values(score_column, ascending=False)
-            
             rankings = []
-            for rank, (_, row) in enumerate(school_scores.iterrows(), 1):
+            for item in ranking_index.rankings():
                 rankings.append({
-                    'school_id': row['school_id'],
-                    'school_name': f"学校_{row['school_id']}",  # 可以从学校表获取真实名称
-                    'avg_score': format_decimal(row[score_column]),
-                    'rank': rank
+                    'school_id': item['school_id'],
+                    'school_name': f"学校_{item['school_id']}",  # 可以从学校表获取真实名称
+                    'avg_score': format_decimal(item['avg_score']),
+                    'rank': item['rank']
                 })
             
             return rankings
@@ -765,28 +804,11 @@ class SimplifiedAggregationService:
     
     def _calculate_school_rank(
         self,
-        regional_data: pd.DataFrame,
-        school_id: str,
-        score_column: str
+        ranking_index: SchoolRankingIndex,
+        school_id: str
     ) -> Tuple[Optional[int], int]:
-        """计算学校在区域内的排名"""
-        try:
-            # 计算各学校平均分
-            school_scores = regional_data.groupby('school_id')[score_column].mean().reset_index()
-            school_scores = school_scores.sort_values(score_column, ascending=False)
-            
-            total_schools = len(school_scores)
-            
-            # 找到目标学校的排名
-            for rank, (_, row) in enumerate(school_scores.iterrows(), 1):
-                if row['school_id'] == school_id:
-                    return rank, total_schools
-            
-            return None, total_schools
-            
-        except Exception as e:
-            logger.error(f"计算学校排名失败: {str(e)}")
-            return None, 0
+        """计算学校在区域内的排名（O(1) 索引查询）"""
+        return ranking_index.rank_of(school_id), ranking_index.total_schools
     
     def _calculate_exam_dimensions(self, data: pd.DataFrame) -> Optional[Dict[str, DimensionMetrics]]:
         """计算考试科目维度统计"""
@@ -0,0 +1,169 @@
+# 科目并行执行器
+"""
+区域级多科目汇总的并行执行。
+
+每个科目的总分统计和每个维度的统计都拆分为独立的 ScoreTask，
+任务只包含分数数组和计算配置，可在线程或进程间传递。执行模式：
+
+- serial：在调用方线程内依次执行（小批次默认）
+- thread：线程池执行，适合问卷明细查询等 I/O 密集任务
+- process：进程池执行，适合大批次的 CPU 密集统计
+- auto：行数达到阈值且任务数大于1时使用进程池，否则串行
+
+结果按任务键返回，由调用方按科目配置顺序合并，保证输出确定。
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Union
+
+import numpy as np
+
+from ..calculation.subject_metrics import RESULT_GROUPS
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_MODES = ('auto', 'serial', 'thread', 'process')
+
+
+@dataclass(frozen=True)
+class ExecutorSettings:
+    """执行器配置（默认值可由环境变量覆盖）"""
+    mode: str = 'auto'
+    max_workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+    process_threshold: int = 200000   # auto 模式下总行数达到该值时使用进程池
+
+    def __post_init__(self):
+        if self.mode not in EXECUTOR_MODES:
+            raise ValueError(f"不支持的执行模式: {self.mode}")
+
+    @classmethod
+    def from_env(cls) -> 'ExecutorSettings':
+        return cls(
+            mode=os.getenv("CALC_EXECUTOR_MODE", "auto"),
+            max_workers=int(os.getenv("CALC_EXECUTOR_WORKERS", os.cpu_count() or 1)),
+            process_threshold=int(os.getenv("CALC_PROCESS_THRESHOLD", 200000)),
+        )
+
+    def resolve_mode(self, total_rows: int, task_count: int) -> str:
+        """确定本次运行的实际执行模式"""
+        if self.mode != 'auto':
+            return self.mode
+        if task_count <= 1 or self.max_workers <= 1:
+            return 'serial'
+        return 'process' if total_rows >= self.process_threshold else 'serial'
+
+    @property
+    def io_concurrency(self) -> bool:
+        """是否并发执行 I/O 查询（问卷明细等）"""
+        return self.mode != 'serial' and self.max_workers > 1
+
+
+@dataclass(frozen=True)
+class ScoreTask:
+    """单个统计任务：科目总分或科目内某一维度"""
+    key: Hashable            # (科目名, 维度代码)，科目总分任务维度代码为空字符串
+    scores: np.ndarray
+    config: Dict[str, Any]
+    min_discrimination_size: int = 10
+
+
+def run_score_task(task: ScoreTask, engine: Any = None) -> Dict[str, Any]:
+    """执行单个统计任务：基础统计、教育指标、百分位数、区分度（subject_metrics 融合策略一次完成）"""
+    engine = engine or _worker_engine()
+    config = dict(task.config, min_discrimination_size=task.min_discrimination_size)
+    result = engine.calculate('subject_metrics', np.asarray(task.scores, dtype=np.float64), config)
+    return {group: result[group] for group in RESULT_GROUPS}
+
+
+async def run_score_tasks(tasks: Sequence[ScoreTask], mode: str, max_workers: int,
+                          engine: Any = None,
+                          progress_callback: Optional[Callable[[int, int], None]] = None
+                          ) -> Dict[Hashable, Union[Dict[str, Any], Exception]]:
+    """按执行模式运行全部任务，返回 {任务键: 结果或异常}
+
+    progress_callback(已完成任务数, 任务总数) 在每个任务结束后于事件循环线程中调用。
+    """
+    if not tasks:
+        return {}
+
+    completed = 0
+
+    def task_done(_=None):
+        nonlocal completed
+        completed += 1
+        if progress_callback:
+            progress_callback(completed, len(tasks))
+
+    if mode == 'serial':
+        results = {}
+        for task in tasks:
+            try:
+                results[task.key] = run_score_task(task, engine)
+            except Exception as e:
+                results[task.key] = e
+            task_done()
+        return results
+
+    loop = asyncio.get_running_loop()
+    if mode == 'process':
+        pool = _get_process_pool(max_workers)
+        futures = [loop.run_in_executor(pool, run_score_task, task) for task in tasks]
+        for future in futures:
+            future.add_done_callback(task_done)
+        outcomes = await asyncio.gather(*futures, return_exceptions=True)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='subject-calc') as pool:
+            futures = [loop.run_in_executor(pool, run_score_task, task, engine) for task in tasks]
+            for future in futures:
+                future.add_done_callback(task_done)
+            outcomes = await asyncio.gather(*futures, return_exceptions=True)
+
+    return {task.key: outcome for task, outcome in zip(tasks, outcomes)}
+
+
+# 工作进程内的计算引擎（每个进程初始化一次）
+_engine = None
+
+# 进程池在多次计算运行间复用，避免重复启动进程
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_workers = 0
+_process_pool_lock = threading.Lock()
+
+
+def _worker_engine():
+    global _engine
+    if _engine is None:
+        from ..calculation.calculators import initialize_calculation_system
+        _engine = initialize_calculation_system()
+    return _engine
+
+
+def _get_process_pool(max_workers: int) -> Executor:
+    """获取共享进程池（spawn 启动，不继承父进程的数据库连接）"""
+    global _process_pool, _process_pool_workers
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_workers != max_workers:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False)
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            _process_pool_workers = max_workers
+            logger.info(f"科目计算进程池已启动: {max_workers} 个工作进程")
+        return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """关闭共享进程池"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=True)
+            _process_pool = None
@@ -13,15 +13,27 @@ SubjectsBuilder
 - 问卷维度/题目选项占比 option_distribution
 
 输出已做两位小数精度统一（值与百分比字段）。
+
+维度分数读取 student_dimension_scores 长表（由数据清洗服务写入），不再解析 JSON。
+
+批量物化（build_all_school_subjects）每个科目只查询一次学生成绩和维度分组均分，
+在内存中一次性计算所有学校的指标、区域名次与维度名次，
+与逐校调用 build_school_subjects 的输出结构一致。
+
+*_from_partials 变体由学校部分统计量（school_score_partials）合并生成区域与
+学校结果，用于单校成绩更正后的增量汇聚。
 """
 
 from __future__ import annotations
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from decimal import Decimal
 from dataclasses import dataclass
 
+import numpy as np
+import pandas as pd
 from sqlalchemy import text
 
+from app.calculation.partials import ScorePartial
 from app.database.connection import get_db
 from app.utils.precision import round2, round2_json
 
@@ -61,25 +73,28 @@ class SubjectsBuilder:
                 "school_rankings": self._compute_school_rankings(batch_code, s.name),
             }
             if s.type == 'questionnaire':
-                # 问卷维度/题目选项占比
-                dims_od = self._compute_questionnaire_dimension_option_distribution(batch_code, s.name)
-                qs_od = self._compute_questionnaire_question_option_distribution(batch_code, s.name)
-                if dims_od:
-                    subj.setdefault("dimensions", [])
-                    # 将按维度聚合的分布填入 dimensions 列表项
-                    for dim_code, dist in dims_od.items():
-                        subj["dimensions"].append({
-                            "code": dim_code,
-                            "name": dim_code,
-                            "option_distribution": dist,
-                        })
-                if qs_od:
-                    subj["questions"] = [
-                        {"question_id": qid, "option_distribution": dist} for qid, dist in qs_od.items()
-                    ]
+                self._attach_questionnaire_distributions(batch_code, s.name, subj)
             subjects.append(round2_json(subj))
         return subjects
 
+    def _attach_questionnaire_distributions(self, batch_code: str, subject_name: str, subj: Dict[str, Any]) -> None:
+        """问卷维度/题目选项占比"""
+        dims_od = self._compute_questionnaire_dimension_option_distribution(batch_code, subject_name)
+        qs_od = self._compute_questionnaire_question_option_distribution(batch_code, subject_name)
+        if dims_od:
+            subj.setdefault("dimensions", [])
+            # 将按维度聚合的分布填入 dimensions 列表项
+            for dim_code, dist in dims_od.items():
+                subj["dimensions"].append({
+                    "code": dim_code,
+                    "name": dim_code,
+                    "option_distribution": dist,
+                })
+        if qs_od:
+            subj["questions"] = [
+                {"question_id": qid, "option_distribution": dist} for qid, dist in qs_od.items()
+            ]
+
     def build_school_subjects(self, batch_code: str, school_code: str) -> List[Dict[str, Any]]:
         subjects: List[Dict[str, Any]] = []
         for s in self.list_subjects(batch_code):
@@ -97,6 +112,141 @@ class SubjectsBuilder:
             subjects.append(round2_json(subj))
         return subjects
 
+    def build_all_school_subjects(self, batch_code: str,
+                                  school_codes: Optional[Iterable[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """批量生成批次内所有学校的 subjects（每个科目一次查询 + 内存分组计算）
+
+        Args:
+            batch_code: 批次代码
+            school_codes: 需要生成的学校代码，默认批次内全部学校
+
+        Returns:
+            {school_code: subjects}，每个 subjects 与 build_school_subjects 的输出一致
+        """
+        subjects_info = self.list_subjects(batch_code)
+        with next(get_db()) as db:
+            if school_codes is None:
+                rows = db.execute(
+                    text(
+                        """
+                        SELECT DISTINCT school_code
+                        FROM student_cleaned_scores
+                        WHERE batch_code=:batch AND school_code IS NOT NULL
+                        ORDER BY school_code
+                        """
+                    ),
+                    {"batch": batch_code},
+                ).fetchall()
+                school_codes = [r[0] for r in rows]
+            school_codes = list(school_codes)
+
+            per_subject: Dict[str, Dict[str, Dict[str, Any]]] = {}
+            for s in subjects_info:
+                if s.type not in ('exam', 'questionnaire'):
+                    continue
+                params = {"batch": batch_code, "subject": s.name}
+                result = db.execute(
+                    text(
+                        """
+                        SELECT school_code, total_score, max_score
+                        FROM student_cleaned_scores
+                        WHERE batch_code=:batch AND subject_name=:subject
+                          AND subject_type IN ('exam','questionnaire')
+                          AND school_code IS NOT NULL
+                        """
+                    ),
+                    params,
+                )
+                frame = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+                dim_result = db.execute(
+                    text(
+                        """
+                        SELECT dimension_code, school_code,
+                               AVG(score) AS dim_avg, COUNT(*) AS cnt, SUM(max_score) AS max_sum
+                        FROM student_dimension_scores
+                        WHERE batch_code=:batch AND subject_name=:subject
+                          AND school_code IS NOT NULL
+                        GROUP BY dimension_code, school_code
+                        ORDER BY MIN(id)
+                        """
+                    ),
+                    params,
+                )
+                dim_frame = pd.DataFrame(dim_result.fetchall(), columns=list(dim_result.keys()))
+                per_subject[s.name] = compute_school_subject_payloads(frame, dim_frame)
+
+        return assemble_school_subjects(subjects_info, per_subject, school_codes)
+
+    def build_regional_subjects_from_partials(self, batch_code: str,
+                                              partials: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """由学校部分统计量合并生成区域 subjects（不扫描学生成绩，问卷选项占比仍由分布表计算）
+
+        Args:
+            partials: SchoolPartialRepository.get_partials 的结果
+        """
+        totals: Dict[str, Dict[str, Any]] = {}
+        for row in partials:
+            if row['dimension_code'] == '':
+                totals.setdefault(row['subject_name'], {})[row['school_code']] = row
+
+        subjects: List[Dict[str, Any]] = []
+        for s in self.list_subjects(batch_code):
+            schools = totals.get(s.name, {}) if s.type in ('exam', 'questionnaire') else {}
+            school_partials = {code: ScorePartial.from_dict(row['partial']) for code, row in schools.items()}
+            merged = ScorePartial.merge_all(school_partials.values())
+            avg = round2(merged.mean or 0)
+            max_score = round2(merged.full_score_max or 0)
+            means = pd.Series({code: p.mean for code, p in school_partials.items()}, dtype=float)
+            ranks = _ordered_ranks(means.fillna(-np.inf))
+            rankings = sorted(
+                (
+                    {"school_code": code, "school_name": schools[code].get('school_name'),
+                     "avg": float(round2(means[code]) or 0), "rank": int(ranks[code])}
+                    for code in means.index
+                ),
+                key=lambda item: (-item["avg"], item["school_code"]),
+            )
+            subj: Dict[str, Any] = {
+                "subject_name": s.name,
+                "type": s.type,
+                "metrics": {
+                    "avg": avg,
+                    "stddev": round2(merged.std or 0),
+                    "max": round2(merged.max or 0),
+                    "min": round2(merged.min or 0),
+                    "difficulty": round2((avg / max_score) if max_score else 0),
+                },
+                "school_rankings": rankings,
+            }
+            if s.type == 'questionnaire':
+                self._attach_questionnaire_distributions(batch_code, s.name, subj)
+            subjects.append(round2_json(subj))
+        return subjects
+
+    def build_all_school_subjects_from_partials(self, batch_code: str, partials: Iterable[Dict[str, Any]],
+                                                school_codes: Optional[Iterable[str]] = None
+                                                ) -> Dict[str, List[Dict[str, Any]]]:
+        """由学校部分统计量生成学校 subjects，与 build_all_school_subjects 的输出一致"""
+        subjects_info = self.list_subjects(batch_code)
+        totals: Dict[str, Dict[str, Any]] = {}
+        dimension_rows: Dict[str, List[Dict[str, Any]]] = {}
+        for row in partials:
+            if row['dimension_code'] == '':
+                totals.setdefault(row['subject_name'], {})[row['school_code']] = ScorePartial.from_dict(row['partial'])
+            else:
+                dimension_rows.setdefault(row['subject_name'], []).append(row)
+
+        per_subject: Dict[str, Dict[str, Any]] = {}
+        for s in subjects_info:
+            if s.type not in ('exam', 'questionnaire'):
+                continue
+            per_subject[s.name] = compute_school_subject_payloads_from_partials(
+                totals.get(s.name, {}), dimension_rows.get(s.name, [])
+            )
+        if school_codes is None:
+            school_codes = sorted({code for schools in totals.values() for code in schools})
+        return assemble_school_subjects(subjects_info, per_subject, school_codes)
+
     # --- Internals ---
 
     def _compute_subject_metrics(self, batch_code: str, subject_name: str, school_code: Optional[str] = None) -> Dict[str, Any]:
@@ -181,78 +331,70 @@ class SubjectsBuilder:
         return {"region_rank": int(row[0] or 0), "total_schools": int(row[1] or 0)}
 
     def _discover_dimension_codes(self, batch_code: str, subject_name: str) -> List[str]:
-        # 探测维度编码（从学生维度JSON中抽取）
+        # 探测维度编码（读取维度分数长表，按首次写入顺序）
         sql = text(
             """
-            SELECT dimension_scores
-            FROM student_cleaned_scores
+            SELECT dimension_code
+            FROM student_dimension_scores
             WHERE batch_code=:batch AND subject_name=:subject
-              AND subject_type IN ('exam','questionnaire')
-              AND dimension_scores IS NOT NULL AND dimension_scores != ''
-            LIMIT 200
+            GROUP BY dimension_code
+            ORDER BY MIN(id)
             """
         )
-        codes: Dict[str, int] = {}
-        import json
         with next(get_db()) as db:
-            for (ds_json,) in db.execute(sql, {"batch": batch_code, "subject": subject_name}).fetchall():
-                try:
-                    ds = json.loads(ds_json) if isinstance(ds_json, str) else (ds_json or {})
-                except Exception:
-                    ds = {}
-                if isinstance(ds, dict):
-                    for code in ds.keys():
-                        codes[code] = 1
-        return list(codes.keys())
+            rows = db.execute(sql, {"batch": batch_code, "subject": subject_name}).fetchall()
+        return [r[0] for r in rows]
 
     def _compute_school_dimensions_with_rank(self, batch_code: str, subject_name: str, school_code: str) -> List[Dict[str, Any]]:
-        dims_out: List[Dict[str, Any]] = []
         dim_codes = self._discover_dimension_codes(batch_code, subject_name)
         if not dim_codes:
-            return dims_out
+            return []
+        params = {"batch": batch_code, "subject": subject_name, "school": school_code}
+        # 所有维度的学校均分与名次一次查询（索引 idx_batch_subject_dimension_school）
+        sql_rank = text(
+            """
+            WITH per_school AS (
+              SELECT dimension_code, school_code, AVG(score) AS dim_avg
+              FROM student_dimension_scores
+              WHERE batch_code=:batch AND subject_name=:subject
+              GROUP BY dimension_code, school_code
+            ),
+            ranked AS (
+              SELECT dimension_code, school_code, dim_avg,
+                     DENSE_RANK() OVER (PARTITION BY dimension_code ORDER BY dim_avg DESC, school_code ASC) AS r
+              FROM per_school
+            )
+            SELECT dimension_code, ROUND(dim_avg, 2) AS my_avg, r AS my_rank
+            FROM ranked WHERE school_code=:school
+            """
+        )
+        # 维度满分：以该维度 max_score 的平均值为准
+        sql_max = text(
+            """
+            SELECT dimension_code, ROUND(AVG(max_score), 2) AS max_score
+            FROM student_dimension_scores
+            WHERE batch_code=:batch AND subject_name=:subject
+            GROUP BY dimension_code
+            """
+        )
         with next(get_db()) as db:
-            for dim in dim_codes:
-                sql_rank = text(
-                    f"""
-                    WITH per_school AS (
-                      SELECT school_code,
-                             AVG(CAST(JSON_UNQUOTE(JSON_EXTRACT(CAST(dimension_scores AS JSON), '$."{dim}".score')) AS DECIMAL(10,4))) AS dim_avg
-                      FROM student_cleaned_scores
-                      WHERE batch_code=:batch AND subject_name=:subject
-                        AND subject_type IN ('exam','questionnaire')
-                        AND JSON_EXTRACT(CAST(dimension_scores AS JSON), '$."{dim}".score') IS NOT NULL
-                      GROUP BY school_code
-                    )
-                    SELECT 
-                      (SELECT ROUND(dim_avg, 2) FROM per_school WHERE school_code=:school) AS my_avg,
-                      (SELECT DENSE_RANK() OVER (ORDER BY dim_avg DESC, school_code ASC) FROM per_school WHERE school_code=:school) AS my_rank
-                    """
-                )
-                row = db.execute(sql_rank, {"batch": batch_code, "subject": subject_name, "school": school_code}).fetchone()
-                if not row:
-                    continue
-                dim_avg = float(row[0]) if row[0] is not None else None
-                dim_rank = int(row[1]) if row[1] is not None else None
-                # 估算维度满分（可选）：以该维度 max_score 的平均值为准
-                sql_max = text(
-                    f"""
-                    SELECT ROUND(AVG(CAST(JSON_UNQUOTE(JSON_EXTRACT(CAST(dimension_max_scores AS JSON), '$."{dim}"')) AS DECIMAL(10,4))), 2) AS max_score
-                    FROM student_cleaned_scores
-                    WHERE batch_code=:batch AND subject_name=:subject
-                      AND subject_type IN ('exam','questionnaire')
-                      AND JSON_EXTRACT(CAST(dimension_max_scores AS JSON), '$."{dim}"') IS NOT NULL
-                    """
-                )
-                max_row = db.execute(sql_max, {"batch": batch_code, "subject": subject_name}).fetchone()
-                max_score = float(max_row[0]) if max_row and max_row[0] is not None else None
-                score_rate = round2((dim_avg / max_score * 100.0) if (dim_avg is not None and max_score) else None)
-                dims_out.append({
-                    "code": dim,
-                    "name": dim,
-                    "avg": round2(dim_avg) if dim_avg is not None else None,
-                    "score_rate": score_rate,
-                    "rank": dim_rank,
-                })
+            school_rows = {r[0]: r for r in db.execute(sql_rank, params).fetchall()}
+            max_scores = {r[0]: r[1] for r in db.execute(sql_max, params).fetchall()}
+
+        dims_out: List[Dict[str, Any]] = []
+        for dim in dim_codes:
+            row = school_rows.get(dim)
+            dim_avg = float(row[1]) if row and row[1] is not None else None
+            dim_rank = int(row[2]) if row and row[2] is not None else None
+            max_score = float(max_scores[dim]) if max_scores.get(dim) is not None else None
+            score_rate = round2((dim_avg / max_score * 100.0) if (dim_avg is not None and max_score) else None)
+            dims_out.append({
+                "code": dim,
+                "name": dim,
+                "avg": round2(dim_avg) if dim_avg is not None else None,
+                "score_rate": score_rate,
+                "rank": dim_rank,
+            })
         return dims_out
 
     def _compute_questionnaire_dimension_option_distribution(self, batch_code: str, subject_name: str) -> Dict[str, List[Dict[str, Any]]]:
@@ -396,3 +538,166 @@ class SubjectsBuilder:
                     out = base
                 return out
         return {int(r[0]): r[1] for r in opts} if opts else {}
+
+
+_EMPTY_METRICS = {"avg": 0.0, "stddev": 0.0, "max": 0.0, "min": 0.0, "difficulty": 0.0}
+
+
+def _ordered_ranks(values: pd.Series) -> pd.Series:
+    """按 (值 DESC, 学校代码 ASC) 排序后的名次，与 DENSE_RANK() OVER (ORDER BY v DESC, school_code ASC) 一致"""
+    ordered = sorted(values.index, key=lambda code: (-values[code], code))
+    return pd.Series(np.arange(1, len(ordered) + 1), index=ordered)
+
+
+def compute_school_subject_payloads(frame: pd.DataFrame,
+                                    dimension_frame: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    """单科目内存计算：所有学校的指标、区域名次与维度均分/名次
+
+    Args:
+        frame: 该科目学生成绩（school_code, total_score, max_score）
+        dimension_frame: 维度长表按 (维度, 学校) 分组结果（dimension_code, school_code, dim_avg, cnt, max_sum），
+            行顺序即维度首次出现顺序
+
+    Returns:
+        {'total_schools', 'schools': {school_code: {'metrics', 'region_rank'}},
+         'dimension_codes', 'dimension_avgs', 'dimension_ranks', 'dimension_max_scores'}
+    """
+    if frame.empty:
+        return {'total_schools': 0, 'schools': {}, 'dimension_codes': []}
+
+    scores = pd.to_numeric(frame['total_score'], errors='coerce')
+    grouped = scores.groupby(frame['school_code'])
+    stats = pd.DataFrame({
+        'avg': grouped.mean(),
+        'stddev': grouped.std(ddof=0),
+        'max': grouped.max(),
+        'min': grouped.min(),
+        'max_score': pd.to_numeric(frame['max_score'], errors='coerce').groupby(frame['school_code']).max(),
+    })
+    return _payloads_from_school_stats(stats, dimension_frame)
+
+
+def compute_school_subject_payloads_from_partials(school_partials: Dict[str, Any],
+                                                  dimension_rows: Iterable[Dict[str, Any]] = ()) -> Dict[str, Any]:
+    """单科目由学校部分统计量计算，与 compute_school_subject_payloads 的输出一致
+
+    Args:
+        school_partials: {school_code: ScorePartial}（科目总分）
+        dimension_rows: 维度部分统计量行（dimension_code, school_code, partial, first_seen_id）
+    """
+    if not school_partials:
+        return {'total_schools': 0, 'schools': {}, 'dimension_codes': []}
+
+    stats = pd.DataFrame.from_dict({
+        code: {
+            'avg': p.mean, 'stddev': p.std, 'max': p.max, 'min': p.min, 'max_score': p.full_score_max,
+        }
+        for code, p in school_partials.items()
+    }, orient='index', columns=['avg', 'stddev', 'max', 'min', 'max_score'], dtype=float)
+
+    # 维度按首次写入顺序排列（与 ORDER BY MIN(id) 一致）
+    dimension_rows = list(dimension_rows)
+    first_seen: Dict[str, float] = {}
+    for row in dimension_rows:
+        seen = row.get('first_seen_id')
+        seen = float('inf') if seen is None else seen
+        first_seen[row['dimension_code']] = min(first_seen.get(row['dimension_code'], seen), seen)
+    records = []
+    for row in sorted(dimension_rows, key=lambda r: (first_seen[r['dimension_code']], r['dimension_code'])):
+        partial = ScorePartial.from_dict(row['partial'])
+        records.append({
+            'dimension_code': row['dimension_code'],
+            'school_code': row['school_code'],
+            'dim_avg': partial.mean,
+            'cnt': partial.count,
+            'max_sum': partial.full_score_sum,
+        })
+    dimension_frame = pd.DataFrame(records, columns=['dimension_code', 'school_code', 'dim_avg', 'cnt', 'max_sum'])
+    return _payloads_from_school_stats(stats, dimension_frame)
+
+
+def _payloads_from_school_stats(stats: pd.DataFrame, dimension_frame: Optional[pd.DataFrame]) -> Dict[str, Any]:
+    """由学校指标表（index=school_code, avg/stddev/max/min/max_score）计算名次与维度结果"""
+    # AVG 为 NULL 的学校排在最后（与 MySQL DESC 排序一致）
+    ranks = _ordered_ranks(stats['avg'].fillna(-np.inf))
+
+    schools: Dict[str, Dict[str, Any]] = {}
+    for school_code, row in stats.iterrows():
+        avg_v = round2(0 if pd.isna(row['avg']) else row['avg'])
+        max_score = round2(0 if pd.isna(row['max_score']) else row['max_score'])
+        schools[school_code] = {
+            "metrics": {
+                "avg": avg_v,
+                "stddev": round2(0 if pd.isna(row['stddev']) else row['stddev']),
+                "max": round2(0 if pd.isna(row['max']) else row['max']),
+                "min": round2(0 if pd.isna(row['min']) else row['min']),
+                "difficulty": round2((avg_v / max_score) if max_score else 0),
+            },
+            "region_rank": int(ranks[school_code]),
+        }
+
+    dimension_codes: List[str] = []
+    dimension_avgs: Dict[str, pd.Series] = {}
+    dimension_ranks: Dict[str, pd.Series] = {}
+    dimension_max_scores: Dict[str, Optional[float]] = {}
+    if dimension_frame is not None and not dimension_frame.empty:
+        dimension_codes = list(dict.fromkeys(dimension_frame['dimension_code']))
+        for code, group in dimension_frame.groupby('dimension_code', sort=False):
+            dim_avg = pd.Series(pd.to_numeric(group['dim_avg']).astype(float).values, index=group['school_code'])
+            dimension_avgs[code] = dim_avg
+            dimension_ranks[code] = _ordered_ranks(dim_avg)
+            count = float(pd.to_numeric(group['cnt']).sum())
+            dimension_max_scores[code] = round2(float(pd.to_numeric(group['max_sum']).sum()) / count) if count else None
+
+    return {
+        'total_schools': int(len(stats)),
+        'schools': schools,
+        'dimension_codes': dimension_codes,
+        'dimension_avgs': dimension_avgs,
+        'dimension_ranks': dimension_ranks,
+        'dimension_max_scores': dimension_max_scores,
+    }
+
+
+def assemble_school_subjects(subjects_info: List[SubjectInfo], per_subject: Dict[str, Dict[str, Any]],
+                             school_codes: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """按学校组装各科目批量结果为 subjects 列表"""
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for school_code in school_codes:
+        subjects: List[Dict[str, Any]] = []
+        for s in subjects_info:
+            payload = per_subject.get(s.name, {})
+            entry = payload.get('schools', {}).get(school_code)
+            subj: Dict[str, Any] = {
+                "subject_name": s.name,
+                "type": s.type,
+                "metrics": entry["metrics"] if entry else dict(_EMPTY_METRICS),
+                "region_rank": entry["region_rank"] if entry else None,
+                "total_schools": payload.get('total_schools', 0) if entry else 0,
+            }
+            dims = _school_dimensions(payload, school_code)
+            if dims:
+                subj["dimensions"] = dims
+            subjects.append(round2_json(subj))
+        out[school_code] = subjects
+    return out
+
+
+def _school_dimensions(payload: Dict[str, Any], school_code: str) -> List[Dict[str, Any]]:
+    """从科目批量结果中取出单个学校的维度列表"""
+    dims_out: List[Dict[str, Any]] = []
+    for dim in payload.get('dimension_codes', []):
+        dim_avg_series = payload['dimension_avgs'].get(dim)
+        has_value = dim_avg_series is not None and school_code in dim_avg_series.index
+        dim_avg = round2(float(dim_avg_series[school_code])) if has_value else None
+        dim_rank = int(payload['dimension_ranks'][dim][school_code]) if has_value else None
+        max_score = payload['dimension_max_scores'].get(dim)
+        score_rate = round2((dim_avg / max_score * 100.0) if (dim_avg is not None and max_score) else None)
+        dims_out.append({
+            "code": dim,
+            "name": dim,
+            "avg": dim_avg,
+            "score_rate": score_rate,
+            "rank": dim_rank,
+        })
+    return dims_out
@@ -5,15 +5,15 @@ from datetime import datetime, timedelta
 from fastapi import BackgroundTasks
 import uuid
 import logging
-import asyncio
-import threading
+import time
 from enum import Enum
 
 from ..database.models import StatisticalAggregation, Task
 from ..database.enums import CalculationStatus, AggregationLevel
-from ..database.repositories import StatisticalAggregationRepository, TaskRepository
+from ..database.repositories import InputFingerprintRepository, StatisticalAggregationRepository, TaskRepository
 from ..schemas.response_schemas import TaskResponse
 from ..services.calculation_service import CalculationService
+from .task_queue import current_worker_pool, notify_task_queued
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -21,6 +21,31 @@ from data_cleaning_service import DataCleaningService
 
 logger = logging.getLogger(__name__)
 
+# 进度写库节流：运行中的进度至少间隔 PROGRESS_WRITE_INTERVAL 秒且变化不少于
+# PROGRESS_WRITE_MIN_DELTA 个百分点才写入数据库，阶段切换与结束时立即写入
+PROGRESS_WRITE_INTERVAL = float(os.getenv("TASK_PROGRESS_WRITE_INTERVAL", 1.0))
+PROGRESS_WRITE_MIN_DELTA = float(os.getenv("TASK_PROGRESS_WRITE_MIN_DELTA", 1.0))
+# 计算服务进度回调中数据加载与验证所占的区间上界（百分比）
+LOADING_PROGRESS = 15
+
+CALCULATION_STAGES = (
+    ("data_loading", "数据加载和验证"),
+    ("statistical_calculation", "统计计算和数据生成"),
+    ("result_aggregation", "结果汇聚和存储"),
+)
+CLEANING_STAGES = (
+    ("precheck", "预检查与准备"),
+    ("cleaning", "执行数据清洗"),
+    ("verification", "结果校验"),
+)
+
+
+def _initial_stages(stages) -> List[Dict[str, Any]]:
+    return [
+        {"stage": stage, "status": "pending", "progress": 0.0, "description": description}
+        for stage, description in stages
+    ]
+
 
 class TaskStatus(str, Enum):
     """任务状态枚举"""
@@ -51,6 +76,8 @@ class TaskManager:
         self._running_tasks: Dict[str, Dict[str, Any]] = {}
         self._task_progress: Dict[str, Dict[str, Any]] = {}
         self._cancelled_tasks: set = set()
+        # 每个任务最近一次写库的 (时间, 进度, 阶段)
+        self._progress_writes: Dict[str, tuple] = {}
         
         # 系统状态
         self._system_stats = {
@@ -68,9 +95,14 @@ class TaskManager:
         aggregation_level: Optional[AggregationLevel] = None,
         school_id: Optional[str] = None,
         priority: int = TaskPriority.NORMAL,
-        background_tasks: BackgroundTasks = None
+        background_tasks: BackgroundTasks = None,
+        estimated_rows: Optional[int] = None
     ) -> TaskResponse:
-        """启动统计计算任务"""
+        """提交统计计算任务到任务队列（background_tasks 仅为兼容旧调用保留，任务由队列工作线程执行）
+        
+        estimated_rows 为批次清洗记录数估算值，工作线程池据此控制同时执行任务的内存占用；
+        未提供时批次级任务自行估算。
+        """
         try:
             # 验证批次是否存在
             batch = self.aggregation_repo.get_by_filters({
@@ -82,74 +114,40 @@ class TaskManager:
             if not batch:
                 raise ValueError(f"批次 {batch_code} 不存在")
             
-            # 检查是否已经在运行
-            if batch.calculation_status == CalculationStatus.PROCESSING:
-                existing_task = self._find_running_task_by_batch(batch_code, school_id)
-                if existing_task:
-                    return self._convert_to_task_response(existing_task)
+            # 同一批次（学校）已有排队或执行中的计算任务时直接返回该任务
+            existing_task = self.task_repo.find_active("calculation", batch_code, school_id)
+            if existing_task:
+                return self._db_task_response(existing_task)
+            
+            if estimated_rows is None and school_id is None:
+                estimated_rows = self._estimate_batch_rows([batch_code]).get(batch_code)
             
             # 创建新任务 - 使用时间戳生成数字ID
-            import time
             task_id = int(time.time() * 1000000) + batch.id  # 微秒时间戳 + batch_id确保唯一性
             task_data = {
                 "id": task_id,
+                "task_type": "calculation",
                 "batch_id": batch.id,
                 "batch_code": batch_code,
                 "school_id": school_id,
                 "aggregation_level": aggregation_level.value if aggregation_level else batch.aggregation_level.value,
                 "status": TaskStatus.PENDING,
-                "priority": priority,
+                "priority": int(priority),
                 "progress": 0.0,
                 "started_at": datetime.now(),
                 "completed_at": None,
                 "error_message": None,
-                "stage_details": [
-                    {"stage": "data_loading", "status": "pending", "progress": 0.0, "description": "数据加载和验证"},
-                    {"stage": "statistical_calculation", "status": "pending", "progress": 0.0, "description": "统计计算和数据生成"},
-                    {"stage": "result_aggregation", "status": "pending", "progress": 0.0, "description": "结果汇聚和存储"}
-                ]
+                "stage_details": _initial_stages(CALCULATION_STAGES),
+                "estimated_rows": estimated_rows
             }
             
-            # 保存到数据库
-            task_create_data = {
-                "id": task_data["id"],
-                "batch_id": task_data["batch_id"],
-                "status": task_data["status"].value,  # 转换枚举为字符串值
-                "progress": task_data["progress"],
-                "started_at": task_data["started_at"]
-            }
-            
-            self.task_repo.create(task_create_data)
-            
             # 更新批次状态
             self.aggregation_repo.update(batch.id, {
                 "calculation_status": CalculationStatus.PROCESSING
             })
             
-            # 缓存任务信息
-            self._running_tasks[task_id] = task_data
-            self._task_progress[task_id] = {
-                "overall_progress": 0.0,
-                "stage_details": task_data["stage_details"],
-                "last_updated": datetime.now()
-            }
-            
-            # 启动后台任务
-            if background_tasks:
-                background_tasks.add_task(self._execute_calculation_task, task_id)
-            else:
-                # 如果没有BackgroundTasks，启动独立线程
-                threading.Thread(
-                    target=self._execute_calculation_task_sync,
-                    args=(task_id,),
-                    daemon=True
-                ).start()
-            
-            # 更新系统统计
-            self._system_stats["total_tasks"] += 1
-            self._system_stats["running_tasks"] += 1
-            
-            logger.info(f"Started calculation task {task_id} for batch {batch_code}")
+            self._enqueue_task(task_data)
+            logger.info(f"Queued calculation task {task_id} for batch {batch_code} (priority={int(priority)})")
             return self._convert_to_task_response(task_data)
             
         except Exception as e:
@@ -161,66 +159,70 @@ class TaskManager:
         batch_code: str,
         background_tasks: BackgroundTasks = None
     ) -> TaskResponse:
-        """启动数据清洗任务，返回任务信息（task_id用于前端轮询）。"""
+        """提交数据清洗任务到任务队列，返回任务信息（task_id用于前端轮询）。"""
         try:
-            import time
+            existing_task = self.task_repo.find_active("cleaning", batch_code)
+            if existing_task:
+                return self._db_task_response(existing_task)
+
             task_id = int(time.time() * 1000000)
             task_data = {
                 "id": task_id,
+                "task_type": "cleaning",
                 "batch_id": 0,
                 "batch_code": batch_code,
                 "status": TaskStatus.PENDING,
-                "priority": TaskPriority.NORMAL,
+                "priority": int(TaskPriority.NORMAL),
                 "progress": 0.0,
                 "started_at": datetime.now(),
                 "completed_at": None,
                 "error_message": None,
-                "stage_details": [
-                    {"stage": "precheck", "status": "pending", "progress": 0.0, "description": "预检查与准备"},
-                    {"stage": "cleaning", "status": "pending", "progress": 0.0, "description": "执行数据清洗"},
-                    {"stage": "verification", "status": "pending", "progress": 0.0, "description": "结果校验"}
-                ]
+                "stage_details": _initial_stages(CLEANING_STAGES)
             }
 
-            # 入库
-            self.task_repo.create({
-                "id": task_id,
-                "batch_id": task_data["batch_id"],
-                "status": task_data["status"].value,
-                "progress": task_data["progress"],
-                "started_at": task_data["started_at"]
-            })
-
-            # 缓存
-            self._running_tasks[task_id] = task_data
-            self._task_progress[task_id] = {
-                "overall_progress": 0.0,
-                "stage_details": [
-                    {"stage": "precheck", "status": "pending", "progress": 0.0},
-                    {"stage": "cleaning", "status": "pending", "progress": 0.0},
-                    {"stage": "verification", "status": "pending", "progress": 0.0}
-                ],
-                "last_updated": datetime.now()
-            }
-
-            # 启动后台执行
-            if background_tasks:
-                background_tasks.add_task(self._execute_cleaning_task_sync, task_id, batch_code)
-            else:
-                threading.Thread(target=self._execute_cleaning_task_sync, args=(task_id, batch_code), daemon=True).start()
-
-            # 统计
-            self._system_stats["total_tasks"] += 1
-            self._system_stats["running_tasks"] += 1
-
+            self._enqueue_task(task_data)
             return self._convert_to_task_response(task_data)
 
         except Exception as e:
             logger.error(f"Error starting cleaning task: {str(e)}")
             raise
 
-    def _execute_cleaning_task_sync(self, task_id: str, batch_code: str) -> None:
-        asyncio.run(self._execute_cleaning_task(task_id, batch_code))
+    def _enqueue_task(self, task_data: Dict[str, Any]) -> None:
+        """任务入库即入队，并唤醒工作线程"""
+        self.task_repo.create({**task_data, "status": task_data["status"].value})
+        self._system_stats["total_tasks"] += 1
+        notify_task_queued()
+
+    async def run_queued_task(self, task: Task) -> None:
+        """执行队列工作线程认领的任务"""
+        stages = task.stage_details or _initial_stages(
+            CLEANING_STAGES if task.task_type == "cleaning" else CALCULATION_STAGES
+        )
+        self._running_tasks[task.id] = {
+            "id": task.id,
+            "task_type": task.task_type,
+            "batch_id": task.batch_id,
+            "batch_code": task.batch_code,
+            "school_id": task.school_id,
+            "aggregation_level": task.aggregation_level,
+            "status": TaskStatus.RUNNING,
+            "priority": task.priority,
+            "progress": task.progress or 0.0,
+            "started_at": task.started_at,
+            "completed_at": None,
+            "error_message": None,
+            "stage_details": stages
+        }
+        self._task_progress[task.id] = {
+            "overall_progress": task.progress or 0.0,
+            "stage_details": stages,
+            "last_updated": datetime.now()
+        }
+        self._system_stats["running_tasks"] += 1
+        if task.task_type == "cleaning":
+            await self._execute_cleaning_task(task.id, task.batch_code)
+        else:
+            await self._execute_calculation_task(task.id)
 
     async def _execute_cleaning_task(self, task_id: str, batch_code: str) -> None:
         try:
@@ -230,20 +232,29 @@ class TaskManager:
 
             # 运行中
             task_info["status"] = TaskStatus.RUNNING
-            self._update_task_progress(task_id, 5.0, "precheck", "processing")
+            self._update_task_progress(task_id, 0.0, "precheck", "processing")
 
-            # 执行清洗
+            # 执行清洗：按已完成科目映射到 5-90% 的任务进度
             svc = DataCleaningService(self.db)
-            await self._simulate_progress(task_id, 5, 15, "precheck")
-            self._update_task_progress(task_id, 20.0, "cleaning", "processing")
-            await svc.clean_batch_scores(batch_code)
-            await self._simulate_progress(task_id, 20, 85, "cleaning")
+
+            def progress_callback(progress: float, message: str):
+                task_progress = 5 + progress * 0.85
+                self._update_task_progress(task_id, task_progress, "cleaning", "processing", progress)
+                logger.debug(f"Task {task_id}: {message} ({task_progress:.1f}%)")
+
+            self._update_task_progress(task_id, 5.0, "cleaning", "processing")
+            result = await svc.clean_batch_scores(batch_code, progress_callback=progress_callback)
+            if task_id in self._cancelled_tasks:
+                return
+            if result.get('error'):
+                await self._complete_task_with_error(task_id, result['error'])
+                return
 
             # 简要校验
+            self._update_task_progress(task_id, 90.0, "verification", "processing")
             from sqlalchemy import text
             row = self.db.execute(text("SELECT COUNT(*) FROM student_cleaned_scores WHERE batch_code=:b"), {"b": batch_code}).fetchone()
             _ = int(row[0]) if row and row[0] is not None else 0
-            self._update_task_progress(task_id, 95.0, "verification", "processing")
 
             await self._complete_task_successfully(task_id)
 
@@ -251,38 +262,30 @@ class TaskManager:
             await self._complete_task_with_error(task_id, str(e))
     
     async def cancel_task(self, task_id: str) -> bool:
-        """取消任务"""
+        """取消任务（任一进程均可调用：排队中的任务不再执行，执行中的任务由工作线程在阶段边界停止）"""
         try:
-            if task_id not in self._running_tasks:
-                # 检查数据库中的任务
-                db_task = self.task_repo.get_by_id(task_id)
-                if not db_task:
-                    return False
-                
-                # 如果任务已经完成或失败，不能取消
-                if db_task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED]:
-                    return False
+            db_task = self.task_repo.get_by_id(task_id)
+            if not db_task:
+                return False
+            
+            # 只能取消排队或执行中的任务
+            if not self.task_repo.request_cancel(db_task.id):
+                return False
             
             # 标记为取消
-            self._cancelled_tasks.add(task_id)
+            self._cancelled_tasks.add(db_task.id)
             
             # 更新内存中的任务状态
-            if task_id in self._running_tasks:
-                self._running_tasks[task_id]["status"] = TaskStatus.CANCELLED
-                self._running_tasks[task_id]["completed_at"] = datetime.now()
-                
-                # 更新批次状态
-                batch_id = self._running_tasks[task_id]["batch_id"]
-                self.aggregation_repo.update(batch_id, {
+            if db_task.id in self._running_tasks:
+                self._running_tasks[db_task.id]["status"] = TaskStatus.CANCELLED
+                self._running_tasks[db_task.id]["completed_at"] = datetime.now()
+            
+            # 更新批次状态
+            if db_task.task_type != "cleaning" and db_task.batch_id:
+                self.aggregation_repo.update(db_task.batch_id, {
                     "calculation_status": CalculationStatus.FAILED
                 })
             
-            # 更新数据库中的任务
-            self.task_repo.update(task_id, {
-                "status": TaskStatus.CANCELLED,
-                "completed_at": datetime.now()
-            })
-            
             # 更新系统统计
             self._system_stats["cancelled_tasks"] += 1
             if self._system_stats["running_tasks"] > 0:
@@ -302,18 +305,10 @@ class TaskManager:
             if task_id in self._running_tasks:
                 return self._convert_to_task_response(self._running_tasks[task_id])
             
-            # 从数据库查找
+            # 从数据库查找（任务可能由其他进程执行）
             db_task = self.task_repo.get_by_id(task_id)
             if db_task:
-                return TaskResponse(
-                    id=db_task.id,
-                    batch_id=db_task.batch_id,
-                    status=db_task.status,
-                    progress=db_task.progress or 0.0,
-                    started_at=db_task.started_at,
-                    completed_at=db_task.completed_at,
-                    error_message=db_task.error_message
-                )
+                return self._db_task_response(db_task)
             
             return None
             
@@ -329,8 +324,16 @@ class TaskManager:
                 progress_info["task_id"] = task_id
                 return progress_info
             
-            # 从数据库获取基本进度信息
+            # 从数据库获取进度信息（队列任务的阶段进度由执行进程写入）
             db_task = self.task_repo.get_by_id(task_id)
+            if db_task and db_task.stage_details:
+                return {
+                    "task_id": task_id,
+                    "status": db_task.status,
+                    "overall_progress": db_task.progress or 0.0,
+                    "stage_details": db_task.stage_details,
+                    "last_updated": db_task.updated_at or db_task.started_at
+                }
             if db_task:
                 return {
                     "task_id": task_id,
@@ -355,16 +358,25 @@ class TaskManager:
         priority: int = TaskPriority.NORMAL,
         background_tasks: BackgroundTasks = None
     ) -> List[TaskResponse]:
-        """批量启动任务"""
+        """批量提交批次计算任务
+        
+        按批次代码去重，每个批次提交一个区域级任务：任务内先完成区域级统计再生成全部学校统计，
+        两者共用一次加载的批次分数快照。各批次的记录数估算由一次查询得到并随任务入队，
+        工作线程池按内存预算（TASK_QUEUE_MEMORY_BUDGET_MB）限制同时执行的批次。
+        """
         tasks = []
         errors = []
+        unique_codes = list(dict.fromkeys(code for code in batch_codes if code))
+        row_estimates = self._estimate_batch_rows(unique_codes)
         
-        for batch_code in batch_codes:
+        for batch_code in unique_codes:
             try:
                 task = await self.start_calculation_task(
                     batch_code=batch_code,
+                    aggregation_level=AggregationLevel.REGIONAL,
                     priority=priority,
-                    background_tasks=background_tasks
+                    background_tasks=background_tasks,
+                    estimated_rows=row_estimates.get(batch_code, 0)
                 )
                 tasks.append(task)
             except Exception as e:
@@ -372,10 +384,18 @@ class TaskManager:
                 errors.append({"batch_code": batch_code, "error": str(e)})
         
         if errors:
-            logger.warning(f"Failed to start {len(errors)} tasks out of {len(batch_codes)}")
+            logger.warning(f"Failed to start {len(errors)} tasks out of {len(unique_codes)}")
         
         return tasks
     
+    def _estimate_batch_rows(self, batch_codes: List[str]) -> Dict[str, int]:
+        """估算批次清洗记录数（估算失败时不限制内存预算）"""
+        try:
+            return InputFingerprintRepository(self.db).estimate_batch_rows(batch_codes)
+        except Exception as e:
+            logger.warning(f"Failed to estimate rows for batches {batch_codes}: {str(e)}")
+            return {}
+    
     async def batch_cancel_tasks(self, task_ids: List[str]) -> int:
         """批量取消任务"""
         cancelled_count = 0
@@ -448,15 +468,7 @@ class TaskManager:
                 if db_task.id in self._running_tasks:
                     tasks.append(self._convert_to_task_response(self._running_tasks[db_task.id]))
                 else:
-                    tasks.append(TaskResponse(
-                        id=db_task.id,
-                        batch_id=db_task.batch_id,
-                        status=db_task.status,
-                        progress=db_task.progress or 0.0,
-                        started_at=db_task.started_at,
-                        completed_at=db_task.completed_at,
-                        error_message=db_task.error_message
-                    ))
+                    tasks.append(self._db_task_response(db_task))
             
             return tasks
             
@@ -474,12 +486,15 @@ class TaskManager:
             # 计算系统运行时间
             uptime = datetime.now() - self._system_stats["system_start_time"]
             
+            pool = current_worker_pool()
             return {
                 "system_status": "healthy",
                 "uptime_seconds": uptime.total_seconds(),
                 "memory_tasks": len(self._running_tasks),
                 "cached_progress": len(self._task_progress),
                 "statistics": self._system_stats.copy(),
+                "queue": self.task_repo.status_counts(),
+                "worker_pool": pool.stats() if pool else None,
                 "last_updated": datetime.now().isoformat()
             }
             
@@ -510,23 +525,24 @@ class TaskManager:
                 await self._complete_task_with_error(task_id, "批次数据不存在")
                 return
             
-            # 第一阶段：数据加载
-            logger.info(f"Task {task_id}: Starting data loading")
-            await self._simulate_progress(task_id, 0, 33, "data_loading")
-            
             if task_id in self._cancelled_tasks:
                 return
             
-            # 第二阶段：统计计算
+            # 数据加载与统计计算均在计算服务内完成
             logger.info(f"Task {task_id}: Starting statistical calculation")
             start_time = datetime.now()
             
             try:
                 # 调用计算服务，传入进度回调
                 def progress_callback(progress: float, message: str):
-                    # 将计算进度映射到 33-90% 的任务进度范围
-                    task_progress = 33 + (progress / 100.0) * 57  # 33% + 57% = 90%
-                    self._update_task_progress(task_id, task_progress, "statistical_calculation", "processing")
+                    # 计算进度映射到 0-90% 的任务进度；计算服务 15% 之前为数据加载与验证
+                    task_progress = progress * 0.9
+                    if progress < LOADING_PROGRESS:
+                        self._update_task_progress(task_id, task_progress, "data_loading", "processing",
+                                                   progress / LOADING_PROGRESS * 100)
+                    else:
+                        self._update_task_progress(task_id, task_progress, "statistical_calculation", "processing",
+                                                   (progress - LOADING_PROGRESS) / (100 - LOADING_PROGRESS) * 100)
                     logger.debug(f"Task {task_id}: {message} ({task_progress:.1f}%)")
                 
                 if batch.aggregation_level == AggregationLevel.REGIONAL:
@@ -554,6 +570,7 @@ class TaskManager:
             
             # 第三阶段：结果汇聚
             logger.info(f"Task {task_id}: Starting result aggregation")
+            self._update_task_progress(task_id, 90, "result_aggregation", "processing")
             
             # 更新批次统计数据
             calculation_duration = (datetime.now() - start_time).total_seconds()
@@ -573,8 +590,6 @@ class TaskManager:
                 "calculation_duration": calculation_duration
             })
             
-            await self._simulate_progress(task_id, 90, 100, "result_aggregation")
-            
             # 完成任务
             await self._complete_task_successfully(task_id)
             
@@ -582,12 +597,13 @@ class TaskManager:
             logger.error(f"Error executing task {task_id}: {str(e)}")
             await self._complete_task_with_error(task_id, str(e))
     
-    def _execute_calculation_task_sync(self, task_id: str) -> None:
-        """执行计算任务（同步版本，用于线程）"""
-        asyncio.run(self._execute_calculation_task(task_id))
-    
-    def _update_task_progress(self, task_id: str, progress: float, stage: str, status: str) -> None:
-        """更新任务进度"""
+    def _update_task_progress(self, task_id: str, progress: float, stage: str, status: str,
+                              stage_progress: Optional[float] = None) -> None:
+        """更新任务进度
+
+        内存中的进度每次都更新；数据库写入按 PROGRESS_WRITE_INTERVAL / PROGRESS_WRITE_MIN_DELTA 节流合并，
+        阶段切换或阶段结束时立即写入。进入某一阶段时其之前的阶段标记为已完成。
+        """
         if task_id not in self._task_progress:
             return
         
@@ -596,52 +612,57 @@ class TaskManager:
         self._task_progress[task_id]["last_updated"] = datetime.now()
         
         # 更新阶段状态
+        if stage_progress is None:
+            stage_progress = 100.0 if status == "completed" else 0.0
         for stage_info in self._task_progress[task_id]["stage_details"]:
             if stage_info["stage"] == stage:
                 stage_info["status"] = status
-                stage_info["progress"] = min(progress * 3, 100.0) if status == "processing" else (100.0 if status == "completed" else 0.0)
+                stage_info["progress"] = min(max(stage_progress, 0.0), 100.0)
                 break
+            stage_info["status"] = "completed"
+            stage_info["progress"] = 100.0
         
         # 更新内存中的任务进度
         if task_id in self._running_tasks:
             self._running_tasks[task_id]["progress"] = progress
         
-        # 更新数据库中的任务进度
+        # 更新数据库中的任务进度（节流）
+        now = time.monotonic()
+        last = self._progress_writes.get(task_id)
+        if (last is not None and status == "processing" and stage == last[2]
+                and (now - last[0] < PROGRESS_WRITE_INTERVAL or abs(progress - last[1]) < PROGRESS_WRITE_MIN_DELTA)):
+            return
+        self._progress_writes[task_id] = (now, progress, stage)
         try:
-            self.task_repo.update(task_id, {"progress": progress})
+            self.task_repo.update(task_id, {
+                "progress": progress,
+                "stage_details": [dict(s) for s in self._task_progress[task_id]["stage_details"]]
+            })
         except Exception as e:
             logger.error(f"Error updating task progress in database: {str(e)}")
     
-    async def _simulate_progress(self, task_id: str, start_progress: float, end_progress: float, stage: str) -> None:
-        """模拟进度更新"""
-        steps = 10
-        step_size = (end_progress - start_progress) / steps
-        
-        for i in range(steps + 1):
-            if task_id in self._cancelled_tasks:
-                return
-            
-            progress = start_progress + (step_size * i)
-            status = "completed" if i == steps else "processing"
-            self._update_task_progress(task_id, progress, stage, status)
-            
-            if i < steps:  # 最后一步不需要等待
-                await asyncio.sleep(0.5)  # 模拟处理时间
-    
     async def _complete_task_successfully(self, task_id: str) -> None:
         """成功完成任务"""
-        if task_id not in self._running_tasks:
+        if task_id not in self._running_tasks or self._cancel_requested(task_id):
             return
         
         # 更新任务状态
         self._running_tasks[task_id]["status"] = TaskStatus.COMPLETED
         self._running_tasks[task_id]["progress"] = 100.0
         self._running_tasks[task_id]["completed_at"] = datetime.now()
+        if task_id in self._task_progress:
+            self._task_progress[task_id]["overall_progress"] = 100.0
+            self._task_progress[task_id]["last_updated"] = datetime.now()
+            for stage_info in self._task_progress[task_id]["stage_details"]:
+                stage_info["status"] = "completed"
+                stage_info["progress"] = 100.0
+        self._progress_writes.pop(task_id, None)
         
         # 更新数据库
         self.task_repo.update(task_id, {
             "status": TaskStatus.COMPLETED,
             "progress": 100.0,
+            "stage_details": [dict(s) for s in self._task_progress.get(task_id, {}).get("stage_details", [])],
             "completed_at": datetime.now()
         })
         
@@ -655,7 +676,7 @@ class TaskManager:
     
     async def _complete_task_with_error(self, task_id: str, error_message: str) -> None:
         """任务执行失败"""
-        if task_id not in self._running_tasks:
+        if task_id not in self._running_tasks or self._cancel_requested(task_id):
             return
         
         # 更新任务状态
@@ -663,6 +684,8 @@ class TaskManager:
         self._running_tasks[task_id]["error_message"] = error_message
         self._running_tasks[task_id]["completed_at"] = datetime.now()
         
+        self._progress_writes.pop(task_id, None)
+        
         # 更新批次状态
         batch_id = self._running_tasks[task_id]["batch_id"]
         self.aggregation_repo.update(batch_id, {
@@ -683,14 +706,23 @@ class TaskManager:
         
         logger.error(f"Task {task_id} failed: {error_message}")
     
-    def _find_running_task_by_batch(self, batch_code: str, school_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
-        """根据批次查找正在运行的任务"""
-        for task_id, task_info in self._running_tasks.items():
-            if (task_info["batch_code"] == batch_code and 
-                task_info.get("school_id") == school_id and
-                task_info["status"] in [TaskStatus.PENDING, TaskStatus.RUNNING]):
-                return task_info
-        return None
+    def _cancel_requested(self, task_id: str) -> bool:
+        """任务是否已被取消（取消请求可能来自其他进程）"""
+        if task_id not in self._cancelled_tasks and self.task_repo.is_cancel_requested(task_id):
+            self._cancelled_tasks.add(task_id)
+        return task_id in self._cancelled_tasks
+    
+    def _db_task_response(self, db_task: Task) -> TaskResponse:
+        """由数据库任务记录生成响应模型"""
+        return TaskResponse(
+            id=db_task.id,
+            batch_id=db_task.batch_id,
+            status=db_task.status,
+            progress=db_task.progress or 0.0,
+            started_at=db_task.started_at,
+            completed_at=db_task.completed_at,
+            error_message=db_task.error_message
+        )
     
     def _convert_to_task_response(self, task_info: Dict[str, Any]) -> TaskResponse:
         """转换为任务响应模型"""
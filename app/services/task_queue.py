@@ -0,0 +1,254 @@
+# 任务队列工作线程池
+"""
+跨进程共享的计算/清洗任务队列。
+
+任务登记在 tasks 表中（status='pending' 即为排队），任何进程都可以入队、查询进度和请求取消：
+
+- 工作线程按 priority 从高到低、同优先级先入先出认领任务；认领时占用批次锁（task_batch_locks），
+  同一批次同一时间只执行一个任务，同批次的其他任务留在队列中等待
+- 每个工作线程使用独立的数据库会话和事件循环执行任务，不占用 API 服务的事件循环
+- 心跳线程定期刷新执行中任务的心跳并读取取消请求；心跳超时（进程退出）的任务标记为失败并释放批次锁
+- 任务进度写入 tasks.progress / stage_details，任一进程均可查询
+- 内存预算：任务入队时记录估算行数，线程池按 TASK_QUEUE_MEMORY_BUDGET_MB / TASK_QUEUE_ROW_BYTES
+  折算的行数预算认领任务，执行中任务的估算行数之和不超过预算。排在最前的可执行任务超出剩余预算时，
+  线程池不再认领其后的任务，待执行中的任务结束后单独执行它（没有任务执行时不受预算限制），
+  持续到来的小批次不会使大批次饿死
+
+TASK_QUEUE_EMBEDDED 为 true（默认）时 API 进程在首次入队时启动工作线程池。多个 uvicorn worker 部署时
+建议设为 false，另行运行 ``python -m app.services.task_queue`` 作为独立工作进程，任务不与 API 请求争用资源。
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Set
+
+from ..database.repositories import TaskRepository
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TaskQueueSettings:
+    """任务队列配置（默认值可由环境变量覆盖）"""
+    workers: int = 2
+    poll_interval: float = 2.0         # 空闲时轮询队列的间隔（秒）
+    heartbeat_interval: float = 5.0    # 心跳与取消请求检查间隔（秒）
+    stale_timeout: float = 120.0       # 心跳超时时间（秒）
+    embedded: bool = True              # API 进程内是否启动工作线程池
+    memory_budget_mb: int = 2048       # 本进程同时执行的任务可占用的内存预算
+    row_bytes: int = 1024              # 每条清洗记录在快照与计算中的估算内存占用（字节）
+
+    @classmethod
+    def from_env(cls) -> 'TaskQueueSettings':
+        return cls(
+            workers=max(1, int(os.getenv("TASK_QUEUE_WORKERS", 2))),
+            poll_interval=float(os.getenv("TASK_QUEUE_POLL_INTERVAL", 2.0)),
+            heartbeat_interval=float(os.getenv("TASK_QUEUE_HEARTBEAT_INTERVAL", 5.0)),
+            stale_timeout=float(os.getenv("TASK_QUEUE_STALE_TIMEOUT", 120.0)),
+            embedded=os.getenv("TASK_QUEUE_EMBEDDED", "true").lower() in ('1', 'true', 'yes'),
+            memory_budget_mb=int(os.getenv("TASK_QUEUE_MEMORY_BUDGET_MB", 2048)),
+            row_bytes=max(1, int(os.getenv("TASK_QUEUE_ROW_BYTES", 1024))),
+        )
+
+    @property
+    def row_budget(self) -> int:
+        """内存预算折算的行数"""
+        return self.memory_budget_mb * 1024 * 1024 // self.row_bytes
+
+
+def run_task(session, task, cancelled: Set[int]) -> None:
+    """在当前线程的新事件循环中执行已认领的任务"""
+    from .task_manager import TaskManager
+    manager = TaskManager(session)
+    manager._cancelled_tasks = cancelled
+    asyncio.run(manager.run_queued_task(task))
+
+
+class TaskWorkerPool:
+    """任务工作线程池（每个线程依次认领并执行任务）"""
+
+    def __init__(self, session_factory: Optional[Callable[[], Any]] = None,
+                 settings: Optional[TaskQueueSettings] = None,
+                 runner: Callable[[Any, Any, Set[int]], None] = run_task):
+        if session_factory is None:
+            from ..database.connection import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.settings = settings or TaskQueueSettings.from_env()
+        self.runner = runner
+        self.pool_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        # 认领与内存预算预留串行执行，避免多个线程按同一剩余预算认领
+        self._claim_lock = threading.Lock()
+        # 执行中的任务ID -> 该任务的取消标记集合（心跳线程发现取消请求时写入）
+        self._running: Dict[int, Set[int]] = {}
+        # 执行中的任务ID -> 预留的估算行数
+        self._reserved_rows: Dict[int, int] = {}
+
+    @property
+    def started(self) -> bool:
+        return bool(self._threads) and not self._stop.is_set()
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        for i in range(self.settings.workers):
+            thread = threading.Thread(target=self._worker_loop, args=(f"{self.pool_id}#{i}",),
+                                      name=f"task-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="task-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        logger.info(f"任务工作线程池 {self.pool_id} 已启动: {self.settings.workers} 个工作线程")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止认领新任务并等待执行中的任务结束"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self) -> None:
+        """唤醒空闲的工作线程立即认领任务"""
+        self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = sorted(self._running)
+            reserved = sum(self._reserved_rows.values())
+        return {'pool_id': self.pool_id, 'workers': self.settings.workers, 'running_tasks': running,
+                'reserved_rows': reserved, 'row_budget': self.settings.row_budget}
+
+    def _worker_loop(self, worker_id: str) -> None:
+        while not self._stop.is_set():
+            try:
+                task = self._claim(worker_id)
+            except Exception as e:
+                logger.error(f"工作线程 {worker_id} 认领任务失败: {e}")
+                task = None
+            if task is None:
+                self._wake.wait(self.settings.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(task)
+
+    def _claim(self, worker_id: str):
+        """在剩余内存预算内认领任务并预留其估算行数"""
+        session = self.session_factory()
+        try:
+            with self._claim_lock:
+                with self._lock:
+                    reserved = sum(self._reserved_rows.values()) if self._reserved_rows else None
+                max_rows = None if reserved is None else max(0, self.settings.row_budget - reserved)
+                task = TaskRepository(session).claim_next(worker_id, max_rows=max_rows)
+                if task is not None:
+                    with self._lock:
+                        self._reserved_rows[task.id] = int(task.estimated_rows or 0)
+                    session.expunge(task)
+            return task
+        finally:
+            session.close()
+
+    def _run(self, task) -> None:
+        cancelled: Set[int] = set()
+        with self._lock:
+            self._running[task.id] = cancelled
+        session = self.session_factory()
+        try:
+            logger.info(f"开始执行任务 {task.id}（{task.task_type}，批次 {task.batch_code}）")
+            self.runner(session, task, cancelled)
+        except Exception as e:
+            logger.error(f"任务 {task.id} 执行异常: {e}")
+        finally:
+            with self._lock:
+                self._running.pop(task.id, None)
+                self._reserved_rows.pop(task.id, None)
+            try:
+                session.rollback()
+                TaskRepository(session).release(task.id, task.batch_code)
+            except Exception as e:
+                # 未释放的锁在心跳超时后由 reap_stale 回收
+                logger.error(f"任务 {task.id} 批次锁释放失败: {e}")
+            session.close()
+            # 批次锁释放后同批次的排队任务可以被认领
+            self._wake.set()
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.settings.heartbeat_interval):
+            self.heartbeat()
+
+    def heartbeat(self) -> None:
+        """刷新本线程池执行中任务的心跳、传递取消请求，并回收心跳超时的任务"""
+        session = self.session_factory()
+        try:
+            repo = TaskRepository(session)
+            with self._lock:
+                running = dict(self._running)
+            for task_id in repo.heartbeat(list(running)):
+                running[task_id].add(task_id)
+            stale = repo.reap_stale(self.settings.stale_timeout)
+            if stale:
+                logger.warning(f"回收心跳超时的任务: {stale}")
+                self._wake.set()
+        except Exception as e:
+            logger.error(f"任务心跳失败: {e}")
+        finally:
+            session.close()
+
+
+_pool: Optional[TaskWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> TaskWorkerPool:
+    """获取本进程的工作线程池（首次调用时启动）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = TaskWorkerPool()
+            _pool.start()
+        return _pool
+
+
+def current_worker_pool() -> Optional[TaskWorkerPool]:
+    """本进程已启动的工作线程池（未启动时为 None）"""
+    return _pool
+
+
+def notify_task_queued() -> None:
+    """任务入队后调用：嵌入模式下唤醒（必要时启动）本进程的工作线程池，否则由独立工作进程轮询认领"""
+    if TaskQueueSettings.from_env().embedded:
+        get_worker_pool().notify()
+
+
+def shutdown_worker_pool(timeout: Optional[float] = None) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.stop(timeout)
+            _pool = None
+
+
+def run_worker_process() -> None:
+    """独立工作进程入口：启动工作线程池直至进程被中断"""
+    pool = get_worker_pool()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        logger.info("任务工作进程退出，等待执行中的任务结束...")
+        pool.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_worker_process()
@@ -13,8 +13,11 @@ from sqlalchemy import text
 import asyncio
 import time
 
-async def auto_recalculate_main_batches():
-    """自动重新计算主要批次的汇聚数据"""
+async def auto_recalculate_main_batches(force: bool = False):
+    """自动重新计算主要批次的汇聚数据
+    
+    默认跳过清洗数据指纹与算法版本均未变化的批次；force=True 时清空并全部重算。
+    """
     print("=== 自动重新计算主要批次汇聚数据 ===")
     
     db = next(get_db())
@@ -42,11 +45,14 @@ async def auto_recalculate_main_batches():
         for batch in batches:
             print(f"  - {batch.batch_code}: {batch.student_count}学生, {batch.school_count}学校, {batch.subject_count}科目")
         
-        # 2. 清理现有statistical_aggregations数据
-        print("\n2. 清理现有统计数据...")
-        db.execute(text("DELETE FROM statistical_aggregations"))
-        db.commit()
-        print("✓ 清理完成")
+        # 2. 强制模式下清理现有statistical_aggregations数据
+        if force:
+            print("\n2. 清理现有统计数据...")
+            db.execute(text("DELETE FROM statistical_aggregations"))
+            db.commit()
+            print("✓ 清理完成")
+        else:
+            print("\n2. 增量模式：输入未变化的批次将跳过计算（--force 全部重算）")
         
         # 3. 重新计算每个主要批次
         total_batches = len(batches)
@@ -70,11 +76,15 @@ async def auto_recalculate_main_batches():
                 
                 result = await calc_service.calculate_batch_statistics(
                     batch_code=batch_code,
-                    progress_callback=progress_callback
+                    progress_callback=progress_callback,
+                    force=force
                 )
                 
                 duration = time.time() - start_time
-                print(f"✓ 批次 {batch_code} 汇聚计算完成，耗时: {duration:.1f}秒")
+                if result.get('skipped'):
+                    print(f"✓ 批次 {batch_code} 输入未变化，沿用已有汇聚结果，耗时: {duration:.1f}秒")
+                else:
+                    print(f"✓ 批次 {batch_code} 汇聚计算完成，耗时: {duration:.1f}秒")
                 
                 # 验证结果
                 result = db.execute(text("""
@@ -163,4 +173,4 @@ async def auto_recalculate_main_batches():
         db.close()
 
 if __name__ == "__main__":
-    asyncio.run(auto_recalculate_main_batches())
\ No newline at end of file
+    asyncio.run(auto_recalculate_main_batches(force="--force" in sys.argv))
\ No newline at end of file
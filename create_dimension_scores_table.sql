@@ -0,0 +1,40 @@
+-- 创建学生维度分数长表
+-- 由数据清洗服务与 student_cleaned_scores 同步写入，每个学生每个科目每个维度一条记录，
+-- 汇聚与 v1.2 subjects 生成直接按索引读取维度分数，无需解析 dimension_scores JSON
+
+CREATE TABLE IF NOT EXISTS `student_dimension_scores` (
+  `id` bigint NOT NULL AUTO_INCREMENT COMMENT '主键',
+  `batch_code` varchar(50) NOT NULL COMMENT '批次代码',
+  `subject_name` varchar(100) NOT NULL COMMENT '科目名称',
+  `student_id` varchar(100) NOT NULL COMMENT '学生ID',
+  `school_id` varchar(50) DEFAULT NULL COMMENT '学校ID',
+  `school_code` varchar(50) DEFAULT NULL COMMENT '学校代码',
+  `dimension_code` varchar(64) NOT NULL COMMENT '维度代码',
+  `dimension_name` varchar(100) DEFAULT NULL COMMENT '维度名称',
+  `score` decimal(10,4) NOT NULL DEFAULT 0 COMMENT '维度得分',
+  `max_score` decimal(10,4) NOT NULL DEFAULT 0 COMMENT '维度满分',
+  `created_at` timestamp DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_batch_subject_student_dimension` (`batch_code`, `subject_name`, `student_id`, `dimension_code`),
+  KEY `idx_batch_subject_dimension_school` (`batch_code`, `subject_name`, `dimension_code`, `school_code`, `score`),
+  KEY `idx_batch_school` (`batch_code`, `school_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='学生维度分数长表';
+
+-- 历史批次回填：从 student_cleaned_scores.dimension_scores JSON 展开（MySQL 8.0 JSON_TABLE）
+INSERT IGNORE INTO `student_dimension_scores`
+  (batch_code, subject_name, student_id, school_id, school_code, dimension_code, dimension_name, score, max_score)
+SELECT
+  scs.batch_code,
+  scs.subject_name,
+  scs.student_id,
+  scs.school_id,
+  scs.school_code,
+  dims.dimension_code,
+  JSON_UNQUOTE(JSON_EXTRACT(scs.dimension_scores, CONCAT('$."', dims.dimension_code, '".name'))),
+  COALESCE(CAST(JSON_UNQUOTE(JSON_EXTRACT(scs.dimension_scores, CONCAT('$."', dims.dimension_code, '".score'))) AS DECIMAL(10,4)), 0),
+  COALESCE(CAST(JSON_UNQUOTE(JSON_EXTRACT(scs.dimension_max_scores, CONCAT('$."', dims.dimension_code, '".max_score'))) AS DECIMAL(10,4)), 0)
+FROM student_cleaned_scores scs
+JOIN JSON_TABLE(
+  JSON_KEYS(CAST(scs.dimension_scores AS JSON)), '$[*]' COLUMNS (dimension_code VARCHAR(64) PATH '$')
+) dims
+WHERE scs.dimension_scores IS NOT NULL AND scs.dimension_scores NOT IN ('', '{}');
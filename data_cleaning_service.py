@@ -6,20 +6,68 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 import json
-from typing import Dict, List, Any
-from sqlalchemy import create_engine, text
+from typing import Callable, Dict, List, Any, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import create_engine, text, bindparam, inspect
 from sqlalchemy.orm import sessionmaker
 
+# 批次清洗写入的表；并行清洗时各科目先写入本次运行的暂存表，全部成功后整批替换
+CLEANED_TABLES = (
+    'student_cleaned_scores',
+    'student_dimension_scores',
+    'questionnaire_question_scores',
+    'questionnaire_option_distribution',
+)
+
+def _scoped_text(sql: str, school_codes: Optional[List[str]]):
+    """学校范围限定的 SQL（school_codes 以 IN 展开绑定）"""
+    stmt = text(sql)
+    if school_codes:
+        stmt = stmt.bindparams(bindparam('school_codes', expanding=True))
+    return stmt
+
+
+def _school_clause(column: str, school_codes: Optional[List[str]]) -> str:
+    return f" AND {column} IN :school_codes" if school_codes else ""
+
+
+class StudentDimensionScores(NamedTuple):
+    """学生维度分数（与清洗数据逐行对齐）"""
+    codes: List[str]
+    names: List[Any]
+    values: np.ndarray      # (学生 × 维度)
+    present: np.ndarray     # subject_scores 为有效 JSON 对象的学生才有维度分数
+
+
 class DataCleaningService:
     """数据清洗服务"""
     
-    def __init__(self, db_session):
+    def __init__(self, db_session, tables: Optional[Dict[str, str]] = None):
         self.db_session = db_session
+        # 清洗结果表名映射（并行清洗的工作线程写入暂存表）
+        self.tables = dict(tables or {})
     
-    async def clean_batch_scores(self, batch_code: str) -> Dict[str, Any]:
-        """清洗批次分数数据"""
+    def _table(self, name: str) -> str:
+        return self.tables.get(name, name)
+    
+    async def clean_batch_scores(self, batch_code: str, parallel: Optional[bool] = None,
+                                 max_workers: Optional[int] = None,
+                                 progress_callback: Optional[Callable[[float, str], None]] = None) -> Dict[str, Any]:
+        """清洗批次分数数据
+
+        parallel 为 True（默认取环境变量 CLEANING_PARALLEL）时各科目并行清洗到暂存表，
+        全部成功后在一个事务内替换该批次的清洗数据，清洗期间读取方仍看到旧数据。
+        progress_callback(进度百分比, 说明) 在每个科目清洗完成后调用。
+        """
+        if parallel is None:
+            parallel = os.getenv("CLEANING_PARALLEL", "false").lower() in ('1', 'true', 'yes')
+        if parallel:
+            return await self.clean_batch_scores_staged(batch_code, max_workers, progress_callback)
+        
         print(f"开始清洗批次 {batch_code} 的分数数据...")
         
         cleaning_result = {
@@ -44,29 +92,10 @@ class DataCleaningService:
             await self._clear_existing_cleaned_data(batch_code)
             
             # 3. 逐科目处理
-            for subject_config in subjects_config:
-                subject_name = subject_config['subject_name'] 
-                max_score = subject_config['max_score']
-                question_count = subject_config['question_count']
-                is_questionnaire = subject_config.get('is_questionnaire', False)
-                instrument_id = subject_config.get('instrument_id')
-                
-                if is_questionnaire:
-                    print(f"处理问卷科目: {subject_name} (量表ID: {instrument_id})")
-                    subject_result = await self._clean_questionnaire_scores(
-                        batch_code, subject_name, instrument_id, question_count
-                    )
-                else:
-                    print(f"处理考试科目: {subject_name} (满分: {max_score})")
-                    subject_result = await self._clean_subject_scores(
-                        batch_code, subject_name, max_score, question_count
-                    )
-                
-                cleaning_result['subjects'][subject_name] = subject_result
-                cleaning_result['total_raw_records'] += subject_result['raw_records']
-                cleaning_result['total_cleaned_records'] += subject_result['cleaned_records']
-                cleaning_result['anomalous_records'] += subject_result['anomalous_records']
-                cleaning_result['subjects_processed'] += 1
+            for i, subject_config in enumerate(subjects_config):
+                subject_result = await self._clean_subject(batch_code, subject_config)
+                _add_subject_result(cleaning_result, subject_config['subject_name'], subject_result)
+                _report_subject_done(progress_callback, subject_config['subject_name'], i + 1, len(subjects_config))
             
             print(f"批次 {batch_code} 清洗完成:")
             print(f"  处理科目: {cleaning_result['subjects_processed']} 个")
@@ -74,6 +103,13 @@ class DataCleaningService:
             print(f"  清洗后记录: {cleaning_result['total_cleaned_records']} 条") 
             print(f"  异常记录: {cleaning_result['anomalous_records']} 条")
             
+            # 4. 记录清洗数据指纹，汇聚计算据此跳过输入未变化的单元
+            try:
+                from app.services.input_fingerprint import refresh_input_fingerprints
+                refresh_input_fingerprints(self.db_session, batch_code)
+            except Exception as e:
+                print(f"清洗数据指纹生成失败（汇聚时将重新计算）: {e}")
+            
             return cleaning_result
             
         except Exception as e:
@@ -81,6 +117,230 @@ class DataCleaningService:
             import traceback
             traceback.print_exc()
             return cleaning_result
+        
+        finally:
+            # 清洗数据已变化，使计算服务缓存的批次元数据失效
+            from app.services.batch_context import invalidate_batch_context
+            invalidate_batch_context(batch_code)
+    
+    async def clean_school_scores(self, batch_code: str, school_codes: List[str],
+                                  subject_names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """增量清洗：只重新清洗指定学校（及科目）的数据切片
+
+        用于单校成绩更正，只替换 (批次, 科目, 学校) 范围内的清洗数据，
+        其他学校的清洗数据、指纹以外的汇聚结果保持不变。
+        """
+        school_codes = sorted({code for code in school_codes if code})
+        print(f"开始增量清洗批次 {batch_code} 学校 {school_codes} 的分数数据...")
+
+        cleaning_result = {
+            'batch_code': batch_code,
+            'school_codes': school_codes,
+            'subjects_processed': 0,
+            'total_raw_records': 0,
+            'total_cleaned_records': 0,
+            'anomalous_records': 0,
+            'subjects': {}
+        }
+        if not school_codes:
+            return cleaning_result
+
+        try:
+            subjects_config = await self._get_batch_subjects(batch_code)
+            if subject_names:
+                subjects_config = [s for s in subjects_config if s['subject_name'] in set(subject_names)]
+            if not subjects_config:
+                print(f"批次 {batch_code} 没有找到需要清洗的科目配置")
+                return cleaning_result
+
+            for subject_config in subjects_config:
+                subject_result = await self._clean_subject(batch_code, subject_config, school_codes)
+                _add_subject_result(cleaning_result, subject_config['subject_name'], subject_result)
+
+            print(f"批次 {batch_code} 增量清洗完成: {cleaning_result['subjects_processed']} 个科目，"
+                  f"清洗后记录 {cleaning_result['total_cleaned_records']} 条")
+
+            # 指纹按整批重新计算（数据库分组查询），已有部分统计量时只刷新受影响的学校
+            try:
+                from app.services.input_fingerprint import refresh_input_fingerprints
+                refresh_input_fingerprints(self.db_session, batch_code)
+            except Exception as e:
+                print(f"清洗数据指纹生成失败（汇聚时将重新计算）: {e}")
+            from app.database.repositories import SchoolPartialRepository
+            partial_repo = SchoolPartialRepository(self.db_session)
+            try:
+                if partial_repo.has_partials(batch_code):
+                    partial_repo.replace_partials(
+                        batch_code, partial_repo.compute_partials(batch_code, school_codes), school_codes
+                    )
+            except Exception as e:
+                # 部分统计量不能与清洗数据不一致，删除后由增量汇聚重建
+                print(f"学校部分统计量刷新失败，已删除（增量汇聚时重建）: {e}")
+                partial_repo.delete_partials(batch_code)
+
+            return cleaning_result
+
+        except Exception as e:
+            print(f"增量清洗失败: {e}")
+            import traceback
+            traceback.print_exc()
+            return cleaning_result
+
+        finally:
+            from app.services.batch_context import invalidate_batch_context
+            invalidate_batch_context(batch_code)
+
+    async def clean_batch_scores_staged(self, batch_code: str, max_workers: Optional[int] = None,
+                                        progress_callback: Optional[Callable[[float, str], None]] = None
+                                        ) -> Dict[str, Any]:
+        """并行清洗批次：每个科目一个工作线程（独立数据库连接）写入本次运行的暂存表，
+        全部科目成功后在一个事务内用暂存数据替换该批次的清洗数据；任一科目失败时保留原数据。
+
+        清洗表中包含所有批次的数据，不能整表 RENAME 交换，因此按批次在同一事务内
+        删除旧行并从暂存表 INSERT…SELECT，InnoDB 下提交前读取方看到的仍是旧数据。
+        """
+        run_id = uuid.uuid4().hex[:12]
+        print(f"开始并行清洗批次 {batch_code} 的分数数据（运行 {run_id}）...")
+        
+        cleaning_result = {
+            'batch_code': batch_code,
+            'run_id': run_id,
+            'subjects_processed': 0,
+            'total_raw_records': 0,
+            'total_cleaned_records': 0,
+            'anomalous_records': 0,
+            'subjects': {}
+        }
+        staging = {table: f'{table}__stg_{run_id}' for table in CLEANED_TABLES}
+        
+        try:
+            subjects_config = await self._get_batch_subjects(batch_code)
+            if not subjects_config:
+                print(f"批次 {batch_code} 没有找到科目配置")
+                return cleaning_result
+            
+            self._create_staging_tables(staging)
+            
+            workers = max_workers or int(os.getenv("CLEANING_WORKERS", 4))
+            workers = max(1, min(workers, len(subjects_config)))
+            print(f"找到 {len(subjects_config)} 个科目，使用 {workers} 个工作线程")
+            
+            bind = self.db_session.get_bind()
+            loop = asyncio.get_running_loop()
+            completed = 0
+            
+            def subject_done(subject_name: str):
+                # 完成回调在事件循环线程中执行
+                nonlocal completed
+                completed += 1
+                _report_subject_done(progress_callback, subject_name, completed, len(subjects_config))
+            
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cleaning') as pool:
+                futures = []
+                for subject_config in subjects_config:
+                    future = loop.run_in_executor(pool, _clean_subject_worker, bind, staging, batch_code, subject_config)
+                    future.add_done_callback(lambda _, name=subject_config['subject_name']: subject_done(name))
+                    futures.append(future)
+                outcomes = await asyncio.gather(*futures, return_exceptions=True)
+            
+            failed = []
+            for subject_config, outcome in zip(subjects_config, outcomes):
+                subject_name = subject_config['subject_name']
+                if isinstance(outcome, Exception):
+                    outcome = {'subject_name': subject_name, 'raw_records': 0, 'cleaned_records': 0,
+                               'anomalous_records': 0, 'error': str(outcome)}
+                if outcome.get('error'):
+                    failed.append(subject_name)
+                _add_subject_result(cleaning_result, subject_name, outcome)
+            
+            if failed:
+                cleaning_result['error'] = f"科目清洗失败: {', '.join(failed)}，保留原清洗数据"
+                print(cleaning_result['error'])
+                return cleaning_result
+            
+            # 旧指纹与部分统计量在替换前删除：替换后到指纹重建之间的汇聚会重新计算
+            try:
+                from app.database.repositories import InputFingerprintRepository, SchoolPartialRepository
+                InputFingerprintRepository(self.db_session).delete_fingerprints(batch_code)
+                SchoolPartialRepository(self.db_session).delete_partials(batch_code)
+            except Exception as e:
+                print(f"清理清洗数据指纹失败: {e}")
+            
+            self._swap_staged_data(batch_code, staging)
+            
+            print(f"批次 {batch_code} 并行清洗完成: {cleaning_result['subjects_processed']} 个科目，"
+                  f"清洗后记录 {cleaning_result['total_cleaned_records']} 条")
+            
+            try:
+                from app.services.input_fingerprint import refresh_input_fingerprints
+                refresh_input_fingerprints(self.db_session, batch_code)
+            except Exception as e:
+                print(f"清洗数据指纹生成失败（汇聚时将重新计算）: {e}")
+            
+            return cleaning_result
+        
+        except Exception as e:
+            print(f"并行数据清洗失败: {e}")
+            import traceback
+            traceback.print_exc()
+            self.db_session.rollback()
+            cleaning_result['error'] = str(e)
+            return cleaning_result
+        
+        finally:
+            self._drop_staging_tables(staging)
+            from app.services.batch_context import invalidate_batch_context
+            invalidate_batch_context(batch_code)
+    
+    def _create_staging_tables(self, staging: Dict[str, str]):
+        """按正式表结构创建本次运行的暂存表"""
+        for table, staged in staging.items():
+            self.db_session.execute(text(f"CREATE TABLE {staged} LIKE {table}"))
+        self.db_session.commit()
+    
+    def _drop_staging_tables(self, staging: Dict[str, str]):
+        for staged in staging.values():
+            try:
+                self.db_session.execute(text(f"DROP TABLE IF EXISTS {staged}"))
+            except Exception as e:
+                print(f"删除暂存表 {staged} 失败: {e}")
+        self.db_session.commit()
+    
+    def _swap_staged_data(self, batch_code: str, staging: Dict[str, str]):
+        """在一个事务内用暂存数据替换批次清洗数据（自增主键由正式表重新生成）"""
+        inspector = inspect(self.db_session.get_bind())
+        try:
+            for table, staged in staging.items():
+                columns = ', '.join(
+                    column['name'] for column in inspector.get_columns(table)
+                    if column.get('autoincrement') is not True
+                )
+                self.db_session.execute(text(f"DELETE FROM {table} WHERE batch_code = :batch_code"),
+                                        {'batch_code': batch_code})
+                self.db_session.execute(text(
+                    f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {staged} WHERE batch_code = :batch_code"
+                ), {'batch_code': batch_code})
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+    
+    async def _clean_subject(self, batch_code: str, subject_config: Dict[str, Any],
+                             school_codes: Optional[List[str]] = None) -> Dict[str, Any]:
+        """按科目类型清洗单个科目"""
+        subject_name = subject_config['subject_name']
+        question_count = subject_config['question_count']
+        if subject_config.get('is_questionnaire', False):
+            instrument_id = subject_config.get('instrument_id')
+            print(f"处理问卷科目: {subject_name} (量表ID: {instrument_id})")
+            return await self._clean_questionnaire_scores(
+                batch_code, subject_name, instrument_id, question_count, school_codes=school_codes
+            )
+        max_score = subject_config['max_score']
+        print(f"处理考试科目: {subject_name} (满分: {max_score})")
+        return await self._clean_subject_scores(
+            batch_code, subject_name, max_score, question_count, school_codes=school_codes
+        )
     
     async def _get_batch_subjects(self, batch_code: str) -> List[Dict[str, Any]]:
         """获取批次科目配置，包含问卷类型识别"""
@@ -135,15 +395,30 @@ class DataCleaningService:
             query2 = text("DELETE FROM questionnaire_question_scores WHERE batch_code = :batch_code")
             result2 = self.db_session.execute(query2, {'batch_code': batch_code})
             
+            # 清理维度分数长表
+            query3 = text("DELETE FROM student_dimension_scores WHERE batch_code = :batch_code")
+            result3 = self.db_session.execute(query3, {'batch_code': batch_code})
+            
             self.db_session.commit()
-            print(f"清理了 {result1.rowcount} 条常规清洗数据，{result2.rowcount} 条问卷详细数据")
+            print(f"清理了 {result1.rowcount} 条常规清洗数据，{result2.rowcount} 条问卷详细数据，"
+                  f"{result3.rowcount} 条维度分数数据")
         except Exception as e:
             print(f"清理旧数据失败: {e}")
             self.db_session.rollback()
+        
+        try:
+            # 清洗中断时不能沿用旧指纹，汇聚计算会在指纹缺失时重新计算
+            from app.database.repositories import InputFingerprintRepository, SchoolPartialRepository
+            InputFingerprintRepository(self.db_session).delete_fingerprints(batch_code)
+            # 学校部分统计量在首次增量汇聚时由清洗表重建
+            SchoolPartialRepository(self.db_session).delete_partials(batch_code)
+        except Exception as e:
+            print(f"清理清洗数据指纹失败: {e}")
     
     async def _clean_subject_scores(self, batch_code: str, subject_name: str, 
-                                  max_score: float, question_count: int) -> Dict[str, Any]:
-        """清洗单个科目的分数数据"""
+                                  max_score: float, question_count: int,
+                                  school_codes: Optional[List[str]] = None) -> Dict[str, Any]:
+        """清洗单个科目的分数数据（指定 school_codes 时只替换这些学校的清洗数据）"""
         result = {
             'subject_name': subject_name,
             'max_score': max_score,
@@ -159,7 +434,7 @@ class DataCleaningService:
             print(f"  计算得到 {len(dimension_max_scores)} 个维度满分")
             
             # 2. 获取原始数据（包含subject_scores）
-            query = text("""
+            query = _scoped_text(f"""
                 SELECT 
                     student_id,
                     student_name,
@@ -172,18 +447,25 @@ class DataCleaningService:
                     subject_scores
                 FROM student_score_detail
                 WHERE batch_code = :batch_code AND subject_name = :subject_name
+                      {_school_clause('school_code', school_codes)}
                 ORDER BY student_id
-            """)
+            """, school_codes)
+            params = {'batch_code': batch_code, 'subject_name': subject_name}
+            if school_codes:
+                params['school_codes'] = school_codes
             
-            raw_result = self.db_session.execute(query, {
-                'batch_code': batch_code,
-                'subject_name': subject_name
-            })
+            raw_result = self.db_session.execute(query, params)
             
             raw_data = raw_result.fetchall()
             result['raw_records'] = len(raw_data)
             
+            if school_codes:
+                # 增量清洗：先删除这些学校的旧清洗数据，与新数据在同一事务中提交
+                await self._delete_cleaned_slice(batch_code, subject_name, school_codes)
+            
             if not raw_data:
+                if school_codes:
+                    self.db_session.commit()
                 print(f"  科目 {subject_name} 没有原始数据")
                 return result
             
@@ -208,24 +490,18 @@ class DataCleaningService:
                 'subject_name': subject_name
             }).fetchall()
             qid_set = set(str(r[0]) for r in qids if r[0] is not None)
-
-            def _sum_scores(json_text: str) -> float:
-                try:
-                    if not json_text:
-                        return 0.0
-                    data = json.loads(json_text)
-                    s = 0.0
-                    for k, v in data.items():
-                        if str(k) in qid_set:
-                            try:
-                                s += float(v) if v is not None else 0.0
-                            except (TypeError, ValueError):
-                                continue
-                    return s
-                except Exception:
-                    return 0.0
-
-            df['total_score'] = df['subject_scores'].apply(_sum_scores)
+            
+            dimension_questions = {}
+            if len(dimension_max_scores) > 0:
+                dimension_questions = await self._get_dimension_questions(batch_code, subject_name)
+            
+            # 每行 subject_scores 只解析一次，得到 (记录 × 题目) 分数矩阵；
+            # 总分与维度分数都由分数矩阵乘以题目关联矩阵得到
+            vocabulary, exam_weights, dimension_weights = _question_incidence(qid_set, dimension_questions)
+            score_matrix, parsed = _parse_score_matrix(df['subject_scores'].tolist(), vocabulary)
+            df['total_score'] = _weighted_sums(score_matrix, exam_weights)[:, 0]
+            # 维度分数取每个学生第一条非空 subject_scores 记录
+            df['score_row'] = np.where(df['subject_scores'].notna(), np.arange(len(df)), np.nan)
 
             aggregated = df.groupby(['student_id']).agg({
                 'student_name': 'first',
@@ -235,27 +511,39 @@ class DataCleaningService:
                 'class_name': 'first',
                 'subject_id': 'first',
                 'total_score': 'sum',  # 关键：按学生汇总总分
-                'subject_scores': 'first'  # 保留subject_scores用于维度计算
+                'score_row': 'first'
             }).reset_index()
             
             print(f"  按学生聚合后: {len(aggregated)} 条")
             result['unique_students'] = len(aggregated)
             
             # 5. 计算学生维度分数
+            present = np.zeros(len(aggregated), dtype=bool)
+            dimension_values = np.zeros((len(aggregated), len(dimension_questions)))
             if len(dimension_max_scores) > 0:
-                print(f"  开始计算学生维度分数...")
-                aggregated['dimension_scores'] = await self._calculate_student_dimension_scores_batch(
-                    batch_code, subject_name, aggregated['subject_scores'].tolist()
-                )
-                print(f"  维度分数计算完成")
+                score_rows = aggregated['score_row'].to_numpy()
+                has_row = ~np.isnan(score_rows)
+                rows = score_rows[has_row].astype(np.intp)
+                present[has_row] = parsed[rows]
+                dimension_values[has_row] = _weighted_sums(score_matrix[rows], dimension_weights)
             else:
-                aggregated['dimension_scores'] = [{}] * len(aggregated)
                 print(f"  未找到维度定义，跳过维度分数计算")
+            student_dimensions = StudentDimensionScores(
+                codes=list(dimension_questions),
+                names=[info['name'] for info in dimension_questions.values()],
+                values=dimension_values,
+                present=present
+            )
             
             # 6. 过滤异常分数
             valid_mask = (aggregated['total_score'] >= 0) & (aggregated['total_score'] <= max_score)
             anomalous_data = aggregated[~valid_mask]
             clean_data = aggregated[valid_mask]
+            valid_rows = valid_mask.to_numpy()
+            clean_dimensions = student_dimensions._replace(
+                values=student_dimensions.values[valid_rows],
+                present=student_dimensions.present[valid_rows]
+            )
             
             result['anomalous_records'] = len(anomalous_data)
             result['cleaned_records'] = len(clean_data)
@@ -266,9 +554,12 @@ class DataCleaningService:
             
             # 7. 写入清洗表
             if len(clean_data) > 0:
-                await self._insert_cleaned_scores(batch_code, subject_name, clean_data, max_score, question_count, dimension_max_scores)
+                await self._insert_cleaned_scores(batch_code, subject_name, clean_data, max_score, question_count,
+                                                  dimension_max_scores, clean_dimensions)
                 print(f"  成功写入 {len(clean_data)} 条清洗数据")
             else:
+                if school_codes:
+                    self.db_session.commit()
                 print(f"  科目 {subject_name} 没有有效数据")
             
             return result
@@ -277,40 +568,70 @@ class DataCleaningService:
             print(f"清洗科目 {subject_name} 失败: {e}")
             import traceback
             traceback.print_exc()
+            result['error'] = str(e)
+            if school_codes:
+                self.db_session.rollback()
             return result
     
+    async def _delete_cleaned_slice(self, batch_code: str, subject_name: str, school_codes: List[str]):
+        """删除指定学校的考试科目清洗数据与维度分数（不提交）"""
+        params = {'batch_code': batch_code, 'subject_name': subject_name, 'school_codes': school_codes}
+        self.db_session.execute(_scoped_text(f"""
+            DELETE FROM {self._table('student_cleaned_scores')}
+            WHERE batch_code = :batch_code AND subject_name = :subject_name AND school_code IN :school_codes
+        """, school_codes), params)
+        self.db_session.execute(_scoped_text(f"""
+            DELETE FROM {self._table('student_dimension_scores')}
+            WHERE batch_code = :batch_code AND subject_name = :subject_name AND school_code IN :school_codes
+        """, school_codes), params)
+    
     async def _insert_cleaned_scores(self, batch_code: str, subject_name: str, 
-                                   clean_data: pd.DataFrame, max_score: float, question_count: int, dimension_max_scores: Dict[str, Any]):
-        """批量插入清洗后的分数数据"""
+                                   clean_data: pd.DataFrame, max_score: float, question_count: int,
+                                   dimension_max_scores: Dict[str, Any],
+                                   dimensions: Optional[StudentDimensionScores] = None):
+        """批量插入清洗后的分数数据（dimensions 与 clean_data 逐行对齐）"""
         try:
-            # 准备批量插入数据
-            insert_data = []
-            for _, row in clean_data.iterrows():
-                dimension_scores_json = json.dumps(row.get('dimension_scores', {}), ensure_ascii=False)
-                dimension_max_scores_json = json.dumps(dimension_max_scores, ensure_ascii=False)
-                
-                insert_data.append({
-                    'batch_code': batch_code,
-                    'student_id': row['student_id'],
-                    'student_name': row['student_name'],
-                    'school_id': row['school_id'],
-                    'school_code': row['school_code'],
-                    'school_name': row['school_name'],
-                    'class_name': row['class_name'],
-                    'subject_id': row['subject_id'],
-                    'subject_name': subject_name,
-                    'total_score': float(row['total_score']),
-                    'max_score': max_score,
-                    'question_count': question_count,
-                    'is_valid': 1,
-                    'dimension_scores': dimension_scores_json,
-                    'dimension_max_scores': dimension_max_scores_json,
-                    'subject_type': 'exam'
-                })
+            if dimensions is None:
+                dimensions = StudentDimensionScores([], [], np.zeros((len(clean_data), 0)), np.zeros(len(clean_data), dtype=bool))
+            
+            # 准备批量插入数据：逐行字段取自列，常量列（含维度满分 JSON）只序列化一次
+            student_columns = ['student_id', 'student_name', 'school_id', 'school_code',
+                               'school_name', 'class_name', 'subject_id']
+            records = clean_data[student_columns].assign(
+                batch_code=batch_code,
+                subject_name=subject_name,
+                total_score=clean_data['total_score'].astype(float),
+                max_score=max_score,
+                question_count=question_count,
+                is_valid=1,
+                dimension_scores=_dimension_scores_json(dimensions),
+                dimension_max_scores=json.dumps(dimension_max_scores, ensure_ascii=False),
+                subject_type='exam'
+            )
+            insert_data = _records(records)
+            
+            # 维度分数同时展开为长表行（每个学生每个维度一行）
+            dimension_rows = []
+            students = np.flatnonzero(dimensions.present)
+            if len(students) and dimensions.codes:
+                n_dims = len(dimensions.codes)
+                dimension_max = [
+                    float(dim_max.get('max_score', 0) or 0) if isinstance(dim_max, dict) else 0.0
+                    for dim_max in (dimension_max_scores.get(code, {}) for code in dimensions.codes)
+                ]
+                long_rows = clean_data[['student_id', 'school_id', 'school_code']].iloc[np.repeat(students, n_dims)]
+                dimension_rows = _records(long_rows.assign(
+                    batch_code=batch_code,
+                    subject_name=subject_name,
+                    dimension_code=np.tile(np.array(dimensions.codes, dtype=object), len(students)),
+                    dimension_name=np.tile(np.array(dimensions.names, dtype=object), len(students)),
+                    score=dimensions.values[students].ravel(),
+                    max_score=np.tile(dimension_max, len(students))
+                ))
             
             # 批量插入
-            query = text("""
-                INSERT INTO student_cleaned_scores 
+            query = text(f"""
+                INSERT INTO {self._table('student_cleaned_scores')} 
                 (batch_code, student_id, student_name, school_id, school_code, school_name,
                  class_name, subject_id, subject_name, total_score, max_score, question_count, is_valid,
                  dimension_scores, dimension_max_scores, subject_type)
@@ -321,6 +642,18 @@ class DataCleaningService:
             """)
             
             self.db_session.execute(query, insert_data)
+            
+            if dimension_rows:
+                dimension_query = text(f"""
+                    INSERT INTO {self._table('student_dimension_scores')}
+                    (batch_code, subject_name, student_id, school_id, school_code,
+                     dimension_code, dimension_name, score, max_score)
+                    VALUES
+                    (:batch_code, :subject_name, :student_id, :school_id, :school_code,
+                     :dimension_code, :dimension_name, :score, :max_score)
+                """)
+                self.db_session.execute(dimension_query, dimension_rows)
+            
             self.db_session.commit()
             
         except Exception as e:
@@ -387,10 +720,9 @@ class DataCleaningService:
             traceback.print_exc()
             return {}
     
-    async def _calculate_student_dimension_scores_batch(self, batch_code: str, subject_name: str, subject_scores_list: List[str]) -> List[Dict[str, Any]]:
-        """批量计算学生维度分数"""
+    async def _get_dimension_questions(self, batch_code: str, subject_name: str) -> Dict[str, Any]:
+        """获取维度-题目映射 {维度代码: {'name': 维度名称, 'questions': [题目ID]}}"""
         try:
-            # 1. 获取维度-题目映射
             mapping_query = text("""
                 SELECT qdm.dimension_code, bdd.dimension_name, qdm.question_id
                 FROM question_dimension_mapping qdm
@@ -400,16 +732,11 @@ class DataCleaningService:
                 WHERE qdm.batch_code = :batch_code AND qdm.subject_name = :subject_name
             """)
             
-            mapping_result = self.db_session.execute(mapping_query, {
+            mappings = self.db_session.execute(mapping_query, {
                 'batch_code': batch_code,
                 'subject_name': subject_name
-            })
-            
-            mappings = mapping_result.fetchall()
-            if not mappings:
-                return [{}] * len(subject_scores_list)
+            }).fetchall()
             
-            # 2. 构建维度映射字典
             dimension_questions = {}
             for dim_code, dim_name, question_id in mappings:
                 if dim_code not in dimension_questions:
@@ -419,73 +746,24 @@ class DataCleaningService:
                     }
                 dimension_questions[dim_code]['questions'].append(question_id)
             
-            # 3. 批量处理每个学生的维度分数
-            results = []
-            for subject_scores_json in subject_scores_list:
-                student_dimension_scores = await self._calculate_student_dimension_scores(
-                    subject_scores_json, dimension_questions
-                )
-                results.append(student_dimension_scores)
-            
-            return results
+            return dimension_questions
             
         except Exception as e:
-            print(f"批量计算学生维度分数失败: {e}")
+            print(f"获取维度题目映射失败: {e}")
             import traceback
             traceback.print_exc()
-            return [{}] * len(subject_scores_list)
-    
-    async def _calculate_student_dimension_scores(self, subject_scores_json: str, dimension_questions: Dict[str, Any]) -> Dict[str, Any]:
-        """计算单个学生的维度分数"""
-        try:
-            # 1. 解析学生分数JSON
-            if not subject_scores_json:
-                return {}
-            
-            try:
-                subject_scores = json.loads(subject_scores_json)
-            except (json.JSONDecodeError, TypeError) as e:
-                print(f"    解析subject_scores JSON失败: {e}")
-                return {}
-            
-            if not isinstance(subject_scores, dict):
-                return {}
-            
-            # 2. 按维度汇总分数
-            student_dimension_scores = {}
-            
-            for dim_code, dim_info in dimension_questions.items():
-                dimension_score = 0.0
-                question_count = 0
-                
-                for question_id in dim_info['questions']:
-                    if question_id in subject_scores:
-                        try:
-                            score = float(subject_scores[question_id])
-                            dimension_score += score
-                            question_count += 1
-                        except (ValueError, TypeError):
-                            continue
-                
-                student_dimension_scores[dim_code] = {
-                    'score': dimension_score,
-                    'name': dim_info['name']
-                }
-            
-            return student_dimension_scores
-            
-        except Exception as e:
-            print(f"计算学生维度分数失败: {e}")
             return {}
     
     async def _clean_questionnaire_scores(self, batch_code: str, subject_name: str, 
-                                        instrument_id: str, question_count: int) -> Dict[str, Any]:
+                                        instrument_id: str, question_count: int,
+                                        school_codes: Optional[List[str]] = None) -> Dict[str, Any]:
         """清洗问卷科目（SQL 一次性落地 + 物化 + 汇总）。
 
         - 明细：INSERT…SELECT via JOIN + JSON_EXTRACT
         - 分布：REPLACE INTO questionnaire_option_distribution
         - 汇总：INSERT INTO student_cleaned_scores（subject_type='questionnaire'）
         - instrument_type = instrument_id；is_reverse = 0
+        - 指定 school_codes 时明细与汇总只替换这些学校的学生，选项分布按科目重新物化
         """
         result = {
             'subject_name': subject_name,
@@ -496,26 +774,45 @@ class DataCleaningService:
             'unique_students': 0
         }
 
+        params = {'batch_code': batch_code, 'subject_name': subject_name}
+        if school_codes:
+            params['school_codes'] = school_codes
+        ssd_scope = _school_clause('ssd.school_code', school_codes)
+
         try:
             # 0) 原始学生数
-            raw_cnt = self.db_session.execute(text(
+            raw_cnt = self.db_session.execute(_scoped_text(
                 "SELECT COUNT(*) FROM student_score_detail WHERE batch_code=:batch_code AND subject_name=:subject_name"
-            ), {'batch_code': batch_code, 'subject_name': subject_name}).scalar() or 0
+                + _school_clause('school_code', school_codes), school_codes
+            ), params).scalar() or 0
             result['raw_records'] = int(raw_cnt)
             result['unique_students'] = int(raw_cnt)
-            if raw_cnt == 0:
+            if raw_cnt == 0 and not school_codes:
                 print(f"  问卷科目 {subject_name} 没有原始数据")
                 return result
 
             # 1) 清理旧明细
-            self.db_session.execute(text(
-                "DELETE FROM questionnaire_question_scores WHERE batch_code=:batch_code AND subject_name=:subject_name"
-            ), {'batch_code': batch_code, 'subject_name': subject_name})
+            if school_codes:
+                self.db_session.execute(_scoped_text(
+                    f"""
+                    DELETE qqs FROM {self._table('questionnaire_question_scores')} qqs
+                    JOIN {self._table('student_cleaned_scores')} scs
+                      ON scs.batch_code = qqs.batch_code
+                     AND scs.subject_name = qqs.subject_name
+                     AND scs.student_id = qqs.student_id
+                    WHERE qqs.batch_code=:batch_code AND qqs.subject_name=:subject_name
+                      AND scs.subject_type='questionnaire' AND scs.school_code IN :school_codes
+                    """, school_codes
+                ), params)
+            else:
+                self.db_session.execute(text(
+                    f"DELETE FROM {self._table('questionnaire_question_scores')} WHERE batch_code=:batch_code AND subject_name=:subject_name"
+                ), params)
 
             # 2) 插入明细（每生×每题）
-            self.db_session.execute(text(
-                """
-                INSERT INTO questionnaire_question_scores
+            inserted = self.db_session.execute(_scoped_text(
+                f"""
+                INSERT INTO {self._table('questionnaire_question_scores')}
                     (batch_code, subject_name, student_id, question_id,
                      original_score, max_score, scale_level, instrument_type, is_reverse)
                 SELECT
@@ -541,19 +838,26 @@ class DataCleaningService:
                 WHERE BINARY ssd.batch_code = BINARY :batch_code
                   AND BINARY ssd.subject_name = BINARY :subject_name
                   AND JSON_EXTRACT(ssd.subject_scores, CONCAT('$."', sqc.question_id, '"')) IS NOT NULL
-                  AND ssd.student_id REGEXP '^[0-9]+$'
-                """
-            ), {'batch_code': batch_code, 'subject_name': subject_name})
+                  AND ssd.student_id REGEXP '^[0-9]+$'{ssd_scope}
+                """, school_codes
+            ), params)
 
-            cnt_detail = self.db_session.execute(text(
-                "SELECT COUNT(*) FROM questionnaire_question_scores WHERE batch_code=:batch_code AND subject_name=:subject_name"
-            ), {'batch_code': batch_code, 'subject_name': subject_name}).scalar() or 0
+            if school_codes:
+                cnt_detail = inserted.rowcount
+            else:
+                cnt_detail = self.db_session.execute(text(
+                    f"SELECT COUNT(*) FROM {self._table('questionnaire_question_scores')} WHERE batch_code=:batch_code AND subject_name=:subject_name"
+                ), params).scalar() or 0
             result['cleaned_records'] = int(cnt_detail)
 
-            # 3) 物化选项分布
+            # 3) 物化选项分布（增量清洗时先清空，避免人数降为0的选项保留旧计数）
+            if school_codes:
+                self.db_session.execute(text(
+                    f"DELETE FROM {self._table('questionnaire_option_distribution')} WHERE batch_code=:batch_code AND subject_name=:subject_name"
+                ), params)
             self.db_session.execute(text(
-                """
-                REPLACE INTO questionnaire_option_distribution
+                f"""
+                REPLACE INTO {self._table('questionnaire_option_distribution')}
                     (batch_code, subject_name, question_id, option_level, count, updated_at)
                 SELECT batch_code, subject_name, question_id, option_level, COUNT(*), NOW()
                 FROM (
@@ -564,7 +868,7 @@ class DataCleaningService:
                         GREATEST(1, LEAST(scale_level,
                             ROUND(COALESCE(original_score,0) / NULLIF(max_score,0) * scale_level, 0)
                         )) AS option_level
-                    FROM questionnaire_question_scores
+                    FROM {self._table('questionnaire_question_scores')}
                     WHERE BINARY batch_code = BINARY :batch_code
                       AND BINARY subject_name = BINARY :subject_name
                 ) x
@@ -573,13 +877,14 @@ class DataCleaningService:
             ), {'batch_code': batch_code, 'subject_name': subject_name})
 
             # 4) 写入汇总 student_cleaned_scores（逐题求和 / 满分求和）
-            self.db_session.execute(text(
-                "DELETE FROM student_cleaned_scores WHERE batch_code=:batch_code AND subject_name=:subject_name AND subject_type='questionnaire'"
-            ), {'batch_code': batch_code, 'subject_name': subject_name})
+            self.db_session.execute(_scoped_text(
+                f"DELETE FROM {self._table('student_cleaned_scores')} WHERE batch_code=:batch_code AND subject_name=:subject_name AND subject_type='questionnaire'"
+                + _school_clause('school_code', school_codes), school_codes
+            ), params)
 
-            self.db_session.execute(text(
-                """
-                INSERT INTO student_cleaned_scores 
+            self.db_session.execute(_scoped_text(
+                f"""
+                INSERT INTO {self._table('student_cleaned_scores')} 
                     (batch_code, student_id, student_name, school_id, school_code, school_name,
                      class_name, subject_id, subject_name, total_score, max_score,
                      question_count, is_valid, dimension_scores, dimension_max_scores, subject_type)
@@ -609,21 +914,21 @@ class DataCleaningService:
                           AND sqc3.question_type_enum = 'questionnaire'
                     ) AS question_count,
                     1 AS is_valid,
-                    '{}' AS dimension_scores,
-                    '{}' AS dimension_max_scores,
+                    '{{}}' AS dimension_scores,
+                    '{{}}' AS dimension_max_scores,
                     'questionnaire' AS subject_type
-                FROM questionnaire_question_scores qqs
+                FROM {self._table('questionnaire_question_scores')} qqs
                 JOIN student_score_detail ssd
                   ON BINARY ssd.batch_code = BINARY qqs.batch_code
                  AND BINARY ssd.subject_name = BINARY qqs.subject_name
                  AND ssd.student_id = qqs.student_id
                 WHERE BINARY qqs.batch_code = BINARY :batch_code
                   AND BINARY qqs.subject_name = BINARY :subject_name
-                  AND ssd.student_id REGEXP '^[0-9]+$'
+                  AND ssd.student_id REGEXP '^[0-9]+$'{ssd_scope}
                 GROUP BY ssd.student_id, ssd.student_name, ssd.school_id, ssd.school_code,
                          ssd.school_name, ssd.class_name, ssd.subject_id
-                """
-            ), {'batch_code': batch_code, 'subject_name': subject_name})
+                """, school_codes
+            ), params)
 
             self.db_session.commit()
             print(f"  问卷科目 {subject_name} 处理完成（明细 {result['cleaned_records']} 条）")
@@ -634,6 +939,7 @@ class DataCleaningService:
             import traceback
             traceback.print_exc()
             self.db_session.rollback()
+            result['error'] = str(e)
             return result
     
     async def _get_scale_info(self, instrument_id: str) -> Dict[str, Any]:
@@ -1007,6 +1313,33 @@ async def generate_processing_report(all_results: Dict[str, Any], total_duration
     print(f"{'='*80}")
 
     
+def _add_subject_result(cleaning_result: Dict[str, Any], subject_name: str, subject_result: Dict[str, Any]):
+    """将科目清洗结果累加到批次结果"""
+    cleaning_result['subjects'][subject_name] = subject_result
+    cleaning_result['total_raw_records'] += subject_result['raw_records']
+    cleaning_result['total_cleaned_records'] += subject_result['cleaned_records']
+    cleaning_result['anomalous_records'] += subject_result['anomalous_records']
+    cleaning_result['subjects_processed'] += 1
+
+
+def _report_subject_done(progress_callback: Optional[Callable[[float, str], None]], subject_name: str,
+                         completed: int, total: int):
+    """按已完成科目数报告清洗进度"""
+    if progress_callback:
+        progress_callback(100.0 * completed / total, f"科目 {subject_name} 清洗完成 ({completed}/{total})")
+
+
+def _clean_subject_worker(bind, tables: Dict[str, str], batch_code: str,
+                          subject_config: Dict[str, Any]) -> Dict[str, Any]:
+    """工作线程：使用独立会话将单个科目清洗到暂存表"""
+    session = sessionmaker(bind=bind)()
+    try:
+        service = DataCleaningService(session, tables)
+        return asyncio.run(service._clean_subject(batch_code, subject_config))
+    finally:
+        session.close()
+
+
 def _safe_float(v: Any) -> float:
     try:
         return float(v)
@@ -1014,6 +1347,104 @@ def _safe_float(v: Any) -> float:
         return 0.0
 
 
+def _question_incidence(exam_questions: set, dimension_questions: Dict[str, Any]
+                        ) -> Tuple[Dict[str, int], np.ndarray, np.ndarray]:
+    """题目词表与关联矩阵
+
+    返回 (题目ID -> 列号, 总分权重 (题目 × 1), 维度关联矩阵 (题目 × 维度))；
+    同一维度重复映射的题目按出现次数计权。
+    """
+    question_ids = set(exam_questions)
+    for info in dimension_questions.values():
+        question_ids.update(str(q) for q in info['questions'])
+    vocabulary = {qid: i for i, qid in enumerate(sorted(question_ids))}
+
+    exam_weights = np.zeros((len(vocabulary), 1))
+    exam_weights[[vocabulary[q] for q in exam_questions], 0] = 1.0
+    dimension_weights = np.zeros((len(vocabulary), len(dimension_questions)))
+    for j, info in enumerate(dimension_questions.values()):
+        for q in info['questions']:
+            dimension_weights[vocabulary[str(q)], j] += 1.0
+    return vocabulary, exam_weights, dimension_weights
+
+
+def _parse_score_matrix(subject_scores: Sequence[Optional[str]], vocabulary: Dict[str, int]
+                        ) -> Tuple[np.ndarray, np.ndarray]:
+    """将每条 subject_scores JSON 解析一次为 (记录 × 题目) 分数矩阵
+
+    不在词表中的题目忽略，无法转换为数值的分数记为 0。
+    返回 (分数矩阵, 是否为有效 JSON 对象)。
+    """
+    keys, values, row_lengths = [], [], []
+    parsed = np.zeros(len(subject_scores), dtype=bool)
+    for i, json_text in enumerate(subject_scores):
+        if not json_text:
+            continue
+        try:
+            data = json.loads(json_text)
+        except Exception:
+            continue
+        if not isinstance(data, dict):
+            continue
+        parsed[i] = True
+        keys.extend(data.keys())
+        values.extend(data.values())
+        row_lengths.append(len(data))
+
+    # 键与分数展平后一次性映射到列号与数值（JSON 对象的键均为字符串）
+    rows = np.repeat(np.flatnonzero(parsed), row_lengths)
+    cols = pd.Index(list(vocabulary)).get_indexer(keys) if keys else np.zeros(0, dtype=np.intp)
+    scores = _to_float_array(values)
+    known = cols >= 0
+    matrix = np.zeros((len(subject_scores), len(vocabulary)))
+    matrix[rows[known], cols[known]] = scores[known]
+    return matrix, parsed
+
+
+def _to_float_array(values: List[Any]) -> np.ndarray:
+    """分数列表转为 float 数组，与逐个 _safe_float 一致（None 与无法转换的值为 0）"""
+    if None not in values:
+        try:
+            scores = np.array(values, dtype=np.float64)
+            if scores.shape == (len(values),):
+                return scores
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return np.fromiter(map(_safe_float, values), dtype=np.float64, count=len(values))
+
+
+def _records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """DataFrame 转为批量插入参数（按列 tolist 转为 Python 原生类型，避免逐元素装箱）"""
+    columns = list(frame.columns)
+    return [dict(zip(columns, row)) for row in zip(*(frame[c].tolist() for c in columns))]
+
+
+def _weighted_sums(matrix: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """matrix @ weights；NaN/inf 分数只计入其关联的列（避免与 0 权重相乘污染其他列）"""
+    finite = np.isfinite(matrix)
+    if finite.all():
+        return matrix @ weights
+    sums = np.where(finite, matrix, 0.0) @ weights
+    for i, j in zip(*np.nonzero(~finite)):
+        for k in np.flatnonzero(weights[j]):
+            sums[i, k] += matrix[i, j] * weights[j, k]
+    return sums
+
+
+def _dimension_scores_json(dimensions: StudentDimensionScores) -> List[str]:
+    """逐学生的维度分数 JSON（{维度代码: {'score', 'name'}}），无维度分数的学生为 '{}'"""
+    result = []
+    for values, present in zip(dimensions.values.tolist(), dimensions.present.tolist()):
+        if not present:
+            result.append('{}')
+            continue
+        result.append(json.dumps({
+            code: {'score': score, 'name': name}
+            for code, name, score in zip(dimensions.codes, dimensions.names, values)
+        }, ensure_ascii=False))
+    return result
+
+
 async def _create_questionnaire_summary_total(self, batch_code: str, subject_name: str,
                                               student_data: List) -> None:
     """Create questionnaire summary using total score / total max score.
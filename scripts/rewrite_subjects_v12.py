@@ -68,8 +68,8 @@ def rewrite_batch(batch_code: str) -> None:
             {"b": batch_code},
         ).fetchall()
 
-        for (school_code,) in schools:
-            school_subjects = sb.build_school_subjects(batch_code, school_code)
+        subjects_by_school = sb.build_all_school_subjects(batch_code, [r[0] for r in schools])
+        for school_code, school_subjects in subjects_by_school.items():
             school_json = {
                 "schema_version": "v1.2",
                 "batch_code": batch_code,
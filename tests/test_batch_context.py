@@ -0,0 +1,60 @@
+from unittest.mock import MagicMock
+
+from app.services.batch_context import BatchContext, invalidate_batch_context
+from app.services.calculation_service import CalculationService
+
+
+class TestBatchContext:
+    """测试批次上下文元数据缓存"""
+
+    def setup_method(self):
+        self.db = MagicMock()
+        self.db.execute.return_value.fetchone.return_value = ('3rd_grade',)
+        self.adapter = MagicMock()
+        self.adapter.check_data_readiness.return_value = {'is_ready': True, 'completeness_ratio': 1.0}
+        self.adapter.get_subject_configurations.return_value = [{'subject_name': '数学'}]
+        self.context = BatchContext(self.db, 'CTX-001', self.adapter)
+
+    def test_values_resolved_once(self):
+        """测试同一运行内元数据只查询一次"""
+        for _ in range(5):
+            assert self.context.grade_level == '3rd_grade'
+            assert self.context.readiness['is_ready']
+            assert self.context.subject_configurations == [{'subject_name': '数学'}]
+        assert self.db.execute.call_count == 1
+        assert self.adapter.check_data_readiness.call_count == 1
+        assert self.adapter.get_subject_configurations.call_count == 1
+
+    def test_batch_summary_reuses_cached_values(self):
+        """测试批次摘要复用已缓存的准备状态与科目配置"""
+        self.context.batch_summary
+        self.adapter.get_batch_summary.assert_called_once_with(
+            'CTX-001', readiness=self.adapter.check_data_readiness.return_value,
+            subject_configs=[{'subject_name': '数学'}]
+        )
+
+    def test_invalidate_after_cleaning(self):
+        """测试清洗完成后缓存失效"""
+        self.context.readiness
+        invalidate_batch_context('CTX-001')
+        self.context.readiness
+        assert self.adapter.check_data_readiness.call_count == 2
+        # 其他批次不受影响
+        invalidate_batch_context('CTX-OTHER')
+        self.context.readiness
+        assert self.adapter.check_data_readiness.call_count == 2
+
+    def test_missing_grade_level_uses_default(self):
+        """测试年级缺失时使用默认年级"""
+        self.db.execute.return_value.fetchone.return_value = None
+        context = BatchContext(self.db, 'CTX-002', self.adapter)
+        assert context.known_grade_level is None
+        assert context.grade_level == '7th_grade'
+
+    def test_calculation_service_shares_context(self):
+        """测试计算服务在多次查询年级时复用上下文"""
+        service = CalculationService(self.db)
+        for _ in range(3):
+            assert service._get_batch_grade_level('CTX-003') == '3rd_grade'
+        assert self.db.execute.call_count == 1
+        assert service.batch_context('CTX-003') is service.batch_context('CTX-003')
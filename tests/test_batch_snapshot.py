@@ -0,0 +1,203 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from app.database.score_stream import DIMENSION_COLUMNS, ColumnBuffer, DimensionChunk, ScoreChunk
+from app.services.batch_snapshot import BatchScoreSnapshot
+from app.services.calculation_service import CalculationService
+
+
+def _record(student_id, school_id, subject_name, score, dimensions=None, subject_type='exam', max_score=100.0):
+    return {
+        'student_id': student_id,
+        'student_name': f'学生{student_id}',
+        'school_id': school_id,
+        'school_name': f'学校{school_id}',
+        'subject_name': subject_name,
+        'subject_type': subject_type,
+        'total_score': score,
+        'max_score': max_score,
+        'dimensions': dimensions or {},
+        'data_source': 'cleaned'
+    }
+
+
+class TestBatchScoreSnapshot:
+    """测试批次分数快照"""
+
+    def setup_method(self):
+        self.records = [
+            _record('S1', 'SCH_A', '数学', 90, {'D1': {'score': 40, 'max_score': 50}, 'D2': {'score': 50, 'max_score': 50}}),
+            _record('S2', 'SCH_A', '数学', 70, {'D1': {'score': 30, 'max_score': 50}}),
+            _record('S3', 'SCH_B', '数学', 60, {'D2': {'score': 35, 'max_score': 50}}),
+            _record('S1', 'SCH_A', '语文', 85),
+            _record('S3', 'SCH_B', '语文', 75),
+        ]
+        self.snapshot = BatchScoreSnapshot.from_records('G7-2025', self.records)
+
+    def test_columnar_arrays(self):
+        """测试列式数组构建"""
+        assert len(self.snapshot) == 5
+        assert self.snapshot.scores.dtype == np.float64
+        assert list(self.snapshot.subject_names) == ['数学', '数学', '数学', '语文', '语文']
+        assert self.snapshot.school_list() == ['SCH_A', 'SCH_B']
+        assert self.snapshot.school_name('SCH_B') == '学校SCH_B'
+
+    def test_subject_view_and_dimensions(self):
+        """测试科目视图与预解析维度矩阵"""
+        math = self.snapshot.subject('数学')
+        assert math.subject_type == 'exam'
+        assert list(math.scores) == [90.0, 70.0, 60.0]
+        assert math.dimension_codes == ('D1', 'D2')
+        # 缺失维度按0分处理
+        assert list(math.dimension_vector('D1')) == [40.0, 30.0, 0.0]
+        assert list(math.dimension_vector('D2')) == [50.0, 0.0, 35.0]
+        assert math.dimension_max_scores['D1'] == 50.0
+        assert self.snapshot.subject('语文').dimension_codes == ()
+        assert self.snapshot.subject('英语') is None
+
+    def test_arrays_are_read_only(self):
+        """测试快照不可变"""
+        with pytest.raises(ValueError):
+            self.snapshot.scores[0] = 0
+        with pytest.raises(ValueError):
+            self.snapshot.subject('数学').dimension_scores[0, 0] = 0
+        with pytest.raises(TypeError):
+            self.snapshot.subjects['英语'] = None
+
+    def test_for_school(self):
+        """测试按学校筛选子快照"""
+        school = self.snapshot.for_school('SCH_B')
+        assert len(school) == 2
+        assert set(school.subjects) == {'数学', '语文'}
+        assert list(school.subject('数学').dimension_vector('D2')) == [35.0]
+
+    def test_to_frame(self):
+        """测试转换为计算用DataFrame"""
+        df = self.snapshot.to_frame()
+        assert 'score' in df.columns
+        assert df['score'].sum() == 380.0
+        assert df['subject_name'].nunique() == 2
+
+    def test_empty_records(self):
+        """测试空记录"""
+        snapshot = BatchScoreSnapshot.from_records('EMPTY', [])
+        assert snapshot.empty
+        assert snapshot.school_list() == []
+        assert snapshot.to_frame().empty
+
+    def test_from_chunks_matches_from_records(self):
+        """测试由流式列块构建的快照与逐行记录构建结果一致"""
+        rows = [
+            SimpleNamespace(student_id=r['student_id'], student_name=r['student_name'], school_id=r['school_id'],
+                            school_name=r['school_name'], subject_name=r['subject_name'],
+                            subject_type=r['subject_type'], score=r['total_score'], max_score=r['max_score'])
+            for r in self.records
+        ]
+        dimensions = DimensionChunk.from_rows([
+            (r['student_id'], r['subject_name'], code, d['score'], d['max_score'])
+            for r in self.records for code, d in r['dimensions'].items()
+        ])
+        snapshot = BatchScoreSnapshot.from_chunks(
+            'G7-2025', [ScoreChunk.from_rows(rows[:2]), ScoreChunk.from_rows(rows[2:])], dimensions
+        )
+
+        assert list(snapshot.scores) == list(self.snapshot.scores)
+        assert list(snapshot.school_ids) == list(self.snapshot.school_ids)
+        for name, expected in self.snapshot.subjects.items():
+            view = snapshot.subject(name)
+            assert view.dimension_codes == expected.dimension_codes
+            np.testing.assert_array_equal(view.dimension_scores, expected.dimension_scores)
+            assert dict(view.dimension_max_scores) == dict(expected.dimension_max_scores)
+
+    def test_from_chunks_uses_parsed_json_dimensions(self):
+        """测试维度长表缺失时使用列块中解析的JSON维度"""
+        row = SimpleNamespace(student_id='S1', student_name='', school_id='SCH_A', school_name='',
+                              subject_name='数学', subject_type='exam', score=90, max_score=100,
+                              dimension_scores='{"D1": 40}', dimension_max_scores='{"D1": 50}')
+        chunk = ScoreChunk.from_rows(
+            [row], parse_dimensions=lambda s, m: {'D1': {'score': 40.0, 'max_score': 50.0}}
+        )
+        snapshot = BatchScoreSnapshot.from_chunks('G7-2025', [chunk])
+        assert list(snapshot.subject('数学').dimension_vector('D1')) == [40.0]
+        assert BatchScoreSnapshot.from_chunks('EMPTY', []).empty
+
+    def test_from_chunks_streams_into_preallocated_columns(self):
+        """测试列块逐块写入按行数预分配的列数组，结果与一次性传入列表一致"""
+        rows = [
+            SimpleNamespace(student_id=r['student_id'], student_name=r['student_name'], school_id=r['school_id'],
+                            school_name=r['school_name'], subject_name=r['subject_name'],
+                            subject_type=r['subject_type'], score=r['total_score'], max_score=r['max_score'])
+            for r in self.records
+        ]
+        consumed = []
+
+        def stream():
+            for i in range(0, len(rows), 2):
+                consumed.append(i)
+                yield ScoreChunk.from_rows(rows[i:i + 2])
+
+        snapshot = BatchScoreSnapshot.from_chunks('G7-2025', stream(), capacity=len(rows))
+        assert consumed == list(range(0, len(rows), 2))
+        assert list(snapshot.scores) == list(self.snapshot.scores)
+        assert list(snapshot.subject_names) == list(self.snapshot.subject_names)
+
+
+class TestColumnBuffer:
+    """测试流式列块的预分配列缓冲区"""
+
+    def _chunk(self, n, offset=0):
+        return DimensionChunk.from_rows([(f'S{offset + i}', '数学', 'D1', float(offset + i), 10.0) for i in range(n)])
+
+    def test_preallocated_capacity_is_not_grown(self):
+        buffer = ColumnBuffer(DIMENSION_COLUMNS, capacity=5)
+        buffer.append(self._chunk(3))
+        buffer.append(self._chunk(2, offset=3))
+        assert (len(buffer), buffer.capacity) == (5, 5)
+        assert list(buffer.columns()['scores']) == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+    def test_grows_when_estimate_is_short(self):
+        buffer = ColumnBuffer(DIMENSION_COLUMNS, capacity=2)
+        buffer.append(self._chunk(2))
+        buffer.append(self._chunk(3, offset=2))
+        assert len(buffer) == 5 and buffer.capacity >= 5
+        assert list(buffer.columns()['student_ids']) == ['S0', 'S1', 'S2', 'S3', 'S4']
+
+    def test_collect_trims_overestimate(self):
+        dimensions = DimensionChunk.collect([self._chunk(2), self._chunk(0)], capacity=10)
+        assert len(dimensions) == 2
+        assert list(dimensions.dimension_codes) == ['D1', 'D1']
+
+
+class TestSnapshotLoading:
+    """测试计算服务按预先查询的行数流式加载快照"""
+
+    def _service(self):
+        row = SimpleNamespace(student_id='S1', student_name='', school_id='1001', school_name='',
+                              subject_name='数学', subject_type='exam', score=90, max_score=100)
+        service = CalculationService(MagicMock())
+        adapter = service.data_adapter = MagicMock()
+        adapter.check_data_readiness.return_value = {
+            'is_ready': True, 'completeness_ratio': 1.0, 'cleaned_records': 1,
+            'data_sources': {'has_cleaned_data': True},
+        }
+        adapter.count_dimension_scores.return_value = 0
+        adapter.count_cleaned_scores.return_value = 1
+        adapter.iter_dimension_score_chunks.return_value = iter([])
+        adapter.iter_cleaned_score_chunks.side_effect = lambda *a, **k: iter([ScoreChunk.from_rows([row])])
+        return service, adapter
+
+    def test_batch_uses_readiness_row_count(self):
+        service, adapter = self._service()
+        snapshot = asyncio.run(service._load_batch_snapshot('G7-2025'))
+        assert list(snapshot.scores) == [90.0]
+        adapter.count_cleaned_scores.assert_not_called()
+        adapter.count_dimension_scores.assert_called_once_with('G7-2025', school_id=None)
+
+    def test_school_counts_its_rows(self):
+        service, adapter = self._service()
+        asyncio.run(service._load_batch_snapshot('G7-2025', school_id='1001'))
+        adapter.count_cleaned_scores.assert_called_once_with('G7-2025', school_id='1001')
@@ -0,0 +1,128 @@
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from sqlalchemy.dialects import mysql
+
+from app.database.bulk_upsert import build_upsert_statement, group_by_columns, normalize_row
+from app.database.models import AggregationLevel, CalculationStatus
+from app.database.repositories import StatisticalAggregationRepository
+
+
+def _school_rows(n, school_name='学校'):
+    return [
+        {
+            'batch_code': 'B1',
+            'aggregation_level': AggregationLevel.SCHOOL,
+            'school_id': f'S{i:03d}',
+            'school_name': school_name,
+            'statistics_data': {'subjects': [i]},
+            'calculation_status': CalculationStatus.COMPLETED,
+            'total_students': 100 + i,
+        }
+        for i in range(n)
+    ]
+
+
+def _mysql_session(existing=()):
+    session = Mock()
+    session.get_bind.return_value.dialect.name = 'mysql'
+    session.execute.return_value.rowcount = 0
+    session.query.return_value.filter.return_value.all.return_value = list(existing)
+    return session
+
+
+class TestUpsertStatement:
+    """测试多行 upsert 语句构建"""
+
+    def test_statement_is_multi_row_on_duplicate_key_update(self):
+        from datetime import datetime
+        rows = [normalize_row(item, datetime(2025, 1, 1)) for item in _school_rows(3)]
+        sql = str(build_upsert_statement(rows).compile(dialect=mysql.dialect()))
+        assert sql.count('ON DUPLICATE KEY UPDATE') == 1
+        assert 'statistics_data = VALUES(statistics_data)' in sql
+        assert 'created_at = VALUES' not in sql and 'school_name = VALUES' not in sql
+        assert sql.count('%s, %s') >= 3
+
+    def test_string_enums_are_normalized(self):
+        from datetime import datetime
+        row = normalize_row({'batch_code': 'B1', 'aggregation_level': 'school', 'school_id': 'S1',
+                             'calculation_status': 'completed', 'unknown': 1}, datetime.now())
+        assert row['aggregation_level'] is AggregationLevel.SCHOOL
+        assert row['calculation_status'] is CalculationStatus.COMPLETED
+        assert 'unknown' not in row and row['school_name'] is None
+
+    def test_rows_grouped_by_columns(self):
+        rows = [{'a': 1, 'b': 2}, {'b': 3, 'a': 4}, {'a': 5, 'id': 9}]
+        assert [len(g) for g in group_by_columns(rows)] == [2, 1]
+
+
+class TestBulkUpsertRepository:
+    """测试 MySQL 下的批量写入路径"""
+
+    def test_one_statement_and_commit_per_chunk_without_history(self):
+        session = _mysql_session()
+        repo = StatisticalAggregationRepository(session)
+        result = repo.batch_upsert_statistics(_school_rows(250), batch_size=100, track_history=False)
+
+        assert result.total_processed == 250 and not result.errors
+        assert session.execute.call_count == 3
+        assert session.commit.call_count == 3
+        # 唯一键完整且不写历史时不查询已有记录
+        session.query.assert_not_called()
+
+    def test_null_key_rows_resolve_ids(self):
+        """测试唯一键含NULL的行通过一次查询解析id，按主键冲突更新"""
+        existing = SimpleNamespace(id=42, batch_code='B1', aggregation_level=AggregationLevel.SCHOOL,
+                                   school_id='S000', school_name=None)
+        session = _mysql_session([existing])
+        repo = StatisticalAggregationRepository(session)
+        result = repo.batch_upsert_statistics(_school_rows(2, school_name=None), track_history=False)
+
+        assert session.query.call_count == 1
+        assert result.total_updated == 1 and result.total_created == 1
+        params = [c.args[0].compile(dialect=mysql.dialect()).params for c in session.execute.call_args_list]
+        assert any(p.get('id_m0') == 42 for p in params)
+
+    def test_history_recorded_for_existing_rows(self):
+        existing = SimpleNamespace(id=7, batch_code='B1', aggregation_level=AggregationLevel.SCHOOL,
+                                   school_id='S001', school_name='学校', statistics_data={'subjects': [0]},
+                                   calculation_status=CalculationStatus.COMPLETED, total_students=1)
+        session = _mysql_session([existing])
+        session.query.return_value.filter.return_value.order_by.return_value.first.return_value = None
+        repo = StatisticalAggregationRepository(session)
+        result = repo.batch_upsert_statistics(_school_rows(3))
+
+        assert result.total_updated == 1 and result.total_created == 2
+        assert session.add.call_count == 1
+        assert session.commit.call_count == 1
+
+    def test_other_dialects_use_orm_path(self):
+        session = Mock()
+        session.get_bind.return_value.dialect.name = 'sqlite'
+        session.query.return_value.filter.return_value.first.return_value = None
+        repo = StatisticalAggregationRepository(session)
+        result = repo.batch_upsert_statistics(_school_rows(2))
+        assert result.total_created == 2
+        session.execute.assert_not_called()
+
+    def test_atomic_commits_once(self):
+        session = _mysql_session()
+        repo = StatisticalAggregationRepository(session)
+        result = repo.batch_upsert_statistics(_school_rows(250), batch_size=100, track_history=False, atomic=True)
+
+        assert result.total_processed == 250 and not result.errors
+        assert session.execute.call_count == 3
+        assert session.commit.call_count == 1
+
+    def test_atomic_failure_rolls_back_all_chunks(self):
+        session = _mysql_session()
+        session.execute.side_effect = [Mock(rowcount=0), RuntimeError('deadlock'), Mock(rowcount=0)]
+        repo = StatisticalAggregationRepository(session)
+        result = repo.batch_upsert_statistics(_school_rows(250), batch_size=100, track_history=False, atomic=True)
+
+        assert result.total_processed == 0 and result.success_rate == 0
+        assert len(result.errors) == 1 and 'deadlock' in result.errors[0]
+        # 第三个分块不再执行，之前的分块随事务回滚
+        assert session.execute.call_count == 2
+        session.commit.assert_not_called()
+        session.rollback.assert_called_once()
@@ -245,6 +245,44 @@ class TestDataAdapterRepository:
         assert "AND school_id = %s" in sql_query
         assert params == [batch_code, subject_type, school_id]
     
+    def test_get_dimension_scores_from_long_table(self):
+        """测试从维度分数长表读取维度分数"""
+        self.mock_db.execute.return_value.fetchall.return_value = [
+            ('S1', '数学', 'D1', 30, 40),
+            ('S1', '数学', 'D2', 10, 0),
+            ('S2', '数学', 'D1', 20, 40),
+        ]
+        
+        result = self.repo.get_dimension_scores("G7-2025", subject_name='数学')
+        
+        assert result[('S1', '数学')]['D1'] == {'score': 30.0, 'max_score': 40.0, 'score_rate': 0.75}
+        assert result[('S1', '数学')]['D2']['score_rate'] == 0.0
+        assert list(result[('S2', '数学')]) == ['D1']
+        sql_query = str(self.mock_db.execute.call_args[0][0])
+        assert "student_dimension_scores" in sql_query
+        assert "AND subject_name = :subject_name" in sql_query
+    
+    def test_iter_cleaned_score_chunks_streams_partitions(self):
+        """测试流式读取按服务端游标分块并填充列数组"""
+        def row(student_id, score):
+            return Mock(student_id=student_id, student_name=None, subject_name='数学', subject_type=None,
+                        score=score, max_score=100, school_id=1001, school_name='实验中学')
+        
+        result = self.mock_db.execute.return_value
+        result.partitions.return_value = iter([[row('S1', 85.5), row('S2', None)], [row('S3', 60)]])
+        
+        chunks = list(self.repo.iter_cleaned_score_chunks("G7-2025", school_id='1001', chunk_size=2))
+        
+        assert [len(c) for c in chunks] == [2, 1]
+        assert list(chunks[0].scores) == [85.5, 0.0]
+        assert list(chunks[0].school_ids) == ['1001', '1001']
+        assert chunks[0].subject_types[0] == 'exam'
+        assert chunks[0].dimensions is None
+        options = self.mock_db.execute.call_args[1]['execution_options']
+        assert options['stream_results'] is True
+        result.partitions.assert_called_once_with(2)
+        result.close.assert_called_once()
+    
     def test_get_legacy_student_scores(self):
         """测试从原始数据表获取学生分数"""
         batch_code = "G7-2025"
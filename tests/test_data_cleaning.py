@@ -0,0 +1,216 @@
+import asyncio
+import json
+from unittest.mock import Mock
+
+import numpy as np
+import pandas as pd
+
+from data_cleaning_service import (
+    DataCleaningService,
+    StudentDimensionScores,
+    _dimension_scores_json,
+    _parse_score_matrix,
+    _question_incidence,
+    _weighted_sums,
+)
+
+
+DIMENSIONS = {
+    'D1': {'name': '运算', 'questions': ['q1', 'q2', 'q2']},
+    'D2': {'name': '推理', 'questions': ['q3', 'q9']},
+}
+
+
+def _reference_total(json_text, qid_set):
+    """原逐行求和口径"""
+    try:
+        data = json.loads(json_text)
+        total = 0.0
+        for k, v in data.items():
+            if str(k) in qid_set:
+                try:
+                    total += float(v) if v is not None else 0.0
+                except (TypeError, ValueError):
+                    continue
+        return total
+    except Exception:
+        return 0.0
+
+
+class TestScoreMatrix:
+    """测试单次解析的分数矩阵与关联矩阵求和"""
+
+    def test_totals_and_dimensions_match_row_loop(self):
+        qid_set = {'q1', 'q2', 'q3'}
+        texts = [
+            json.dumps({'q1': 2, 'q2': '1.5', 'q3': None, 'q4': 9}),
+            json.dumps({'q1': 'x', 'q2': 3, 'q9': 4}),
+            json.dumps({'q3': 1, 'q2': {'a': 1}}),
+            'not json',
+            json.dumps([1, 2]),
+            '',
+            None,
+        ]
+        vocabulary, exam_weights, dimension_weights = _question_incidence(qid_set, DIMENSIONS)
+        matrix, parsed = _parse_score_matrix(texts, vocabulary)
+
+        assert parsed.tolist() == [True, True, True, False, False, False, False]
+        totals = _weighted_sums(matrix, exam_weights)[:, 0]
+        assert totals.tolist() == [_reference_total(t, qid_set) for t in texts]
+        # D1 中 q2 重复映射，按出现次数计权
+        np.testing.assert_array_equal(
+            _weighted_sums(matrix, dimension_weights)[:3], [[5.0, 0.0], [6.0, 4.0], [0.0, 1.0]]
+        )
+
+    def test_non_finite_scores_stay_in_their_columns(self):
+        vocabulary, exam_weights, dimension_weights = _question_incidence({'q1'}, DIMENSIONS)
+        matrix, _ = _parse_score_matrix([json.dumps({'q1': 1, 'q3': 'nan', 'q9': 2})], vocabulary)
+
+        assert _weighted_sums(matrix, exam_weights)[0, 0] == 1.0
+        sums = _weighted_sums(matrix, dimension_weights)[0]
+        assert sums[0] == 1.0 and np.isnan(sums[1])
+
+    def test_dimension_scores_json(self):
+        dimensions = StudentDimensionScores(
+            codes=['D1', 'D2'], names=['运算', '推理'],
+            values=np.array([[1.0, 2.5], [0.0, 0.0]]), present=np.array([True, False])
+        )
+        assert _dimension_scores_json(dimensions) == [
+            json.dumps({'D1': {'score': 1.0, 'name': '运算'}, 'D2': {'score': 2.5, 'name': '推理'}}, ensure_ascii=False),
+            '{}',
+        ]
+
+
+class TestInsertCleanedScores:
+    """测试清洗数据批量插入参数"""
+
+    def test_insert_rows(self):
+        session = Mock()
+        clean_data = pd.DataFrame({
+            'student_id': ['s1', 's2'], 'student_name': ['甲', '乙'], 'school_id': [1, 1],
+            'school_code': ['A', 'A'], 'school_name': ['一中', '一中'], 'class_name': ['1班', '2班'],
+            'subject_id': [3, 3], 'total_score': [80.0, 95.5],
+        })
+        dimensions = StudentDimensionScores(
+            codes=['D1', 'D2'], names=['运算', '推理'],
+            values=np.array([[30.0, 50.0], [0.0, 0.0]]), present=np.array([True, False])
+        )
+        max_scores = {'D1': {'max_score': 40.0, 'name': '运算'}, 'D2': {'max_score': 60.0, 'name': '推理'}}
+
+        asyncio.run(DataCleaningService(session)._insert_cleaned_scores(
+            'B1', '数学', clean_data, 100.0, 20, max_scores, dimensions
+        ))
+
+        (_, cleaned), (_, dimension_rows) = [c.args for c in session.execute.call_args_list]
+        assert [row['student_id'] for row in cleaned] == ['s1', 's2']
+        assert cleaned[1]['total_score'] == 95.5 and cleaned[1]['dimension_scores'] == '{}'
+        assert json.loads(cleaned[0]['dimension_scores'])['D2'] == {'score': 50.0, 'name': '推理'}
+        assert cleaned[0]['dimension_max_scores'] == json.dumps(max_scores, ensure_ascii=False)
+        assert {k: cleaned[0][k] for k in ('batch_code', 'subject_name', 'max_score', 'question_count', 'is_valid', 'subject_type')} == {
+            'batch_code': 'B1', 'subject_name': '数学', 'max_score': 100.0,
+            'question_count': 20, 'is_valid': 1, 'subject_type': 'exam',
+        }
+        assert dimension_rows == [
+            {'student_id': 's1', 'school_id': 1, 'school_code': 'A', 'batch_code': 'B1', 'subject_name': '数学',
+             'dimension_code': 'D1', 'dimension_name': '运算', 'score': 30.0, 'max_score': 40.0},
+            {'student_id': 's1', 'school_id': 1, 'school_code': 'A', 'batch_code': 'B1', 'subject_name': '数学',
+             'dimension_code': 'D2', 'dimension_name': '推理', 'score': 50.0, 'max_score': 60.0},
+        ]
+        session.commit.assert_called_once()
+
+    def test_without_dimensions(self):
+        session = Mock()
+        clean_data = pd.DataFrame({
+            'student_id': ['s1'], 'student_name': ['甲'], 'school_id': [1], 'school_code': ['A'],
+            'school_name': ['一中'], 'class_name': ['1班'], 'subject_id': [3], 'total_score': [10.0],
+        })
+        asyncio.run(DataCleaningService(session)._insert_cleaned_scores('B1', '数学', clean_data, 100.0, 20, {}))
+
+        assert session.execute.call_count == 1
+        assert session.execute.call_args.args[1][0]['dimension_scores'] == '{}'
+
+
+class TestStagedCleaning:
+    """测试并行清洗：暂存表写入与整批替换"""
+
+    SUBJECTS = [
+        {'subject_name': '数学', 'max_score': 100.0, 'question_count': 20, 'is_questionnaire': False},
+        {'subject_name': '语文', 'max_score': 100.0, 'question_count': 20, 'is_questionnaire': False},
+    ]
+
+    def _run(self, monkeypatch, worker):
+        import data_cleaning_service
+
+        session = Mock()
+        service = DataCleaningService(session)
+        monkeypatch.setattr(service, '_get_batch_subjects', Mock(side_effect=lambda b: asyncio.sleep(0, self.SUBJECTS)))
+        monkeypatch.setattr(service, '_swap_staged_data', Mock())
+        monkeypatch.setattr(data_cleaning_service, '_clean_subject_worker', worker)
+        result = asyncio.run(service.clean_batch_scores('B1', parallel=True, max_workers=2))
+        statements = [str(c.args[0]) for c in session.execute.call_args_list]
+        return service, result, statements
+
+    def test_workers_write_to_run_staging_tables(self, monkeypatch):
+        seen = []
+
+        def worker(bind, tables, batch_code, subject_config):
+            seen.append((subject_config['subject_name'], tables['student_cleaned_scores']))
+            return {'raw_records': 10, 'cleaned_records': 9, 'anomalous_records': 1}
+
+        service, result, statements = self._run(monkeypatch, worker)
+        run_id = result['run_id']
+
+        assert sorted(seen) == [('数学', f'student_cleaned_scores__stg_{run_id}'),
+                                ('语文', f'student_cleaned_scores__stg_{run_id}')]
+        assert (result['subjects_processed'], result['total_cleaned_records']) == (2, 18)
+        assert 'error' not in result
+        service._swap_staged_data.assert_called_once()
+        assert f'CREATE TABLE student_dimension_scores__stg_{run_id} LIKE student_dimension_scores' in statements
+        assert f'DROP TABLE IF EXISTS student_dimension_scores__stg_{run_id}' in statements
+
+    def test_failed_subject_keeps_live_data(self, monkeypatch):
+        def worker(bind, tables, batch_code, subject_config):
+            if subject_config['subject_name'] == '语文':
+                raise RuntimeError('connection lost')
+            return {'raw_records': 10, 'cleaned_records': 10, 'anomalous_records': 0}
+
+        service, result, statements = self._run(monkeypatch, worker)
+
+        assert '语文' in result['error']
+        assert result['subjects']['语文']['error'] == 'connection lost'
+        service._swap_staged_data.assert_not_called()
+        assert not any(s.startswith('DELETE FROM student_cleaned_scores') for s in statements)
+        assert sum(s.startswith('DROP TABLE IF EXISTS') for s in statements) == 4
+
+    def test_swap_replaces_batch_in_one_transaction(self, monkeypatch):
+        import data_cleaning_service
+
+        inspector = Mock()
+        inspector.get_columns.return_value = [
+            {'name': 'id', 'autoincrement': True}, {'name': 'batch_code'}, {'name': 'score', 'autoincrement': 'auto'},
+        ]
+        monkeypatch.setattr(data_cleaning_service, 'inspect', Mock(return_value=inspector))
+        session = Mock()
+        DataCleaningService(session)._swap_staged_data('B1', {'student_cleaned_scores': 'student_cleaned_scores__stg_x'})
+
+        statements = [str(c.args[0]) for c in session.execute.call_args_list]
+        assert statements == [
+            'DELETE FROM student_cleaned_scores WHERE batch_code = :batch_code',
+            'INSERT INTO student_cleaned_scores (batch_code, score) SELECT batch_code, score '
+            'FROM student_cleaned_scores__stg_x WHERE batch_code = :batch_code',
+        ]
+        session.commit.assert_called_once()
+
+    def test_progress_reported_per_completed_subject(self, monkeypatch):
+        import data_cleaning_service
+
+        reported = []
+        session = Mock()
+        service = DataCleaningService(session)
+        monkeypatch.setattr(service, '_get_batch_subjects', Mock(side_effect=lambda b: asyncio.sleep(0, self.SUBJECTS)))
+        monkeypatch.setattr(service, '_swap_staged_data', Mock())
+        monkeypatch.setattr(data_cleaning_service, '_clean_subject_worker',
+                            lambda *args: {'raw_records': 1, 'cleaned_records': 1, 'anomalous_records': 0})
+        asyncio.run(service.clean_batch_scores('B1', parallel=True, max_workers=2,
+                                               progress_callback=lambda p, m: reported.append(p)))
+        assert reported == [50.0, 100.0]
@@ -0,0 +1,129 @@
+import threading
+from unittest.mock import Mock
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app.calculation.engine import PerformanceMonitor
+from app.calculation.instrumentation import (
+    BUCKET_BOUNDS,
+    EngineMetrics,
+    bucket_index,
+    quantile,
+)
+
+
+class TestLatencyHistogram:
+    """测试对数线性延迟分桶"""
+
+    def test_bucket_bounds_contain_value(self):
+        for seconds in (1e-7, 1e-6, 3.3e-5, 0.002, 0.5, 1.0, 42.0):
+            i = bucket_index(seconds)
+            assert seconds <= BUCKET_BOUNDS[i]
+            if i > 0:
+                assert seconds > BUCKET_BOUNDS[i - 1]
+        assert bucket_index(1e9) == len(BUCKET_BOUNDS) - 1
+
+    def test_quantile_relative_error(self):
+        buckets = [0] * len(BUCKET_BOUNDS)
+        values = np.random.default_rng(3).lognormal(-6, 1, 5000)
+        for v in values:
+            buckets[bucket_index(v)] += 1
+        for q in (0.5, 0.9, 0.99):
+            exact = np.quantile(values, q)
+            assert exact <= quantile(buckets, q) <= exact * 2 ** (1 / 8) * 1.01
+        assert quantile([0] * len(BUCKET_BOUNDS), 0.5) == 0.0
+
+
+class TestEngineMetrics:
+    """测试按线程分片的引擎埋点"""
+
+    def test_record_and_snapshot(self):
+        metrics = EngineMetrics(rss_sample_every=0)
+        metrics.record('percentiles', 0.002, rows=100)
+        metrics.record('percentiles', 0.004, rows=50)
+        metrics.record('percentiles', 0.1, rows=10, success=False)
+
+        stats = metrics.snapshot()['strategies']['percentiles']
+        assert (stats['calls'], stats['succeeded'], stats['failed'], stats['rows']) == (3, 2, 1, 150)
+        assert stats['max_seconds'] == 0.1
+        assert stats['total_seconds'] == pytest.approx(0.106)
+
+    def test_dead_thread_shards_are_folded(self):
+        """测试线程结束后分片并入归档，分片数只与存活线程数有关"""
+        metrics = EngineMetrics(rss_sample_every=0)
+
+        def work():
+            for _ in range(100):
+                metrics.record('basic_statistics', 0.001, rows=1)
+
+        for _ in range(5):
+            threads = [threading.Thread(target=work) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        assert metrics.merged()['basic_statistics'].succeeded == 2000
+        assert len(metrics._shards) == 0
+
+    def test_rss_sampled_every_n_calls(self):
+        metrics = EngineMetrics(rss_sample_every=3)
+        metrics._process = Mock()
+        metrics._process.memory_info.return_value = Mock(rss=1024)
+
+        samples = [metrics.should_sample() for _ in range(7)]
+        assert samples == [True, False, False, True, False, False, True]
+        assert metrics.sample_rss() == 1024
+        assert metrics.snapshot()['rss_max_bytes'] == 1024
+
+    def test_monitor_stats_report_rss_delta_in_bytes(self):
+        monitor = PerformanceMonitor(rss_sample_every=0)
+        monitor.record_calculation('percentiles', 100, 0.01, 4096, True)
+        monitor.record_calculation('percentiles', 100, 0.01, None, True)
+        monitor.record_calculation('percentiles', 100, 0.01, 1024, False, 'error')
+
+        stats = monitor.get_stats()
+        assert 'avg_memory_usage' not in stats
+        assert (stats['avg_rss_delta_bytes'], stats['memory_samples']) == (2560, 2)
+        assert (stats['total_operations'], stats['failed_operations']) == (3, 1)
+
+    def test_prometheus_text(self):
+        metrics = EngineMetrics(rss_sample_every=0)
+        metrics.record('subject_metrics', 0.003, rows=40)
+        metrics.record('subject_metrics', 2.0, rows=40, success=False)
+        text = metrics.prometheus_text()
+
+        assert '# TYPE calculation_engine_duration_seconds histogram' in text
+        assert 'calculation_engine_duration_seconds_bucket{strategy="subject_metrics",le="+Inf"} 2' in text
+        assert 'calculation_engine_duration_seconds_count{strategy="subject_metrics"} 2' in text
+        assert 'calculation_engine_calls_total{strategy="subject_metrics",status="failure"} 1' in text
+        assert 'calculation_engine_rows_total{strategy="subject_metrics"} 40' in text
+        buckets = [line for line in text.splitlines() if line.startswith('calculation_engine_duration_seconds_bucket')]
+        counts = [int(line.rsplit(' ', 1)[1]) for line in buckets]
+        assert counts == sorted(counts)
+
+    def test_reset(self):
+        metrics = EngineMetrics(rss_sample_every=0)
+        metrics.record('percentiles', 0.001)
+        metrics.reset()
+        metrics.record('discrimination', 0.001)
+        assert list(metrics.merged()) == ['discrimination']
+
+
+def test_engine_metrics_endpoint():
+    from app.main import app
+    from app.calculation.calculators import initialize_calculation_system
+
+    engine = initialize_calculation_system()
+    engine.calculate('subject_metrics', np.arange(20, dtype=np.float64), {'max_score': 100.0})
+    client = TestClient(app)
+
+    snapshot = client.get('/api/v1/statistics/system/engine-metrics').json()
+    assert snapshot['strategies']['subject_metrics']['calls'] >= 1
+
+    response = client.get('/api/v1/statistics/system/engine-metrics', params={'format': 'prometheus'})
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    assert 'calculation_engine_calls_total{strategy="subject_metrics",status="success"}' in response.text
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.calculation.formulas import (
+    BasicStatisticsStrategy,
+    DiscriminationStrategy,
+    EducationalMetricsStrategy,
+    EducationalPercentileStrategy
+)
+from app.calculation.grouped_statistics import calculate_grouped_statistics, sort_segments
+
+
+class TestGroupedStatistics:
+    """测试分组统计计算与单组策略结果一致"""
+
+    def setup_method(self):
+        rng = np.random.default_rng(42)
+        self.labels = np.array([f'SCH_{i:02d}' for i in rng.integers(0, 8, 2000)], dtype=object)
+        self.scores = np.round(rng.uniform(0, 100, 2000))
+
+    @pytest.mark.parametrize('grade_level', ['3rd_grade', '7th_grade'])
+    def test_matches_single_group_strategies(self, grade_level):
+        """测试与逐组调用计算策略的结果一致"""
+        config = {'max_score': 100.0, 'grade_level': grade_level, 'percentiles': [10, 25, 50, 75, 90]}
+        grouped = calculate_grouped_statistics(self.labels, self.scores, config)
+        assert len(grouped) == 8
+
+        for label, result in grouped.items():
+            df = pd.DataFrame({'score': self.scores[self.labels == label]})
+            basic = BasicStatisticsStrategy().calculate(df, config)
+            metrics = EducationalMetricsStrategy().calculate(df, config)
+            percentiles = EducationalPercentileStrategy().calculate(df, config)
+            discrimination = DiscriminationStrategy().calculate(df, config)
+
+            for key in ['count', 'sum', 'mean', 'median', 'std', 'variance', 'min', 'max', 'range']:
+                assert result['basic_statistics'][key] == pytest.approx(basic[key])
+            assert result['percentiles'] == pytest.approx(percentiles)
+            assert result['educational_metrics']['grade_distribution'] == pytest.approx(metrics['grade_distribution'])
+            for key in ['pass_rate', 'excellent_rate', 'average_score_rate', 'difficulty_coefficient']:
+                assert result['educational_metrics'][key] == pytest.approx(metrics[key])
+            assert result['discrimination']['discrimination_index'] == pytest.approx(discrimination['discrimination_index'])
+            assert result['discrimination']['interpretation'] == discrimination['interpretation']
+
+    def test_small_groups_skip_discrimination(self):
+        """测试样本不足的分组不计算区分度"""
+        grouped = calculate_grouped_statistics(['A', 'A', 'B'], np.array([80.0, 60.0, 90.0]), {'max_score': 100})
+        assert grouped['A']['discrimination'] is None
+        assert grouped['A']['basic_statistics']['median'] == 70.0
+        assert np.isnan(grouped['B']['basic_statistics']['std'])
+
+    def test_nan_scores_are_dropped(self):
+        """测试NaN分数被剔除"""
+        segments = sort_segments(['A', 'B', 'A'], np.array([np.nan, 50.0, 70.0]))
+        assert list(segments.labels) == ['A', 'B']
+        assert list(segments.counts) == [1, 1]
+
+    def test_empty_input(self):
+        """测试空输入"""
+        assert calculate_grouped_statistics([], np.array([]), {'max_score': 100}) == {}
@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.database.models import AggregationLevel
+from app.services.calculation_service import CalculationService
+from app.services.input_fingerprint import InputFingerprints, load_input_fingerprints
+
+
+def _rows(checksum_s2='00000000000000bb'):
+    return [
+        {'subject_name': '数学', 'school_id': 'S1', 'school_code': 'C1', 'row_count': 10,
+         'score_sum': 700, 'checksum': '00000000000000aa'},
+        {'subject_name': '数学', 'school_id': 'S2', 'school_code': 'C2', 'row_count': 12,
+         'score_sum': 810.5, 'checksum': checksum_s2},
+    ]
+
+
+def _stored(fingerprints, school_keys=('S1', 'S2')):
+    stored = {('REGIONAL', None): fingerprints.unit_fingerprint(AggregationLevel.REGIONAL)}
+    for key in school_keys:
+        stored[('SCHOOL', key)] = fingerprints.unit_fingerprint(AggregationLevel.SCHOOL, key)
+    return stored
+
+
+class TestInputFingerprints:
+    """测试汇聚单元输入指纹"""
+
+    def test_digest_ignores_row_order(self):
+        a = InputFingerprints.from_rows('B1', _rows())
+        b = InputFingerprints.from_rows('B1', list(reversed(_rows())))
+        assert a.batch_digest == b.batch_digest
+        assert a.unit_fingerprint(AggregationLevel.SCHOOL, 'S1') == b.unit_fingerprint(AggregationLevel.SCHOOL, 'S1')
+        assert a.school_ids == ['S1', 'S2'] and a.school_codes == ['C1', 'C2']
+
+    def test_unchanged_inputs_match_stored(self):
+        fingerprints = InputFingerprints.from_rows('B1', _rows())
+        stored = _stored(fingerprints)
+        assert fingerprints.unchanged(stored)
+        # 缺少学校记录时需要重新生成
+        del stored[('SCHOOL', 'S2')]
+        assert not fingerprints.unchanged(stored)
+
+    def test_data_change_invalidates_all_units(self):
+        """测试任一学校数据变化使所有单元失效（学校结果包含区域排名）"""
+        stored = _stored(InputFingerprints.from_rows('B1', _rows()))
+        changed = InputFingerprints.from_rows('B1', _rows(checksum_s2='00000000000000cc'))
+        assert not changed.unit_unchanged(stored, AggregationLevel.REGIONAL)
+        assert not changed.unit_unchanged(stored, AggregationLevel.SCHOOL, 'S1')
+
+    def test_algorithm_version_change_invalidates(self):
+        stored = _stored(InputFingerprints.from_rows('B1', _rows()))
+        upgraded = InputFingerprints('B1', InputFingerprints.from_rows('B1', _rows()).entries, algorithm_version='9.9')
+        assert not upgraded.unchanged(stored)
+
+    def test_config_change_invalidates(self):
+        """测试题目满分、维度映射或年级变化使所有单元失效"""
+        stored = _stored(InputFingerprints.from_rows('B1', _rows(), config_digest='a'))
+        assert InputFingerprints.from_rows('B1', _rows(), config_digest='a').unchanged(stored)
+        assert not InputFingerprints.from_rows('B1', _rows(), config_digest='b').unchanged(stored)
+
+    def test_empty_fingerprints_never_match(self):
+        empty = InputFingerprints('B1', [])
+        assert not empty
+        assert empty.unit_fingerprint(AggregationLevel.REGIONAL) is None
+        assert not empty.unchanged({('REGIONAL', None): None})
+
+
+class TestLoadInputFingerprints:
+    """测试计算时由清洗表重新计算指纹，不信任已保存的指纹"""
+
+    def _load(self, computed, stored, config_rows=('g|7th_grade',)):
+        with patch('app.services.input_fingerprint.InputFingerprintRepository') as repository_cls:
+            repository = repository_cls.return_value
+            repository.compute_fingerprints.return_value = computed
+            repository.get_fingerprints.return_value = stored
+            repository.get_config_rows.return_value = list(config_rows)
+            return load_input_fingerprints(MagicMock(), 'B1'), repository
+
+    def test_out_of_band_change_detected(self):
+        fingerprints, repository = self._load(_rows(checksum_s2='00000000000000cc'), _rows())
+        assert fingerprints.entries[1].checksum == '00000000000000cc'
+        assert not fingerprints.unchanged(_stored(InputFingerprints.from_rows('B1', _rows())))
+        repository.replace_fingerprints.assert_called_once()
+
+    def test_matching_stored_fingerprints_not_rewritten(self):
+        fingerprints, repository = self._load(_rows(), _rows())
+        assert fingerprints
+        repository.replace_fingerprints.assert_not_called()
+
+    def test_config_rows_change_fingerprint(self):
+        a, _ = self._load(_rows(), _rows(), ['g|7th_grade', 'q|数学|Q1|10.0000|exam|'])
+        b, _ = self._load(_rows(), _rows(), ['g|7th_grade', 'q|数学|Q1|12.0000|exam|'])
+        assert a.unit_fingerprint(AggregationLevel.REGIONAL) != b.unit_fingerprint(AggregationLevel.REGIONAL)
+
+
+class TestCalculationSkip:
+    """测试计算服务跳过输入未变化的批次"""
+
+    def _service(self, fingerprints, stored):
+        service = CalculationService(MagicMock())
+        service.repository = MagicMock()
+        service.repository.get_input_fingerprints.return_value = stored
+        service.repository.get_regional_statistics.return_value = SimpleNamespace(
+            statistics_data={'schema_version': 'v1.2', 'subjects': []}, total_students=22
+        )
+        return service
+
+    @pytest.mark.asyncio
+    async def test_unchanged_batch_is_skipped(self):
+        fingerprints = InputFingerprints.from_rows('B1', _rows())
+        service = self._service(fingerprints, _stored(fingerprints))
+        with patch.object(service, 'batch_context', return_value=SimpleNamespace(input_fingerprints=fingerprints)), \
+                patch.object(service, '_load_batch_snapshot') as load:
+            result = await service.calculate_batch_statistics('B1')
+        assert result['skipped']
+        assert result['regional_statistics'] == {'schema_version': 'v1.2', 'subjects': []}
+        assert result['school_statistics_summary']['successful_schools'] == 2
+        load.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_force_recalculates(self):
+        fingerprints = InputFingerprints.from_rows('B1', _rows())
+        service = self._service(fingerprints, _stored(fingerprints))
+        with patch.object(service, 'batch_context', return_value=SimpleNamespace(input_fingerprints=fingerprints)), \
+                patch.object(service, '_load_batch_snapshot', side_effect=RuntimeError('loaded')), \
+                patch.object(service, '_update_calculation_status'):
+            with pytest.raises(RuntimeError, match='loaded'):
+                await service.calculate_batch_statistics('B1', force=True)
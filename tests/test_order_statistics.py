@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.calculation.calculators.percentile_calculator import InterpolationMethod, PercentileCalculator
+from app.calculation.order_statistics import (
+    order_statistics,
+    segment_discrimination,
+    segment_percentiles,
+    select_ranks,
+    sort_segments,
+)
+
+
+def _sorted_reference(scores, percentiles=(10, 25, 50, 75, 90)):
+    """完整排序的参考实现"""
+    ordered = np.sort(scores)
+    n = len(ordered)
+    size = max(1, int(n * 0.27))
+    result = {f'P{p}': ordered[max(0, min(int(np.floor(n * p / 100.0)), n - 1))] for p in percentiles}
+    return result, ordered[-size:].mean(), ordered[:size].mean(), size
+
+
+class TestOrderStatistics:
+    """测试部分排序的百分位数与区分度内核"""
+
+    @pytest.mark.parametrize('n', [1, 2, 3, 10, 37, 1000])
+    def test_matches_full_sort(self, n):
+        """测试与完整排序结果一致（含重复分数）"""
+        scores = np.round(np.random.default_rng(n).normal(70, 12, n))
+        expected, high, low, size = _sorted_reference(scores)
+
+        stats = order_statistics(scores)
+        for key, value in expected.items():
+            assert stats['percentiles'][key] == value
+        assert stats['percentiles']['IQR'] == expected['P75'] - expected['P25']
+        assert stats['median'] == pd.Series(scores).median()
+        assert stats['group_size'] == size
+        assert stats['high_group_mean'] == pytest.approx(high)
+        assert stats['low_group_mean'] == pytest.approx(low)
+
+    def test_nan_removed_and_empty_rejected(self):
+        stats = order_statistics([np.nan, 3.0, 1.0, 2.0], percentiles=[50])
+        assert stats['count'] == 3 and stats['percentiles'] == {'P50': 2.0}
+        with pytest.raises(ValueError):
+            order_statistics([np.nan])
+
+    def test_select_ranks_places_requested_ranks(self):
+        scores = np.random.default_rng(1).uniform(0, 100, 200)
+        selected = select_ranks(scores, [0, 57, 199])
+        ordered = np.sort(scores)
+        assert selected[[0, 57, 199]].tolist() == ordered[[0, 57, 199]].tolist()
+        assert set(selected[:57]) == set(ordered[:57])
+
+    def test_percentile_calculator_methods_unchanged(self):
+        """测试百分位数计算器各插值方法与完整排序结果一致"""
+        scores = np.random.default_rng(2).uniform(0, 100, 101)
+        ordered = np.sort(scores)
+        calculator = PercentileCalculator()
+        n = len(scores)
+        for method in InterpolationMethod:
+            results = calculator.calculate_multiple_percentiles(scores, [5, 33, 50, 95], method)
+            for p in (5, 33, 50, 95):
+                position = p / 100.0 * (n - 1) if method == InterpolationMethod.LINEAR else np.floor(n * p / 100.0)
+                expected = calculator._calculate_with_method(ordered, position, p, method)
+                assert results[f'P{p}'].value == expected.value
+                assert calculator.calculate_percentile(scores, p, method).value == expected.value
+
+
+class TestSegmentKernels:
+    """测试分组（分段排序）内核与逐组计算一致"""
+
+    def test_segments_match_per_group(self):
+        rng = np.random.default_rng(4)
+        labels = rng.choice(['A', 'B', 'C'], size=300)
+        scores = np.round(rng.uniform(0, 100, 300))
+        segments = sort_segments(labels, scores)
+        percentiles = segment_percentiles(segments)
+        discrimination = segment_discrimination(segments, 100.0)
+
+        for i, label in enumerate(segments.labels):
+            stats = order_statistics(scores[labels == label])
+            for key, value in stats['percentiles'].items():
+                assert percentiles[key][i] == value
+            assert discrimination['high_group_mean'][i] == pytest.approx(stats['high_group_mean'])
+            assert discrimination['low_group_mean'][i] == pytest.approx(stats['low_group_mean'])
+            assert discrimination['group_size'][i] == stats['group_size']
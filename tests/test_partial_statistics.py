@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.calculation.engine import ChunkProcessor
+from app.calculation.grouped_statistics import calculate_grouped_statistics, statistics_from_partial
+from app.calculation.partials import ScorePartial, merge_partial_rows
+from app.services.calculation_service import CalculationService
+from app.services.subject_executor import ScoreTask, run_score_task
+
+
+CONFIG = {'max_score': 100.0, 'grade_level': '7th_grade', 'percentiles': [10, 25, 50, 75, 90]}
+
+
+def _assert_results_match(actual, expected):
+    for section in ('basic_statistics', 'educational_metrics', 'percentiles', 'discrimination'):
+        expected_section = {k: v for k, v in expected[section].items() if k != '_meta'}
+        assert set(expected_section) <= set(actual[section])
+        for key, value in expected_section.items():
+            if isinstance(value, float):
+                assert actual[section][key] == pytest.approx(value, rel=1e-9, abs=1e-12), key
+            else:
+                assert actual[section][key] == value, key
+
+
+class TestStatisticsFromPartial:
+    """测试由学校部分统计量合并得到的区域指标"""
+
+    def setup_method(self):
+        rng = np.random.default_rng(5)
+        self.scores = np.round(rng.normal(68, 15, 1200).clip(0, 100) * 2) / 2
+        self.schools = rng.choice(['S1', 'S2', 'S3', 'S4', 'S5'], size=1200)
+
+    def test_merged_school_partials_match_engine(self):
+        """测试学校部分统计量合并后与逐学生计算结果一致"""
+        by_school = ScorePartial.from_grouped(self.schools, self.scores, 100.0)
+        merged = ScorePartial.merge_all(by_school.values())
+
+        assert merged.exact
+        _assert_results_match(statistics_from_partial(merged, CONFIG),
+                              run_score_task(ScoreTask(('数学', ''), self.scores, CONFIG)))
+
+    def test_school_partials_match_grouped_statistics(self):
+        """测试单校部分统计量与分组统计结果一致（含小学等级口径）"""
+        config = dict(CONFIG, grade_level='3rd_grade')
+        grouped = calculate_grouped_statistics(self.schools, self.scores, config)
+        by_school = ScorePartial.from_grouped(self.schools, self.scores, 100.0)
+        for school, partial in by_school.items():
+            _assert_results_match(statistics_from_partial(partial, config), grouped[school])
+
+    def test_from_grouped_matches_from_scores(self):
+        """测试分组计算与逐组计算一致"""
+        by_school = ScorePartial.from_grouped(self.schools, self.scores, 100.0)
+        for school, partial in by_school.items():
+            mask = self.schools == school
+            expected = ScorePartial.from_scores(self.scores[mask], np.full(mask.sum(), 100.0))
+            assert partial.histogram == expected.histogram
+            assert partial.count == expected.count and partial.exact
+            assert partial.total == pytest.approx(expected.total)
+
+    def test_off_grid_scores_are_not_exact(self):
+        """测试分数不在计分精度上时标记为不精确且拒绝还原分布"""
+        partial = ScorePartial.from_scores([60.0, 72.25, 88.5])
+        merged = ScorePartial.from_scores([90.0]).merge(partial)
+        assert not merged.exact
+        assert merged.mean == pytest.approx((60.0 + 72.25 + 88.5 + 90.0) / 4)
+        with pytest.raises(ValueError):
+            statistics_from_partial(merged, CONFIG)
+
+    def test_merge_partial_rows_across_batches(self):
+        """测试跨批次按科目合并部分统计量"""
+        rows = [
+            {'subject_name': '数学', 'dimension_code': '', 'partial': ScorePartial.from_scores(chunk).to_dict()}
+            for chunk in np.array_split(self.scores, 4)
+        ]
+        merged = merge_partial_rows(rows)[('数学', '')]
+        assert merged.count == len(self.scores)
+        assert merged.percentile(50) == np.sort(self.scores)[len(self.scores) // 2]
+
+
+class TestRegionalDerivation:
+    """测试区域级任务的部分统计量合并与回退"""
+
+    def test_exact_tasks_derived_and_off_grid_tasks_kept(self):
+        schools = np.array(['S1', 'S2', 'S1', 'S2'] * 5)
+        exact = np.arange(20, dtype=np.float64) * 2.5
+        tasks = [
+            ScoreTask(('数学', ''), exact, CONFIG),
+            ScoreTask(('语文', ''), exact + 0.3, CONFIG),
+            ScoreTask(('问卷', ''), exact, CONFIG),
+        ]
+        derived, remaining = CalculationService._derive_from_school_partials(
+            tasks, {'数学': schools, '语文': schools}
+        )
+        assert list(derived) == [('数学', '')]
+        assert [task.key for task in remaining] == [('语文', ''), ('问卷', '')]
+        _assert_results_match(derived[('数学', '')], run_score_task(tasks[0]))
+
+
+class TestChunkMerge:
+    """测试分块结果由部分统计量合并"""
+
+    def test_chunked_percentiles_match_full_data(self):
+        rng = np.random.default_rng(9)
+        data = pd.DataFrame({'score': np.round(rng.uniform(0, 100, 2500) * 2) / 2})
+        processor = ChunkProcessor(chunk_size=400)
+        merged = processor.process_large_dataset(data, lambda chunk: {'count': len(chunk)})
+
+        ordered = np.sort(data['score'].to_numpy())
+        assert merged['count'] == 2500
+        assert merged['median'] == data['score'].median()
+        assert merged['std'] == pytest.approx(data['score'].std(ddof=1))
+        for p in (10, 25, 50, 75, 90):
+            assert merged[f'P{p}'] == ordered[int(2500 * p / 100)]
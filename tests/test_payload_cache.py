@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from app.database.payload_cache import LocalPayloadCache, PayloadCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSharedCache:
+    """模拟 StatisticalDataCache 的预编码响应接口"""
+
+    def __init__(self):
+        self.store = {}
+
+    async def get_payload(self, key_components):
+        return self.store.get(tuple(key_components))
+
+    async def set_payload(self, key_components, payload, batch_code=None, ttl=None):
+        self.store[tuple(key_components)] = payload
+        return True
+
+
+class TestLocalPayloadCache:
+    """测试进程内 LRU + TTL 缓存"""
+
+    def test_lru_eviction_by_entries(self):
+        """测试超出条目上限时淘汰最久未使用的条目"""
+        cache = LocalPayloadCache(max_entries=2)
+        cache.set(('a',), b'1')
+        cache.set(('b',), b'2')
+        assert cache.get(('a',)) == b'1'
+        cache.set(('c',), b'3')
+        assert cache.get(('b',)) is None
+        assert cache.get(('a',)) == b'1'
+        assert cache.evictions == 1
+
+    def test_eviction_by_bytes(self):
+        """测试超出字节上限时淘汰，超大值不缓存"""
+        cache = LocalPayloadCache(max_bytes=10)
+        cache.set(('a',), b'12345')
+        cache.set(('b',), b'123456')
+        assert cache.get(('a',)) is None
+        assert cache.total_bytes == 6
+        cache.set(('c',), b'x' * 11)
+        assert cache.get(('c',)) is None
+
+    def test_ttl_expiry(self):
+        """测试过期条目视为未命中"""
+        clock = FakeClock()
+        cache = LocalPayloadCache(ttl=10, clock=clock)
+        cache.set(('a',), b'1')
+        clock.now = 9.9
+        assert cache.get(('a',)) == b'1'
+        clock.now = 10.0
+        assert cache.get(('a',)) is None
+        assert len(cache) == 0 and cache.total_bytes == 0
+
+
+class TestPayloadCache:
+    """测试两级缓存与 single-flight"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_load_once(self):
+        """测试同一键的并发未命中只加载一次"""
+        cache = PayloadCache(LocalPayloadCache())
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return b'payload'
+
+        results = await asyncio.gather(*[cache.get_or_load(('v12', 'B1'), loader) for _ in range(10)])
+        assert results == [b'payload'] * 10
+        assert len(calls) == 1
+        assert await cache.get_or_load(('v12', 'B1'), loader) == b'payload'
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_load_is_not_cached(self):
+        """测试加载失败时异常传递给所有等待者且不缓存"""
+        cache = PayloadCache(LocalPayloadCache())
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError('db down')
+
+        results = await asyncio.gather(
+            *[cache.get_or_load(('k',), failing) for _ in range(3)], return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+        async def ok():
+            return b'ok'
+
+        assert await cache.get_or_load(('k',), ok) == b'ok'
+
+    @pytest.mark.asyncio
+    async def test_shared_tier_fills_local(self):
+        """测试 Redis 命中时不调用 loader 并回填进程内缓存"""
+        shared = FakeSharedCache()
+        shared.store[('v12', 'B1', 'SCHOOL', 'S1', '1.0@t')] = b'from-redis'
+        cache = PayloadCache(LocalPayloadCache(), shared)
+
+        async def loader():
+            raise AssertionError('should not load')
+
+        key = ('v12', 'B1', 'SCHOOL', 'S1', '1.0@t')
+        assert await cache.get_or_load(key, loader) == b'from-redis'
+        assert cache.local.get(key) == b'from-redis'
+
+    @pytest.mark.asyncio
+    async def test_loaded_value_written_to_shared_tier(self):
+        """测试加载结果写入 Redis"""
+        shared = FakeSharedCache()
+        cache = PayloadCache(LocalPayloadCache(), shared)
+
+        async def loader():
+            return b'fresh'
+
+        await cache.get_or_load(('v12', 'B1'), loader, batch_code='B1')
+        assert shared.store[('v12', 'B1')] == b'fresh'
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.ranking_index import SchoolRankingIndex
+
+
+class TestSchoolRankingIndex:
+    """测试学校排名索引"""
+
+    def setup_method(self):
+        # 学校平均分: A=80, B=90, C=80, D=70
+        self.data = pd.DataFrame({
+            'school_id': ['A', 'A', 'B', 'C', 'D', 'D', 'B'],
+            'raw_score': [70.0, 90.0, 95.0, 80.0, 60.0, 80.0, 85.0]
+        })
+
+    def test_competition_ranks(self):
+        """测试并列跳号排名"""
+        index = SchoolRankingIndex.from_frame(self.data, 'raw_score')
+        assert list(index.school_ids) == ['B', 'A', 'C', 'D']
+        assert list(index.ranks) == [1, 2, 2, 4]
+        assert index.rank_of('C') == 2
+        assert index.rank_of('D') == 4
+        assert index.rank_of('X') is None
+        assert index.total_schools == 4
+
+    def test_dense_ranks(self):
+        """测试并列连续排名"""
+        index = SchoolRankingIndex.from_frame(self.data, 'raw_score', tie_policy='dense')
+        assert list(index.ranks) == [1, 2, 2, 3]
+        assert index.rank_for_score(75.0) == 3
+        assert index.rank_for_score(100.0) == 1
+
+    def test_rank_for_score(self):
+        """测试按分数二分查找名次"""
+        index = SchoolRankingIndex.from_frame(self.data, 'raw_score')
+        assert index.rank_for_score(80.0) == 2
+        assert index.rank_for_score(75.0) == 4
+        assert index.rank_for_score(10.0) == 5
+
+    def test_rankings_agree_with_rank_of(self):
+        """测试排名列表与单校查询一致"""
+        rng = np.random.default_rng(7)
+        ids = rng.integers(0, 50, 5000).astype(str)
+        scores = rng.integers(0, 10, 5000).astype(float)
+        index = SchoolRankingIndex.build(ids, scores)
+        for item in index.rankings():
+            assert index.rank_of(item['school_id']) == item['rank']
+        means = pd.Series(scores).groupby(ids).mean()
+        expected = means.rank(method='min', ascending=False).astype(int)
+        assert {k: index.rank_of(k) for k in expected.index} == expected.to_dict()
+
+    def test_nan_scores_and_invalid_policy(self):
+        """测试NaN分数被忽略及非法并列策略"""
+        index = SchoolRankingIndex.build(['A', 'B'], [np.nan, 50.0])
+        assert list(index.school_ids) == ['B']
+        with pytest.raises(ValueError):
+            SchoolRankingIndex.build(['A'], [1.0], tie_policy='ordinal')
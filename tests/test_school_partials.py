@@ -0,0 +1,113 @@
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.calculation.partials import ScorePartial
+from app.services.subjects_builder import (
+    SubjectInfo,
+    SubjectsBuilder,
+    compute_school_subject_payloads,
+    compute_school_subject_payloads_from_partials,
+)
+
+
+def _partial_row(school, partial, dimension='', first_seen_id=None, school_name=None):
+    return {
+        'subject_name': '数学', 'subject_type': 'exam', 'school_code': school, 'school_name': school_name,
+        'dimension_code': dimension, 'first_seen_id': first_seen_id, 'partial': partial.to_dict(),
+    }
+
+
+class TestScorePartial:
+    """测试可合并部分统计量"""
+
+    def setup_method(self):
+        rng = np.random.default_rng(11)
+        self.scores = np.round(rng.uniform(0, 100, 500) * 2) / 2
+        self.chunks = np.array_split(self.scores, 7)
+
+    def test_merge_matches_full_computation(self):
+        """测试分块合并与整体计算一致"""
+        merged = ScorePartial.merge_all(ScorePartial.from_scores(chunk) for chunk in self.chunks)
+        full = ScorePartial.from_scores(self.scores)
+
+        assert merged.count == 500
+        assert merged.mean == pytest.approx(self.scores.mean())
+        assert merged.std == pytest.approx(self.scores.std(ddof=0))
+        assert (merged.min, merged.max) == (self.scores.min(), self.scores.max())
+        assert merged.histogram == full.histogram
+
+    def test_percentile_exact_at_bin_resolution(self):
+        """测试分数为0.5分粒度时直方图百分位数与排序结果一致"""
+        partial = ScorePartial.merge_all(ScorePartial.from_scores(chunk) for chunk in self.chunks)
+        ordered = np.sort(self.scores)
+        for p in (10, 25, 50, 75, 90):
+            assert partial.percentile(p) == ordered[int(len(ordered) * p / 100)]
+
+    def test_round_trip_and_empty(self):
+        """测试序列化往返与空统计量"""
+        partial = ScorePartial.from_scores([1.0, np.nan, 3.5], full_scores=[10, 10, 10])
+        restored = ScorePartial.from_dict(partial.to_dict())
+        assert restored == partial
+        assert restored.count == 2 and restored.full_score_max == 10.0
+        assert ScorePartial().merge(restored) == restored
+        assert ScorePartial().mean is None and ScorePartial().percentile(50) is None
+
+
+class TestPayloadsFromPartials:
+    """测试由部分统计量生成学校与区域 subjects"""
+
+    def setup_method(self):
+        self.frame = pd.DataFrame({
+            'school_code': ['S1', 'S1', 'S2', 'S3', 'S3', 'S3'],
+            'total_score': [80.0, 60.0, 90.0, 90.0, 70.5, 88.0],
+            'max_score': [100.0] * 6,
+        })
+        self.partials = {
+            code: ScorePartial.from_scores(group['total_score'], group['max_score'])
+            for code, group in self.frame.groupby('school_code')
+        }
+
+    def test_school_payloads_match_student_level(self):
+        """测试与逐学生计算的学校指标、名次和维度结果一致"""
+        dim_scores = [('D2', 'S1', 4.0, 10.0, 5), ('D1', 'S1', 30.0, 50.0, 1), ('D1', 'S2', 45.0, 50.0, 3),
+                      ('D1', 'S1', 20.0, 50.0, 2)]
+        dim_frame = pd.DataFrame(dim_scores, columns=['dimension_code', 'school_code', 'score', 'max_score', 'id'])
+        grouped = dim_frame.groupby(['dimension_code', 'school_code'])
+        expected_dims = grouped.agg(dim_avg=('score', 'mean'), cnt=('score', 'size'),
+                                    max_sum=('max_score', 'sum'), first=('id', 'min'))
+        expected_dims = expected_dims.sort_values('first').reset_index()
+        dimension_rows = [
+            _partial_row(school, ScorePartial.from_scores(group['score'], group['max_score']),
+                         dimension=dim, first_seen_id=int(group['id'].min()))
+            for (dim, school), group in grouped
+        ]
+
+        expected = compute_school_subject_payloads(self.frame, expected_dims)
+        actual = compute_school_subject_payloads_from_partials(self.partials, dimension_rows)
+
+        assert actual['schools'] == expected['schools']
+        assert actual['total_schools'] == expected['total_schools'] == 3
+        assert actual['dimension_codes'] == expected['dimension_codes'] == ['D1', 'D2']
+        assert actual['dimension_max_scores'] == expected['dimension_max_scores']
+        for dim in ('D1', 'D2'):
+            assert actual['dimension_ranks'][dim].to_dict() == expected['dimension_ranks'][dim].to_dict()
+
+    def test_regional_subjects_from_partials(self):
+        """测试区域指标与学校排名由部分统计量合并得到"""
+        rows = [_partial_row(code, p, school_name=f'学校{code}') for code, p in self.partials.items()]
+        builder = SubjectsBuilder()
+        with patch.object(builder, 'list_subjects', return_value=[SubjectInfo('数学', 'exam')]):
+            subjects = builder.build_regional_subjects_from_partials('G7-2025', rows)
+
+        scores = self.frame['total_score']
+        metrics = subjects[0]['metrics']
+        assert metrics['avg'] == round(scores.mean(), 2)
+        assert metrics['stddev'] == round(scores.std(ddof=0), 2)
+        assert (metrics['max'], metrics['min']) == (90.0, 60.0)
+        assert [(r['school_code'], r['rank']) for r in subjects[0]['school_rankings']] == [
+            ('S2', 1), ('S3', 2), ('S1', 3)
+        ]
+        assert subjects[0]['school_rankings'][0]['school_name'] == '学校S2'
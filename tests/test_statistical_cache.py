@@ -0,0 +1,135 @@
+import fnmatch
+
+import pytest
+
+from app.database.cache import StatisticalDataCache
+
+
+class InMemoryAsyncRedis:
+    """最小化的 redis.asyncio 内存替身，记录命令以验证往返次数"""
+
+    def __init__(self):
+        self.store = {}
+        self.sets = {}
+        self.commands = []
+
+    async def get(self, key):
+        self.commands.append('GET')
+        return self.store.get(key)
+
+    async def mget(self, keys):
+        self.commands.append('MGET')
+        return [self.store.get(k) for k in keys]
+
+    async def smembers(self, key):
+        self.commands.append('SMEMBERS')
+        return set(self.sets.get(key, set()))
+
+    async def unlink(self, *keys):
+        self.commands.append('UNLINK')
+        deleted = 0
+        for k in keys:
+            deleted += int(self.store.pop(k, None) is not None or self.sets.pop(k, None) is not None)
+        return deleted
+
+    async def scan_iter(self, match=None, count=None):
+        for key in list(self.store):
+            if match is None or fnmatch.fnmatch(key, match):
+                yield key
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+
+class _Pipeline:
+    def __init__(self, client):
+        self.client = client
+        self.ops = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def setex(self, key, ttl, value):
+        self.ops.append(lambda: self.client.store.__setitem__(key, value) or True)
+
+    def sadd(self, key, *members):
+        self.ops.append(lambda: self.client.sets.setdefault(key, set()).update(members) or len(members))
+
+    def expire(self, key, ttl):
+        self.ops.append(lambda: True)
+
+    def unlink(self, *keys):
+        self.ops.append(lambda: sum(
+            int(self.client.store.pop(k, None) is not None or self.client.sets.pop(k, None) is not None)
+            for k in keys
+        ))
+
+    async def execute(self):
+        self.client.commands.append('PIPELINE')
+        return [op() for op in self.ops]
+
+
+@pytest.fixture
+def redis_client():
+    return InMemoryAsyncRedis()
+
+
+@pytest.fixture
+def cache(redis_client):
+    return StatisticalDataCache(redis_client)
+
+
+class TestStatisticalDataCache:
+    """测试异步缓存的标签失效与批量读写"""
+
+    @pytest.mark.asyncio
+    async def test_set_and_get_round_trip(self, cache):
+        """测试写入后可读取"""
+        assert await cache.set_regional_statistics('B1', {'mean': 80.5})
+        assert await cache.get_regional_statistics('B1') == {'mean': 80.5}
+        assert await cache.get_regional_statistics('B2') is None
+
+    @pytest.mark.asyncio
+    async def test_bulk_school_read_uses_single_mget(self, cache, redis_client):
+        """测试批量学校读写各只需一次往返"""
+        await cache.set_many_school_statistics('B1', {'S1': {'mean': 1}, 'S2': {'mean': 2}})
+        assert redis_client.commands == ['PIPELINE']
+
+        redis_client.commands.clear()
+        result = await cache.get_many_school_statistics('B1', ['S1', 'S2', 'S3'])
+        assert result == {'S1': {'mean': 1}, 'S2': {'mean': 2}}
+        assert redis_client.commands == ['MGET']
+
+    @pytest.mark.asyncio
+    async def test_batch_invalidation_uses_tag_set(self, cache, redis_client):
+        """测试批次失效只删除本批次标签登记的键"""
+        await cache.set_regional_statistics('B1', {'mean': 1})
+        await cache.set_school_statistics('B1', 'S1', {'mean': 2})
+        await cache.set_batch_summary_cache('B1', {'schools': 1})
+        await cache.set_regional_statistics('B10', {'mean': 3})
+
+        deleted = await cache.invalidate_batch_cache('B1')
+        assert deleted == 3
+        assert await cache.get_regional_statistics('B1') is None
+        assert await cache.get_school_statistics('B1', 'S1') is None
+        # 模式匹配 *B1* 会误删 B10，标签集合不会
+        assert await cache.get_regional_statistics('B10') == {'mean': 3}
+
+    @pytest.mark.asyncio
+    async def test_smart_invalidation_clears_query_cache(self, cache):
+        """测试更新时清理查询结果缓存"""
+        await cache.set_query_result_cache('abc', {'rows': [1, 2]}, batch_code='B1')
+        assert await cache.get_query_result_cache('abc') == {'rows': [1, 2]}
+
+        await cache.smart_invalidate_on_update({'batch_code': 'B2'})
+        assert await cache.get_query_result_cache('abc') is None
+
+    @pytest.mark.asyncio
+    async def test_school_id_index(self, cache):
+        """测试学校ID列表缓存"""
+        assert await cache.get_school_id_index('B1') is None
+        await cache.set_school_id_index('B1', ['S1', 'S2'])
+        assert await cache.get_school_id_index('B1') == ['S1', 'S2']
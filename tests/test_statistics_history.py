@@ -0,0 +1,122 @@
+from types import SimpleNamespace
+
+from app.database.models import CalculationStatus
+from app.database.statistics_history import (
+    apply_json_patch,
+    build_delta_history,
+    content_hash,
+    diff_json,
+    replay_statistics_history,
+    replay_window
+)
+
+
+def _versions():
+    base = {
+        'academic_subjects': {
+            '数学': {'school_stats': {'avg_score': 71.2, 'score_rate': 0.71}, 'percentiles': {'P50': 72}},
+            '语文': {'school_stats': {'avg_score': 80.5, 'score_rate': 0.81}, 'grade_distribution': [1, 2, 3]},
+        },
+        'total_students': 120,
+    }
+    versions = [base]
+    for i in range(1, 8):
+        data = apply_json_patch(versions[-1], [])
+        data['academic_subjects']['数学']['school_stats']['avg_score'] = 71.2 + i
+        if i % 3 == 0:
+            data['academic_subjects']['语文']['grade_distribution'].append(i)
+        if i == 5:
+            del data['academic_subjects']['语文']['school_stats']['score_rate']
+            data['non_academic_subjects'] = {'问卷': {'avg_score': 3.2}}
+        versions.append(data)
+    return versions
+
+
+def _history_rows(versions, interval):
+    """模拟仓库逐次更新写入的历史记录"""
+    rows, head = [], None
+    existing = SimpleNamespace(statistics_data=versions[0], calculation_status=CalculationStatus.COMPLETED,
+                               total_students=120)
+    for data in versions[1:]:
+        entry = build_delta_history(existing, {'statistics_data': data}, head, checkpoint_interval=interval)
+        history_data, head = entry
+        rows.append(SimpleNamespace(id=len(rows) + 1, **history_data))
+        existing.statistics_data = data
+    return rows
+
+
+class TestJsonDiff:
+    """测试结构化差异"""
+
+    def test_round_trip(self):
+        versions = _versions()
+        for old, new in zip(versions, versions[1:]):
+            patch = diff_json(old, new)
+            assert apply_json_patch(old, patch) == new
+        assert diff_json(versions[0], versions[0]) == []
+
+    def test_patch_is_local(self):
+        """测试差异只包含变化的叶子"""
+        old, new = _versions()[:2]
+        assert diff_json(old, new) == [{
+            'op': 'set', 'path': ['academic_subjects', '数学', 'school_stats', 'avg_score'], 'value': 72.2
+        }]
+
+    def test_apply_does_not_mutate_input(self):
+        old, new = _versions()[4:6]
+        snapshot = apply_json_patch(old, [])
+        apply_json_patch(old, diff_json(old, new))
+        assert old == snapshot
+
+    def test_content_hash_ignores_key_order(self):
+        assert content_hash({'a': 1, 'b': [1, 2]}) == content_hash({'b': [1, 2], 'a': 1})
+        assert content_hash({'a': 1}) != content_hash({'a': 1.5})
+
+
+class TestDeltaHistory:
+    """测试差异历史的写入与重建"""
+
+    def test_unchanged_recalculation_is_skipped(self):
+        data = _versions()[0]
+        existing = SimpleNamespace(statistics_data=data, calculation_status=CalculationStatus.COMPLETED,
+                                   total_students=120)
+        assert build_delta_history(existing, {'statistics_data': dict(data), 'calculation_duration': 3.2}, None) is None
+
+    def test_checkpoint_cadence(self):
+        rows = _history_rows(_versions(), interval=3)
+        assert [row.change_summary['checkpoint'] for row in rows] == [True, False, False, True, False, False, True]
+        assert all('statistics_data' not in row.previous_data for row in rows if not row.change_summary['checkpoint'])
+
+    def test_chain_break_forces_checkpoint(self):
+        """测试当前数据与最近历史版本不一致时写检查点"""
+        versions = _versions()
+        _, head = build_delta_history(
+            SimpleNamespace(statistics_data=versions[0], calculation_status=CalculationStatus.COMPLETED,
+                            total_students=120),
+            {'statistics_data': versions[1]}, None)
+        existing = SimpleNamespace(statistics_data=versions[2], calculation_status=CalculationStatus.COMPLETED,
+                                   total_students=120)
+        history_data, _ = build_delta_history(existing, {'statistics_data': versions[3]}, head)
+        assert history_data['change_summary']['checkpoint']
+        assert history_data['previous_data']['statistics_data'] == versions[2]
+
+    def test_reconstruct_every_version(self):
+        versions = _versions()
+        rows = _history_rows(versions, interval=3)
+        summaries = [(row.id, row.change_summary) for row in rows]
+        for data in versions:
+            target = content_hash(data)
+            start, end = replay_window(summaries, target)
+            window = [row for row in rows if start <= row.id <= end]
+            assert replay_statistics_history(window, target) == data
+        assert replay_statistics_history(rows, 'missing') is None
+
+    def test_legacy_full_rows_are_replayed(self):
+        versions = _versions()
+        legacy = SimpleNamespace(id=1, previous_data={'statistics_data': versions[0]},
+                                 current_data={'statistics_data': versions[1]}, change_summary={})
+        rows = [legacy] + [SimpleNamespace(id=row.id + 1, previous_data=row.previous_data,
+                                           current_data=row.current_data, change_summary=row.change_summary)
+                           for row in _history_rows(versions[1:], interval=10)]
+        assert replay_statistics_history(rows, content_hash(versions[1])) == versions[1]
+        assert replay_statistics_history(rows, content_hash(versions[6])) == versions[6]
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from app.services.subject_executor import (
+    ExecutorSettings,
+    ScoreTask,
+    run_score_tasks,
+    shutdown_process_pool
+)
+
+
+def _tasks():
+    rng = np.random.default_rng(7)
+    config = {'max_score': 100.0, 'grade_level': '7th_grade', 'percentiles': [10, 25, 50, 75, 90],
+              'required_columns': ['score']}
+    return [
+        ScoreTask(('数学', ''), rng.uniform(0, 100, 300), config),
+        ScoreTask(('数学', 'D1'), rng.uniform(0, 50, 300), dict(config, max_score=50.0)),
+        ScoreTask(('语文', ''), rng.uniform(0, 100, 8), config),
+    ]
+
+
+class TestExecutorSettings:
+    """测试执行模式选择"""
+
+    def test_auto_mode(self):
+        settings = ExecutorSettings(mode='auto', max_workers=16, process_threshold=1000)
+        assert settings.resolve_mode(total_rows=5000, task_count=10) == 'process'
+        assert settings.resolve_mode(total_rows=500, task_count=10) == 'serial'
+        assert settings.resolve_mode(total_rows=5000, task_count=1) == 'serial'
+        assert ExecutorSettings(mode='auto', max_workers=1).resolve_mode(10 ** 7, 10) == 'serial'
+
+    def test_explicit_mode(self):
+        assert ExecutorSettings(mode='thread').resolve_mode(0, 1) == 'thread'
+        assert not ExecutorSettings(mode='serial').io_concurrency
+        with pytest.raises(ValueError):
+            ExecutorSettings(mode='gpu')
+
+
+class TestRunScoreTasks:
+    """测试各执行模式结果一致"""
+
+    @pytest.mark.asyncio
+    async def test_modes_produce_identical_results(self):
+        serial = await run_score_tasks(_tasks(), 'serial', 1)
+        threaded = await run_score_tasks(_tasks(), 'thread', 4)
+        try:
+            processed = await run_score_tasks(_tasks(), 'process', 2)
+        finally:
+            shutdown_process_pool()
+
+        assert list(serial) == [('数学', ''), ('数学', 'D1'), ('语文', '')]
+        for key, expected in serial.items():
+            for other in (threaded, processed):
+                for stat in ('count', 'mean', 'std', 'min', 'max'):
+                    assert other[key]['basic_statistics'][stat] == pytest.approx(expected['basic_statistics'][stat])
+                for p in ('P10', 'P50', 'P90'):
+                    assert other[key]['percentiles'][p] == pytest.approx(expected['percentiles'][p])
+        # 样本不足时不计算区分度
+        assert serial[('语文', '')]['discrimination'] is None
+        assert serial[('数学', '')]['discrimination'] is not None
+
+    @pytest.mark.asyncio
+    async def test_task_errors_are_returned(self):
+        """测试单个任务失败不影响其他任务"""
+        tasks = _tasks()
+        tasks.append(ScoreTask(('英语', ''), np.array([50.0] * 20), {'max_score': 'bad'}))
+        results = await run_score_tasks(tasks, 'thread', 2)
+        assert isinstance(results[('英语', '')], Exception)
+        assert isinstance(results[('数学', '')], dict)
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('mode', ['serial', 'thread'])
+    async def test_progress_reported_per_task(self, mode):
+        tasks = _tasks()
+        tasks.append(ScoreTask(('英语', ''), np.array([50.0] * 20), {'max_score': 'bad'}))
+        reported = []
+        await run_score_tasks(tasks, mode, 2, progress_callback=lambda done, total: reported.append((done, total)))
+        assert reported == [(1, 4), (2, 4), (3, 4), (4, 4)]
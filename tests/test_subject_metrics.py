@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.calculation.calculators import initialize_calculation_system
+from app.calculation.subject_metrics import SubjectMetricsStrategy
+
+
+CONFIG = {'max_score': 100.0, 'grade_level': '7th_grade', 'percentiles': [10, 25, 50, 75, 90]}
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return initialize_calculation_system()
+
+
+def _separate_strategies(engine, scores, config):
+    """原有四次策略调用的结果"""
+    df = pd.DataFrame({'score': scores})
+    results = {
+        group: engine.calculate(group, df, config)
+        for group in ('basic_statistics', 'educational_metrics', 'percentiles')
+    }
+    results['discrimination'] = engine.calculate('discrimination', df, config) if len(df) >= 10 else None
+    return results
+
+
+def _assert_same(actual, expected):
+    for group, values in expected.items():
+        if values is None:
+            assert actual[group] is None
+            continue
+        for key, value in values.items():
+            if key == '_meta':
+                continue
+            if isinstance(value, float) and np.isnan(value):
+                assert np.isnan(actual[group][key]), key
+            elif isinstance(value, float):
+                # 原有路径经 optimize_dataframe_memory 降为 float32，融合策略保持 float64
+                assert actual[group][key] == pytest.approx(value, rel=1e-6, abs=1e-6), key
+            else:
+                assert actual[group][key] == value, key
+
+
+class TestSubjectMetricsStrategy:
+    """测试科目指标融合策略与四个单独策略结果一致"""
+
+    @pytest.mark.parametrize('n', [1, 3, 9, 10, 250])
+    def test_matches_separate_strategies(self, engine, n):
+        scores = np.round(np.random.default_rng(n).normal(70, 15, n).clip(0, 100), 1)
+        fused = engine.calculate('subject_metrics', scores, CONFIG)
+        _assert_same(fused, _separate_strategies(engine, scores, CONFIG))
+        assert fused['_meta']['algorithm_info']['name'] == 'SubjectMetrics'
+
+    def test_primary_grade_and_nan_scores(self, engine):
+        config = dict(CONFIG, grade_level='4th_grade')
+        scores = np.array([95.0, 85.0, np.nan, 72.0, 60.0, 59.5, 85.0, 100.0, 30.0, 70.0, 84.9, np.nan])
+        fused = engine.calculate('subject_metrics', scores, config)
+        _assert_same(fused, _separate_strategies(engine, scores[~np.isnan(scores)], config))
+        assert fused['basic_statistics']['count'] == 10
+        assert fused['basic_statistics']['mode'] == 85.0
+        assert fused['_meta']['validation_warnings'] == ['发现2个无效分数值']
+
+    def test_dataframe_input(self):
+        result = SubjectMetricsStrategy().calculate(pd.DataFrame({'score': ['80', 60, None]}), CONFIG)
+        assert result['basic_statistics']['mean'] == 70.0
+        assert result['discrimination'] is None
+
+    def test_invalid_input_rejected(self, engine):
+        with pytest.raises(ValueError, match='数据验证失败'):
+            engine.calculate('subject_metrics', np.array([np.nan]), CONFIG)
+        with pytest.raises(ValueError, match='数据验证失败'):
+            engine.calculate('subject_metrics', np.array([1.0, 2.0]), dict(CONFIG, max_score=0))
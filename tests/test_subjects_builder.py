@@ -0,0 +1,73 @@
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+
+from app.services.subjects_builder import SubjectInfo, SubjectsBuilder, compute_school_subject_payloads
+
+
+def _row(school, total, max_score=100):
+    return {'school_code': school, 'total_score': total, 'max_score': max_score}
+
+
+def _result(frame):
+    result = MagicMock()
+    result.fetchall.return_value = list(frame.itertuples(index=False, name=None))
+    result.keys.return_value = list(frame.columns)
+    return result
+
+
+class TestBulkSubjectsBuilder:
+    """测试批量物化学校级 subjects"""
+
+    def setup_method(self):
+        self.frame = pd.DataFrame([_row('S1', 80), _row('S1', 60), _row('S2', 90), _row('S3', 90)])
+        # 维度长表按 (维度, 学校) 分组结果
+        self.dim_frame = pd.DataFrame([
+            ('D1', 'S1', 30.0, 2, 100.0),
+            ('D1', 'S2', 45.0, 1, 50.0),
+            ('D2', 'S2', 5.0, 1, 10.0),
+        ], columns=['dimension_code', 'school_code', 'dim_avg', 'cnt', 'max_sum'])
+
+    def test_metrics_and_region_rank(self):
+        """测试学校指标与区域名次（平均分相同按学校代码升序）"""
+        payload = compute_school_subject_payloads(self.frame)
+        assert payload['total_schools'] == 3
+        s1 = payload['schools']['S1']
+        assert s1['metrics'] == {'avg': 70.0, 'stddev': 10.0, 'max': 80.0, 'min': 60.0, 'difficulty': 0.7}
+        assert [payload['schools'][s]['region_rank'] for s in ('S2', 'S3', 'S1')] == [1, 2, 3]
+
+    def test_dimension_avgs_and_ranks(self):
+        """测试维度均分与名次"""
+        payload = compute_school_subject_payloads(self.frame, self.dim_frame)
+        assert payload['dimension_codes'] == ['D1', 'D2']
+        assert payload['dimension_avgs']['D1'].to_dict() == {'S1': 30.0, 'S2': 45.0}
+        assert payload['dimension_ranks']['D1'].to_dict() == {'S2': 1, 'S1': 2}
+        assert payload['dimension_max_scores'] == {'D1': 50.0, 'D2': 10.0}
+
+    def test_build_all_school_subjects(self):
+        """测试批量生成结果结构与逐校生成一致"""
+        db = MagicMock()
+        db.__enter__.return_value = db
+        db.execute.side_effect = [_result(self.frame), _result(self.dim_frame)]
+
+        builder = SubjectsBuilder()
+        subjects = [SubjectInfo(name='数学', type='exam'), SubjectInfo(name='互动', type='interaction')]
+        with patch.object(builder, 'list_subjects', return_value=subjects), \
+                patch('app.services.subjects_builder.get_db', side_effect=lambda: iter([db])):
+            out = builder.build_all_school_subjects('G7-2025', ['S1', 'S4'])
+
+        assert db.execute.call_count == 2
+        math, interaction = out['S1']
+        assert math['region_rank'] == 3 and math['total_schools'] == 3
+        assert math['dimensions'][0] == {'code': 'D1', 'name': 'D1', 'avg': 30.0, 'score_rate': 60.0, 'rank': 2}
+        assert math['dimensions'][1]['avg'] is None and math['dimensions'][1]['rank'] is None
+        assert interaction == {'subject_name': '互动', 'type': 'interaction',
+                               'metrics': {'avg': 0.0, 'stddev': 0.0, 'max': 0.0, 'min': 0.0, 'difficulty': 0.0},
+                               'region_rank': None, 'total_schools': 0}
+        # 该科目无数据的学校
+        assert out['S4'][0]['region_rank'] is None and out['S4'][0]['total_schools'] == 0
+
+    def test_empty_subject(self):
+        """测试空科目数据"""
+        payload = compute_school_subject_payloads(pd.DataFrame(columns=self.frame.columns))
+        assert payload == {'total_schools': 0, 'schools': {}, 'dimension_codes': []}
@@ -617,6 +617,150 @@ class TestSurveyStrategies:
         logger.info("问卷质量策略测试通过")
 
 
+
+def _reference_flags(data, max_consecutive, variance_threshold):
+    """逐行（iterrows）参考实现"""
+    straight_line, no_variance = [], []
+    for index, row in data.iterrows():
+        valid = row.dropna()
+        if len(valid) < 3:
+            continue
+        longest = current = 1
+        for i in range(1, len(valid)):
+            current = current + 1 if valid.iloc[i] == valid.iloc[i - 1] else 1
+            longest = max(longest, current)
+        if longest >= max_consecutive:
+            straight_line.append(index)
+        numeric = pd.to_numeric(valid, errors='coerce').dropna()
+        if len(numeric) >= 3 and numeric.var() <= variance_threshold:
+            no_variance.append(index)
+    return straight_line, no_variance
+
+
+class TestSurveyQualityVectorized:
+    """测试向量化的直线响应与无变化响应检测与逐行实现一致"""
+
+    @pytest.mark.parametrize('seed', [0, 1, 2])
+    def test_matches_row_reference(self, seed):
+        rng = np.random.default_rng(seed)
+        values = rng.integers(1, 4, size=(300, 12)).astype(float)
+        values[rng.random(values.shape) < 0.2] = np.nan
+        values[:20] = 3.0
+        data = pd.DataFrame(values, columns=[f'Q{i}' for i in range(12)], index=np.arange(300) * 7)
+
+        strategy = SurveyQualityStrategy()
+        for max_consecutive in (1, 4, 8):
+            straight_line, no_variance = _reference_flags(data, max_consecutive, 0.3)
+            assert strategy._get_straight_line_indices(data, max_consecutive) == straight_line
+            assert strategy._detect_straight_line_responses(data, max_consecutive) == len(straight_line)
+            assert strategy._get_no_variance_indices(data, 0.3) == no_variance
+            assert strategy._detect_no_variance_responses(data, 0.3) == len(no_variance)
+
+    def test_mixed_object_responses(self):
+        """测试非数值列按原始取值比较，方差只统计可转换为数值的响应"""
+        data = pd.DataFrame({
+            'Q1': ['1', 2, 'x', None, 5],
+            'Q2': ['1', 2, 'x', 3, 5],
+            'Q3': [1, 2, 'x', 3, 5],
+            'Q4': ['1', 2.0, 'y', 3, None],
+        })
+        strategy = SurveyQualityStrategy()
+        for max_consecutive in (2, 3):
+            straight_line, no_variance = _reference_flags(data, max_consecutive, 0.1)
+            assert strategy._get_straight_line_indices(data, max_consecutive) == straight_line
+            assert strategy._get_no_variance_indices(data, 0.1) == no_variance
+
+    def test_summary_counts_each_invalid_response_once(self):
+        data = pd.DataFrame({f'Q{i}': [3, 1, 3, np.nan] for i in range(5)})
+        data.loc[1] = [1, 2, 3, 4, 5]
+        config = {'questions': list(data.columns),
+                  'quality_rules': {'completion_rate_min': 0.8, 'straight_line_max': 5, 'variance_threshold': 0.1}}
+        result = SurveyQualityStrategy().calculate(data, config)
+
+        assert result['quality_flags']['straight_line']['count'] == 2
+        assert result['quality_flags']['no_variance']['count'] == 2
+        assert result['quality_summary']['valid_responses'] == 1
+        assert result['detailed_analysis']['response_variance_analysis']['zero_variance_count'] == 2
+
+
+class TestColumnarScaleTransformation:
+    """测试列式量表转换与逐列 Series.map 结果一致"""
+
+    def setup_method(self):
+        rng = np.random.default_rng(7)
+        values = rng.integers(1, 6, size=(200, 6)).astype(float)
+        values[rng.random(values.shape) < 0.15] = np.nan
+        values[0, 0] = 2.5   # 非整数分值不在映射中
+        values[1, 1] = 9     # 超出量表范围
+        self.data = pd.DataFrame(values, columns=[f'Q{i}' for i in range(1, 7)])
+        self.data['Q6'] = self.data['Q6'].astype(object)
+        self.data.loc[2, 'Q6'] = 'x'
+        self.dimensions = {
+            'A': {'forward_questions': ['Q1', 'Q2', 'Q3'], 'reverse_questions': ['Q4'], 'weight': 1.5},
+            'B': {'forward_questions': ['Q5', 'Q6', 'Q_missing'], 'reverse_questions': ['Q1']},
+            'C': {'forward_questions': ['Q_missing']},
+        }
+
+    def _reference_scores(self, dimension):
+        from app.calculation.survey.scale_config import SCALE_TYPES
+        config = self.dimensions[dimension]
+        columns = [
+            self.data[q].map(SCALE_TYPES[direction]).astype('Float64')
+            for direction in ('forward', 'reverse')
+            for q in config.get(f'{direction}_questions', []) if q in self.data.columns
+        ]
+        return pd.concat(columns, axis=1).mean(axis=1, skipna=True).astype(float)
+
+    def test_transform_items_matches_series_map(self):
+        from app.calculation.survey import transform_items
+        from app.calculation.survey.scale_config import SCALE_TYPES
+
+        matrix = transform_items(self.data, self.dimensions, SCALE_TYPES)
+        assert matrix.dimensions == ['A', 'B']
+        assert matrix.question_counts == [4, 3]
+        for column, (question, direction) in enumerate(matrix.items):
+            expected = self.data[question].map(SCALE_TYPES[direction]).astype('Float64').to_numpy(np.float64, na_value=np.nan)
+            np.testing.assert_array_equal(matrix.values[:, column], expected)
+        for j, dimension in enumerate(matrix.dimensions):
+            np.testing.assert_allclose(matrix.scores[:, j], self._reference_scores(dimension), rtol=1e-12)
+
+    def test_transformed_data_only_when_requested(self):
+        strategy = ScaleTransformationStrategy()
+        config = {'dimensions': self.dimensions}
+        full = strategy.calculate(self.data, config)
+        lean = strategy.calculate(self.data, dict(config, include_transformed_data=False))
+
+        assert lean['transformed_data'] == {}
+        assert lean['dimension_scores'] == full['dimension_scores']
+        assert list(full['transformed_data']) == [
+            'Q1_transformed', 'Q2_transformed', 'Q3_transformed', 'Q4_transformed', 'A_score',
+            'Q5_transformed', 'Q6_transformed', 'B_score',
+        ]
+        # Q1 在维度 B 中为反向题，转换列与汇总以最后一次处理为准
+        assert full['transformation_summary']['Q1']['type'] == 'reverse'
+        reversed_q1 = pd.Series(full['transformed_data']['Q1_transformed']).dropna()
+        assert (reversed_q1 == 6 - self.data.loc[reversed_q1.index, 'Q1']).all()
+        assert full['dimension_scores']['A']['mean'] == pytest.approx(self._reference_scores('A').mean())
+
+    def test_dimension_aggregation_uses_columnar_scores(self):
+        result = DimensionAggregationStrategy().calculate(self.data, {'dimensions': self.dimensions})
+        expected = {name: self._reference_scores(name).dropna() for name in ('A', 'B')}
+
+        for name, scores in expected.items():
+            stats = result['dimension_statistics'][name]
+            assert stats['count'] == len(scores)
+            assert stats['mean'] == pytest.approx(scores.mean())
+            assert stats['P75'] == pytest.approx(np.percentile(scores, 75))
+        assert result['dimension_correlations']['A_vs_B']['correlation'] == pytest.approx(
+            pd.DataFrame(expected).corr().loc['A', 'B']
+        )
+        overall = result['overall_survey_metrics']
+        assert overall['overall_mean'] == pytest.approx(np.concatenate(list(expected.values())).mean())
+        assert overall['weighted_overall_mean'] == pytest.approx(
+            np.concatenate([expected['A'] * 1.5, expected['B']]).mean()
+        )
+        assert overall['dimension_balance'] == pytest.approx(2 / 3)
+
 if __name__ == '__main__':
     # 配置日志
     logging.basicConfig(
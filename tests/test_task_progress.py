@@ -0,0 +1,151 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, Mock
+
+from app.database.enums import AggregationLevel
+from app.services import task_manager as task_manager_module
+from app.services.task_manager import TaskManager, TaskStatus
+
+
+def _manager(task_id, stages):
+    manager = TaskManager(Mock())
+    manager.db.execute.return_value.fetchone.return_value = (10,)
+    manager.task_repo = Mock()
+    manager.task_repo.is_cancel_requested.return_value = False
+    manager.aggregation_repo = Mock()
+    manager._running_tasks[task_id] = {
+        "id": task_id, "batch_id": 7, "batch_code": "B1", "school_id": None,
+        "status": TaskStatus.PENDING, "progress": 0.0, "started_at": None,
+    }
+    manager._task_progress[task_id] = {
+        "overall_progress": 0.0,
+        "stage_details": [{"stage": stage, "status": "pending", "progress": 0.0} for stage in stages],
+    }
+    return manager
+
+
+def _written_progress(manager):
+    return [c.args[1]["progress"] for c in manager.task_repo.update.call_args_list if "status" not in c.args[1]]
+
+
+class TestProgressThrottling:
+    """测试进度写库节流与阶段状态"""
+
+    def test_writes_coalesced_within_interval(self, monkeypatch):
+        monkeypatch.setattr(task_manager_module, "PROGRESS_WRITE_INTERVAL", 60.0)
+        manager = _manager(1, ["precheck", "cleaning", "verification"])
+
+        for progress in (5, 10, 20, 40, 80):
+            manager._update_task_progress(1, progress, "cleaning", "processing", progress)
+        manager._update_task_progress(1, 90, "verification", "processing")
+
+        # 阶段首次进入与切换时写入，其余合并到内存
+        assert _written_progress(manager) == [5, 90]
+        assert manager._running_tasks[1]["progress"] == 90
+        stages = manager._task_progress[1]["stage_details"]
+        assert [s["status"] for s in stages] == ["completed", "completed", "processing"]
+
+    def test_min_delta(self, monkeypatch):
+        monkeypatch.setattr(task_manager_module, "PROGRESS_WRITE_INTERVAL", 0.0)
+        manager = _manager(1, ["cleaning"])
+
+        for progress in (10, 10.5, 11, 11.2, 30):
+            manager._update_task_progress(1, progress, "cleaning", "processing", progress)
+
+        assert _written_progress(manager) == [10, 11, 30]
+        assert manager._task_progress[1]["stage_details"][0]["progress"] == 30
+
+
+class TestTaskExecution:
+    """测试任务进度由实际计算驱动，不再模拟等待"""
+
+    def test_school_calculation_finishes_with_computation(self):
+        manager = _manager(1, ["data_loading", "statistical_calculation", "result_aggregation"])
+        manager.aggregation_repo.get_by_id.return_value = Mock(
+            id=7, batch_code="B1", school_id="S1", aggregation_level=AggregationLevel.SCHOOL
+        )
+        manager.calculation_service = Mock()
+        manager.calculation_service.calculate_school_statistics = AsyncMock(return_value={"statistics": {"n": 1}})
+
+        started = time.perf_counter()
+        asyncio.run(manager._execute_calculation_task(1))
+
+        assert time.perf_counter() - started < 0.5
+        assert manager._running_tasks[1]["status"] == TaskStatus.COMPLETED
+        assert all(s["status"] == "completed" for s in manager._task_progress[1]["stage_details"])
+        assert manager.aggregation_repo.update.call_args.args[1]["statistics_data"] == {"n": 1}
+
+    def test_regional_progress_follows_service_callback(self):
+        manager = _manager(1, ["data_loading", "statistical_calculation", "result_aggregation"])
+        manager.aggregation_repo.get_by_id.return_value = Mock(
+            id=7, batch_code="B1", school_id=None, aggregation_level=AggregationLevel.REGIONAL
+        )
+        seen = []
+
+        async def calculate(batch_code, config=None, progress_callback=None):
+            for progress in (5, 50, 100):
+                progress_callback(progress, "")
+                seen.append((manager._running_tasks[1]["progress"],
+                             [s["status"] for s in manager._task_progress[1]["stage_details"]]))
+            return {"regional_statistics": {}}
+
+        manager.calculation_service = Mock(calculate_batch_statistics=calculate)
+        asyncio.run(manager._execute_calculation_task(1))
+
+        assert seen == [
+            (4.5, ["processing", "pending", "pending"]),
+            (45.0, ["completed", "processing", "pending"]),
+            (90.0, ["completed", "processing", "pending"]),
+        ]
+        assert manager._running_tasks[1]["status"] == TaskStatus.COMPLETED
+
+    def test_cleaning_progress_and_failure(self, monkeypatch):
+        results = iter([{"subjects_processed": 2}, {"error": "科目清洗失败: 语文"}])
+
+        class FakeCleaningService:
+            def __init__(self, db):
+                pass
+
+            async def clean_batch_scores(self, batch_code, progress_callback=None):
+                progress_callback(50.0, "")
+                progress_callback(100.0, "")
+                return next(results)
+
+        monkeypatch.setattr(task_manager_module, "DataCleaningService", FakeCleaningService)
+        monkeypatch.setattr(task_manager_module, "PROGRESS_WRITE_INTERVAL", 0.0)
+
+        manager = _manager(1, ["precheck", "cleaning", "verification"])
+        asyncio.run(manager._execute_cleaning_task(1, "B1"))
+        assert _written_progress(manager) == [0.0, 5.0, 47.5, 90.0, 90.0]
+        assert manager._running_tasks[1]["status"] == TaskStatus.COMPLETED
+
+        manager = _manager(2, ["precheck", "cleaning", "verification"])
+        asyncio.run(manager._execute_cleaning_task(2, "B1"))
+        assert manager._running_tasks[2]["status"] == TaskStatus.FAILED
+        assert manager._running_tasks[2]["error_message"] == "科目清洗失败: 语文"
+
+
+class TestBatchStartTasks:
+    """测试批量启动：按批次去重，每个批次一个区域级任务并附带估算行数"""
+
+    def test_dedupes_and_passes_row_estimates(self, monkeypatch):
+        manager = _manager(1, [])
+        manager._estimate_batch_rows = Mock(return_value={"B1": 1200})
+        submitted = []
+
+        async def start(**kwargs):
+            submitted.append(kwargs)
+            if kwargs["batch_code"] == "B3":
+                raise ValueError("批次 B3 不存在")
+            return kwargs["batch_code"]
+
+        monkeypatch.setattr(manager, "start_calculation_task", start)
+        tasks = asyncio.run(manager.batch_start_tasks(["B1", "B2", "B1", "B3"], priority=10))
+
+        assert tasks == ["B1", "B2"]
+        manager._estimate_batch_rows.assert_called_once_with(["B1", "B2", "B3"])
+        assert [(k["batch_code"], k["aggregation_level"], k["estimated_rows"], k["priority"]) for k in submitted] == [
+            ("B1", AggregationLevel.REGIONAL, 1200, 10),
+            ("B2", AggregationLevel.REGIONAL, 0, 10),
+            ("B3", AggregationLevel.REGIONAL, 0, 10),
+        ]
@@ -0,0 +1,218 @@
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.database.models import ScoreInputFingerprint, Task, TaskBatchLock
+from app.database.repositories import InputFingerprintRepository, TaskRepository
+from app.services.task_queue import TaskQueueSettings, TaskWorkerPool
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    # 文件数据库 + 默认连接池：每个会话使用独立连接，工作线程与心跳线程的事务互不交错（与 MySQL 一致）
+    engine = create_engine(f"sqlite:///{tmp_path / 'tasks.db'}", connect_args={'check_same_thread': False})
+    Task.__table__.create(engine)
+    TaskBatchLock.__table__.create(engine)
+    return sessionmaker(bind=engine)
+
+
+def _enqueue(factory, task_id, batch_code, priority=5, task_type='calculation', estimated_rows=None):
+    session = factory()
+    TaskRepository(session).create({
+        'id': task_id, 'batch_id': 1, 'task_type': task_type, 'batch_code': batch_code,
+        'status': 'pending', 'priority': priority, 'progress': 0.0, 'started_at': datetime.now(),
+        'estimated_rows': estimated_rows,
+    })
+    session.close()
+
+
+class TestTaskQueueRepository:
+    """测试任务认领顺序、批次互斥与取消"""
+
+    def test_priority_and_batch_exclusion(self, session_factory):
+        _enqueue(session_factory, 1, 'B1', priority=5)
+        _enqueue(session_factory, 2, 'B1', priority=10)
+        _enqueue(session_factory, 3, 'B2', priority=1)
+        repo = TaskRepository(session_factory())
+
+        assert repo.claim_next('w1').id == 2
+        # B1 已被占用，低优先级的 B2 先执行
+        assert repo.claim_next('w2').id == 3
+        assert repo.claim_next('w3') is None
+
+        repo.release(2, 'B1')
+        claimed = repo.claim_next('w3')
+        assert (claimed.id, claimed.status, claimed.worker_id) == (1, 'running', 'w3')
+        assert repo.find_active('calculation', 'B1').id == 1
+
+    def test_row_budget(self, session_factory):
+        _enqueue(session_factory, 1, 'B1', priority=10, estimated_rows=80)
+        _enqueue(session_factory, 2, 'B2', estimated_rows=500)
+        _enqueue(session_factory, 3, 'B3')
+        repo = TaskRepository(session_factory())
+
+        assert repo.claim_next('w1', max_rows=100).id == 1
+        # 预算不足的任务排在最前时，其后的任务也不认领
+        assert repo.claim_next('w2', max_rows=20) is None
+        assert repo.claim_next('w2').id == 2
+        assert repo.claim_next('w3', max_rows=20).id == 3
+
+    def test_estimate_batch_rows(self, session_factory):
+        session = session_factory()
+        ScoreInputFingerprint.__table__.create(session.get_bind())
+        session.execute(text("CREATE TABLE student_cleaned_scores (batch_code VARCHAR(50))"))
+        session.execute(ScoreInputFingerprint.__table__.insert(), [
+            {'id': i, 'batch_code': 'B1', 'subject_name': s, 'school_id': '1', 'row_count': 100,
+             'score_sum': 0, 'checksum': '0', 'created_at': datetime.now()}
+            for i, s in enumerate(['数学', '语文'], start=1)
+        ])
+        session.execute(text("INSERT INTO student_cleaned_scores VALUES ('B2'), ('B2'), ('B2'), ('B1')"))
+        session.commit()
+
+        assert InputFingerprintRepository(session).estimate_batch_rows(['B1', 'B2', 'B3']) == {'B1': 200, 'B2': 3}
+
+    def test_cancel(self, session_factory):
+        _enqueue(session_factory, 1, 'B1')
+        _enqueue(session_factory, 2, 'B2')
+        repo = TaskRepository(session_factory())
+
+        assert repo.request_cancel(1)
+        assert repo.claim_next('w1').id == 2
+        assert repo.request_cancel(2)
+        # 执行中的任务在心跳时收到取消请求
+        assert repo.heartbeat([2]) == [2]
+        assert not repo.request_cancel(2)
+        assert repo.get_by_id(1).status == 'cancelled'
+
+    def test_reap_stale(self, session_factory):
+        _enqueue(session_factory, 1, 'B1')
+        _enqueue(session_factory, 2, 'B1')
+        _enqueue(session_factory, 3, 'B2')
+        repo = TaskRepository(session_factory())
+        repo.claim_next('w1')
+        repo.claim_next('w2')
+        repo.update(1, {'heartbeat_at': datetime.now() - timedelta(minutes=10)})
+
+        assert repo.reap_stale(60) == [1]
+        task = repo.get_by_id(1)
+        assert task.status == 'failed' and '心跳超时' in task.error_message
+        assert repo.claim_next('w3').id == 2
+        assert repo.status_counts() == {'failed': 1, 'running': 2}
+
+
+class TestTaskWorkerPool:
+    """测试工作线程池：同一批次的任务不会同时执行"""
+
+    def test_runs_all_tasks_with_batch_exclusion(self, session_factory):
+        active = {}
+        overlaps = []
+        finished = []
+        lock = threading.Lock()
+
+        def runner(session, task, cancelled):
+            with lock:
+                if active.get(task.batch_code):
+                    overlaps.append(task.id)
+                active[task.batch_code] = True
+            time.sleep(0.02)
+            TaskRepository(session).update(task.id, {'status': 'completed'})
+            with lock:
+                active[task.batch_code] = False
+                finished.append(task.id)
+
+        for i in range(8):
+            _enqueue(session_factory, i + 1, f'B{i % 2}')
+        pool = TaskWorkerPool(session_factory, TaskQueueSettings(workers=3, poll_interval=0.01,
+                                                                 heartbeat_interval=0.05), runner)
+        pool.start()
+        try:
+            deadline = time.time() + 10
+            while len(finished) < 8 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            pool.stop(timeout=5)
+
+        assert sorted(finished) == list(range(1, 9))
+        assert overlaps == []
+        assert TaskRepository(session_factory()).status_counts() == {'completed': 8}
+
+    def test_memory_budget_caps_concurrent_batches(self, session_factory):
+        lock = threading.Lock()
+        running = set()
+        peak = []
+        finished = []
+
+        def runner(session, task, cancelled):
+            with lock:
+                running.add(task.id)
+                peak.append(sorted(running))
+            time.sleep(0.03)
+            TaskRepository(session).update(task.id, {'status': 'completed'})
+            with lock:
+                running.discard(task.id)
+                finished.append(task.id)
+
+        # 预算 100 行：两个 60 行的批次不能同时执行，20 行的批次可以与 60 行的并行，500 行的批次单独执行
+        for task_id, rows in ((1, 60), (2, 60), (3, 20), (4, 500), (5, 60)):
+            _enqueue(session_factory, task_id, f'B{task_id}', estimated_rows=rows)
+        settings = TaskQueueSettings(workers=4, poll_interval=0.01, heartbeat_interval=0.05,
+                                     memory_budget_mb=100, row_bytes=1024 * 1024)
+        pool = TaskWorkerPool(session_factory, settings, runner)
+        pool.start()
+        try:
+            deadline = time.time() + 10
+            while len(finished) < 5 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            pool.stop(timeout=5)
+
+        rows = {1: 60, 2: 60, 3: 20, 4: 500, 5: 60}
+        assert sorted(finished) == [1, 2, 3, 4, 5]
+        for snapshot in peak:
+            assert len(snapshot) == 1 or sum(rows[t] for t in snapshot) <= 100
+
+    def test_large_batch_not_starved_by_small_batches(self, session_factory):
+        """测试持续到来的小批次不会使预算不足的高优先级大批次饿死"""
+        lock = threading.Lock()
+        ids = itertools.count(1)
+        events = []
+        big_done = threading.Event()
+        big_queued = threading.Event()
+
+        def enqueue_small():
+            task_id = next(ids)
+            _enqueue(session_factory, task_id, f'S{task_id}', estimated_rows=30)
+
+        def runner(session, task, cancelled):
+            with lock:
+                events.append((task.batch_code, big_queued.is_set()))
+            time.sleep(0.02)
+            TaskRepository(session).update(task.id, {'status': 'completed'})
+            if task.batch_code == 'BIG':
+                big_done.set()
+            elif not big_done.is_set() and len(events) < 200:
+                enqueue_small()
+
+        for _ in range(3):
+            enqueue_small()
+        settings = TaskQueueSettings(workers=3, poll_interval=0.01, heartbeat_interval=0.05,
+                                     memory_budget_mb=100, row_bytes=1024 * 1024)
+        pool = TaskWorkerPool(session_factory, settings, runner)
+        pool.start()
+        try:
+            time.sleep(0.1)
+            _enqueue(session_factory, 10_000, 'BIG', priority=10, estimated_rows=500)
+            big_queued.set()
+            pool.notify()
+            assert big_done.wait(10)
+        finally:
+            pool.stop(timeout=5)
+
+        started = [batch for batch, queued in events if queued]
+        # 大批次入队后最多还有正在认领的工作线程各启动一个小批次
+        assert 'BIG' in started[:settings.workers + 1]